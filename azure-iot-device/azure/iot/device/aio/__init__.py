@@ -6,6 +6,7 @@ from an IoT device.
 
 from azure.iot.device.iothub.aio import *
 from azure.iot.device.provisioning.aio import *
+from azure.iot.device.common.async_adapter import enable_asyncio_pipeline
 from azure.iot.device import patch
 
 # Dynamically patch the clients to add shim implementations for all the inherited methods.
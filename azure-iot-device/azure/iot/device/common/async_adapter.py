@@ -9,6 +9,7 @@ import functools
 import logging
 import traceback
 import azure.iot.device.common.asyncio_compat as asyncio_compat
+from azure.iot.device.common.pipeline import pipeline_thread
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,9 @@ def emulate_async(fn):
 
     Can be applied as a decorator.
 
+    If the pipeline is running on the current event loop (see enable_asyncio_pipeline), the
+    function is called directly instead.
+
     :param fn: The sync function to be run in async.
     :returns: A coroutine function that will call the given sync function.
     """
@@ -27,12 +31,41 @@ def emulate_async(fn):
     async def async_fn_wrapper(*args, **kwargs):
         loop = asyncio_compat.get_running_loop()
 
+        if pipeline_thread.get_event_loop() is loop:
+            # The pipeline is running on this loop, and pipeline functions never block, so there
+            # is nothing to be gained by handing fn off to another thread.
+            return fn(*args, **kwargs)
+
         # Run fn in default ThreadPoolExecutor (CPU * 5 threads)
         return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
 
     return async_fn_wrapper
 
 
+def enable_asyncio_pipeline():
+    """Run the pipelines of all clients in this process on the currently running event loop,
+    instead of on their own threads.
+
+    This removes the thread switches between the event loop and the pipeline that happen on every
+    client call and every pipeline callback.  It must be called from a coroutine running on the
+    event loop that will be used for all clients, before any clients are created.  Sync clients
+    can not be used on the event loop thread once this has been called.
+    """
+    pipeline_thread.run_on_event_loop(asyncio_compat.get_running_loop())
+
+
+def _is_running_on(loop):
+    """Return True if the given loop is running on the current thread"""
+    try:
+        return asyncio_compat.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def _call_now(fn, *args):
+    fn(*args)
+
+
 class AwaitableCallback(object):
     """A sync callback whose completion can be waited upon.
     """
@@ -69,14 +102,21 @@ class AwaitableCallback(object):
                 exception = None
                 result = None
 
+            if _is_running_on(loop):
+                # Already on the event loop (e.g. if the pipeline is running on it), so the
+                # future can be completed directly.
+                complete = _call_now
+            else:
+                complete = loop.call_soon_threadsafe
+
             if exception:
                 # Do not use exc_info parameter on logger.error.  This casuses pytest to save the traceback which saves stack frames which shows up as a leak
                 logger.error("Callback completed with error {}".format(exception))
                 logger.error(traceback.format_exception_only(type(exception), exception))
-                loop.call_soon_threadsafe(self.future.set_exception, exception)
+                complete(self.future.set_exception, exception)
             else:
                 logger.debug("Callback completed with result {}".format(result))
-                loop.call_soon_threadsafe(self.future.set_result, result)
+                complete(self.future.set_result, result)
 
         self.callback = wrapping_callback
 
@@ -0,0 +1,89 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import pickle
+import struct
+import tempfile
+
+"""
+This module contains a first-in, first-out queue which keeps its items in a file instead of in
+process memory.  Inboxes use it to hold received items which don't fit in memory.
+
+Items are pickled and appended to an anonymous temporary file, which the operating system
+deletes once it is closed, so nothing is left on disk if the process exits.  Items are read
+back in the order they were added.  The file is truncated every time the queue becomes empty,
+so it only grows while the queue stays non-empty.
+
+The queue is not thread-safe.
+"""
+
+# Each item is a header holding the length of the pickled item, followed by the pickled item
+ITEM_HEADER = struct.Struct(">I")
+
+
+class DiskQueue(object):
+    """
+    A first-in, first-out queue of picklable items, kept in a temporary file.
+
+    :ivar str directory: The directory the temporary file is created in, or None for the
+        default temporary directory.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        # The file is created when the first item is added
+        self._file = None
+        self._read_position = 0
+        self._write_position = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def put(self, item):
+        """Add an item to the end of the queue"""
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="azure-iot-inbox-", dir=self.directory)
+        self._file.seek(self._write_position)
+        self._file.write(ITEM_HEADER.pack(len(data)))
+        self._file.write(data)
+        self._write_position += ITEM_HEADER.size + len(data)
+        self._count += 1
+
+    def get(self):
+        """
+        Remove and return the item at the front of the queue.
+
+        :raises: IndexError if the queue is empty.
+        """
+        if not self._count:
+            raise IndexError("get from an empty DiskQueue")
+        self._file.seek(self._read_position)
+        (length,) = ITEM_HEADER.unpack(self._file.read(ITEM_HEADER.size))
+        item = pickle.loads(self._file.read(length))
+        self._read_position += ITEM_HEADER.size + length
+        self._count -= 1
+        if not self._count:
+            self.clear()
+        return item
+
+    def clear(self):
+        """Remove all items from the queue"""
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.truncate()
+        self._read_position = 0
+        self._write_position = 0
+        self._count = 0
+
+    def close(self):
+        """Remove all items from the queue, and delete its file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._read_position = 0
+        self._write_position = 0
+        self._count = 0
@@ -8,8 +8,8 @@ import logging
 import uuid
 import threading
 import json
-import ssl
 from . import transport_exceptions as exceptions
+from . import ssl_context_cache
 from .pipeline import pipeline_thread
 from six.moves import http_client
 
@@ -37,26 +37,13 @@ class HTTPTransport(object):
     def _create_ssl_context(self):
         """
         This method creates the SSLContext object used to authenticate the connection. The generated context is used by the http_client and is necessary when authenticating using a self-signed X509 cert or trusted X509 cert
-        """
-        logger.debug("creating a SSL context")
-        ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLSv1_2)
-
-        if self._server_verification_cert:
-            ssl_context.load_verify_locations(cadata=self._server_verification_cert)
-        else:
-            ssl_context.load_default_certs()
-        ssl_context.verify_mode = ssl.CERT_REQUIRED
-        ssl_context.check_hostname = True
 
-        if self._x509_cert is not None:
-            logger.debug("configuring SSL context with client-side certificate and key")
-            ssl_context.load_cert_chain(
-                self._x509_cert.certificate_file,
-                self._x509_cert.key_file,
-                self._x509_cert.pass_phrase,
-            )
-
-        return ssl_context
+        The underlying SSLContext is shared with any other transports in the process that use the same certificates, and the TLS session is resumed by each new connection.
+        """
+        ssl_context = ssl_context_cache.get_ssl_context(
+            server_verification_cert=self._server_verification_cert, x509_cert=self._x509_cert
+        )
+        return ssl_context_cache.SessionResumingContext(ssl_context)
 
     @pipeline_thread.invoke_on_http_thread_nowait
     def request(self, method, path, callback, body="", headers={}, query_params=""):
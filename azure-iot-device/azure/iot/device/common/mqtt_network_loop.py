@@ -0,0 +1,257 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import collections
+import logging
+import socket
+import threading
+import time
+import weakref
+import paho.mqtt.client as mqtt
+from azure.iot.device.common import handle_exceptions
+
+try:
+    import selectors
+except ImportError:
+    # Python 2.7
+    selectors = None
+
+logger = logging.getLogger(__name__)
+
+"""
+This module contains a network loop which drives the sockets of many Paho MQTT clients from a
+single thread.
+
+Paho's loop_start() starts a network thread for every client, so a process that runs many
+clients (for example, a gateway with one client for each of its downstream devices) ends up
+with one thread per connection.  A NetworkLoop waits on the sockets of every client attached to
+it with a single selector, and calls loop_read(), loop_write() and loop_misc() on each client as
+needed.  It uses Paho's external event loop callbacks (on_socket_open, on_socket_close,
+on_socket_register_write and on_socket_unregister_write) to find out which sockets it should be
+watching.
+
+MQTTTransport objects which are created with shared_network_loop=True attach to one of a small,
+fixed-size pool of NetworkLoop objects returned by get_shared_network_loop(), so the number of
+network threads does not grow with the number of connections.
+
+The selectors module and Paho's external event loop callbacks are both required.  On Python 2.7,
+or with a version of Paho older than 1.5, get_shared_network_loop() returns None and each
+MQTTTransport falls back to using its own Paho network thread.
+"""
+
+# Number of NetworkLoop objects (and therefore threads) shared by every MQTTTransport in the
+# process.  Each transport is attached to whichever loop has the fewest clients.
+SHARED_POOL_SIZE = 2
+
+# Paho expects loop_misc() to be called about once a second so it can send keepalive pings and
+# notice when the broker has stopped responding.
+MISC_INTERVAL = 1.0
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    # Python 2.7
+    _monotonic = time.time
+
+
+def is_supported():
+    """
+    Return True if the Python runtime and the installed version of Paho support running clients
+    on a NetworkLoop
+    """
+    return selectors is not None and hasattr(mqtt.Client, "on_socket_open")
+
+
+class NetworkLoop(object):
+    """
+    A network loop which drives the sockets of many Paho clients from a single thread.
+
+    Most code should not create this object directly.  Use get_shared_network_loop() instead.
+    """
+
+    def __init__(self, name="mqtt-network-loop"):
+        self.name = name
+        self._lock = threading.Lock()
+        # Functions which need to run on the network loop thread, because they change the
+        # selector or call into Paho.
+        self._pending = collections.deque()
+        self._clients = weakref.WeakSet()
+        self._selector = None
+        self._wakeup_reader = None
+        self._wakeup_writer = None
+        self._thread = None
+
+    @property
+    def client_count(self):
+        """
+        The number of Paho clients which are attached to this loop
+        """
+        with self._lock:
+            return len(self._clients)
+
+    def attach(self, mqtt_client):
+        """
+        Drive the network traffic for the given Paho client from this loop instead of from a
+        Paho network thread.  This must be called before the client connects, and loop_start()
+        must not be called on the client.
+        """
+        mqtt_client.on_socket_open = self._on_socket_open
+        mqtt_client.on_socket_close = self._on_socket_close
+        mqtt_client.on_socket_register_write = self._on_socket_register_write
+        mqtt_client.on_socket_unregister_write = self._on_socket_unregister_write
+        with self._lock:
+            self._clients.add(mqtt_client)
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        # Must be called with self._lock held
+        if self._thread is None:
+            self._selector = selectors.DefaultSelector()
+            self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+            self._wakeup_reader.setblocking(False)
+            self._wakeup_writer.setblocking(False)
+            self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _call_on_loop_thread(self, func, *args):
+        """
+        Run the given function on the network loop thread.  If this is called from the network
+        loop thread, the function runs immediately.  Otherwise, it is queued and the network
+        loop is woken up to run it.
+        """
+        if threading.current_thread() is self._thread:
+            func(*args)
+        else:
+            with self._lock:
+                wake = not self._pending
+                self._pending.append((func, args))
+            if wake:
+                try:
+                    self._wakeup_writer.send(b"\0")
+                except socket.error:
+                    # The wakeup socket is full, so the loop is already going to wake up.
+                    pass
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_on_loop_thread(self._register, client, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call_on_loop_thread(self._unregister, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_on_loop_thread(self._modify, client, sock, True)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_on_loop_thread(self._modify, client, sock, False)
+
+    def _register(self, client, sock):
+        events = selectors.EVENT_READ
+        if client.want_write():
+            events |= selectors.EVENT_WRITE
+        try:
+            self._selector.register(sock, events, client)
+        except ValueError:
+            # The socket was closed on another thread before it could be registered.
+            pass
+
+    def _unregister(self, sock):
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            # Paho closes sockets that it never told us it opened (e.g. if the connection
+            # attempt fails), and a socket that has already been closed may no longer be found.
+            pass
+
+    def _modify(self, client, sock, want_write):
+        events = selectors.EVENT_READ
+        if want_write:
+            events |= selectors.EVENT_WRITE
+        try:
+            self._selector.modify(sock, events, client)
+        except (KeyError, ValueError):
+            # The socket was closed after the request to watch it for writing was queued.
+            pass
+
+    def _run_pending(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = collections.deque()
+        for func, args in pending:
+            try:
+                func(*args)
+            except Exception as e:
+                handle_exceptions.handle_background_exception(e)
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def _service(self, client, sock, mask):
+        try:
+            if mask & selectors.EVENT_READ:
+                rc = client.loop_read()
+                # An SSL socket can hold decrypted data which the selector can't see, so keep
+                # reading until it's gone.
+                pending = getattr(sock, "pending", None)
+                while rc == mqtt.MQTT_ERR_SUCCESS and pending and pending():
+                    rc = client.loop_read()
+            if mask & selectors.EVENT_WRITE and client.socket() is sock:
+                client.loop_write()
+        except Exception as e:
+            handle_exceptions.handle_background_exception(e)
+
+    def _service_misc(self):
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                try:
+                    key.data.loop_misc()
+                except Exception as e:
+                    handle_exceptions.handle_background_exception(e)
+
+    def _run(self):
+        logger.debug("{}: starting".format(self.name))
+        next_misc = _monotonic() + MISC_INTERVAL
+        while True:
+            self._run_pending()
+            timeout = max(0, next_misc - _monotonic())
+            try:
+                ready = self._selector.select(timeout)
+            except (OSError, ValueError) as e:
+                # A socket was closed on another thread before its unregistration ran.  The
+                # unregistration is queued, so run it and try again.
+                logger.debug("{}: select failed: {}".format(self.name, e))
+                ready = []
+            for key, mask in ready:
+                if key.fileobj is self._wakeup_reader:
+                    self._drain_wakeup()
+                else:
+                    self._service(key.data, key.fileobj, mask)
+            now = _monotonic()
+            if now >= next_misc:
+                self._service_misc()
+                next_misc = now + MISC_INTERVAL
+
+
+_shared_loops = []
+_shared_loops_lock = threading.Lock()
+
+
+def get_shared_network_loop():
+    """
+    Return the NetworkLoop from the shared pool which has the fewest clients attached, or None
+    if NetworkLoop is not supported (see is_supported())
+    """
+    if not is_supported():
+        return None
+    with _shared_loops_lock:
+        if not _shared_loops:
+            for i in range(SHARED_POOL_SIZE):
+                _shared_loops.append(NetworkLoop(name="mqtt-network-loop-{}".format(i)))
+        return min(_shared_loops, key=lambda loop: loop.client_count)
@@ -5,6 +5,8 @@
 # --------------------------------------------------------------------------
 
 import paho.mqtt.client as mqtt
+import collections
+import functools
 import logging
 import ssl
 import sys
@@ -13,6 +15,8 @@ import traceback
 import weakref
 import socket
 from . import transport_exceptions as exceptions
+from . import mqtt_network_loop
+from . import ssl_context_cache
 import socks
 
 logger = logging.getLogger(__name__)
@@ -101,6 +105,8 @@ class MQTTTransport(object):
         websockets=False,
         cipher=None,
         proxy_options=None,
+        shared_network_loop=False,
+        make_before_break=False,
     ):
         """
         Constructor to instantiate an MQTT protocol wrapper.
@@ -112,6 +118,10 @@ class MQTTTransport(object):
         :param bool websockets: Indicates whether or not to enable a websockets connection in the Transport.
         :param str cipher: Cipher string in OpenSSL cipher list format
         :param proxy_options: Options for sending traffic through proxy servers.
+        :param bool shared_network_loop: Indicates whether to drive the connection from a network
+            loop that is shared with other transports, instead of from a Paho thread of its own.
+        :param bool make_before_break: Indicates whether reauthorize_connection() should open a
+            new connection before closing the current one, instead of reconnecting.
         """
         self._client_id = client_id
         self._hostname = hostname
@@ -122,6 +132,18 @@ class MQTTTransport(object):
         self._websockets = websockets
         self._cipher = cipher
         self._proxy_options = proxy_options
+        self._shared_network_loop = shared_network_loop
+        self._make_before_break = make_before_break
+        self._network_loop = None
+        self._ssl_context = None
+
+        # While a make-before-break reauthorization is in progress, the Paho client opening the
+        # new connection and the OperationManager for it.  The lock protects switching the current
+        # client for the replacement.
+        self._replacement_client = None
+        self._replacement_op_manager = None
+        self._replaced_disconnect_causes = []
+        self._client_lock = threading.RLock()
 
         self.on_mqtt_connected_handler = None
         self.on_mqtt_disconnected_handler = None
@@ -130,11 +152,13 @@ class MQTTTransport(object):
 
         self._op_manager = OperationManager()
 
-        self._mqtt_client = self._create_mqtt_client()
+        self._mqtt_client = self._create_mqtt_client(self._op_manager)
 
-    def _create_mqtt_client(self):
+    def _create_mqtt_client(self, op_manager):
         """
         Create the MQTT client object and assign all necessary event handler callbacks.
+
+        :param op_manager: The OperationManager tracking the operations sent with the client.
         """
         logger.info("creating mqtt client")
 
@@ -167,6 +191,7 @@ class MQTTTransport(object):
 
         # Configure TLS/SSL
         ssl_context = self._create_ssl_context()
+        self._ssl_context = ssl_context
         mqtt_client.tls_set_context(context=ssl_context)
 
         # Set event handlers.  Use weak references back into this object to prevent
@@ -179,8 +204,12 @@ class MQTTTransport(object):
         def on_connect(client, userdata, flags, rc):
             this = self_weakref()
             logger.info("connected with result code: {}".format(rc))
+            # The TLS handshake is complete, so the session can be resumed next time we connect
+            ssl_context.save_session()
 
-            if rc:  # i.e. if there is an error
+            if client is this._replacement_client:
+                this._on_replacement_connected(client, rc)
+            elif rc:  # i.e. if there is an error
                 if this.on_mqtt_connection_failure_handler:
                     try:
                         this.on_mqtt_connection_failure_handler(
@@ -210,7 +239,11 @@ class MQTTTransport(object):
             if rc:  # i.e. if there is an error
                 logger.debug("".join(traceback.format_stack()))
                 cause = _create_error_from_rc_code(rc)
-                this._stop_automatic_reconnect()
+                this._stop_automatic_reconnect(client)
+
+            if this._replacement_client is not None or client is not this._mqtt_client:
+                if this._on_disconnected_while_replacing(client, cause):
+                    return
 
             if this.on_mqtt_disconnected_handler:
                 try:
@@ -222,25 +255,22 @@ class MQTTTransport(object):
                 logger.warning("No event handler callback set for on_mqtt_disconnected_handler")
 
         def on_subscribe(client, userdata, mid, granted_qos):
-            this = self_weakref()
             logger.info("suback received for {}".format(mid))
             # subscribe failures are returned from the subscribe() call.  This is just
             # a notification that a SUBACK was received, so there is no failure case here
-            this._op_manager.complete_operation(mid)
+            op_manager.complete_operation(mid)
 
         def on_unsubscribe(client, userdata, mid):
-            this = self_weakref()
             logger.info("UNSUBACK received for {}".format(mid))
             # unsubscribe failures are returned from the unsubscribe() call.  This is just
             # a notification that a SUBACK was received, so there is no failure case here
-            this._op_manager.complete_operation(mid)
+            op_manager.complete_operation(mid)
 
         def on_publish(client, userdata, mid):
-            this = self_weakref()
             logger.info("payload published for {}".format(mid))
             # publish failures are returned from the publish() call.  This is just
             # a notification that a PUBACK was received, so there is no failure case here
-            this._op_manager.complete_operation(mid)
+            op_manager.complete_operation(mid)
 
         def on_message(client, userdata, mqtt_message):
             this = self_weakref()
@@ -264,10 +294,20 @@ class MQTTTransport(object):
         mqtt_client.on_publish = on_publish
         mqtt_client.on_message = on_message
 
+        if self._shared_network_loop:
+            self._network_loop = mqtt_network_loop.get_shared_network_loop()
+            if self._network_loop:
+                logger.info("Using shared network loop {}".format(self._network_loop.name))
+                self._network_loop.attach(mqtt_client)
+            else:
+                logger.warning(
+                    "Shared network loop is not supported on this platform.  Using a Paho thread instead"
+                )
+
         logger.debug("Created MQTT protocol client, assigned callbacks")
         return mqtt_client
 
-    def _stop_automatic_reconnect(self):
+    def _stop_automatic_reconnect(self, mqtt_client):
         """
         After disconnecting because of an error, Paho will attempt to reconnect (some of the time --
         this isn't 100% reliable).  We don't want Paho to reconnect because we want to control the
@@ -279,6 +319,11 @@ class MQTTTransport(object):
         (so far) and making our own would be more complex than is currently justified.
         """
 
+        if self._network_loop:
+            # Paho only reconnects automatically from inside the thread started by loop_start(),
+            # which isn't running when the shared network loop drives the client.
+            return
+
         logger.info("Forcing paho disconnect to prevent it from automatically reconnecting")
 
         # Note: We are calling this inside our on_disconnect() handler, so we are inside the
@@ -286,52 +331,34 @@ class MQTTTransport(object):
         # loop_forever() function recomment calling disconnect() from a callback to exit the
         # Paho thread/loop.
 
-        self._mqtt_client.disconnect()
+        mqtt_client.disconnect()
 
         # Calling disconnect() isn't enough.  We also need to call loop_stop to make sure
         # Paho is as clean as possible.  Our call to disconnect() above is enough to stop the
         # loop and exit the tread, but the call to loop_stop() is necessary to complete the cleanup.
 
-        self._mqtt_client.loop_stop()
+        mqtt_client.loop_stop()
 
         # Finally, because of a bug in Paho, we need to null out the _thread pointer.  This
         # is necessary because the code that sets _thread to None only gets called if you
         # call loop_stop from an external thread (and we're still inside the Paho thread here).
 
-        self._mqtt_client._thread = None
+        mqtt_client._thread = None
         logger.debug("Done forcing paho disconnect")
 
     def _create_ssl_context(self):
         """
         This method creates the SSLContext object used by Paho to authenticate the connection.
-        """
-        logger.debug("creating a SSL context")
-        ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLSv1_2)
-
-        if self._server_verification_cert:
-            ssl_context.load_verify_locations(cadata=self._server_verification_cert)
-        else:
-            ssl_context.load_default_certs()
-
-        if self._cipher:
-            try:
-                ssl_context.set_ciphers(self._cipher)
-            except ssl.SSLError as e:
-                # TODO: custom error with more detail?
-                raise e
-
-        if self._x509_cert is not None:
-            logger.debug("configuring SSL context with client-side certificate and key")
-            ssl_context.load_cert_chain(
-                self._x509_cert.certificate_file,
-                self._x509_cert.key_file,
-                self._x509_cert.pass_phrase,
-            )
 
-        ssl_context.verify_mode = ssl.CERT_REQUIRED
-        ssl_context.check_hostname = True
-
-        return ssl_context
+        The underlying SSLContext is shared with any other transports in the process that use the
+        same certificates and cipher, and the TLS session is resumed when reconnecting.
+        """
+        ssl_context = ssl_context_cache.get_ssl_context(
+            server_verification_cert=self._server_verification_cert,
+            x509_cert=self._x509_cert,
+            cipher=self._cipher,
+        )
+        return ssl_context_cache.SessionResumingContext(ssl_context)
 
     def connect(self, password=None):
         """
@@ -352,18 +379,22 @@ class MQTTTransport(object):
         :raises: ProtocolClientError if there is some other client error.
         """
         logger.info("connecting to mqtt broker")
+        self._connect_client(self._mqtt_client, password)
 
-        self._mqtt_client.username_pw_set(username=self._username, password=password)
+    def _connect_client(self, mqtt_client, password):
+        """
+        Start connecting the given Paho client to the MQTT broker, raising any error as a
+        transport exception.
+        """
+        mqtt_client.username_pw_set(username=self._username, password=password)
 
         try:
             if self._websockets:
                 logger.info("Connect using port 443 (websockets)")
-                rc = self._mqtt_client.connect(
-                    host=self._hostname, port=443, keepalive=DEFAULT_KEEPALIVE
-                )
+                rc = mqtt_client.connect(host=self._hostname, port=443, keepalive=DEFAULT_KEEPALIVE)
             else:
                 logger.info("Connect using port 8883 (TCP)")
-                rc = self._mqtt_client.connect(
+                rc = mqtt_client.connect(
                     host=self._hostname, port=8883, keepalive=DEFAULT_KEEPALIVE
                 )
         except socket.error as e:
@@ -398,7 +429,8 @@ class MQTTTransport(object):
         logger.debug("_mqtt_client.connect returned rc={}".format(rc))
         if rc:
             raise _create_error_from_rc_code(rc)
-        self._mqtt_client.loop_start()
+        if not self._network_loop:
+            mqtt_client.loop_start()
 
     def reauthorize_connection(self, password=None):
         """
@@ -408,6 +440,13 @@ class MQTTTransport(object):
 
         The password is not required if the transport was instantiated with an x509 certificate.
 
+        If the transport was instantiated with make_before_break, a new connection is opened with
+        the password while the current connection stays open.  Once the new connection is
+        established, the transport switches to it, operations still waiting for a response on the
+        current connection are sent again on the new one, and the current connection is closed.
+        The subscriptions carry over, because the broker keeps them in the session of the client.
+        If the new connection fails, the current connection stays open.
+
         :param str password: The password for reauthorizing with the MQTT broker (Optional).
 
         :raises: ConnectionFailedError if connection could not be established.
@@ -415,6 +454,10 @@ class MQTTTransport(object):
         :raises: UnauthorizedError if there is an error authenticating.
         :raises: ProtocolClientError if there is some other client error.
         """
+        if self._make_before_break:
+            self._open_replacement_connection(password)
+            return
+
         logger.info("reauthorizing MQTT client")
         self._mqtt_client.username_pw_set(username=self._username, password=password)
         try:
@@ -429,6 +472,155 @@ class MQTTTransport(object):
             # or ProtocolClientError
             raise _create_error_from_rc_code(rc)
 
+    def _open_replacement_connection(self, password):
+        """
+        Start opening a new connection to replace the current one.  It replaces the current
+        connection when it is established.
+        """
+        logger.info("opening replacement MQTT connection")
+        self._discard_replacement()
+        op_manager = OperationManager()
+        replacement = self._create_mqtt_client(op_manager)
+        with self._client_lock:
+            self._replacement_client = replacement
+            self._replacement_op_manager = op_manager
+        try:
+            self._connect_client(replacement, password)
+        except Exception:
+            self._discard_replacement()
+            raise
+
+    def _on_replacement_connected(self, mqtt_client, rc):
+        """
+        Handle the CONNACK of the replacement connection, switching to it if it succeeded.
+        """
+        if rc:
+            if self._discard_replacement(mqtt_client):
+                self._on_replacement_failed(_create_error_from_connack_rc_code(rc))
+            return
+
+        with self._client_lock:
+            if mqtt_client is not self._replacement_client:
+                return
+            old_client = self._mqtt_client
+            pending_operations = self._op_manager.take_pending_operations()
+            self._mqtt_client = mqtt_client
+            self._op_manager = self._replacement_op_manager
+            self._replacement_client = None
+            self._replacement_op_manager = None
+            # The broker drops the old connection once the new one is established, so
+            # disconnections of the old connection are expected
+            self._replaced_disconnect_causes = []
+
+        logger.info(
+            "switched to replacement MQTT connection.  Sending {} pending operations again".format(
+                len(pending_operations)
+            )
+        )
+        for resend, callback in pending_operations:
+            try:
+                resend(callback=callback)
+            except Exception:
+                logger.error("Unexpected error sending operation on replacement connection")
+                logger.error(traceback.format_exc())
+        self._close_replaced_client(old_client)
+
+        if self.on_mqtt_connected_handler:
+            try:
+                self.on_mqtt_connected_handler()
+            except Exception:
+                logger.error("Unexpected error calling on_mqtt_connected_handler")
+                logger.error(traceback.format_exc())
+        else:
+            logger.warning("No event handler callback set for on_mqtt_connected_handler")
+
+    def _on_disconnected_while_replacing(self, mqtt_client, cause):
+        """
+        Handle a disconnection while a replacement connection is being opened, or of a client
+        which has been replaced.
+
+        :returns: True if the disconnection must not be reported as a disconnection of the
+            transport.
+        """
+        with self._client_lock:
+            if mqtt_client is self._mqtt_client and self._replacement_client is not None:
+                # The broker may drop the current connection before the CONNACK of the
+                # replacement is handled.  It is only reported if the replacement fails.
+                logger.info("current connection dropped while opening replacement connection")
+                self._replaced_disconnect_causes.append(cause)
+                return True
+            if mqtt_client is self._mqtt_client:
+                return False
+        if self._discard_replacement(mqtt_client):
+            self._on_replacement_failed(
+                cause or exceptions.ConnectionFailedError("replacement connection closed")
+            )
+        return True
+
+    def _on_replacement_failed(self, cause):
+        """
+        Report the failure of the replacement connection, and any disconnection of the current
+        connection which happened while the replacement was being opened.
+        """
+        logger.info("replacement MQTT connection failed: {}".format(cause))
+        with self._client_lock:
+            disconnect_causes = self._replaced_disconnect_causes
+            self._replaced_disconnect_causes = []
+
+        if self.on_mqtt_connection_failure_handler:
+            try:
+                self.on_mqtt_connection_failure_handler(cause)
+            except Exception:
+                logger.error("Unexpected error calling on_mqtt_connection_failure_handler")
+                logger.error(traceback.format_exc())
+        else:
+            logger.warning(
+                "connection failed, but no on_mqtt_connection_failure_handler handler callback provided"
+            )
+
+        for disconnect_cause in disconnect_causes:
+            if self.on_mqtt_disconnected_handler:
+                try:
+                    self.on_mqtt_disconnected_handler(disconnect_cause)
+                except Exception:
+                    logger.error("Unexpected error calling on_mqtt_disconnected_handler")
+                    logger.error(traceback.format_exc())
+
+    def _discard_replacement(self, mqtt_client=None):
+        """
+        Stop opening a replacement connection, if one is being opened.
+
+        :param mqtt_client: Only discard the replacement if it is this client (Optional).
+
+        :returns: True if a replacement was discarded.
+        """
+        with self._client_lock:
+            replacement = self._replacement_client
+            if replacement is None or (mqtt_client is not None and mqtt_client is not replacement):
+                return False
+            self._replacement_client = None
+            self._replacement_op_manager = None
+        self._close_replaced_client(replacement)
+        return True
+
+    def _close_replaced_client(self, mqtt_client):
+        """
+        Close a Paho client which is no longer the current client.  Messages it has already
+        received are still delivered, but no other events are reported for it.
+        """
+        mqtt_client.on_connect = None
+        mqtt_client.on_disconnect = None
+        mqtt_client.on_subscribe = None
+        mqtt_client.on_unsubscribe = None
+        mqtt_client.on_publish = None
+        try:
+            mqtt_client.disconnect()
+            if not self._network_loop:
+                mqtt_client.loop_stop()
+        except Exception:
+            logger.error("Unexpected error closing replaced MQTT client")
+            logger.error(traceback.format_exc())
+
     def disconnect(self):
         """
         Disconnect from the MQTT broker.
@@ -436,6 +628,7 @@ class MQTTTransport(object):
         :raises: ProtocolClientError if there is some client error.
         """
         logger.info("disconnecting MQTT client")
+        self._discard_replacement()
         try:
             rc = self._mqtt_client.disconnect()
         except Exception as e:
@@ -443,7 +636,8 @@ class MQTTTransport(object):
                 message="Unexpected Paho failure during disconnect", cause=e
             )
         logger.debug("_mqtt_client.disconnect returned rc={}".format(rc))
-        self._mqtt_client.loop_stop()
+        if not self._network_loop:
+            self._mqtt_client.loop_stop()
         if rc:
             # This could result in ConnectionDroppedError or ProtocolClientError
             err = _create_error_from_rc_code(rc)
@@ -470,19 +664,22 @@ class MQTTTransport(object):
         :raises: ProtocolClientError if there is some other client error.
         """
         logger.info("subscribing to {} with qos {}".format(topic, qos))
-        try:
-            (rc, mid) = self._mqtt_client.subscribe(topic, qos=qos)
-        except ValueError:
-            raise
-        except Exception as e:
-            raise exceptions.ProtocolClientError(
-                message="Unexpected Paho failure during subscribe", cause=e
+        with self._client_lock:
+            try:
+                rc, mid = self._mqtt_client.subscribe(topic, qos=qos)
+            except ValueError:
+                raise
+            except Exception as e:
+                raise exceptions.ProtocolClientError(
+                    message="Unexpected Paho failure during subscribe", cause=e
+                )
+            logger.debug("_mqtt_client.subscribe returned rc={}".format(rc))
+            if rc:
+                # This could result in ConnectionDroppedError or ProtocolClientError
+                raise _create_error_from_rc_code(rc)
+            self._op_manager.establish_operation(
+                mid, callback, self._get_resend(self.subscribe, topic=topic, qos=qos)
             )
-        logger.debug("_mqtt_client.subscribe returned rc={}".format(rc))
-        if rc:
-            # This could result in ConnectionDroppedError or ProtocolClientError
-            raise _create_error_from_rc_code(rc)
-        self._op_manager.establish_operation(mid, callback)
 
     def unsubscribe(self, topic, callback=None):
         """
@@ -496,19 +693,22 @@ class MQTTTransport(object):
         :raises: ProtocolClientError if there is some other client error.
         """
         logger.info("unsubscribing from {}".format(topic))
-        try:
-            (rc, mid) = self._mqtt_client.unsubscribe(topic)
-        except ValueError:
-            raise
-        except Exception as e:
-            raise exceptions.ProtocolClientError(
-                message="Unexpected Paho failure during unsubscribe", cause=e
+        with self._client_lock:
+            try:
+                rc, mid = self._mqtt_client.unsubscribe(topic)
+            except ValueError:
+                raise
+            except Exception as e:
+                raise exceptions.ProtocolClientError(
+                    message="Unexpected Paho failure during unsubscribe", cause=e
+                )
+            logger.debug("_mqtt_client.unsubscribe returned rc={}".format(rc))
+            if rc:
+                # This could result in ConnectionDroppedError or ProtocolClientError
+                raise _create_error_from_rc_code(rc)
+            self._op_manager.establish_operation(
+                mid, callback, self._get_resend(self.unsubscribe, topic=topic)
             )
-        logger.debug("_mqtt_client.unsubscribe returned rc={}".format(rc))
-        if rc:
-            # This could result in ConnectionDroppedError or ProtocolClientError
-            raise _create_error_from_rc_code(rc)
-        self._op_manager.establish_operation(mid, callback)
 
     def publish(self, topic, payload, qos=1, callback=None):
         """
@@ -529,21 +729,35 @@ class MQTTTransport(object):
         :raises: ProtocolClientError if there is some other client error.
         """
         logger.info("publishing on {}".format(topic))
-        try:
-            (rc, mid) = self._mqtt_client.publish(topic=topic, payload=payload, qos=qos)
-        except ValueError:
-            raise
-        except TypeError:
-            raise
-        except Exception as e:
-            raise exceptions.ProtocolClientError(
-                message="Unexpected Paho failure during publish", cause=e
+        with self._client_lock:
+            try:
+                rc, mid = self._mqtt_client.publish(topic=topic, payload=payload, qos=qos)
+            except ValueError:
+                raise
+            except TypeError:
+                raise
+            except Exception as e:
+                raise exceptions.ProtocolClientError(
+                    message="Unexpected Paho failure during publish", cause=e
+                )
+            logger.debug("_mqtt_client.publish returned rc={}".format(rc))
+            if rc:
+                # This could result in ConnectionDroppedError or ProtocolClientError
+                raise _create_error_from_rc_code(rc)
+            self._op_manager.establish_operation(
+                mid,
+                callback,
+                self._get_resend(self.publish, topic=topic, payload=payload, qos=qos),
             )
-        logger.debug("_mqtt_client.publish returned rc={}".format(rc))
-        if rc:
-            # This could result in ConnectionDroppedError or ProtocolClientError
-            raise _create_error_from_rc_code(rc)
-        self._op_manager.establish_operation(mid, callback)
+
+    def _get_resend(self, method, **kwargs):
+        """
+        Get a function which sends an operation again on a replacement connection, or None if
+        connections are not replaced.
+        """
+        if not self._make_before_break:
+            return None
+        return functools.partial(method, **kwargs)
 
 
 class OperationManager(object):
@@ -555,6 +769,10 @@ class OperationManager(object):
         # but the reponse has not yet been received
         self._pending_operation_callbacks = {}
 
+        # Maps mid->resend function for the pending operations which can be sent again, in the
+        # order they were established
+        self._pending_operation_resends = collections.OrderedDict()
+
         # Maps mid->mid for responses received that are NOT established in the _pending_operation_callbacks dict.
         # Necessary because sometimes an operation will complete with a response before the
         # Paho call returns.
@@ -563,10 +781,13 @@ class OperationManager(object):
 
         self._lock = threading.Lock()
 
-    def establish_operation(self, mid, callback=None):
+    def establish_operation(self, mid, callback=None, resend=None):
         """Establish a pending operation identified by MID, and store its completion callback.
 
         If the operation has already been completed, the callback will be triggered.
+
+        :param resend: A function which sends the operation again on another connection, called
+            with the callback as its only argument (Optional).
         """
         trigger_callback = False
 
@@ -584,6 +805,8 @@ class OperationManager(object):
             else:
                 # Store the operation as pending, along with callback
                 self._pending_operation_callbacks[mid] = callback
+                if resend:
+                    self._pending_operation_resends[mid] = resend
                 logger.debug("Waiting for response on MID: {}".format(mid))
 
         # Now that the lock has been released, if the callback should be triggered,
@@ -617,6 +840,7 @@ class OperationManager(object):
                 # Retrieve the callback, and clear the pending operation now that it has been completed
                 callback = self._pending_operation_callbacks[mid]
                 del self._pending_operation_callbacks[mid]
+                self._pending_operation_resends.pop(mid, None)
 
                 # Since the operation is complete, indicate the callback should be triggered
                 trigger_callback = True
@@ -642,3 +866,18 @@ class OperationManager(object):
                     logger.error(traceback.format_exc())
             else:
                 logger.warning("No callback set for MID: {}".format(mid))
+
+    def take_pending_operations(self):
+        """Stop tracking all pending operations which can be sent again, so that they can be sent
+        on another connection.
+
+        :returns: A list of (resend, callback) tuples, in the order the operations were
+            established.
+        """
+        with self._lock:
+            pending = [
+                (resend, self._pending_operation_callbacks.pop(mid))
+                for mid, resend in self._pending_operation_resends.items()
+            ]
+            self._pending_operation_resends.clear()
+        return pending
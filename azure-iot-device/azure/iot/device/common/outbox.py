@@ -0,0 +1,405 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import collections
+import logging
+import mmap
+import os
+import struct
+import zlib
+import six
+
+logger = logging.getLogger(__name__)
+
+"""
+This module contains a disk-backed outbox, which the pipeline uses to hold on to MQTT publishes
+while it is not connected, so that they can be sent once a connection is made.
+
+The outbox is an append-only log of records split across a number of segment files.  Each
+record holds the topic and the payload of one publish.  New records are always appended to the
+last segment, and a new segment is started once the last one reaches its size limit.  Records
+are read back through a memory map of the segment that contains them, so reading does not copy
+whole segments into process memory.
+
+Records are removed by acknowledging them.  The oldest record which has not been acknowledged
+is the "committed position".  Once every record in a segment has been acknowledged, the segment
+file is deleted.  The committed position is saved in a checkpoint file whenever a segment is
+deleted and whenever the outbox becomes empty, so records are kept across restarts of the
+process.  If the process exits between checkpoints, the records acknowledged since the last
+checkpoint are read again the next time the outbox is opened.
+
+The outbox is not thread-safe.  The pipeline only uses it from the pipeline thread.
+"""
+
+# Action taken when a new record would put the outbox over its size limit
+DROP_OLDEST = "drop_oldest"
+REJECT_NEW = "reject_new"
+EVICTION_POLICIES = (DROP_OLDEST, REJECT_NEW)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE_NAME = "checkpoint"
+
+# Each record is a header followed by the topic and the payload.  The header holds the length
+# of the topic, the length of the payload, and a CRC32 of both, which is used to find the end
+# of the valid records if the process exited in the middle of writing one.
+RECORD_HEADER = struct.Struct(">III")
+
+OutboxRecord = collections.namedtuple(
+    "OutboxRecord", ["position", "next_position", "topic", "payload"]
+)
+
+
+class OutboxFullError(Exception):
+    """A record could not be added because the outbox has reached its size limit"""
+
+    pass
+
+
+class Outbox(object):
+    """
+    An append-only, disk-backed log of (topic, payload) records.
+
+    Positions in the outbox are (segment number, offset) tuples.  Positions compare in the order
+    that their records were appended.
+
+    :ivar str directory: The directory that the segment files are stored in.
+    :ivar int max_bytes: The maximum number of bytes the segment files can use, or None for no
+        limit.
+    :ivar str eviction_policy: What to do when a new record would go over max_bytes.  DROP_OLDEST
+        deletes the oldest segments to make room.  REJECT_NEW raises OutboxFullError.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=DEFAULT_MAX_BYTES,
+        eviction_policy=DROP_OLDEST,
+        segment_bytes=DEFAULT_SEGMENT_BYTES,
+    ):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError("Invalid eviction policy '{}'".format(eviction_policy))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+        if max_bytes:
+            # Evicting one segment should never throw away most of the outbox
+            segment_bytes = max(min(segment_bytes, max_bytes // 4), 1)
+        self.segment_bytes = segment_bytes
+
+        # Segment numbers in the order they were created, and the size of each one
+        self._segments = []
+        self._segment_sizes = {}
+        self._active_file = None
+        self._maps = {}
+        self._committed = None
+        # Records that have been acknowledged while older records are still outstanding.
+        # Maps the position of each record to the position of the record after it.
+        self._acked = {}
+
+        self._open()
+
+    @property
+    def committed_position(self):
+        """
+        The position of the oldest record which has not been acknowledged
+        """
+        return self._committed
+
+    @property
+    def end_position(self):
+        """
+        The position that the next record will be appended at
+        """
+        last = self._segments[-1]
+        return (last, self._segment_sizes[last])
+
+    @property
+    def is_empty(self):
+        """
+        True if every record in the outbox has been acknowledged
+        """
+        return self._committed == self.end_position
+
+    @property
+    def size_bytes(self):
+        """
+        The number of bytes currently used by the segment files
+        """
+        return sum(self._segment_sizes.values())
+
+    def append(self, topic, payload):
+        """
+        Add a record to the end of the outbox.
+
+        :param str topic: The topic of the publish
+        :param payload: The payload of the publish
+        :type payload: str or bytes
+        :returns: The position of the new record
+        :raises: OutboxFullError if there is no room for the record
+        """
+        topic = _to_bytes(topic)
+        payload = _to_bytes(payload)
+        body = topic + payload
+        record = RECORD_HEADER.pack(len(topic), len(payload), zlib.crc32(body) & 0xFFFFFFFF) + body
+
+        if self.max_bytes:
+            if len(record) > self.max_bytes:
+                raise OutboxFullError("Record is larger than the outbox")
+            while self.size_bytes + len(record) > self.max_bytes:
+                if self.eviction_policy == REJECT_NEW:
+                    raise OutboxFullError("Outbox is full")
+                if len(self._segments) == 1:
+                    # Start a new segment so that the current one can be evicted
+                    self._roll()
+                else:
+                    self._evict_oldest_segment()
+
+        last = self._segments[-1]
+        if (
+            self._segment_sizes[last]
+            and self._segment_sizes[last] + len(record) > self.segment_bytes
+        ):
+            self._roll()
+            last = self._segments[-1]
+
+        position = (last, self._segment_sizes[last])
+        active_file = self._get_active_file()
+        active_file.write(record)
+        active_file.flush()
+        self._segment_sizes[last] += len(record)
+        return position
+
+    def read(self, position):
+        """
+        Read the record at the given position.  Positions of records that have been evicted are
+        moved forward to the oldest record still in the outbox.
+
+        :param tuple position: The position to read from.
+        :returns: The OutboxRecord at that position, or None if there are no records at or after
+            that position.
+        """
+        if position < self._committed:
+            position = self._committed
+        seq, offset = self._normalize(position)
+        if (seq, offset) == self.end_position:
+            return None
+
+        record_map = self._get_map(seq)
+        topic_length, payload_length, _ = RECORD_HEADER.unpack_from(record_map, offset)
+        start = offset + RECORD_HEADER.size
+        topic = record_map[start : start + topic_length]
+        payload = record_map[start + topic_length : start + topic_length + payload_length]
+        return OutboxRecord(
+            position=(seq, offset),
+            next_position=(seq, start + topic_length + payload_length),
+            topic=topic.decode("utf-8"),
+            payload=payload,
+        )
+
+    def ack(self, record):
+        """
+        Acknowledge a record, so that it can be removed from the outbox.  Records can be
+        acknowledged in any order, but the space used by a record is only released once every
+        record before it has also been acknowledged.
+
+        :param record: The OutboxRecord returned by read()
+        """
+        if record.position < self._committed:
+            # Already acknowledged, or evicted since it was read
+            return
+        self._acked[record.position] = record.next_position
+        while self._committed in self._acked:
+            self._committed = self._normalize(self._acked.pop(self._committed))
+            self._delete_consumed_segments()
+        if self.is_empty:
+            self._write_checkpoint()
+
+    def close(self):
+        """
+        Close all the files used by the outbox and save the committed position.
+        """
+        self._write_checkpoint()
+        self._close_files()
+
+    def _open(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        for name in os.listdir(self.directory):
+            seq = name[: -len(SEGMENT_SUFFIX)]
+            if name.endswith(SEGMENT_SUFFIX) and seq.isdigit():
+                self._segments.append(int(seq))
+        self._segments.sort()
+        for seq in self._segments:
+            self._segment_sizes[seq] = os.path.getsize(self._get_segment_path(seq))
+
+        if self._segments:
+            self._truncate_torn_record(self._segments[-1])
+        else:
+            self._create_segment(0)
+
+        checkpoint = self._read_checkpoint()
+        if checkpoint and checkpoint >= (self._segments[0], 0):
+            self._committed = min(checkpoint, self.end_position)
+        else:
+            self._committed = (self._segments[0], 0)
+        self._committed = self._normalize(self._committed)
+        self._delete_consumed_segments()
+
+        if not self.is_empty:
+            logger.info(
+                "Opened outbox in {} with {} bytes of unsent records".format(
+                    self.directory, self.size_bytes
+                )
+            )
+
+    def _truncate_torn_record(self, seq):
+        """
+        Cut off any partially written record at the end of a segment
+        """
+        size = self._segment_sizes[seq]
+        if not size:
+            return
+        record_map = self._get_map(seq)
+        offset = 0
+        while offset + RECORD_HEADER.size <= size:
+            topic_length, payload_length, crc = RECORD_HEADER.unpack_from(record_map, offset)
+            start = offset + RECORD_HEADER.size
+            end = start + topic_length + payload_length
+            if end > size or zlib.crc32(record_map[start:end]) & 0xFFFFFFFF != crc:
+                break
+            offset = end
+
+        if offset != size:
+            logger.warning(
+                "Discarding {} bytes of incomplete record at the end of outbox segment {}".format(
+                    size - offset, seq
+                )
+            )
+            self._close_map(seq)
+            with open(self._get_segment_path(seq), "r+b") as f:
+                f.truncate(offset)
+            self._segment_sizes[seq] = offset
+
+    def _normalize(self, position):
+        """
+        Move a position that is at the end of a segment to the start of the next segment
+        """
+        seq, offset = position
+        while seq != self._segments[-1] and offset >= self._segment_sizes[seq]:
+            seq = self._segments[self._segments.index(seq) + 1]
+            offset = 0
+        return (seq, offset)
+
+    def _roll(self):
+        self._create_segment(self._segments[-1] + 1)
+        self._committed = self._normalize(self._committed)
+        self._delete_consumed_segments()
+
+    def _create_segment(self, seq):
+        if self._active_file:
+            self._active_file.close()
+        self._active_file = open(self._get_segment_path(seq), "ab")
+        self._segments.append(seq)
+        self._segment_sizes[seq] = 0
+
+    def _get_active_file(self):
+        if not self._active_file:
+            self._active_file = open(self._get_segment_path(self._segments[-1]), "ab")
+        return self._active_file
+
+    def _delete_consumed_segments(self):
+        deleted = False
+        while self._segments[0] < self._committed[0]:
+            self._delete_segment(self._segments[0])
+            deleted = True
+        if deleted:
+            self._write_checkpoint()
+
+    def _evict_oldest_segment(self):
+        seq = self._segments[0]
+        logger.warning(
+            "Outbox is full.  Dropping {} bytes of the oldest unsent records".format(
+                self._segment_sizes[seq]
+            )
+        )
+        self._delete_segment(seq)
+        if self._committed[0] == seq:
+            self._committed = (self._segments[0], 0)
+            self._acked = dict(
+                (position, next_position)
+                for position, next_position in self._acked.items()
+                if position >= self._committed
+            )
+        self._write_checkpoint()
+
+    def _delete_segment(self, seq):
+        self._close_map(seq)
+        os.remove(self._get_segment_path(seq))
+        self._segments.remove(seq)
+        del self._segment_sizes[seq]
+
+    def _get_map(self, seq):
+        # The map of the last segment needs to be recreated once records are appended past its end
+        record_map = self._maps.get(seq)
+        if record_map is None or len(record_map) < self._segment_sizes[seq]:
+            self._close_map(seq)
+            with open(self._get_segment_path(seq), "rb") as f:
+                record_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[seq] = record_map
+        return record_map
+
+    def _close_map(self, seq):
+        record_map = self._maps.pop(seq, None)
+        if record_map is not None:
+            record_map.close()
+
+    def _close_files(self):
+        for seq in list(self._maps):
+            self._close_map(seq)
+        if self._active_file:
+            self._active_file.close()
+            self._active_file = None
+
+    def _read_checkpoint(self):
+        try:
+            with open(self._get_checkpoint_path(), "r") as f:
+                seq, offset = f.read().split()
+                return (int(seq), int(offset))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_checkpoint(self):
+        path = self._get_checkpoint_path()
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write("{} {}\n".format(*self._committed))
+        if hasattr(os, "replace"):
+            os.replace(temp_path, path)
+        else:
+            # Python 2.7
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+
+    def _get_segment_path(self, seq):
+        return os.path.join(self.directory, "{:016d}{}".format(seq, SEGMENT_SUFFIX))
+
+    def _get_checkpoint_path(self):
+        return os.path.join(self.directory, CHECKPOINT_FILE_NAME)
+
+
+def _to_bytes(value):
+    if value is None:
+        return b""
+    if isinstance(value, six.text_type):
+        return value.encode("utf-8")
+    if isinstance(value, (six.integer_types, float)):
+        # Sent as text, the same way the MQTT client sends numeric payloads
+        return str(value).encode("utf-8")
+    return bytes(value)
@@ -7,6 +7,7 @@
 import logging
 import six
 import abc
+from azure.iot.device.common import serializers
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +19,17 @@ class BasePipelineConfig(object):
     config files.
     """
 
-    def __init__(self, websockets=False, cipher="", proxy_options=None):
+    def __init__(
+        self,
+        websockets=False,
+        cipher="",
+        proxy_options=None,
+        max_in_flight_publishes=None,
+        max_queued_publish_bytes=None,
+        shared_network_loop=False,
+        json_serializer=serializers.JSON,
+        make_before_break_reauthorization=False,
+    ):
         """Initializer for BasePipelineConfig
 
         :param bool websockets: Enabling/disabling websockets in MQTT. This feature is relevant
@@ -26,10 +37,33 @@ class BasePipelineConfig(object):
         :param cipher: Optional cipher suite(s) for TLS/SSL, as a string in
             "OpenSSL cipher list format" or as a list of cipher suite strings.
         :type cipher: str or list(str)
+        :param int max_in_flight_publishes: The maximum number of MQTT publishes that can be
+            waiting for an acknowledgement from the service at one time.  Any more publishes are
+            held in the pipeline until earlier ones are acknowledged.  None means no limit.
+        :param int max_queued_publish_bytes: The maximum number of payload bytes that can be
+            waiting to be sent or acknowledged at one time.  Publishes that would go over this
+            limit fail instead of being queued.  None means no limit.
+        :param bool shared_network_loop: Drive the MQTT connection from a network loop that is
+            shared by every client in the process, instead of from a network thread of its own.
+        :param str json_serializer: The name of the serializer to use for JSON documents such as
+            twins and method payloads: "json" (the default), "orjson", "ujson", or "auto" for the
+            fastest of these that is installed.
+        :param bool make_before_break_reauthorization: Reauthorize the connection by opening a new
+            connection with the new credentials before closing the current one, instead of
+            reconnecting.  Operations are not held while the new connection is opened.
         """
         self.websockets = websockets
         self.cipher = self._sanitize_cipher(cipher)
         self.proxy_options = proxy_options
+        self.max_in_flight_publishes = self._sanitize_limit(
+            "max_in_flight_publishes", max_in_flight_publishes
+        )
+        self.max_queued_publish_bytes = self._sanitize_limit(
+            "max_queued_publish_bytes", max_queued_publish_bytes
+        )
+        self.shared_network_loop = shared_network_loop
+        self.json_serializer = self._sanitize_json_serializer(json_serializer)
+        self.make_before_break_reauthorization = make_before_break_reauthorization
 
     @staticmethod
     def _sanitize_cipher(cipher):
@@ -45,3 +79,24 @@ class BasePipelineConfig(object):
             raise TypeError("Invalid type for 'cipher'")
 
         return cipher
+
+    @staticmethod
+    def _sanitize_json_serializer(name):
+        """Look up a JSON serializer by name
+        """
+        serializer = serializers.get_serializer(name)
+        if not serializer.is_json:
+            raise ValueError("'{}' is not a JSON serializer".format(name))
+        return serializer
+
+    @staticmethod
+    def _sanitize_limit(name, limit):
+        """Validate a limit which is either None (no limit) or a positive integer
+        """
+        if limit is None:
+            return None
+        if isinstance(limit, bool) or not isinstance(limit, six.integer_types):
+            raise TypeError("Invalid type for '{}'".format(name))
+        if limit < 1:
+            raise ValueError("'{}' must be greater than 0".format(name))
+        return limit
@@ -79,3 +79,20 @@ class DisconnectedEvent(PipelineEvent):
     """
 
     pass
+
+
+class BackpressureChangedEvent(PipelineEvent):
+    """
+    A PipelineEvent object indicating that the transport has started or stopped applying
+    backpressure to outgoing publishes.  While backpressure is being applied, new publishes
+    are held in the pipeline (or rejected) instead of being sent, so callers should wait
+    before submitting more.
+
+    :ivar backpressure: True if the transport has started applying backpressure, False if
+      it has stopped.
+    :type backpressure: bool
+    """
+
+    def __init__(self, backpressure):
+        super(BackpressureChangedEvent, self).__init__()
+        self.backpressure = backpressure
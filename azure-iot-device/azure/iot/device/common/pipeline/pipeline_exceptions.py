@@ -38,3 +38,9 @@ class PipelineError(PipelineException):
     """Error caused by incorrect pipeline configuration"""
 
     pass
+
+
+class PublishQueueFullError(PipelineException):
+    """Publish was rejected because too much data is already waiting to be sent"""
+
+    pass
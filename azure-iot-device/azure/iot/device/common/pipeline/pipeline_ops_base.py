@@ -339,6 +339,32 @@ class UpdateSasTokenOperation(PipelineOperation):
         self.sas_token = sas_token
 
 
+class RefreshConnectionArgsOperation(PipelineOperation):
+    """
+    A PipelineOperation object which asks the stage that provides the connection args (such as the
+    server verification certificate) to get them again, because connecting with them failed.  If
+    the stage is able to get new connection args, it sends them down the pipeline and sets the
+    'refreshed' attribute before completing this operation.
+
+    This operation is sent down from the root of the pipeline by the stage which watches
+    connections, since the connection args are usually provided by a stage above it.
+
+    This operation is in the group of base operations because many different clients connect with
+    connection args that might go out of date.
+    """
+
+    def __init__(self, callback):
+        """
+        Initializer for RefreshConnectionArgsOperation objects.
+
+        :param Function callback: The function that gets called when this operation is complete or has
+            failed.  The callback function must accept A PipelineOperation object which indicates
+            the specific operation which has completed or failed.
+        """
+        super(RefreshConnectionArgsOperation, self).__init__(callback=callback)
+        self.refreshed = False
+
+
 class RequestAndResponseOperation(PipelineOperation):
     """
     A PipelineOperation object which wraps the common operation of sending a request to iothub with a request_id ($rid)
@@ -54,7 +54,7 @@ class MQTTPublishOperation(PipelineOperation):
     This operation is in the group of MQTT operations because its attributes are very specific to the MQTT protocol.
     """
 
-    def __init__(self, topic, payload, callback):
+    def __init__(self, topic, payload, callback, qos=1, storable=False):
         """
         Initializer for MQTTPublishOperation objects.
 
@@ -63,10 +63,51 @@ class MQTTPublishOperation(PipelineOperation):
         :param Function callback: The function that gets called when this operation is complete or has failed.
           The callback function must accept A PipelineOperation object which indicates the specific operation which
           has completed or failed.
+        :param int qos: The MQTT QoS level to publish at.  A QoS 1 publish completes when it is acknowledged.  A QoS 0
+          publish completes as soon as it has been written to the socket.
+        :param bool storable: True if the publish is telemetry which can be stored while the pipeline is not connected
+          and sent later.  Publishes which are part of a request/response exchange (such as method responses and twin
+          requests) must not be stored, since their responses would be stale by the time they were sent.
         """
         super(MQTTPublishOperation, self).__init__(callback=callback)
         self.topic = topic
         self.payload = payload
+        self.qos = qos
+        self.storable = storable
+        self.needs_connection = True
+        self.retry_timer = None
+
+
+class MQTTPublishBatchOperation(PipelineOperation):
+    """
+    A PipelineOperation object which contains arguments used to publish a batch of payloads, each on its own topic,
+    using the MQTT protocol.  The batch travels the pipeline as a single operation and is only fanned out into
+    individual publishes by the transport stage.
+
+    This operation is in the group of MQTT operations because its attributes are very specific to the MQTT protocol.
+
+    :ivar results: Upon completion, this contains one entry for every item in publishes, in the same order.  Each
+        entry is None if the publish was acknowledged, or the Exception that caused that publish to fail.
+    :type results: list
+    """
+
+    def __init__(self, publishes, callback, qos=1, storable=False):
+        """
+        Initializer for MQTTPublishBatchOperation objects.
+
+        :param list publishes: A list of (topic, payload) tuples to publish
+        :param Function callback: The function that gets called when this operation is complete or has failed.
+          The callback function must accept A PipelineOperation object which indicates the specific operation which
+          has completed or failed.
+        :param int qos: The MQTT QoS level to publish every item in the batch at.
+        :param bool storable: True if the batch is telemetry which can be stored while the pipeline is not connected
+          and sent later.
+        """
+        super(MQTTPublishBatchOperation, self).__init__(callback=callback)
+        self.publishes = publishes
+        self.qos = qos
+        self.storable = storable
+        self.results = None
         self.needs_connection = True
         self.retry_timer = None
 
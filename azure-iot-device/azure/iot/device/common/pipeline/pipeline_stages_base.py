@@ -13,12 +13,11 @@ import traceback
 import uuid
 import weakref
 from six.moves import queue
-import threading
 from . import pipeline_events_base
 from . import pipeline_ops_base, pipeline_ops_mqtt
 from . import pipeline_thread
 from . import pipeline_exceptions
-from azure.iot.device.common import handle_exceptions, transport_exceptions
+from azure.iot.device.common import handle_exceptions, transport_exceptions, timer_wheel, outbox
 from azure.iot.device.common.callable_weak_method import CallableWeakMethod
 
 logger = logging.getLogger(__name__)
@@ -72,8 +71,19 @@ class PipelineStage(object):
       submit an operation to the pipeline starting at the root.  This type of behavior is uncommon but not
       unexpected.
     :type pipeline_root: PipelineStage
+    :cvar handled_op_types: Tuple of the PipelineOperation types that this stage acts on, or None
+      if this stage needs to see every operation.  Operations of any other type skip this stage
+      and are passed directly to the next stage that acts on them.
+    :type handled_op_types: tuple
+    :cvar handled_event_types: Tuple of the PipelineEvent types that this stage acts on, or None
+      if this stage needs to see every event.  Events of any other type skip this stage and are
+      passed directly to the previous stage that acts on them.
+    :type handled_event_types: tuple
     """
 
+    handled_op_types = None
+    handled_event_types = None
+
     def __init__(self):
         """
         Initializer for PipelineStage objects.
@@ -82,6 +92,7 @@ class PipelineStage(object):
         self.next = None
         self.previous = None
         self.pipeline_root = None
+        self._clear_routes()
 
     @pipeline_thread.runs_on_pipeline_thread
     def run_op(self, op):
@@ -168,7 +179,7 @@ class PipelineStage(object):
             )
             op.complete(error=error)
         else:
-            self.next.run_op(op)
+            self._get_op_route(type(op)).run_op(op)
 
     @pipeline_thread.runs_on_pipeline_thread
     def send_event_up(self, event):
@@ -178,7 +189,7 @@ class PipelineStage(object):
         bottom) and move up the pipeline until they're handled or until they error out.
         """
         if self.previous:
-            self.previous.handle_pipeline_event(event)
+            self._get_event_route(type(event)).handle_pipeline_event(event)
         else:
             logger.error("{}({}): Error: unhandled event".format(self.name, event.name))
             error = pipeline_exceptions.PipelineError(
@@ -186,6 +197,58 @@ class PipelineStage(object):
             )
             handle_exceptions.handle_background_exception(error)
 
+    def _clear_routes(self):
+        """
+        Forget the routes calculated by _get_op_route and _get_event_route.  This needs to be
+        called any time the stages after or before this stage change.
+        """
+        self._op_routes = {}
+        self._event_routes = {}
+        self._routes_next = self.next
+        self._routes_previous = self.previous
+
+    def _check_routes(self):
+        if self._routes_next is not self.next or self._routes_previous is not self.previous:
+            self._clear_routes()
+
+    def _get_op_route(self, op_type):
+        """
+        Return the stage that operations of the given type should be passed to when they are sent
+        down from this stage.  This is the first stage after this one which acts on op_type.  The
+        last stage in the pipeline always receives the operation, so operations that nobody
+        acts on still fail in the same way they would if they visited every stage.
+        """
+        self._check_routes()
+        try:
+            return self._op_routes[op_type]
+        except KeyError:
+            stage = self.next
+            while stage.next and not _stage_handles(stage.handled_op_types, op_type):
+                stage = stage.next
+            self._op_routes[op_type] = stage
+            return stage
+
+    def _get_event_route(self, event_type):
+        """
+        Return the stage that events of the given type should be passed to when they are sent
+        up from this stage.  This is the first stage before this one which acts on event_type.
+        The root of the pipeline always receives the event.
+        """
+        self._check_routes()
+        try:
+            return self._event_routes[event_type]
+        except KeyError:
+            stage = self.previous
+            while stage.previous and not _stage_handles(stage.handled_event_types, event_type):
+                stage = stage.previous
+            self._event_routes[event_type] = stage
+            return stage
+
+
+def _stage_handles(handled_types, object_type):
+    # Anything other than a tuple (such as None) means that the stage handles every type.
+    return not isinstance(handled_types, tuple) or issubclass(object_type, handled_types)
+
 
 class PipelineRootStage(PipelineStage):
     """
@@ -236,6 +299,13 @@ class PipelineRootStage(PipelineStage):
         old_tail.next = new_stage
         new_stage.previous = old_tail
         new_stage.pipeline_root = self
+
+        # The shape of the pipeline changed, so every stage needs to recalculate the stages that
+        # its operations and events get passed to.
+        stage = self
+        while stage:
+            stage._clear_routes()
+            stage = stage.next
         return self
 
     @pipeline_thread.runs_on_pipeline_thread
@@ -273,12 +343,176 @@ class PipelineRootStage(PipelineStage):
                 logger.warning("incoming pipeline event with no handler.  dropping.")
 
 
+class StoreAndForwardStage(PipelineStage):
+    """
+    This stage is responsible for holding on to MQTT publishes while the pipeline is not
+    connected, and sending them once it is.
+
+    If the pipeline configuration has an outbox_directory, publishes that arrive while the
+    pipeline is not connected are written to an outbox.Outbox in that directory and completed
+    right away, so they don't use any memory while they wait.  After a connection is made, the
+    stored publishes are replayed in the order they were stored, with at most
+    outbox_replay_concurrency of them in flight at once.  While anything is still waiting in the
+    outbox, new publishes are added to the end of it so that the order is kept.
+
+    Only publishes which are marked as storable (telemetry) are stored.  Other publishes, such as
+    method responses and twin requests, are part of a request/response exchange which would be
+    stale by the time they were replayed, so they are always sent down unchanged.  QoS 0
+    publishes are never stored either, since losing them is acceptable.
+
+    Without an outbox_directory, this stage sends everything down unchanged.
+    """
+
+    handled_op_types = (
+        pipeline_ops_mqtt.MQTTPublishOperation,
+        pipeline_ops_mqtt.MQTTPublishBatchOperation,
+    )
+    handled_event_types = (pipeline_events_base.ConnectedEvent,)
+
+    def __init__(self):
+        super(StoreAndForwardStage, self).__init__()
+        self.outbox = None
+        self.replay_concurrency = 1
+        self._outbox_configured = False
+        # Position of the next record to replay
+        self._replay_position = None
+        self._replay_in_flight = 0
+        self._replay_failed = False
+        # Set if the pipeline connects again before the publishes of a failed replay are done
+        self._replay_restart_needed = False
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _run_op(self, op):
+        if (
+            not op.storable
+            or not self._get_outbox()
+            or op.qos == 0
+            or (self.pipeline_root.connected and self.outbox.is_empty)
+        ):
+            self.send_op_down(op)
+
+        elif isinstance(op, pipeline_ops_mqtt.MQTTPublishOperation):
+            logger.debug("{}({}): Storing publish in outbox".format(self.name, op.name))
+            op.complete(error=self._store(op.topic, op.payload))
+            self._replay()
+
+        elif isinstance(op, pipeline_ops_mqtt.MQTTPublishBatchOperation):
+            logger.debug(
+                "{}({}): Storing {} publishes in outbox".format(
+                    self.name, op.name, len(op.publishes)
+                )
+            )
+            op.results = [self._store(topic, payload) for topic, payload in op.publishes]
+            op.complete()
+            self._replay()
+
+        else:
+            self.send_op_down(op)
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _handle_pipeline_event(self, event):
+        self.send_event_up(event)
+        if isinstance(event, pipeline_events_base.ConnectedEvent):
+            if self._replay_failed:
+                self._replay_restart_needed = True
+            elif self._get_outbox() and not self.outbox.is_empty:
+                logger.info("{}({}): Replaying stored publishes".format(self.name, event.name))
+                self._replay()
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _get_outbox(self):
+        """
+        Open the outbox the first time it is needed, if the pipeline is configured to use one
+        """
+        if not self._outbox_configured:
+            self._outbox_configured = True
+            config = self.pipeline_root.pipeline_configuration
+            if config.outbox_directory:
+                self.outbox = outbox.Outbox(
+                    directory=config.outbox_directory,
+                    max_bytes=config.outbox_max_bytes,
+                    eviction_policy=config.outbox_eviction_policy,
+                )
+                self.replay_concurrency = config.outbox_replay_concurrency
+                self._replay_position = self.outbox.committed_position
+        return self.outbox
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _store(self, topic, payload):
+        """
+        Add a publish to the outbox.  Returns the error to complete the publish with, if any.
+        """
+        try:
+            self.outbox.append(topic, payload)
+        except outbox.OutboxFullError as e:
+            logger.warning("{}: Outbox is full.  Rejecting publish".format(self.name))
+            return pipeline_exceptions.PublishQueueFullError("No room left in the outbox", cause=e)
+        return None
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _replay(self):
+        """
+        Send stored publishes down until the replay window is full or the outbox runs out.
+        Until the pipeline is connected, only one publish is sent, which connects the pipeline
+        the same way any other publish would.
+        """
+        if self._replay_failed:
+            return
+        if self.pipeline_root.connected:
+            limit = self.replay_concurrency
+        else:
+            limit = 1
+
+        while self._replay_in_flight < limit:
+            record = self.outbox.read(self._replay_position)
+            if not record:
+                break
+            self._replay_position = record.next_position
+            self._replay_in_flight += 1
+            self.send_op_down(
+                pipeline_ops_mqtt.MQTTPublishOperation(
+                    topic=record.topic,
+                    payload=record.payload,
+                    callback=self._make_on_replay_complete(record),
+                )
+            )
+
+    def _make_on_replay_complete(self, record):
+        @pipeline_thread.runs_on_pipeline_thread
+        def on_replay_complete(op, error):
+            self._replay_in_flight -= 1
+            if error:
+                logger.info(
+                    "{}({}): Replay of stored publish failed: {}.  Stopping replay.".format(
+                        self.name, op.name, error
+                    )
+                )
+                self._replay_failed = True
+            else:
+                self.outbox.ack(record)
+
+            if not self._replay_failed:
+                self._replay()
+            elif not self._replay_in_flight:
+                # Start again from the oldest publish that hasn't been sent the next time the
+                # pipeline connects, or the next time something is stored.
+                self._replay_position = self.outbox.committed_position
+                self._replay_failed = False
+                if self._replay_restart_needed:
+                    self._replay_restart_needed = False
+                    self._replay()
+
+        return on_replay_complete
+
+
 class AutoConnectStage(PipelineStage):
     """
     This stage is responsible for ensuring that the protocol is connected when
     it needs to be connected.
     """
 
+    handled_event_types = ()
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         # Any operation that requires a connection can trigger a connection if
@@ -335,19 +569,41 @@ class ConnectionLockStage(PipelineStage):
     time.  This way, we don't have to worry about cases like "what happens if we try to
     disconnect if we're in the middle of reauthorizing."  This stage will wait for the
     reauthorize to complete before letting the disconnect past.
+
+    If the pipeline is configured for make-before-break reauthorization, the current connection
+    stays open while the connection is reauthorized, so only connect, disconnect and reauthorize
+    ops wait for the reauthorize to complete.  All other ops are sent down.
     """
 
+    handled_event_types = ()
+
     def __init__(self):
         super(ConnectionLockStage, self).__init__()
         self.queue = queue.Queue()
         self.blocked = False
+        self.blocked_for_make_before_break = False
 
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
 
+        if self.blocked_for_make_before_break and not isinstance(
+            op,
+            (
+                pipeline_ops_base.ConnectOperation,
+                pipeline_ops_base.DisconnectOperation,
+                pipeline_ops_base.ReauthorizeConnectionOperation,
+            ),
+        ):
+            logger.debug(
+                "{}({}): reauthorizing without disconnecting.  Sending down.".format(
+                    self.name, op.name
+                )
+            )
+            self.send_op_down(op)
+
         # If this stage is currently blocked (because we're waiting for a connection, etc,
         # to complete), we queue up all operations until after the connect completes.
-        if self.blocked:
+        elif self.blocked:
             logger.info(
                 "{}({}): pipeline is blocked waiting for a prior connect/disconnect/reauthorize to complete.  queueing.".format(
                     self.name, op.name
@@ -405,6 +661,10 @@ class ConnectionLockStage(PipelineStage):
         """
         logger.debug("{}({}): blocking".format(self.name, op.name))
         self.blocked = True
+        self.blocked_for_make_before_break = (
+            isinstance(op, pipeline_ops_base.ReauthorizeConnectionOperation)
+            and self.pipeline_root.pipeline_configuration.make_before_break_reauthorization
+        )
 
     @pipeline_thread.runs_on_pipeline_thread
     def _unblock(self, op, error):
@@ -414,6 +674,7 @@ class ConnectionLockStage(PipelineStage):
         """
         logger.debug("{}({}): unblocking and releasing queued ops.".format(self.name, op.name))
         self.blocked = False
+        self.blocked_for_make_before_break = False
         logger.info(
             "{}({}): processing {} items in queue".format(self.name, op.name, self.queue.qsize())
         )
@@ -448,6 +709,9 @@ class CoordinateRequestAndResponseStage(PipelineStage):
     an ResponseEvent event.  All other events are passed down unmodified.
     """
 
+    handled_op_types = (pipeline_ops_base.RequestAndResponseOperation,)
+    handled_event_types = (pipeline_events_base.ResponseEvent,)
+
     def __init__(self):
         super(CoordinateRequestAndResponseStage, self).__init__()
         self.pending_responses = {}
@@ -583,6 +847,8 @@ class OpTimeoutStage(PipelineStage):
     redoing multiple MQTT operations).
     """
 
+    handled_event_types = ()
+
     def __init__(self):
         super(OpTimeoutStage, self).__init__()
         # use a fixed list and fixed intervals for now.  Later, this info will come in
@@ -592,6 +858,10 @@ class OpTimeoutStage(PipelineStage):
             pipeline_ops_mqtt.MQTTUnsubscribeOperation: 10,
         }
 
+    @property
+    def handled_op_types(self):
+        return tuple(self.timeout_intervals)
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         if type(op) in self.timeout_intervals:
@@ -610,7 +880,7 @@ class OpTimeoutStage(PipelineStage):
                 )
 
             logger.debug("{}({}): Creating timer".format(self.name, op.name))
-            op.timeout_timer = threading.Timer(self.timeout_intervals[type(op)], on_timeout)
+            op.timeout_timer = timer_wheel.Timer(self.timeout_intervals[type(op)], on_timeout)
             op.timeout_timer.start()
 
             # Send the op down, but intercept the return of the op so we can
@@ -640,6 +910,8 @@ class RetryStage(PipelineStage):
     considered "failed", so no cancellation needs to be done.
     """
 
+    handled_event_types = ()
+
     def __init__(self):
         super(RetryStage, self).__init__()
         # Retry intervals are hardcoded for now. Later, they come in as an
@@ -648,9 +920,14 @@ class RetryStage(PipelineStage):
             pipeline_ops_mqtt.MQTTSubscribeOperation: 20,
             pipeline_ops_mqtt.MQTTUnsubscribeOperation: 20,
             pipeline_ops_mqtt.MQTTPublishOperation: 20,
+            pipeline_ops_mqtt.MQTTPublishBatchOperation: 20,
         }
         self.ops_waiting_to_retry = []
 
+    @property
+    def handled_op_types(self):
+        return tuple(self.retry_intervals)
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         """
@@ -713,7 +990,7 @@ class RetryStage(PipelineStage):
             # if we don't keep track of this op, it might get collected.
             op.halt_completion()
             self.ops_waiting_to_retry.append(op)
-            op.retry_timer = threading.Timer(self.retry_intervals[type(op)], do_retry)
+            op.retry_timer = timer_wheel.Timer(self.retry_intervals[type(op)], do_retry)
             op.retry_timer.start()
 
         else:
@@ -751,6 +1028,9 @@ class ReconnectState(object):
 
 
 class ReconnectStage(PipelineStage):
+    handled_op_types = (pipeline_ops_base.ConnectOperation, pipeline_ops_base.DisconnectOperation)
+    handled_event_types = (pipeline_events_base.DisconnectedEvent,)
+
     def __init__(self):
         super(ReconnectStage, self).__init__()
         self.reconnect_timer = None
@@ -908,7 +1188,7 @@ class ReconnectStage(PipelineStage):
                     )
                 )
 
-        self.reconnect_timer = threading.Timer(self.reconnect_delay, on_reconnect_timer_expired)
+        self.reconnect_timer = timer_wheel.Timer(self.reconnect_delay, on_reconnect_timer_expired)
         self.reconnect_timer.start()
 
     @pipeline_thread.runs_on_pipeline_thread
@@ -946,3 +1226,72 @@ class ReconnectStage(PipelineStage):
         self.waiting_connect_ops = []
         for op in list_copy:
             op.complete(error)
+
+
+class RefreshConnectionArgsStage(PipelineStage):
+    """
+    This stage watches every ConnectOperation that is sent to the transport.  If one fails
+    because the connection could not be established or the server could not be verified, this
+    stage sends a RefreshConnectionArgsOperation down from the root of the pipeline.  If the connection
+    args are refreshed, the ConnectOperation is sent down again.  Otherwise, it completes with
+    its original error.
+
+    A ConnectOperation is only sent down again once.  The stage that provides the connection args
+    decides whether they can be refreshed, and should only refresh them when that might help
+    (for example, when a certificate was loaded from disk and might be out of date).
+
+    This stage needs to be after ReconnectStage, which creates the ConnectOperation for every
+    connection attempt, and before ConnectionLockStage, so that the connection args can be sent
+    down while the ConnectOperation is waiting for them.
+    """
+
+    handled_op_types = (pipeline_ops_base.ConnectOperation,)
+    handled_event_types = ()
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _run_op(self, op):
+        op.add_callback(self._on_connect_complete)
+        self.send_op_down(op)
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _on_connect_complete(self, op, error):
+        if not isinstance(
+            error,
+            (transport_exceptions.ConnectionFailedError, transport_exceptions.TlsExchangeAuthError),
+        ):
+            return
+
+        op.halt_completion()
+        connect_op = op
+        connect_error = error
+
+        @pipeline_thread.runs_on_pipeline_thread
+        def on_refresh_complete(op, error):
+            if error:
+                logger.warning(
+                    "{}({}): Unable to refresh connection args: {}".format(
+                        self.name, connect_op.name, error
+                    )
+                )
+                connect_op.complete(error=connect_error)
+            elif op.refreshed:
+                logger.info(
+                    "{}({}): Connecting again with refreshed connection args".format(
+                        self.name, connect_op.name
+                    )
+                )
+                # The callback that got us here has been removed, so this is only done once
+                self.send_op_down(connect_op)
+            else:
+                connect_op.complete(error=connect_error)
+
+        logger.info(
+            "{}({}): Connection failed with {}.  Refreshing connection args".format(
+                self.name, op.name, error
+            )
+        )
+        # This is sent down from the root rather than run on it, since the root would complete it
+        # on the callback thread.
+        self.pipeline_root.send_op_down(
+            pipeline_ops_base.RefreshConnectionArgsOperation(callback=on_refresh_complete)
+        )
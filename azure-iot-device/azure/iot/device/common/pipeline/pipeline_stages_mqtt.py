@@ -4,9 +4,11 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import functools
 import logging
 import six
-import traceback
+import time
+from collections import deque
 from . import (
     pipeline_ops_base,
     PipelineStage,
@@ -28,6 +30,21 @@ class MQTTTransportStage(PipelineStage):
     PipelineStage object which is responsible for interfacing with the MQTT protocol wrapper object.
     This stage handles all MQTT operations and any other operations (such as ConnectOperation) which
     is not in the MQTT group of operations, but can only be run at the protocol level.
+
+    This stage also limits the number of publishes waiting for a PUBACK (the "publish window") and
+    the number of payload bytes waiting to be sent or acknowledged, as set in the pipeline
+    configuration.  Publishes that don't fit in the window are held in this stage until earlier
+    publishes are acknowledged.  Publishes that would go over the byte limit fail with
+    PublishQueueFullError.  A BackpressureChangedEvent is sent up the pipeline when the window fills
+    up or the byte limit is reached, and again when there is room for more publishes.
+
+    Publishes are sent at the QoS level of their operation.  A QoS 1 publish is complete once
+    its PUBACK is received.  A QoS 0 publish is complete as soon as the transport has written it
+    to the socket, since the service never acknowledges it.  Delivery and latency statistics are
+    kept separately for each QoS level in publish_stats.
+
+    :ivar publish_stats: PublishStats for the publishes sent by this stage, keyed by QoS level.
+    :type publish_stats: dict
     """
 
     def __init__(self):
@@ -41,6 +58,20 @@ class MQTTTransportStage(PipelineStage):
 
         self._pending_connection_op = None
 
+        # Publish limits will be set when Connection Args are received.  None means no limit.
+        self.max_in_flight_publishes = None
+        self.max_queued_publish_bytes = None
+
+        # Publishes which have been given to the transport and have not been acknowledged
+        self._in_flight_publish_count = 0
+        # Payload bytes of all publishes which are either in flight or held in _held_publishes
+        self._queued_publish_bytes = 0
+        self.publish_stats = {0: PublishStats(), 1: PublishStats()}
+
+        # Publishes waiting for room in the publish window
+        self._held_publishes = deque()
+        self._backpressure = False
+
     @pipeline_thread.runs_on_pipeline_thread
     def _cancel_pending_connection_op(self):
         """
@@ -59,6 +90,33 @@ class MQTTTransportStage(PipelineStage):
             op.complete(error=error)
             self._pending_connection_op = None
 
+    @pipeline_thread.runs_on_pipeline_thread
+    def _start_connection_op(self, op, transport_function_name, **kwargs):
+        """
+        Make op the pending connection operation, and start it by calling the named function of
+        the MQTTTransport.  The operation is completed by the transport's connection handlers, or
+        with the error raised by the transport function.
+
+        Connecting blocks for the DNS lookup and the TCP and TLS handshakes, so the transport
+        function is called with invoke_blocking_call, which keeps it off the event loop when the
+        pipeline is running on one.
+        """
+        self._cancel_pending_connection_op()
+        self._pending_connection_op = op
+        transport_function = getattr(self.transport, transport_function_name)
+
+        @pipeline_thread.runs_on_pipeline_thread
+        def on_error(e):
+            logger.error("transport.{} raised error".format(transport_function_name), exc_info=e)
+            if self._pending_connection_op is op:
+                self._pending_connection_op = None
+            if not op.completed:
+                op.complete(error=e)
+
+        pipeline_thread.invoke_blocking_call(
+            functools.partial(transport_function, **kwargs), on_error
+        )
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         if isinstance(op, pipeline_ops_mqtt.SetMQTTConnectionArgsOperation):
@@ -66,6 +124,12 @@ class MQTTTransportStage(PipelineStage):
             # all of its properties.
             logger.debug("{}({}): got connection args".format(self.name, op.name))
             self.sas_token = op.sas_token
+            self.max_in_flight_publishes = (
+                self.pipeline_root.pipeline_configuration.max_in_flight_publishes
+            )
+            self.max_queued_publish_bytes = (
+                self.pipeline_root.pipeline_configuration.max_queued_publish_bytes
+            )
             self.transport = MQTTTransport(
                 client_id=op.client_id,
                 hostname=op.hostname,
@@ -75,6 +139,10 @@ class MQTTTransportStage(PipelineStage):
                 websockets=self.pipeline_root.pipeline_configuration.websockets,
                 cipher=self.pipeline_root.pipeline_configuration.cipher,
                 proxy_options=self.pipeline_root.pipeline_configuration.proxy_options,
+                shared_network_loop=self.pipeline_root.pipeline_configuration.shared_network_loop,
+                make_before_break=(
+                    self.pipeline_root.pipeline_configuration.make_before_break_reauthorization
+                ),
             )
             self.transport.on_mqtt_connected_handler = CallableWeakMethod(
                 self, "_on_mqtt_connected"
@@ -110,53 +178,39 @@ class MQTTTransportStage(PipelineStage):
 
         elif isinstance(op, pipeline_ops_base.ConnectOperation):
             logger.info("{}({}): connecting".format(self.name, op.name))
-
-            self._cancel_pending_connection_op()
-            self._pending_connection_op = op
-            try:
-                self.transport.connect(password=self.sas_token)
-            except Exception as e:
-                logger.error("transport.connect raised error")
-                logger.error(traceback.format_exc())
-                self._pending_connection_op = None
-                op.complete(error=e)
+            self._start_connection_op(op, "connect", password=self.sas_token)
 
         elif isinstance(op, pipeline_ops_base.ReauthorizeConnectionOperation):
             logger.info("{}({}): reauthorizing".format(self.name, op.name))
-
-            # We set _active_connect_op here because reauthorizing the connection is the same as a connect for "active operation" tracking purposes.
-            self._cancel_pending_connection_op()
-            self._pending_connection_op = op
-            try:
-                self.transport.reauthorize_connection(password=self.sas_token)
-            except Exception as e:
-                logger.error("transport.reauthorize_connection raised error")
-                logger.error(traceback.format_exc())
-                self._pending_connection_op = None
-                op.complete(error=e)
+            # Reauthorizing the connection is the same as a connect for "pending operation" tracking purposes.
+            self._start_connection_op(op, "reauthorize_connection", password=self.sas_token)
 
         elif isinstance(op, pipeline_ops_base.DisconnectOperation):
             logger.info("{}({}): disconnecting".format(self.name, op.name))
-
-            self._cancel_pending_connection_op()
-            self._pending_connection_op = op
-            try:
-                self.transport.disconnect()
-            except Exception as e:
-                logger.error("transport.disconnect raised error")
-                logger.error(traceback.format_exc())
-                self._pending_connection_op = None
-                op.complete(error=e)
+            self._start_connection_op(op, "disconnect")
 
         elif isinstance(op, pipeline_ops_mqtt.MQTTPublishOperation):
             logger.info("{}({}): publishing on {}".format(self.name, op.name, op.topic))
 
-            @pipeline_thread.invoke_on_pipeline_thread_nowait
-            def on_published():
-                logger.debug("{}({}): PUBACK received. completing op.".format(self.name, op.name))
-                op.complete()
+            @pipeline_thread.runs_on_pipeline_thread
+            def on_published(error=None):
+                if error:
+                    logger.error("{}({}): publish failed: {}".format(self.name, op.name, error))
+                else:
+                    logger.debug(
+                        "{}({}): publish complete. completing op.".format(self.name, op.name)
+                    )
+                op.complete(error=error)
 
-            self.transport.publish(topic=op.topic, payload=op.payload, callback=on_published)
+            self._publish(op.topic, op.payload, op.qos, on_published)
+
+        elif isinstance(op, pipeline_ops_mqtt.MQTTPublishBatchOperation):
+            logger.info(
+                "{}({}): publishing batch of {} messages".format(
+                    self.name, op.name, len(op.publishes)
+                )
+            )
+            self._publish_batch(op)
 
         elif isinstance(op, pipeline_ops_mqtt.MQTTSubscribeOperation):
             logger.info("{}({}): subscribing to {}".format(self.name, op.name, op.topic))
@@ -185,6 +239,135 @@ class MQTTTransportStage(PipelineStage):
             # This will raise an error when executed.
             self.send_op_down(op)
 
+    @pipeline_thread.runs_on_pipeline_thread
+    def _publish_batch(self, op):
+        """
+        Fan a MQTTPublishBatchOperation out into individual publishes on the transport.  The
+        operation is completed once every publish in the batch has either been acknowledged
+        or has failed.  Failures of individual publishes are recorded in op.results rather than
+        failing the whole operation.
+        """
+        op.results = [None] * len(op.publishes)
+        # Number of publishes that have not yet been resolved.  This is a list so it can be
+        # modified from inside the closure below.
+        remaining = [len(op.publishes)]
+
+        def make_on_published(index):
+            @pipeline_thread.runs_on_pipeline_thread
+            def on_published(error=None):
+                if error:
+                    logger.error(
+                        "{}({}): publish {} failed: {}".format(self.name, op.name, index, error)
+                    )
+                op.results[index] = error
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    logger.debug(
+                        "{}({}): all publishes resolved. completing op.".format(self.name, op.name)
+                    )
+                    op.complete()
+
+            return on_published
+
+        if not op.publishes:
+            op.complete()
+            return
+
+        for index, (topic, payload) in enumerate(op.publishes):
+            self._publish(topic, payload, op.qos, make_on_published(index))
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _publish(self, topic, payload, qos, on_published):
+        """
+        Publish a payload on the transport, subject to the publish window and byte limit.
+        on_published is called on the pipeline thread with error=None once the publish is
+        complete, or with the error if the publish could not be sent.
+        """
+        size = _get_payload_size(payload)
+        if (
+            self.max_queued_publish_bytes is not None
+            and self._queued_publish_bytes > 0
+            and self._queued_publish_bytes + size > self.max_queued_publish_bytes
+        ):
+            # A publish is always accepted if nothing else is queued, even if it is larger than
+            # the limit.  Otherwise, it could never be sent.
+            logger.warning(
+                "{}: {} bytes already queued.  Rejecting publish of {} more bytes.".format(
+                    self.name, self._queued_publish_bytes, size
+                )
+            )
+            on_published(
+                error=pipeline_exceptions.PublishQueueFullError(
+                    "Too much data is waiting to be published"
+                )
+            )
+            return
+
+        self._queued_publish_bytes += size
+        if self._is_publish_window_full():
+            logger.debug("{}: publish window is full.  Holding publish.".format(self.name))
+            self._held_publishes.append((topic, payload, qos, size, on_published))
+        else:
+            self._send_publish(topic, payload, qos, size, on_published)
+        self._update_backpressure()
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _send_publish(self, topic, payload, qos, size, on_published):
+        self._in_flight_publish_count += 1
+        stats = self.publish_stats[qos]
+        stats.sent += 1
+        start = time.time()
+
+        # For QoS 1, this is called when the PUBACK arrives.  For QoS 0, it is called when the
+        # transport has written the publish to the socket.
+        @pipeline_thread.invoke_on_pipeline_thread_nowait
+        def on_complete():
+            stats.add_delivery(time.time() - start)
+            self._on_publish_resolved(size)
+            on_published()
+
+        try:
+            self.transport.publish(topic=topic, payload=payload, qos=qos, callback=on_complete)
+        except Exception as e:
+            stats.failed += 1
+            self._on_publish_resolved(size)
+            on_published(error=e)
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _on_publish_resolved(self, size):
+        """
+        Release the space used by a publish that is no longer in flight, and send any held
+        publishes that now fit in the publish window.
+        """
+        self._in_flight_publish_count -= 1
+        self._queued_publish_bytes -= size
+        while self._held_publishes and not self._is_publish_window_full():
+            self._send_publish(*self._held_publishes.popleft())
+        self._update_backpressure()
+
+    def _is_publish_window_full(self):
+        return (
+            self.max_in_flight_publishes is not None
+            and self._in_flight_publish_count >= self.max_in_flight_publishes
+        )
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _update_backpressure(self):
+        """
+        Send a BackpressureChangedEvent up the pipeline if the stage has started or stopped
+        applying backpressure.
+        """
+        backpressure = self._is_publish_window_full() or (
+            self.max_queued_publish_bytes is not None
+            and self._queued_publish_bytes >= self.max_queued_publish_bytes
+        )
+        if backpressure != self._backpressure:
+            logger.info(
+                "{}: {} backpressure".format(self.name, "applying" if backpressure else "releasing")
+            )
+            self._backpressure = backpressure
+            self.send_event_up(pipeline_events_base.BackpressureChangedEvent(backpressure))
+
     @pipeline_thread.invoke_on_pipeline_thread_nowait
     def _on_mqtt_message_received(self, topic, payload):
         """
@@ -297,3 +480,47 @@ class MQTTTransportStage(PipelineStage):
                 log_msg="Unexpected disconnection.  Safe to ignore since other stages will reconnect.",
                 log_lvl="info",
             )
+
+
+class PublishStats(object):
+    """
+    Delivery and latency statistics for the publishes sent at one QoS level.
+
+    :ivar int sent: Number of publishes given to the transport.
+    :ivar int delivered: Number of publishes that completed.  For QoS 1, this means the PUBACK
+        was received.  For QoS 0, this means the publish was written to the socket.
+    :ivar int failed: Number of publishes that the transport could not send.
+    :ivar float total_latency: Total number of seconds between sending and completing the
+        delivered publishes.
+    :ivar float max_latency: The longest time, in seconds, that a delivered publish took.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.delivered = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def average_latency(self):
+        """
+        The average number of seconds that delivered publishes took, or None if none have been
+        delivered.
+        """
+        if not self.delivered:
+            return None
+        return self.total_latency / self.delivered
+
+    def add_delivery(self, latency):
+        self.delivered += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+
+def _get_payload_size(payload):
+    if payload is None:
+        return 0
+    if isinstance(payload, six.text_type):
+        return len(payload.encode("utf-8"))
+    return len(payload)
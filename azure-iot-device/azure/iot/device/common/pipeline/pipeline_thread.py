@@ -8,7 +8,7 @@ import logging
 import threading
 import traceback
 from multiprocessing.pool import ThreadPool
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, Future
 from azure.iot.device.common import handle_exceptions
 
 logger = logging.getLogger(__name__)
@@ -70,10 +70,37 @@ These decorators use concurrent.futures.Future and the ThreadPoolExecutor becaus
 
 3. concurrent.futures is available as a backport to 2.7.
 
+Optionally, the pipeline and callback threads can be replaced by an asyncio event loop by calling
+`run_on_event_loop`.  This is used by the asyncio clients to avoid the thread switches between
+the event loop, the pipeline thread, and the callback thread.  In this mode:
+
+1. Functions decorated to run on the pipeline thread or the callback thread run as callbacks on
+  the event loop instead.  If the caller is already running on the event loop, they run
+  immediately, just like they do when the caller is already on the pipeline thread.  This is
+  safe for the callback thread because the pipeline only calls back into client code that
+  completes futures and events or puts items into inboxes, and this is necessary because the
+  pipeline constructors block while waiting for their initial operations to complete.
+
+2. The HTTP thread is not affected, since HTTP requests are made with blocking calls.
+
+3. Everything that runs on the event loop must not block.  Most pipeline functions only do
+  in-memory work, but a few make blocking calls: opening an MQTT connection does a DNS lookup
+  and the TCP and TLS handshakes before it returns.  Those calls are made with
+  `invoke_blocking_call`, which runs them on the loop's default executor in this mode, and
+  reports any error back on the loop.  Timed SAS token renewals, which can be requests to an
+  HSM, run on worker threads of their own rather than on the pipeline thread, so they are not
+  affected either.  The first SAS token of a client is created while its pipeline is being
+  constructed, which already blocks the caller.
+
 """
 
 _executors = {}
 
+# Thread names which can be replaced by an event loop.  The http thread is not one of them.
+_event_loop_thread_names = ["pipeline", "callback"]
+_event_loop = None
+_event_loop_thread = None
+
 
 def _get_named_executor(thread_name):
     """
@@ -88,6 +115,100 @@ def _get_named_executor(thread_name):
     return _executors[thread_name]
 
 
+def run_on_event_loop(loop):
+    """
+    Run all functions which would otherwise run on the pipeline and callback threads as callbacks
+    on the given asyncio event loop.  This affects every pipeline in the process.
+
+    This must be called from the thread which is running the loop, and should be called before
+    any pipelines are created.  Pass None to go back to using the pipeline and callback threads.
+    """
+    global _event_loop, _event_loop_thread
+    if loop:
+        logger.debug("Running pipeline and callback functions on event loop {}".format(loop))
+        _event_loop = loop
+        _event_loop_thread = threading.current_thread()
+    else:
+        logger.debug("Running pipeline and callback functions on their own threads")
+        _event_loop = None
+        _event_loop_thread = None
+
+
+def get_event_loop():
+    """
+    Return the event loop that pipeline and callback functions are running on, or None if they
+    are running on their own threads.
+    """
+    return _event_loop
+
+
+def _invoke_on_event_loop(func, function_name, thread_name, block, args, kwargs):
+    """
+    Run a function that would otherwise be run on the given thread as a callback on the event loop.
+    """
+    if threading.current_thread() is _event_loop_thread:
+        logger.debug("Already on event loop for {}".format(function_name))
+        return func(*args, **kwargs)
+
+    logger.debug(
+        "Scheduling {} on event loop in place of {} thread".format(function_name, thread_name)
+    )
+    future = Future()
+
+    def loop_proc():
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            if not block:
+                handle_exceptions.handle_background_exception(e)
+            else:
+                future.set_exception(e)
+        except BaseException as e:
+            if not block:
+                logger.error("Unhandled exception in event loop callback")
+                logger.error(
+                    "This may cause the event loop to abort and may result in system instability."
+                )
+                traceback.print_exc()
+            future.set_exception(e)
+            raise
+
+    _event_loop.call_soon_threadsafe(loop_proc)
+
+    if block:
+        # Blocking here is safe because we know we aren't on the event loop thread.
+        return future.result()
+    else:
+        return future
+
+
+def invoke_blocking_call(func, on_error):
+    """
+    Call a pipeline function which may block, such as one which opens a network connection.
+
+    When pipeline functions run on the pipeline thread, func is called right away, and on_error
+    is called with any exception that it raises.  When they run on an event loop, func is called
+    on the loop's default executor instead, so that it does not block the loop, and on_error is
+    called back on the loop.  In both cases, func must report its result some other way (for
+    example, through a protocol library callback).
+    """
+    loop = _event_loop
+    if not loop:
+        try:
+            func()
+        except Exception as e:
+            on_error(e)
+        return
+
+    def executor_proc():
+        try:
+            func()
+        except Exception as e:
+            loop.call_soon_threadsafe(on_error, e)
+
+    loop.run_in_executor(None, executor_proc)
+
+
 def _invoke_on_executor_thread(func, thread_name, block=True):
     """
     Return wrapper to run the function on a given thread.  If block==False,
@@ -104,7 +225,16 @@ def _invoke_on_executor_thread(func, thread_name, block=True):
         function_has_name = False
 
     def wrapper(*args, **kwargs):
-        if threading.current_thread().name is not thread_name:
+        if _event_loop and thread_name in _event_loop_thread_names:
+            return _invoke_on_event_loop(
+                func=func,
+                function_name=function_name,
+                thread_name=thread_name,
+                block=block,
+                args=args,
+                kwargs=kwargs,
+            )
+        elif threading.current_thread().name is not thread_name:
             logger.debug("Starting {} in {} thread".format(function_name, thread_name))
 
             def thread_proc():
@@ -184,8 +314,10 @@ def _assert_executor_thread(func, thread_name):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
 
-        assert (
-            threading.current_thread().name == thread_name
+        assert threading.current_thread().name == thread_name or (
+            _event_loop
+            and thread_name in _event_loop_thread_names
+            and threading.current_thread() is _event_loop_thread
         ), """
             Function {function_name} is not running inside {thread_name} thread.
             It should be. You should use invoke_on_{thread_name}_thread(_nowait) to enter the
@@ -0,0 +1,132 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import json
+import sys
+import six
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+"""
+This module contains a registry of the serializers which the pipelines can use to turn objects
+into payloads and back again.
+
+JSON serializers are used for twin documents, twin patches and method payloads.  The standard
+library json module is always available, and orjson and ujson are used if they are installed.
+Message payloads can additionally be serialized with msgpack or CBOR (using the cbor2 package).
+"""
+
+JSON = "json"
+ORJSON = "orjson"
+UJSON = "ujson"
+MSGPACK = "msgpack"
+CBOR = "cbor"
+
+# Selects the fastest JSON serializer that is installed
+FASTEST_JSON = "auto"
+
+JSON_CONTENT_TYPE = "application/json"
+
+# Before Python 3.6, json.loads() only accepts bytes on Python 2
+_json_loads_accepts_bytes = six.PY2 or sys.version_info >= (3, 6)
+
+
+class Serializer(object):
+    """
+    A way of serializing objects to payloads, and of deserializing payloads.
+
+    :ivar str name: The name the serializer is registered with.
+    :ivar str content_type: The content type of the payloads the serializer produces.
+    """
+
+    def __init__(self, name, content_type, dumps, loads):
+        """
+        :param str name: The name to register the serializer with.
+        :param str content_type: The content type of the payloads the serializer produces.
+        :param dumps: Function which serializes an object to str or bytes.
+        :param loads: Function which deserializes an object from bytes (which must not be copied
+            to a str first) or from str.
+        """
+        self.name = name
+        self.content_type = content_type
+        self.dumps = dumps
+        self.loads = loads
+
+    @property
+    def is_json(self):
+        return self.content_type == JSON_CONTENT_TYPE
+
+
+def _json_loads(data):
+    if not _json_loads_accepts_bytes and isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def _orjson_dumps(obj):
+    # json.dumps() allows non-string keys, so allow them here too
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+_serializers = {}
+
+
+def register_serializer(serializer):
+    """
+    Make the given Serializer available to pipelines by name, replacing any serializer that is
+    already registered with that name.
+    """
+    _serializers[serializer.name] = serializer
+
+
+def get_serializer(name):
+    """
+    Return the Serializer registered with the given name.  FASTEST_JSON returns the fastest JSON
+    serializer that is installed.
+
+    :raises: ValueError if no serializer is registered with the given name.
+    """
+    if name == FASTEST_JSON:
+        for json_name in (ORJSON, UJSON, JSON):
+            if json_name in _serializers:
+                return _serializers[json_name]
+    try:
+        return _serializers[name]
+    except (KeyError, TypeError):
+        raise ValueError("No serializer named '{}' is available".format(name))
+
+
+register_serializer(Serializer(JSON, JSON_CONTENT_TYPE, json.dumps, _json_loads))
+if orjson:
+    register_serializer(Serializer(ORJSON, JSON_CONTENT_TYPE, _orjson_dumps, orjson.loads))
+if ujson:
+    register_serializer(Serializer(UJSON, JSON_CONTENT_TYPE, ujson.dumps, ujson.loads))
+if msgpack:
+    register_serializer(Serializer(MSGPACK, "application/msgpack", _msgpack_dumps, _msgpack_loads))
+if cbor2:
+    register_serializer(Serializer(CBOR, "application/cbor", cbor2.dumps, cbor2.loads))
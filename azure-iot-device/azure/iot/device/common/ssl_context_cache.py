@@ -0,0 +1,154 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import logging
+import os
+import ssl
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+"""
+This module contains a process-wide cache of the SSLContext objects used by the MQTT and HTTP
+transports, along with a SessionResumingContext object which lets a transport resume its TLS
+session when it reconnects.
+
+Creating an SSLContext means loading the default certificates (or the provided server
+verification certificate) and the client certificate chain from disk, which is expensive to do
+for every transport.  Transports that are configured with the same certificates and ciphers share
+a single SSLContext instead.  Contexts are only held by the cache for as long as a transport is
+using them, and a client certificate is identified by the modification time and size of its
+files as well as their paths, so a certificate that is replaced on disk is loaded again.
+
+TLS session resumption requires Python 3.6 or newer.  On older versions every connection does a
+full TLS handshake, the same as it would without a SessionResumingContext.
+"""
+
+_contexts = weakref.WeakValueDictionary()
+_contexts_lock = threading.Lock()
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        # Let load_cert_chain() report the problem with the file
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def _get_key(server_verification_cert, x509_cert, cipher):
+    if x509_cert is None:
+        x509_key = None
+    else:
+        x509_key = (
+            x509_cert.certificate_file,
+            _file_signature(x509_cert.certificate_file),
+            x509_cert.key_file,
+            _file_signature(x509_cert.key_file),
+            x509_cert.pass_phrase,
+        )
+    return (server_verification_cert, x509_key, cipher)
+
+
+def _create_ssl_context(server_verification_cert, x509_cert, cipher):
+    logger.debug("creating a SSL context")
+    ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLSv1_2)
+
+    if server_verification_cert:
+        ssl_context.load_verify_locations(cadata=server_verification_cert)
+    else:
+        ssl_context.load_default_certs()
+
+    if cipher:
+        ssl_context.set_ciphers(cipher)
+
+    if x509_cert is not None:
+        logger.debug("configuring SSL context with client-side certificate and key")
+        ssl_context.load_cert_chain(
+            x509_cert.certificate_file, x509_cert.key_file, x509_cert.pass_phrase
+        )
+
+    ssl_context.verify_mode = ssl.CERT_REQUIRED
+    ssl_context.check_hostname = True
+
+    return ssl_context
+
+
+def get_ssl_context(server_verification_cert=None, x509_cert=None, cipher=None):
+    """
+    Return an SSLContext which uses TLS 1.2, requires certificates and checks hostnames.  If a
+    transport in this process is already using a context created with the same certificates and
+    cipher, that context is returned instead of creating a new one.
+
+    The returned context is shared, so it must not be modified.
+
+    :param str server_verification_cert: Certificate which can be used to validate a server-side
+        TLS connection (optional).  If not provided, the default certificates are used.
+    :param x509_cert: Certificate which can be used to authenticate the connection (optional).
+    :param str cipher: Cipher string in OpenSSL cipher list format (optional).
+
+    :raises: ssl.SSLError if the cipher or certificates cannot be used.
+    """
+    key = _get_key(server_verification_cert, x509_cert, cipher)
+    with _contexts_lock:
+        ssl_context = _contexts.get(key)
+        if ssl_context is None:
+            ssl_context = _create_ssl_context(server_verification_cert, x509_cert, cipher)
+            _contexts[key] = ssl_context
+        else:
+            logger.debug("using cached SSL context")
+        return ssl_context
+
+
+def clear():
+    """
+    Forget every cached SSLContext.  Transports that are created afterwards use new contexts.
+    """
+    with _contexts_lock:
+        _contexts.clear()
+
+
+class SessionResumingContext(object):
+    """
+    Wraps a (possibly shared) SSLContext for a single transport, and resumes the TLS session of
+    the transport's last connection each time a socket is wrapped.  Everything other than
+    wrap_socket() is passed through to the wrapped SSLContext.
+    """
+
+    def __init__(self, ssl_context):
+        self.ssl_context = ssl_context
+        self.session = None
+        self._last_socket = None
+
+    def __getattr__(self, name):
+        return getattr(self.ssl_context, name)
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None and "session" not in kwargs:
+            kwargs["session"] = self.session
+        ssl_sock = self.ssl_context.wrap_socket(sock, *args, **kwargs)
+        self._last_socket = weakref.ref(ssl_sock)
+        if kwargs.get("do_handshake_on_connect", True):
+            self.save_session()
+        return ssl_sock
+
+    def save_session(self):
+        """
+        Remember the TLS session of the most recently wrapped socket so that the next connection
+        can resume it.  This must be called after the TLS handshake has completed, and before the
+        socket is closed.
+        """
+        ssl_sock = self._last_socket() if self._last_socket else None
+        session = getattr(ssl_sock, "session", None)
+        if session is not None:
+            if session is not self.session:
+                logger.debug(
+                    "saving TLS session (resumed={})".format(
+                        getattr(ssl_sock, "session_reused", None)
+                    )
+                )
+            self.session = session
@@ -0,0 +1,300 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from azure.iot.device.common import handle_exceptions
+
+logger = logging.getLogger(__name__)
+
+"""
+This module contains a process-wide hierarchical timer wheel, along with a Timer object that
+is used in place of threading.Timer everywhere in the SDK.
+
+threading.Timer starts a new OS thread for every timer.  The pipeline starts a timer for every
+operation it watches for timeout or retry, so a busy client ends up with one thread per pending
+operation.  The timer wheel services every timer in the process with a single "timer wheel"
+thread, and runs the functions of expired timers on a small, fixed pool of "timer callback"
+threads, so the number of threads does not grow with the number of pending timers.  Because
+there is more than one callback thread, a timer function which blocks (for example, while it
+signs a token with an HSM) does not hold up every other timer in the process, although timer
+functions which expire at around the same time may run at the same time.
+
+The wheel is made up of several levels of slots.  Level 0 has one slot per tick.  Each slot in
+a higher level covers an entire revolution of the level below it.  A timer is placed in the
+lowest level that can hold it, and is moved down ("cascaded") a level each time the wheel
+reaches the slot it was placed in, until it is in level 0 and expires.  Scheduling and
+cancelling a timer are both O(1), and the timer wheel thread only wakes up when the next
+non-empty slot is reached rather than on every tick.
+
+Timers never expire early, but may expire up to one tick late.
+"""
+
+# 10ms ticks
+DEFAULT_RESOLUTION = 0.01
+
+# Number of threads which run the functions of expired timers
+DEFAULT_CALLBACK_THREADS = 4
+
+# Number of bits of the tick count covered by each level of the wheel.  With 10ms ticks, level
+# 0 covers 2.56 seconds, level 1 covers 2.7 minutes, level 2 covers 2.9 hours and level 3 covers
+# 7.7 days.  Timers that are farther out than that are parked in the last slot of the top level
+# and re-inserted when that slot is reached.
+LEVEL_BITS = (8, 6, 6, 6)
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    # Python 2.7
+    _monotonic = time.time
+
+
+class TimerWheel(object):
+    """
+    A hierarchical timer wheel which runs the functions of expired Timer objects.
+
+    Most code should not use this object directly.  Use the Timer object instead, which
+    schedules itself on the shared TimerWheel returned by get_shared_timer_wheel().
+    """
+
+    def __init__(
+        self,
+        resolution=DEFAULT_RESOLUTION,
+        time_function=_monotonic,
+        callback_threads=DEFAULT_CALLBACK_THREADS,
+    ):
+        self.resolution = resolution
+        self.callback_threads = callback_threads
+        self._time_function = time_function
+        self._start_time = time_function()
+        self._shifts = []
+        self._masks = []
+        shift = 0
+        for bits in LEVEL_BITS:
+            self._shifts.append(shift)
+            self._masks.append((1 << bits) - 1)
+            shift += bits
+        self._levels = [[set() for _ in range(mask + 1)] for mask in self._masks]
+        self._level_counts = [0] * len(LEVEL_BITS)
+        self._current_tick = 0
+        # Tick the timer wheel thread is sleeping until.  None if it is sleeping indefinitely.
+        self._wake_tick = None
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = None
+        self._executor = None
+
+    @property
+    def pending_count(self):
+        """
+        The number of timers that have been scheduled and have not yet expired or been cancelled
+        """
+        with self._condition:
+            return sum(self._level_counts)
+
+    def schedule(self, timer):
+        """
+        Schedule the given timer to expire timer.interval seconds from now.
+        """
+        with self._condition:
+            self._ensure_threads()
+            timer._wheel = self
+            timer._expires_tick = self._get_tick(
+                self._time_function() + timer.interval, round_up=True
+            )
+            self._insert(timer)
+            if self._wake_tick is None or timer._expires_tick < self._wake_tick:
+                self._condition.notify()
+
+    def cancel(self, timer):
+        """
+        Cancel the given timer.  Cancelling a timer which has already expired or been cancelled
+        does nothing.
+        """
+        with self._condition:
+            self._remove(timer)
+
+    def _get_tick(self, t, round_up=False):
+        ticks = (t - self._start_time) / self.resolution
+        if round_up:
+            return int(math.ceil(ticks))
+        else:
+            return int(math.floor(ticks))
+
+    def _insert(self, timer):
+        current = self._current_tick
+        expires = max(timer._expires_tick, current + 1)
+        top_level = len(self._levels) - 1
+        for level in range(len(self._levels)):
+            shift = self._shifts[level]
+            if (expires >> shift) - (current >> shift) <= self._masks[level]:
+                index = (expires >> shift) & self._masks[level]
+                break
+        else:
+            # Too far out for the wheel.  Park it in the last slot of the top level.
+            level = top_level
+            index = ((current >> self._shifts[level]) + self._masks[level]) & self._masks[level]
+
+        bucket = self._levels[level][index]
+        bucket.add(timer)
+        timer._bucket = bucket
+        timer._level = level
+        self._level_counts[level] += 1
+
+    def _remove(self, timer):
+        if timer._bucket is not None:
+            timer._bucket.discard(timer)
+            timer._bucket = None
+            self._level_counts[timer._level] -= 1
+
+    def _get_next_event_tick(self):
+        """
+        Return the tick at which the next non-empty slot is reached, or None if the wheel is empty
+        """
+        next_event_tick = None
+        for level in range(len(self._levels)):
+            if not self._level_counts[level]:
+                continue
+            shift = self._shifts[level]
+            mask = self._masks[level]
+            base = self._current_tick >> shift
+            for offset in range(1, mask + 1):
+                if self._levels[level][(base + offset) & mask]:
+                    tick = (base + offset) << shift
+                    if next_event_tick is None or tick < next_event_tick:
+                        next_event_tick = tick
+                    break
+        return next_event_tick
+
+    def _advance(self, now_tick):
+        """
+        Move the wheel forward to now_tick and return a list of all timers which expired.
+        Only the ticks with non-empty slots are visited.
+        """
+        expired = []
+        while self._current_tick < now_tick:
+            next_event_tick = self._get_next_event_tick()
+            if next_event_tick is None or next_event_tick > now_tick:
+                self._current_tick = now_tick
+                break
+            self._current_tick = next_event_tick
+            self._process_tick(next_event_tick, expired)
+        return expired
+
+    def _process_tick(self, tick, expired):
+        # Cascade the higher levels first, since timers cascaded out of them may land in lower
+        # level slots which are also reached on this tick.
+        for level in range(len(self._levels) - 1, 0, -1):
+            shift = self._shifts[level]
+            if tick & ((1 << shift) - 1):
+                continue
+            bucket = self._levels[level][(tick >> shift) & self._masks[level]]
+            if not bucket:
+                continue
+            timers = list(bucket)
+            for timer in timers:
+                self._remove(timer)
+            for timer in timers:
+                if timer._expires_tick <= tick:
+                    expired.append(timer)
+                else:
+                    self._insert(timer)
+
+        bucket = self._levels[0][tick & self._masks[0]]
+        timers = list(bucket)
+        for timer in timers:
+            self._remove(timer)
+        expired.extend(timers)
+
+    def _ensure_threads(self):
+        if not self._thread:
+            logger.debug("Starting timer wheel thread")
+            self._executor = ThreadPoolExecutor(max_workers=self.callback_threads)
+            self._thread = threading.Thread(target=self._run, name="azure_iot_timer_wheel")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        with self._condition:
+            while True:
+                now = self._time_function()
+                for timer in self._advance(self._get_tick(now)):
+                    self._executor.submit(_run_timer_function, timer)
+
+                self._wake_tick = self._get_next_event_tick()
+                if self._wake_tick is None:
+                    self._condition.wait()
+                else:
+                    wake_time = self._start_time + (self._wake_tick * self.resolution)
+                    self._condition.wait(max(wake_time - now, 0))
+
+
+def _run_timer_function(timer):
+    threading.current_thread().name = "azure_iot_timer_callback"
+    if timer._cancelled:
+        # Cancelled after it expired, but before a callback thread got to it
+        return
+    try:
+        timer.function(*timer.args, **timer.kwargs)
+    except Exception as e:
+        handle_exceptions.handle_background_exception(e)
+
+
+class Timer(object):
+    """
+    A timer which calls a function after a given number of seconds have passed.
+
+    This has the same interface as threading.Timer, but all Timer objects are serviced by the
+    shared TimerWheel instead of each having a dedicated thread.  Timer functions are run on a
+    small pool of timer callback threads which is shared by the whole process, so they should
+    return quickly.  Any long-running work should be handed off to another thread (for example,
+    by using the pipeline_thread decorators).
+    """
+
+    def __init__(self, interval, function, args=None, kwargs=None):
+        self.interval = interval
+        self.function = function
+        self.args = args if args is not None else []
+        self.kwargs = kwargs if kwargs is not None else {}
+        self._wheel = None
+        self._bucket = None
+        self._level = None
+        self._expires_tick = None
+        self._cancelled = False
+
+    def start(self):
+        """
+        Start the timer.
+        """
+        if self._wheel:
+            raise RuntimeError("timers can only be started once")
+        get_shared_timer_wheel().schedule(self)
+
+    def cancel(self):
+        """
+        Stop the timer if it hasn't expired yet.
+        """
+        self._cancelled = True
+        if self._wheel:
+            self._wheel.cancel(self)
+
+
+_shared_timer_wheel = None
+_shared_timer_wheel_lock = threading.Lock()
+
+
+def get_shared_timer_wheel():
+    """
+    Get the TimerWheel object which is shared by every Timer in the process, creating it if
+    necessary.
+    """
+    global _shared_timer_wheel
+    with _shared_timer_wheel_lock:
+        if not _shared_timer_wheel:
+            logger.debug("Creating shared timer wheel")
+            _shared_timer_wheel = TimerWheel()
+        return _shared_timer_wheel
@@ -13,6 +13,9 @@ import os
 import io
 from . import auth
 from . import pipeline
+from .auth import sas_token_service
+from .pipeline import exceptions as pipeline_exceptions
+from azure.iot.device import exceptions
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +30,34 @@ logger = logging.getLogger(__name__)
 # SymmetricKeyAuthenticationProvider was intended to be part of an Edge scenario or not.
 
 
+def convert_pipeline_error(error):
+    """Return the client-facing exception corresponding to an error returned by the pipeline"""
+    if isinstance(error, pipeline_exceptions.ConnectionDroppedError):
+        return exceptions.ConnectionDroppedError(message="Lost connection to IoTHub", cause=error)
+    elif isinstance(error, pipeline_exceptions.ConnectionFailedError):
+        return exceptions.ConnectionFailedError(message="Could not connect to IoTHub", cause=error)
+    elif isinstance(error, pipeline_exceptions.UnauthorizedError):
+        return exceptions.CredentialError(
+            message="Credentials invalid, could not connect", cause=error
+        )
+    elif isinstance(error, pipeline_exceptions.ProtocolClientError):
+        return exceptions.ClientError(message="Error in the IoTHub client", cause=error)
+    elif isinstance(error, pipeline_exceptions.TlsExchangeAuthError):
+        return exceptions.ClientError(
+            message="Error in the IoTHub client due to TLS exchanges.", cause=error
+        )
+    elif isinstance(error, pipeline_exceptions.ProtocolProxyError):
+        return exceptions.ClientError(
+            message="Error in the IoTHub client raised due to proxy connections.", cause=error
+        )
+    elif isinstance(error, pipeline_exceptions.PublishQueueFullError):
+        return exceptions.ClientError(
+            message="Too much data is already waiting to be sent to IoTHub", cause=error
+        )
+    else:
+        return exceptions.ClientError(message="Unexpected failure", cause=error)
+
+
 def _validate_kwargs(**kwargs):
     """Helper function to validate user provided kwargs.
     Raises TypeError if an invalid option has been provided"""
@@ -36,6 +67,27 @@ def _validate_kwargs(**kwargs):
         "cipher",
         "server_verification_cert",
         "proxy_options",
+        "max_in_flight_publishes",
+        "max_queued_publish_bytes",
+        "outbox_directory",
+        "outbox_max_bytes",
+        "outbox_eviction_policy",
+        "outbox_replay_concurrency",
+        "telemetry_qos",
+        "shared_network_loop",
+        "make_before_break_reauthorization",
+        "compression",
+        "compression_threshold",
+        "json_serializer",
+        "payload_serializer",
+        "reported_properties_window",
+        "reported_properties_max_bytes",
+        "inbox_capacity",
+        "inbox_overflow_policy",
+        "inbox_spill_directory",
+        "twin_cache",
+        "shared_sas_token_service",
+        "trust_bundle_cache_directory",
     ]
 
     for kwarg in kwargs:
@@ -43,6 +95,14 @@ def _validate_kwargs(**kwargs):
             raise TypeError("Got an unexpected keyword argument '{}'".format(kwarg))
 
 
+def _reject_unsupported_kwargs(unsupported_kwargs, clients_description, **kwargs):
+    """Helper function to reject user provided kwargs which have no effect on the client being
+    created.  Raises TypeError if one of the unsupported options has been provided"""
+    for kwarg in unsupported_kwargs:
+        if kwargs.get(kwarg):
+            raise TypeError("'{}' is not supported by {}".format(kwarg, clients_description))
+
+
 def _get_pipeline_config_kwargs(**kwargs):
     """Helper function to get a subset of user provided kwargs relevant to IoTHubPipelineConfig"""
     new_kwargs = {}
@@ -54,9 +114,65 @@ def _get_pipeline_config_kwargs(**kwargs):
         new_kwargs["cipher"] = kwargs["cipher"]
     if "proxy_options" in kwargs:
         new_kwargs["proxy_options"] = kwargs["proxy_options"]
+    if "max_in_flight_publishes" in kwargs:
+        new_kwargs["max_in_flight_publishes"] = kwargs["max_in_flight_publishes"]
+    if "max_queued_publish_bytes" in kwargs:
+        new_kwargs["max_queued_publish_bytes"] = kwargs["max_queued_publish_bytes"]
+    if "outbox_directory" in kwargs:
+        new_kwargs["outbox_directory"] = kwargs["outbox_directory"]
+    if "outbox_max_bytes" in kwargs:
+        new_kwargs["outbox_max_bytes"] = kwargs["outbox_max_bytes"]
+    if "outbox_eviction_policy" in kwargs:
+        new_kwargs["outbox_eviction_policy"] = kwargs["outbox_eviction_policy"]
+    if "outbox_replay_concurrency" in kwargs:
+        new_kwargs["outbox_replay_concurrency"] = kwargs["outbox_replay_concurrency"]
+    if "telemetry_qos" in kwargs:
+        new_kwargs["telemetry_qos"] = kwargs["telemetry_qos"]
+    if "shared_network_loop" in kwargs:
+        new_kwargs["shared_network_loop"] = kwargs["shared_network_loop"]
+    if "make_before_break_reauthorization" in kwargs:
+        new_kwargs["make_before_break_reauthorization"] = kwargs[
+            "make_before_break_reauthorization"
+        ]
+    if "compression" in kwargs:
+        new_kwargs["compression"] = kwargs["compression"]
+    if "compression_threshold" in kwargs:
+        new_kwargs["compression_threshold"] = kwargs["compression_threshold"]
+    if "json_serializer" in kwargs:
+        new_kwargs["json_serializer"] = kwargs["json_serializer"]
+    if "payload_serializer" in kwargs:
+        new_kwargs["payload_serializer"] = kwargs["payload_serializer"]
+    if "reported_properties_window" in kwargs:
+        new_kwargs["reported_properties_window"] = kwargs["reported_properties_window"]
+    if "reported_properties_max_bytes" in kwargs:
+        new_kwargs["reported_properties_max_bytes"] = kwargs["reported_properties_max_bytes"]
     return new_kwargs
 
 
+def _apply_client_options(client, **kwargs):
+    """Helper function to apply the subset of user provided kwargs relevant to inboxes and the
+    twin cache to a new client"""
+    inbox_kwargs = {}
+    if "inbox_capacity" in kwargs:
+        inbox_kwargs["capacity"] = kwargs["inbox_capacity"]
+    if "inbox_overflow_policy" in kwargs:
+        inbox_kwargs["overflow_policy"] = kwargs["inbox_overflow_policy"]
+    if "inbox_spill_directory" in kwargs:
+        inbox_kwargs["spill_directory"] = kwargs["inbox_spill_directory"]
+    if inbox_kwargs:
+        client._inbox_manager.set_capacity(**inbox_kwargs)
+    if kwargs.get("twin_cache"):
+        client._enable_twin_cache()
+    return client
+
+
+def _apply_token_service(authentication_provider, **kwargs):
+    """Helper function to have the SAS tokens of a new authentication provider renewed by the
+    shared SasTokenService, if requested by the user provided kwargs"""
+    if kwargs.get("shared_sas_token_service"):
+        authentication_provider.token_service = sas_token_service.get_shared_sas_token_service()
+
+
 @six.add_metaclass(abc.ABCMeta)
 class AbstractIoTHubClient(object):
     """ A superclass representing a generic IoTHub client.
@@ -91,9 +207,86 @@ class AbstractIoTHubClient(object):
             arbitrary product info which is appended to the user agent string.
         :param proxy_options: Options for sending traffic through proxy servers.
         :type ProxyOptions: :class:`azure.iot.device.common.proxy_options`
+        :param int max_in_flight_publishes: Configuration Option. Default is no limit. The maximum
+            number of messages that can be waiting for acknowledgement from the service at once.
+            Sending more messages waits until earlier ones are acknowledged.
+        :param int max_queued_publish_bytes: Configuration Option. Default is no limit. The maximum
+            number of payload bytes that can be waiting to be sent or acknowledged at once.
+            Sending a message that would go over this limit raises a ClientError.
+        :param str outbox_directory: Configuration Option. Default is None. A directory to store
+            messages in while the client is not connected.  Stored messages are sent, in order,
+            once the client connects.  If None, messages are not stored.
+        :param int outbox_max_bytes: Configuration Option. Default is 64MB. The maximum number of
+            bytes of messages that can be stored in the outbox_directory.
+        :param str outbox_eviction_policy: Configuration Option. Default is "drop_oldest". What to
+            do with new messages once the outbox is full.  "drop_oldest" discards the oldest
+            stored messages to make room.  "reject_new" raises a ClientError instead.
+        :param int outbox_replay_concurrency: Configuration Option. Default is 10. The maximum
+            number of stored messages that are sent at the same time once the client connects.
+        :param int telemetry_qos: Configuration Option. Default is 1. The MQTT QoS level that
+            messages are sent at.  With 1, sending a message waits until the service acknowledges
+            it.  With 0, sending a message finishes as soon as it has been written to the network,
+            so messages can be lost, but many more can be sent.  Messages sent with QoS 0 are
+            never stored in the outbox_directory.
+        :param bool shared_network_loop: Configuration Option. Default is False. Set to True to
+            send and receive over a network thread that is shared with other clients in the same
+            process, instead of a network thread for each client.  Useful when a process runs
+            many clients at once.
+        :param bool make_before_break_reauthorization: Configuration Option. Default is False. Set
+            to True to renew the credentials of the connection by opening a new connection before
+            closing the current one, instead of reconnecting.  Messages and other operations are
+            not held while the new connection is opened, and any waiting for a response are sent
+            again on the new connection.
+        :param str compression: Configuration Option. Default is None. Set to "gzip", "deflate"
+            or "zstd" (which requires the zstandard package) to compress the payloads of sent
+            messages, and to decompress received messages which are compressed.  A compressed
+            payload has its content_encoding set to the compression used, and the 256 KB message
+            size limit applies to the compressed size.
+        :param int compression_threshold: Configuration Option. Default is 1024. The size in bytes
+            below which message payloads are sent uncompressed.
+        :param str json_serializer: Configuration Option. Default is "json". The serializer used
+            for twin documents, twin patches and method payloads. Set to "orjson" or "ujson" to use
+            those packages instead of the standard library, or to "auto" to use the fastest of them
+            that is installed.
+        :param str payload_serializer: Configuration Option. Default is None. The serializer used
+            for message payloads which are dicts or lists. Set to "json", "orjson", "ujson", "auto",
+            "msgpack" (which requires the msgpack package) or "cbor" (which requires the cbor2
+            package). The content_type of the message is set to match, unless it is already set.
+        :param float reported_properties_window: Configuration Option. Default is None. A number
+            of seconds to hold reported properties patches for, so that patches made during that
+            time are merged, with the last value of each property winning, and sent as one
+            request. Each call waits for the merged patch to be sent. If None, each patch is sent
+            on its own.
+        :param int reported_properties_max_bytes: Configuration Option. Default is no limit. The
+            size in bytes at which merged reported properties patches are sent without waiting
+            for the rest of the reported_properties_window.
+        :param int inbox_capacity: Configuration Option. Default is no limit. The maximum number
+            of received messages, method requests or twin patches that each inbox holds in memory
+            while waiting for the application to receive them.
+        :param str inbox_overflow_policy: Configuration Option. Default is "block". What to do
+            when an item is received for an inbox which is full. "block" stops receiving until
+            the application receives from that inbox, which stalls all of the traffic of the
+            client, including acknowledgements of sent messages and twin responses, so the
+            application must not wait for any other client call before receiving from a full
+            inbox. "block" can not be used with an inbox_capacity once enable_asyncio_pipeline has
+            been called, since it would block the event loop. "drop_oldest" drops the oldest item
+            in the inbox. "drop_newest" drops the new item. "spill" keeps the new item in a
+            temporary file until there is room for it in memory.
+        :param str inbox_spill_directory: Configuration Option. Default is the system temporary
+            directory. The directory that the "spill" policy keeps items in.
+        :param bool twin_cache: Configuration Option. Default is False. Keep a copy of the twin
+            after it is first retrieved, kept current from desired property patches, and return
+            it from get_twin instead of retrieving the twin from the service every time. The twin
+            is retrieved again if a desired property patch is missed, after the connection is lost,
+            and after reported properties are patched.
+        :param bool shared_sas_token_service: Configuration Option. Default is False. Set to True
+            to renew the SAS token of the client from a service that is shared with other clients
+            in the same process. The service signs each new token ahead of time, and renews the
+            tokens of different clients at randomly spread out times, so that many clients do not
+            all reconnect with new tokens at once.
 
         :raises: ValueError if given an invalid connection_string.
-        :raises: TypeError if given an unrecognized parameter.
+        :raises: TypeError if given an unrecognized or unsupported parameter.
 
         :returns: An instance of an IoTHub client that uses a connection string for authentication.
         """
@@ -102,6 +295,9 @@ class AbstractIoTHubClient(object):
         # in order to differentiate types of connection strings.
 
         _validate_kwargs(**kwargs)
+        _reject_unsupported_kwargs(
+            ["trust_bundle_cache_directory"], "clients using a connection string", **kwargs
+        )
 
         # Pipeline Config setup
         pipeline_config_kwargs = _get_pipeline_config_kwargs(**kwargs)
@@ -112,12 +308,13 @@ class AbstractIoTHubClient(object):
         # Auth Provider setup
         authentication_provider = auth.SymmetricKeyAuthenticationProvider.parse(connection_string)
         authentication_provider.server_verification_cert = kwargs.get("server_verification_cert")
+        _apply_token_service(authentication_provider, **kwargs)
 
         # Pipeline setup
         http_pipeline = pipeline.HTTPPipeline(authentication_provider, pipeline_configuration)
         iothub_pipeline = pipeline.IoTHubPipeline(authentication_provider, pipeline_configuration)
 
-        return cls(iothub_pipeline, http_pipeline)
+        return _apply_client_options(cls(iothub_pipeline, http_pipeline), **kwargs)
 
     @abc.abstractmethod
     def connect(self):
@@ -187,12 +384,89 @@ class AbstractIoTHubDeviceClient(AbstractIoTHubClient):
             arbitrary product info which is appended to the user agent string.
         :param proxy_options: Options for sending traffic through proxy servers.
         :type ProxyOptions: :class:`azure.iot.device.common.proxy_options`
-
-        :raises: TypeError if given an unrecognized parameter.
+        :param int max_in_flight_publishes: Configuration Option. Default is no limit. The maximum
+            number of messages that can be waiting for acknowledgement from the service at once.
+            Sending more messages waits until earlier ones are acknowledged.
+        :param int max_queued_publish_bytes: Configuration Option. Default is no limit. The maximum
+            number of payload bytes that can be waiting to be sent or acknowledged at once.
+            Sending a message that would go over this limit raises a ClientError.
+        :param str outbox_directory: Configuration Option. Default is None. A directory to store
+            messages in while the client is not connected.  Stored messages are sent, in order,
+            once the client connects.  If None, messages are not stored.
+        :param int outbox_max_bytes: Configuration Option. Default is 64MB. The maximum number of
+            bytes of messages that can be stored in the outbox_directory.
+        :param str outbox_eviction_policy: Configuration Option. Default is "drop_oldest". What to
+            do with new messages once the outbox is full.  "drop_oldest" discards the oldest
+            stored messages to make room.  "reject_new" raises a ClientError instead.
+        :param int outbox_replay_concurrency: Configuration Option. Default is 10. The maximum
+            number of stored messages that are sent at the same time once the client connects.
+        :param int telemetry_qos: Configuration Option. Default is 1. The MQTT QoS level that
+            messages are sent at.  With 1, sending a message waits until the service acknowledges
+            it.  With 0, sending a message finishes as soon as it has been written to the network,
+            so messages can be lost, but many more can be sent.  Messages sent with QoS 0 are
+            never stored in the outbox_directory.
+        :param bool shared_network_loop: Configuration Option. Default is False. Set to True to
+            send and receive over a network thread that is shared with other clients in the same
+            process, instead of a network thread for each client.  Useful when a process runs
+            many clients at once.
+        :param bool make_before_break_reauthorization: Configuration Option. Default is False. Set
+            to True to renew the credentials of the connection by opening a new connection before
+            closing the current one, instead of reconnecting.  Messages and other operations are
+            not held while the new connection is opened, and any waiting for a response are sent
+            again on the new connection.
+        :param str compression: Configuration Option. Default is None. Set to "gzip", "deflate"
+            or "zstd" (which requires the zstandard package) to compress the payloads of sent
+            messages, and to decompress received messages which are compressed.  A compressed
+            payload has its content_encoding set to the compression used, and the 256 KB message
+            size limit applies to the compressed size.
+        :param int compression_threshold: Configuration Option. Default is 1024. The size in bytes
+            below which message payloads are sent uncompressed.
+        :param str json_serializer: Configuration Option. Default is "json". The serializer used
+            for twin documents, twin patches and method payloads. Set to "orjson" or "ujson" to use
+            those packages instead of the standard library, or to "auto" to use the fastest of them
+            that is installed.
+        :param str payload_serializer: Configuration Option. Default is None. The serializer used
+            for message payloads which are dicts or lists. Set to "json", "orjson", "ujson", "auto",
+            "msgpack" (which requires the msgpack package) or "cbor" (which requires the cbor2
+            package). The content_type of the message is set to match, unless it is already set.
+        :param float reported_properties_window: Configuration Option. Default is None. A number
+            of seconds to hold reported properties patches for, so that patches made during that
+            time are merged, with the last value of each property winning, and sent as one
+            request. Each call waits for the merged patch to be sent. If None, each patch is sent
+            on its own.
+        :param int reported_properties_max_bytes: Configuration Option. Default is no limit. The
+            size in bytes at which merged reported properties patches are sent without waiting
+            for the rest of the reported_properties_window.
+        :param int inbox_capacity: Configuration Option. Default is no limit. The maximum number
+            of received messages, method requests or twin patches that each inbox holds in memory
+            while waiting for the application to receive them.
+        :param str inbox_overflow_policy: Configuration Option. Default is "block". What to do
+            when an item is received for an inbox which is full. "block" stops receiving until
+            the application receives from that inbox, which stalls all of the traffic of the
+            client, including acknowledgements of sent messages and twin responses, so the
+            application must not wait for any other client call before receiving from a full
+            inbox. "block" can not be used with an inbox_capacity once enable_asyncio_pipeline has
+            been called, since it would block the event loop. "drop_oldest" drops the oldest item
+            in the inbox. "drop_newest" drops the new item. "spill" keeps the new item in a
+            temporary file until there is room for it in memory.
+        :param str inbox_spill_directory: Configuration Option. Default is the system temporary
+            directory. The directory that the "spill" policy keeps items in.
+        :param bool twin_cache: Configuration Option. Default is False. Keep a copy of the twin
+            after it is first retrieved, kept current from desired property patches, and return
+            it from get_twin instead of retrieving the twin from the service every time. The twin
+            is retrieved again if a desired property patch is missed, after the connection is lost,
+            and after reported properties are patched.
+
+        :raises: TypeError if given an unrecognized or unsupported parameter.
 
         :returns: An instance of an IoTHub client that uses an X509 certificate for authentication.
         """
         _validate_kwargs(**kwargs)
+        _reject_unsupported_kwargs(
+            ["trust_bundle_cache_directory", "shared_sas_token_service"],
+            "clients using an X509 certificate",
+            **kwargs
+        )
 
         # Pipeline Config setup
         pipeline_config_kwargs = _get_pipeline_config_kwargs(**kwargs)
@@ -209,7 +483,7 @@ class AbstractIoTHubDeviceClient(AbstractIoTHubClient):
         http_pipeline = pipeline.HTTPPipeline(authentication_provider, pipeline_configuration)
         iothub_pipeline = pipeline.IoTHubPipeline(authentication_provider, pipeline_configuration)
 
-        return cls(iothub_pipeline, http_pipeline)
+        return _apply_client_options(cls(iothub_pipeline, http_pipeline), **kwargs)
 
     @classmethod
     def create_from_symmetric_key(cls, symmetric_key, hostname, device_id, **kwargs):
@@ -231,12 +505,18 @@ class AbstractIoTHubDeviceClient(AbstractIoTHubClient):
         :type cipher: str or list(str)
         :param str product_info: Configuration Option. Default is empty string. The string contains
             arbitrary product info which is appended to the user agent string.
+        :param bool shared_sas_token_service: Configuration Option. Default is False. Set to True
+            to renew the SAS token of the client from a service that is shared with other clients
+            in the same process.
 
-        :raises: TypeError if given an unrecognized parameter.
+        :raises: TypeError if given an unrecognized or unsupported parameter.
 
         :return: An instance of an IoTHub client that uses a symmetric key for authentication.
         """
         _validate_kwargs(**kwargs)
+        _reject_unsupported_kwargs(
+            ["trust_bundle_cache_directory"], "clients using a symmetric key", **kwargs
+        )
 
         # Pipeline Config setup
         pipeline_config_kwargs = _get_pipeline_config_kwargs(**kwargs)
@@ -248,12 +528,13 @@ class AbstractIoTHubDeviceClient(AbstractIoTHubClient):
             hostname=hostname, device_id=device_id, module_id=None, shared_access_key=symmetric_key
         )
         authentication_provider.server_verification_cert = kwargs.get("server_verification_cert")
+        _apply_token_service(authentication_provider, **kwargs)
 
         # Pipeline setup
         http_pipeline = pipeline.HTTPPipeline(authentication_provider, pipeline_configuration)
         iothub_pipeline = pipeline.IoTHubPipeline(authentication_provider, pipeline_configuration)
 
-        return cls(iothub_pipeline, http_pipeline)
+        return _apply_client_options(cls(iothub_pipeline, http_pipeline), **kwargs)
 
     @abc.abstractmethod
     def receive_message(self):
@@ -285,6 +566,14 @@ class AbstractIoTHubModuleClient(AbstractIoTHubClient):
         :type cipher: str or list(str)
         :param str product_info: Configuration Option. Default is empty string. The string contains
             arbitrary product info which is appended to the user agent string.
+        :param bool shared_sas_token_service: Configuration Option. Default is False. Set to True
+            to renew the SAS token of the client from a service that is shared with other clients
+            in the same process.
+        :param str trust_bundle_cache_directory: Configuration Option. Default is None. A
+            directory to store the trust bundle of the IoT Edge runtime in. When the module starts
+            again, the stored trust bundle is used instead of requesting it from the runtime, as
+            long as none of its certificates have expired, and it is requested again in the
+            background once it is an hour old. If None, the trust bundle is requested every time.
 
         :raises: OSError if the IoT Edge container is not configured correctly.
         :raises: ValueError if debug variables are invalid.
@@ -353,11 +642,13 @@ class AbstractIoTHubModuleClient(AbstractIoTHubClient):
                     module_generation_id=module_generation_id,
                     workload_uri=workload_uri,
                     api_version=api_version,
+                    trust_bundle_cache_directory=kwargs.get("trust_bundle_cache_directory"),
                 )
             except auth.IoTEdgeError as e:
                 new_err = OSError("Unexpected failure in IoTEdge")
                 new_err.__cause__ = e
                 raise new_err
+        _apply_token_service(authentication_provider, **kwargs)
 
         # Pipeline Config setup
         pipeline_config_kwargs = _get_pipeline_config_kwargs(**kwargs)
@@ -370,7 +661,7 @@ class AbstractIoTHubModuleClient(AbstractIoTHubClient):
         http_pipeline = pipeline.HTTPPipeline(authentication_provider, pipeline_configuration)
         iothub_pipeline = pipeline.IoTHubPipeline(authentication_provider, pipeline_configuration)
 
-        return cls(iothub_pipeline, http_pipeline)
+        return _apply_client_options(cls(iothub_pipeline, http_pipeline), **kwargs)
 
     @classmethod
     def create_from_x509_certificate(cls, x509, hostname, device_id, module_id, **kwargs):
@@ -398,11 +689,16 @@ class AbstractIoTHubModuleClient(AbstractIoTHubClient):
         :param str product_info: Configuration Option. Default is empty string. The string contains
             arbitrary product info which is appended to the user agent string.
 
-        :raises: TypeError if given an unrecognized parameter.
+        :raises: TypeError if given an unrecognized or unsupported parameter.
 
         :returns: An instance of an IoTHub client that uses an X509 certificate for authentication.
         """
         _validate_kwargs(**kwargs)
+        _reject_unsupported_kwargs(
+            ["trust_bundle_cache_directory", "shared_sas_token_service"],
+            "clients using an X509 certificate",
+            **kwargs
+        )
 
         # Pipeline Config setup
         pipeline_config_kwargs = _get_pipeline_config_kwargs(**kwargs)
@@ -417,7 +713,7 @@ class AbstractIoTHubModuleClient(AbstractIoTHubClient):
         # Pipeline setup
         http_pipeline = pipeline.HTTPPipeline(authentication_provider, pipeline_configuration)
         iothub_pipeline = pipeline.IoTHubPipeline(authentication_provider, pipeline_configuration)
-        return cls(iothub_pipeline, http_pipeline)
+        return _apply_client_options(cls(iothub_pipeline, http_pipeline), **kwargs)
 
     @abc.abstractmethod
     def send_message_to_output(self, message, output_name):
@@ -8,18 +8,22 @@ Azure IoTHub Device SDK for Python.
 """
 
 import logging
+import asyncio
 from azure.iot.device.common import async_adapter
 from azure.iot.device.iothub.abstract_clients import (
     AbstractIoTHubClient,
     AbstractIoTHubDeviceClient,
     AbstractIoTHubModuleClient,
+    convert_pipeline_error,
 )
 from azure.iot.device.iothub.models import Message
 from azure.iot.device.iothub.pipeline import constant
-from azure.iot.device.iothub.pipeline import exceptions as pipeline_exceptions
 from azure.iot.device import exceptions
 from azure.iot.device.iothub.inbox_manager import InboxManager
 from .async_inbox import AsyncClientInbox
+from .async_method_dispatcher import AsyncMethodDispatcher
+from azure.iot.device.iothub.twin_cache import TwinCache
+from azure.iot.device.common.callable_weak_method import CallableWeakMethod
 from azure.iot.device import constant as device_constant
 
 logger = logging.getLogger(__name__)
@@ -28,24 +32,16 @@ logger = logging.getLogger(__name__)
 async def handle_result(callback):
     try:
         return await callback.completion()
-    except pipeline_exceptions.ConnectionDroppedError as e:
-        raise exceptions.ConnectionDroppedError(message="Lost connection to IoTHub", cause=e)
-    except pipeline_exceptions.ConnectionFailedError as e:
-        raise exceptions.ConnectionFailedError(message="Could not connect to IoTHub", cause=e)
-    except pipeline_exceptions.UnauthorizedError as e:
-        raise exceptions.CredentialError(message="Credentials invalid, could not connect", cause=e)
-    except pipeline_exceptions.ProtocolClientError as e:
-        raise exceptions.ClientError(message="Error in the IoTHub client", cause=e)
-    except pipeline_exceptions.TlsExchangeAuthError as e:
-        raise exceptions.ClientError(
-            message="Error in the IoTHub client due to TLS exchanges.", cause=e
-        )
-    except pipeline_exceptions.ProtocolProxyError as e:
-        raise exceptions.ClientError(
-            message="Error in the IoTHub client raised due to proxy connections.", cause=e
-        )
     except Exception as e:
-        raise exceptions.ClientError(message="Unexpected failure", cause=e)
+        raise convert_pipeline_error(e)
+
+
+async def _receive_batch(inbox, max_count, timeout):
+    """Return a batch of items from an inbox, or an empty list if none arrive before the timeout"""
+    try:
+        return await asyncio.wait_for(inbox.get_batch(max_items=max_count), timeout)
+    except asyncio.TimeoutError:
+        return []
 
 
 class GenericIoTHubClient(AbstractIoTHubClient):
@@ -74,6 +70,21 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         self._iothub_pipeline.on_disconnected = self._on_disconnected
         self._iothub_pipeline.on_method_request_received = self._inbox_manager.route_method_request
         self._iothub_pipeline.on_twin_patch_received = self._inbox_manager.route_twin_patch
+        self._twin_cache = None
+        self._twin_patch_inbox_enabled = False
+
+    def _enable_twin_cache(self):
+        """Keep a copy of the twin, and serve get_twin from it"""
+        self._twin_cache = TwinCache()
+        self._iothub_pipeline.on_twin_patch_received = self._on_twin_patch_received
+
+    def _on_twin_patch_received(self, patch):
+        """Handler that is called with twin patches when the twin cache is enabled"""
+        self._twin_cache.apply_desired_properties_patch(patch)
+        # The twin cache enables twin patches on its own, so the patches are only put in the inbox
+        # once the application has asked to receive them.
+        if self._twin_patch_inbox_enabled:
+            self._inbox_manager.route_twin_patch(patch)
 
     def _on_connected(self):
         """Helper handler that is called upon an iothub pipeline connect"""
@@ -84,6 +95,20 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         logger.info("Connection State - Disconnected")
         self._inbox_manager.clear_all_method_requests()
         logger.info("Cleared all pending method requests due to disconnect")
+        if self._twin_cache is not None:
+            # Twin patches may be missed while disconnected
+            self._twin_cache.invalidate()
+
+    async def _wait_for_publish_window(self):
+        """Wait until the pipeline is ready to accept more messages to publish"""
+        if not self._iothub_pipeline.publish_window_open:
+            logger.info("Waiting for previously sent messages to be acknowledged...")
+            wait_for_publish_window_async = async_adapter.emulate_async(
+                self._iothub_pipeline.wait_for_publish_window
+            )
+            callback = async_adapter.AwaitableCallback()
+            await wait_for_publish_window_async(callback=callback)
+            await callback.completion()
 
     async def connect(self):
         """Connects the client to an Azure IoT Hub or Azure IoT Edge Hub instance.
@@ -130,6 +155,10 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         If the connection to the service has not previously been opened by a call to connect, this
         function will open the connection before sending the event.
 
+        If publish limits were configured when the client was created, and too many messages are
+        already waiting to be acknowledged by the service, this function will wait until there is
+        room for more.
+
         :param message: The actual message to send. Anything passed that is not an instance of the
             Message class will be converted to Message object.
         :type message: :class:`azure.iot.device.Message` or str
@@ -147,10 +176,12 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         if not isinstance(message, Message):
             message = Message(message)
 
+        message = self._iothub_pipeline.encode_message(message)
         if message.get_size() > device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
             raise ValueError("Size of telemetry message can not exceed 256 KB.")
 
         logger.info("Sending message to Hub...")
+        await self._wait_for_publish_window()
         send_message_async = async_adapter.emulate_async(self._iothub_pipeline.send_message)
 
         callback = async_adapter.AwaitableCallback()
@@ -159,6 +190,64 @@ class GenericIoTHubClient(AbstractIoTHubClient):
 
         logger.info("Successfully sent message to Hub")
 
+    async def send_message_batch(self, messages):
+        """Sends a batch of messages to the default events endpoint on the Azure IoT Hub or Azure IoT Edge Hub instance.
+
+        The batch is handed to the pipeline as a single operation, so sending N messages this way
+        costs one handoff to the pipeline and one wait, rather than N of each.
+
+        If the connection to the service has not previously been opened by a call to connect, this
+        function will open the connection before sending the messages.
+
+        If publish limits were configured when the client was created, and too many messages are
+        already waiting to be acknowledged by the service, this function will wait until there is
+        room for more.
+
+        :param messages: The messages to send. Anything passed that is not an instance of the
+            Message class will be converted to Message object.
+        :type messages: list of :class:`azure.iot.device.Message` or str
+
+        :returns: A list with one entry per message, in the order they were given. Each entry is
+            None if the message was sent successfully, or the
+            :class:`azure.iot.device.exceptions.ClientError` describing why that message failed.
+        :rtype: list
+
+        :raises: :class:`azure.iot.device.exceptions.CredentialError` if credentials are invalid
+            and a connection cannot be established.
+        :raises: :class:`azure.iot.device.exceptions.ConnectionFailedError` if a establishing a
+            connection results in failure.
+        :raises: :class:`azure.iot.device.exceptions.ConnectionDroppedError` if connection is lost
+            during execution.
+        :raises: :class:`azure.iot.device.exceptions.ClientError` if there is an unexpected failure
+            during execution.
+        :raises: ValueError if any message fails size validation.
+        """
+        messages = [m if isinstance(m, Message) else Message(m) for m in messages]
+
+        # Encoding returns new messages rather than changing the ones passed in, so nothing the
+        # caller owns has been changed if any of them is too big to send
+        messages = [self._iothub_pipeline.encode_message(m) for m in messages]
+        for message in messages:
+            if message.get_size() > device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
+                raise ValueError("Size of telemetry message can not exceed 256 KB.")
+
+        if not messages:
+            return []
+
+        logger.info("Sending batch of {} messages to Hub...".format(len(messages)))
+        await self._wait_for_publish_window()
+        send_message_batch_async = async_adapter.emulate_async(
+            self._iothub_pipeline.send_message_batch
+        )
+
+        callback = async_adapter.AwaitableCallback(return_arg_name="results")
+        await send_message_batch_async(messages, callback=callback)
+        results = await handle_result(callback)
+
+        results = [convert_pipeline_error(e) if e else None for e in results]
+        logger.info("Successfully sent batch of messages to Hub")
+        return results
+
     async def receive_method_request(self, method_name=None):
         """Receive a method request via the Azure IoT Hub or Azure IoT Edge Hub.
 
@@ -181,6 +270,70 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         logger.info("Received method request")
         return method_request
 
+    async def receive_method_requests(self, method_name=None, max_count=None, timeout=None):
+        """Receive the method requests waiting to be received, as a batch.
+
+        If no method request is yet available, will wait until one is available.
+
+        :param str method_name: Optionally provide the name of the method to receive requests for.
+            If this parameter is not given, all methods not already being specifically targeted by
+            a different call to receive_method will be received.
+        :param int max_count: Optionally provide the maximum number of requests to receive.
+        :param int timeout: Optionally provide a number of seconds until waiting times out.
+
+        :returns: List of MethodRequest objects, oldest first, or an empty list if no method
+            request has been received before the timeout.
+        :rtype: list of `azure.iot.device.MethodRequest`
+        """
+        if not self._iothub_pipeline.feature_enabled[constant.METHODS]:
+            await self._enable_feature(constant.METHODS)
+
+        method_inbox = self._inbox_manager.get_method_request_inbox(method_name)
+
+        logger.info("Waiting for method requests...")
+        method_requests = await _receive_batch(method_inbox, max_count, timeout)
+        logger.info("Received {} method requests".format(len(method_requests)))
+        return method_requests
+
+    async def on_method_request(self, method_name, handler, max_concurrency=1):
+        """Set a handler to be called with method requests, instead of receiving them with
+        receive_method_request.
+
+        The handler is called with each MethodRequest in a task on the current event loop, with at
+        most max_concurrency tasks running it at a time, so a slow handler does not delay
+        requests for other methods.  The handler should be a coroutine function, as other handlers
+        are called on the event loop.  It returns either a MethodResponse, or the payload of a
+        response with status 200, and the response is sent automatically.  If the handler raises
+        an exception, a response with status 500 is sent.
+
+        :param str method_name: The name of the method to handle requests for, or None to handle
+            all methods which do not have their own handler or are not being specifically targeted
+            by a call to receive_method_request.
+        :param handler: The function to call with each MethodRequest, or None to remove the
+            handler for the method.
+        :param int max_concurrency: The maximum number of requests handled at a time.
+
+        :raises: TypeError if max_concurrency is not an integer.
+        :raises: ValueError if max_concurrency is less than 1.
+        """
+        if handler is not None:
+            dispatcher = AsyncMethodDispatcher(
+                handler,
+                CallableWeakMethod(self, "send_method_response"),
+                max_concurrency=max_concurrency,
+            )
+            if not self._iothub_pipeline.feature_enabled[constant.METHODS]:
+                await self._enable_feature(constant.METHODS)
+        else:
+            dispatcher = None
+
+        previous_dispatcher = self._inbox_manager.set_method_request_handler(
+            method_name, dispatcher
+        )
+        if previous_dispatcher is not None:
+            previous_dispatcher.close()
+        logger.info("Set method request handler for: {}".format(method_name or "all methods"))
+
     async def send_method_response(self, method_response):
         """Send a response to a method request via the Azure IoT Hub or Azure IoT Edge Hub.
 
@@ -231,6 +384,9 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         """
         Gets the device or module twin from the Azure IoT Hub or Azure IoT Edge Hub service.
 
+        If the twin cache is enabled, the twin is only retrieved from the service the first time,
+        and whenever the cached twin could be out of date.
+
         :returns: Complete Twin as a JSON dict
         :rtype: dict
 
@@ -245,6 +401,16 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         """
         logger.info("Getting twin")
 
+        if self._twin_cache is not None:
+            twin = self._twin_cache.get()
+            if twin is not None:
+                logger.info("Retrieved twin from cache")
+                return twin
+            # The cache is kept current from twin patches, so they must be enabled before fetching
+            if not self._iothub_pipeline.feature_enabled[constant.TWIN_PATCHES]:
+                await self._enable_feature(constant.TWIN_PATCHES)
+            generation = self._twin_cache.generation
+
         if not self._iothub_pipeline.feature_enabled[constant.TWIN]:
             await self._enable_feature(constant.TWIN)
 
@@ -253,6 +419,8 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         callback = async_adapter.AwaitableCallback(return_arg_name="twin")
         await get_twin_async(callback=callback)
         twin = await handle_result(callback)
+        if self._twin_cache is not None:
+            self._twin_cache.set(twin, generation)
         logger.info("Successfully retrieved twin")
         return twin
 
@@ -288,6 +456,9 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         await patch_twin_async(patch=reported_properties_patch, callback=callback)
         await handle_result(callback)
 
+        if self._twin_cache is not None:
+            # The new version of the reported properties is only known to the service
+            self._twin_cache.invalidate()
         logger.info("Successfully sent twin patch")
 
     async def receive_twin_desired_properties_patch(self):
@@ -299,6 +470,7 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         :returns: Twin Desired Properties patch as a JSON dict
         :rtype: dict
         """
+        self._twin_patch_inbox_enabled = True
         if not self._iothub_pipeline.feature_enabled[constant.TWIN_PATCHES]:
             await self._enable_feature(constant.TWIN_PATCHES)
         twin_patch_inbox = self._inbox_manager.get_twin_patch_inbox()
@@ -308,6 +480,21 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         logger.info("twin patch received")
         return patch
 
+    def get_inbox_metrics(self):
+        """
+        Get the metrics of the inboxes which hold received items until the application receives
+        them.
+
+        :returns: A dictionary mapping inbox names to metrics.  The inboxes are named "c2d",
+            "twin_patch", "method" (for method requests not received by method name),
+            "method:<method name>" and "input:<input name>".  The metrics of each inbox are its
+            depth (the number of items it holds), oldest_item_age (the number of seconds the oldest
+            item has been waiting, or None if it is empty) and dropped_count (the number of items
+            dropped because it was full).
+        :rtype: dict
+        """
+        return self._inbox_manager.get_metrics()
+
     async def get_storage_info_for_blob(self, blob_name):
         """Sends a POST request over HTTP to an IoTHub endpoint that will return information for uploading via the Azure Storage Account linked to the IoTHub your device is connected to.
 
@@ -386,6 +573,27 @@ class IoTHubDeviceClient(GenericIoTHubClient, AbstractIoTHubDeviceClient):
         logger.info("Message received")
         return message
 
+    async def receive_messages(self, max_count=None, timeout=None):
+        """Receive the messages that have been sent from the Azure IoT Hub, as a batch.
+
+        If no message is yet available, will wait until one is available.
+
+        :param int max_count: Optionally provide the maximum number of messages to receive.
+        :param int timeout: Optionally provide a number of seconds until waiting times out.
+
+        :returns: List of messages that were sent from the Azure IoT Hub, oldest first, or an
+            empty list if no message has been received before the timeout.
+        :rtype: list of :class:`azure.iot.device.Message`
+        """
+        if not self._iothub_pipeline.feature_enabled[constant.C2D_MSG]:
+            await self._enable_feature(constant.C2D_MSG)
+        c2d_inbox = self._inbox_manager.get_c2d_message_inbox()
+
+        logger.info("Waiting for messages from Hub...")
+        messages = await _receive_batch(c2d_inbox, max_count, timeout)
+        logger.info("Received {} messages".format(len(messages)))
+        return messages
+
 
 class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
     """An asynchronous module client that connects to an Azure IoT Hub or Azure IoT Edge instance.
@@ -413,6 +621,10 @@ class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
         If the connection to the service has not previously been opened by a call to connect, this
         function will open the connection before sending the event.
 
+        If publish limits were configured when the client was created, and too many messages are
+        already waiting to be acknowledged by the service, this function will wait until there is
+        room for more.
+
         :param message: Message to send to the given output. Anything passed that is not an
             instance of the Message class will be converted to Message object.
         :type message: :class:`azure.iot.device.Message` or str
@@ -431,12 +643,15 @@ class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
         if not isinstance(message, Message):
             message = Message(message)
 
+        # The output name is sent as a property, so it counts towards the size of the message
+        message.output_name = output_name
+
+        message = self._iothub_pipeline.encode_message(message)
         if message.get_size() > device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
             raise ValueError("Size of message can not exceed 256 KB.")
 
-        message.output_name = output_name
-
         logger.info("Sending message to output:" + output_name + "...")
+        await self._wait_for_publish_window()
         send_output_event_async = async_adapter.emulate_async(
             self._iothub_pipeline.send_output_event
         )
@@ -466,6 +681,29 @@ class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
         logger.info("Input message received on: " + input_name)
         return message
 
+    async def receive_message_on_input_batch(self, input_name, max_count=None, timeout=None):
+        """Receive the input messages that have been sent from other Modules to a specific input,
+        as a batch.
+
+        If no message is yet available, will wait until one is available.
+
+        :param str input_name: The input name to receive messages on.
+        :param int max_count: Optionally provide the maximum number of messages to receive.
+        :param int timeout: Optionally provide a number of seconds until waiting times out.
+
+        :returns: List of messages that were sent to the specified input, oldest first, or an
+            empty list if no message has been received before the timeout.
+        :rtype: list of :class:`azure.iot.device.Message`
+        """
+        if not self._iothub_pipeline.feature_enabled[constant.INPUT_MSG]:
+            await self._enable_feature(constant.INPUT_MSG)
+        inbox = self._inbox_manager.get_input_message_inbox(input_name)
+
+        logger.info("Waiting for input messages on: " + input_name + "...")
+        messages = await _receive_batch(inbox, max_count, timeout)
+        logger.info("Received {} input messages on: {}".format(len(messages), input_name))
+        return messages
+
     async def invoke_method(self, method_params, device_id, module_id=None):
         """Invoke a method from your client onto a device or module client, and receive the response to the method call.
 
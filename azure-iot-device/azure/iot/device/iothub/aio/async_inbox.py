@@ -5,8 +5,151 @@
 # --------------------------------------------------------------------------
 """This module contains an Inbox class for use with an asynchronous client"""
 
-import janus
-from azure.iot.device.iothub.sync_inbox import AbstractInbox
+import asyncio
+import collections
+import logging
+import threading
+from six.moves import queue
+from azure.iot.device.common import asyncio_compat
+from azure.iot.device.iothub.sync_inbox import AbstractInbox, BLOCK
+
+logger = logging.getLogger(__name__)
+
+
+def _is_running_loop_thread():
+    """Return True if an event loop is running on the current thread"""
+    try:
+        asyncio_compat.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class _HandoffQueue(object):
+    """A queue which hands items from other threads over to coroutines on an event loop.
+
+    Items are appended to a deque, which is threadsafe without a lock.  Coroutines waiting for
+    items are woken up with at most one call to loop.call_soon_threadsafe() for each burst of
+    items, however many items the burst contains.  A lock is only used to wait for room in a
+    queue which is at its maxsize, and never on a thread which is running an event loop.
+
+    The synchronous methods have the same behavior as those of queue.Queue, so that the queue can
+    be used by the capacity limits of AbstractInbox.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._items = collections.deque()
+        # Futures of the coroutines waiting for items, and the loop they are waiting on
+        self._waiters = collections.deque()
+        self._loop = None
+        self._wakeup_scheduled = False
+        self._not_full = threading.Condition(threading.Lock())
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def full(self):
+        return 0 < self.maxsize <= len(self._items)
+
+    def put(self, item):
+        """Add an item, waiting for room if the queue is full.
+
+        Waiting on a thread which is running an event loop would stop the coroutines that make
+        room from running, so on such a thread the item is added over the maxsize instead.
+        """
+        if self.maxsize > 0 and _is_running_loop_thread():
+            if self.full():
+                logger.warning(
+                    "Inbox is full - adding item over capacity to avoid blocking the event loop"
+                )
+            self._append(item)
+        elif self.maxsize > 0:
+            with self._not_full:
+                while self.full():
+                    self._not_full.wait()
+                self._append(item)
+        else:
+            self._append(item)
+
+    def put_nowait(self, item):
+        """Add an item.
+
+        :raises: queue.Full if the queue is full.
+        """
+        if self.full():
+            raise queue.Full
+        self._append(item)
+
+    def get_nowait(self):
+        """Remove and return the oldest item.
+
+        :raises: queue.Empty if the queue is empty.
+        """
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            raise queue.Empty
+        self._notify_not_full()
+        return item
+
+    def get_batch_nowait(self, max_items=None):
+        """Remove and return up to max_items of the oldest items, or all of them if max_items is
+        None.  Returns an empty list if the queue is empty."""
+        batch = []
+        popleft = self._items.popleft
+        try:
+            while max_items is None or len(batch) < max_items:
+                batch.append(popleft())
+        except IndexError:
+            pass
+        if batch:
+            self._notify_not_full()
+        return batch
+
+    def clear(self):
+        self._items.clear()
+        self._notify_not_full()
+
+    def __contains__(self, item):
+        # Copying the deque is atomic, so this is safe while other threads change it
+        return item in list(self._items)
+
+    async def wait(self):
+        """Wait until the queue is not empty.  Must be called on the loop that gets items."""
+        if self._items:
+            return
+        self._loop = asyncio.get_event_loop()
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            # An item may have been appended before the waiter was visible to the appending thread
+            if not self._items:
+                await waiter
+        finally:
+            self._waiters.remove(waiter)
+
+    def _append(self, item):
+        self._items.append(item)
+        if self._waiters and not self._wakeup_scheduled:
+            self._wakeup_scheduled = True
+            self._loop.call_soon_threadsafe(self._wake_waiters)
+
+    def _wake_waiters(self):
+        # Runs on the loop.  Clearing the flag first means items appended from now on schedule
+        # another wakeup.
+        self._wakeup_scheduled = False
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _notify_not_full(self):
+        if self.maxsize > 0:
+            with self._not_full:
+                self._not_full.notify_all()
 
 
 class AsyncClientInbox(AbstractInbox):
@@ -15,27 +158,40 @@ class AsyncClientInbox(AbstractInbox):
     All methods implemented in this class are threadsafe.
     """
 
-    def __init__(self):
-        """Initializer for AsyncClientInbox."""
-        self._queue = janus.Queue()
+    def __init__(self, capacity=None, overflow_policy=BLOCK, spill_directory=None):
+        """Initializer for AsyncClientInbox.
+
+        The Inbox can be created outside of an event loop.  It is bound to the loop of the first
+        coroutine that waits for an item.
+
+        :param int capacity: The maximum number of items the inbox can hold in memory, or None for
+            no limit.
+        :param str overflow_policy: What to do with an item put into the inbox when it is full.
+            BLOCK waits for a free slot, which holds up everything else the pipeline delivers.
+            DROP_OLDEST drops the oldest item to make room.  DROP_NEWEST drops the new item.
+            SPILL keeps the new item on disk until there is room.
+        :param str spill_directory: The directory to spill items to disk in, or None for the
+            default temporary directory.
+
+        :raises: ValueError if the overflow policy is unknown, or is BLOCK with a capacity while
+            the pipeline runs on an event loop.
+        """
+        self._queue = _HandoffQueue(maxsize=capacity or 0)
+        self._init_capacity(self._queue, overflow_policy, spill_directory)
 
     def __contains__(self, item):
         """Return True if item is in Inbox, False otherwise"""
-        # Note that this function accesses private attributes of janus, thus it is somewhat
-        # dangerous. Unforutnately, it is the only way to implement this functionality.
-        # However, because this function is only used in tests, I feel it is acceptable.
-        with self._queue._sync_mutex:
-            return item in self._queue._queue
+        return item in self._queue
 
     def _put(self, item):
         """Put an item into the Inbox.
 
-        Block if necessary until a free slot is available.
+        If the Inbox is full, apply its overflow policy.
         Only to be used by the InboxManager.
 
         :param item: The item to be put in the Inbox.
         """
-        self._queue.sync_q.put(item)
+        self._put_with_overflow_policy(item)
 
     async def get(self):
         """Remove and return an item from the Inbox.
@@ -44,20 +200,44 @@ class AsyncClientInbox(AbstractInbox):
 
         :returns: An item from the Inbox.
         """
-        return await self._queue.async_q.get()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                await self._queue.wait()
+            else:
+                self._on_item_removed()
+                return item
+
+    async def get_batch(self, max_items=None):
+        """Remove and return the items in the Inbox, up to max_items of them.
+
+        If Inbox is empty, wait until an item is available.
+
+        :param int max_items: The maximum number of items to return, or None for no limit.
+
+        :raises: ValueError if max_items is less than 1
+
+        :returns: A list of items from the Inbox, oldest first.
+        """
+        if max_items is not None and max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        while True:
+            batch = self._queue.get_batch_nowait(max_items)
+            if batch:
+                self._on_item_removed(len(batch))
+                return batch
+            await self._queue.wait()
 
     def empty(self):
         """Returns True if the inbox is empty, False otherwise
 
         :returns: Boolean indicating if the inbox is empty
         """
-        return self._queue.async_q.empty()
+        return self._queue.empty()
 
     def clear(self):
         """Remove all items from the inbox.
         """
-        while True:
-            try:
-                self._queue.sync_q.get_nowait()
-            except janus.SyncQueueEmpty:
-                break
+        self._clear_overflow()
+        self._queue.clear()
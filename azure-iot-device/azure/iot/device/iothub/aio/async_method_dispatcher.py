@@ -0,0 +1,67 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""This module contains a class for calling method request handlers in an asynchronous client"""
+
+import asyncio
+import inspect
+import logging
+from azure.iot.device.iothub.sync_method_dispatcher import AbstractMethodDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMethodDispatcher(AbstractMethodDispatcher):
+    """Calls a method request handler in asyncio tasks for an asynchronous client.
+
+    Each method request is handled by its own task, and at most max_concurrency of them run the
+    handler at a time, so a slow handler only delays requests for its own method.  The handler
+    can be a coroutine function.  If it is not, it is called on the event loop, so it must not
+    block.
+    """
+
+    def __init__(self, handler, send_method_response, max_concurrency=1):
+        """Initializer for AsyncMethodDispatcher.
+
+        Must be called on the event loop the handler will be called on.
+        """
+        super().__init__(handler, send_method_response, max_concurrency)
+        self._loop = asyncio.get_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # The event loop only keeps weak references to tasks, so they are kept here until done
+        self._tasks = set()
+
+    def dispatch(self, method_request):
+        """Start a task on the event loop to handle a method request.  Can be called from any
+        thread.
+
+        :param method_request: The MethodRequest to handle.
+        """
+        self._loop.call_soon_threadsafe(self._start_task, method_request)
+
+    def _start_task(self, method_request):
+        task = self._loop.create_task(self._handle(method_request))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, method_request):
+        async with self._semaphore:
+            try:
+                result = self.handler(method_request)
+                if inspect.isawaitable(result):
+                    result = await result
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                method_response = self._create_error_method_response(method_request)
+            else:
+                method_response = self._create_method_response(method_request, result)
+        try:
+            await self._send_method_response(method_response)
+        except Exception:
+            logger.error(
+                "Failed to send response to method request {}".format(method_request.request_id),
+                exc_info=True,
+            )
@@ -10,8 +10,10 @@ import abc
 import logging
 import math
 import six
+import threading
 import weakref
-from threading import Timer
+from concurrent.futures import ThreadPoolExecutor
+from azure.iot.device.common.timer_wheel import Timer
 import six.moves.urllib as urllib
 from .authentication_provider import AuthenticationProvider
 
@@ -20,6 +22,13 @@ logger = logging.getLogger(__name__)
 _device_keyname_token_format = "SharedAccessSignature sr={}&sig={}&se={}&skn={}"
 _device_token_format = "SharedAccessSignature sr={}&sig={}&se={}"
 
+# Maximum number of timed token updates which are signed at once, when the updates are not
+# scheduled by a SasTokenService.
+TOKEN_UPDATE_CONCURRENCY = 4
+
+_token_update_executor = None
+_token_update_executor_lock = threading.Lock()
+
 # Length of time, in seconds, that a SAS token is valid for.
 DEFAULT_TOKEN_VALIDITY_PERIOD = 3600
 
@@ -62,6 +71,7 @@ class BaseRenewableTokenAuthenticationProvider(AuthenticationProvider):
         self.shared_access_key_name = None
         self.sas_token_str = None
         self.on_sas_token_updated_handler_list = []
+        self.token_service = None
 
     def __del__(self):
         self._cancel_token_update_timer()
@@ -110,8 +120,23 @@ class BaseRenewableTokenAuthenticationProvider(AuthenticationProvider):
         the token will be renewed close to it's expiration time, but not so close that
         we risk a problem caused by clock drift.
 
+        If self.token_service is set, the token update is scheduled by that SasTokenService
+        instead of by a timer of this object.  The service can schedule the update earlier than
+        (token_validity_period - token_renewal_margin) seconds in the future, and creates the
+        token for that update ahead of time.
+
         :return: None
         """
+        token, _ = self._create_sas_token()
+        self.sas_token_str = token
+        self._schedule_token_update(self.token_validity_period - self.token_renewal_margin)
+        self._notify_token_updated()
+
+    def _create_sas_token(self):
+        """Create a new SAS token string using the _sign function, without starting to use it.
+
+        :return: A tuple of the new token string and its expiry, in seconds since the epoch.
+        """
         logger.info(
             "Generating new SAS token for (%s,%s) that expires %d seconds in the future",
             self.device_id,
@@ -133,8 +158,14 @@ class BaseRenewableTokenAuthenticationProvider(AuthenticationProvider):
         else:
             token = _device_token_format.format(quoted_resource_uri, signature, str(expiry))
 
-        self.sas_token_str = str(token)
-        self._schedule_token_update(self.token_validity_period - self.token_renewal_margin)
+        return str(token), expiry
+
+    def _update_sas_token(self, token, expiry):
+        """Start using a SAS token which was created ahead of time by _create_sas_token, and
+        schedule the next token update for token_renewal_margin seconds before it expires.
+        """
+        self.sas_token_str = token
+        self._schedule_token_update(max(0, expiry - time.time() - self.token_renewal_margin))
         self._notify_token_updated()
 
     def _cancel_token_update_timer(self):
@@ -157,6 +188,12 @@ class BaseRenewableTokenAuthenticationProvider(AuthenticationProvider):
         previously-scheduled update and schedule a new update.
         """
         self._cancel_token_update_timer()
+        if self.token_service:
+            self._token_update_timer = self.token_service.schedule_token_update(
+                self, seconds_until_update
+            )
+            return
+
         logger.debug(
             "Scheduling token update for (%s,%s) for %d seconds in the future",
             self.device_id,
@@ -184,13 +221,18 @@ class BaseRenewableTokenAuthenticationProvider(AuthenticationProvider):
         #
         self_weakref = weakref.ref(self)
 
-        def timerfunc():
+        def update_token():
             this = self_weakref()
-            logger.debug("Timed SAS update for (%s,%s)", this.device_id, this.module_id)
-            this.generate_new_sas_token()
+            if this:
+                logger.debug("Timed SAS update for (%s,%s)", this.device_id, this.module_id)
+                this.generate_new_sas_token()
+
+        def timerfunc():
+            # Signing the token can be slow (for example, a request to an HSM), so it is done on
+            # a worker thread rather than on the timer callback thread.
+            return _submit_token_update(update_token)
 
         self._token_update_timer = Timer(seconds_until_update, timerfunc)
-        self._token_update_timer.daemon = True
         self._token_update_timer.start()
 
     def _notify_token_updated(self):
@@ -230,3 +272,12 @@ class BaseRenewableTokenAuthenticationProvider(AuthenticationProvider):
         for placing the signature inside the sig field of a SAS token string.
         """
         pass
+
+
+def _submit_token_update(function):
+    """Run a timed token update on one of the token update worker threads"""
+    global _token_update_executor
+    with _token_update_executor_lock:
+        if not _token_update_executor:
+            _token_update_executor = ThreadPoolExecutor(max_workers=TOKEN_UPDATE_CONCURRENCY)
+    return _token_update_executor.submit(function)
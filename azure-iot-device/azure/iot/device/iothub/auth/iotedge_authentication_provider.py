@@ -7,11 +7,16 @@
 import os
 import base64
 import json
+import re
+import six
+import threading
+import time
 import six.moves.urllib as urllib
 import requests
 import requests_unixsocket
 import logging
 from .base_renewable_token_authentication_provider import BaseRenewableTokenAuthenticationProvider
+from . import trust_bundle_store
 from azure.iot.device.common.chainable_exception import ChainableException
 from azure.iot.device.product_info import ProductInfo
 
@@ -19,6 +24,12 @@ requests_unixsocket.monkeypatch()
 
 logger = logging.getLogger(__name__)
 
+# Length of time, in seconds, that a trust bundle received from the workload API is used for before
+# it is requested again.
+TRUST_BUNDLE_CACHE_TTL = 3600
+
+_base64_re = re.compile(r"^[A-Za-z0-9+/\s]+=*\s*$")
+
 
 class IoTEdgeError(ChainableException):
     pass
@@ -39,9 +50,14 @@ class IoTEdgeAuthenticationProvider(BaseRenewableTokenAuthenticationProvider):
         module_generation_id,
         workload_uri,
         api_version,
+        trust_bundle_cache_directory=None,
     ):
         """
         Constructor for IoT Edge Authentication Provider
+
+        :param str trust_bundle_cache_directory: A directory to store the trust bundle in, so that
+            it does not have to be requested from the workload API every time the module starts.
+            None means the trust bundle is not stored.
         """
 
         logger.info("Using IoTEdge authentication for {%s, %s, %s}", hostname, device_id, module_id)
@@ -55,9 +71,27 @@ class IoTEdgeAuthenticationProvider(BaseRenewableTokenAuthenticationProvider):
             api_version=api_version,
             module_generation_id=module_generation_id,
             workload_uri=workload_uri,
+            trust_bundle_cache_directory=trust_bundle_cache_directory,
         )
         self.gateway_hostname = gateway_hostname
         self.server_verification_cert = self.hsm.get_trust_bundle()
+        self._server_verification_cert_is_stored = self.hsm.trust_bundle_is_stored
+
+    def refresh_server_verification_cert(self):
+        """
+        Request the server verification certificate again if it is a stored trust bundle, which
+        can be out of date if the IoT Edge CA has been rotated since it was stored.  This is only
+        done once, since a certificate which was just requested is already up to date.
+
+        :return: The new server verification certificate, or None if it was not refreshed.
+
+        :raises: IoTEdgeError if unable to retrieve the certificate.
+        """
+        if not self._server_verification_cert_is_stored:
+            return None
+        self.server_verification_cert = self.hsm.refresh_trust_bundle()
+        self._server_verification_cert_is_stored = False
+        return self.server_verification_cert
 
     # TODO: reconsider this design when refactoring the BaseRenewableToken auth parent
     # TODO: Consider handling the quoting within this function, and renaming quoted_resource_uri to resource_uri
@@ -87,7 +121,14 @@ class IoTEdgeHsm(object):
        SharedAccessSignature string which can be used to authenticate with Iot Edge
     """
 
-    def __init__(self, module_id, module_generation_id, workload_uri, api_version):
+    def __init__(
+        self,
+        module_id,
+        module_generation_id,
+        workload_uri,
+        api_version,
+        trust_bundle_cache_directory=None,
+    ):
         """
         Constructor for instantiating a Azure IoT Edge HSM object
 
@@ -95,11 +136,16 @@ class IoTEdgeHsm(object):
         :param str api_version: The API version
         :param str module_generation_id: The module generation id
         :param str workload_uri: The workload uri
+        :param str trust_bundle_cache_directory: A directory to store the trust bundle in (optional)
         """
         self.module_id = urllib.parse.quote(module_id)
         self.api_version = api_version
         self.module_generation_id = module_generation_id
         self.workload_uri = _format_socket_uri(workload_uri)
+        self.trust_bundle_cache_directory = trust_bundle_cache_directory
+        # True if the last trust bundle returned by get_trust_bundle was a stored one
+        self.trust_bundle_is_stored = False
+        self._session = _get_workload_session(self.workload_uri)
 
     # TODO: Is this really the right name? It returns a certificate FROM the trust bundle,
     # not the trust bundle itself
@@ -111,9 +157,56 @@ class IoTEdgeHsm(object):
         :return: The server verification certificate to use for connections to the Azure IoT Edge
         instance, as a PEM certificate in string form.
 
+        The trust bundle is shared with every IoTEdgeHsm in the process that uses the same
+        workload API, and is only requested again once it is TRUST_BUNDLE_CACHE_TTL seconds old.
+
+        If self.trust_bundle_cache_directory is set, the trust bundle is also stored in that
+        directory, and a stored trust bundle is returned without making a request, as long as it
+        matches its fingerprint and none of its certificates have expired.  If the stored trust
+        bundle is more than TRUST_BUNDLE_CACHE_TTL seconds old, it is still returned, but it is
+        requested again in the background, so that the stored trust bundle is kept current.
+
         :raises: IoTEdgeError if unable to retrieve the certificate.
         """
-        r = requests.get(
+        cache_key = (self.workload_uri, self.api_version)
+        with _trust_bundle_cache_lock:
+            cached = _trust_bundle_cache.get(cache_key)
+        if cached and time.time() - cached[1] < TRUST_BUNDLE_CACHE_TTL:
+            self.trust_bundle_is_stored = cached[2]
+            return cached[0]
+
+        if self.trust_bundle_cache_directory:
+            stored = trust_bundle_store.load(self._get_trust_bundle_path())
+            if stored:
+                cert, received_time = stored
+                logger.debug("Using stored trust bundle")
+                with _trust_bundle_cache_lock:
+                    _trust_bundle_cache[cache_key] = (cert, time.time(), True)
+                if time.time() - received_time >= TRUST_BUNDLE_CACHE_TTL:
+                    self._refresh_trust_bundle_in_background()
+                self.trust_bundle_is_stored = True
+                return cert
+
+        return self.refresh_trust_bundle()
+
+    def refresh_trust_bundle(self):
+        """
+        Request the trust bundle from the workload API, even if there is a cached or stored one,
+        and replace the cached and stored trust bundle with it.
+
+        :return: The server verification certificate, as a PEM certificate in string form.
+
+        :raises: IoTEdgeError if unable to retrieve the certificate.
+        """
+        cert = self._request_trust_bundle()
+        self.trust_bundle_is_stored = False
+        return cert
+
+    def _request_trust_bundle(self):
+        """
+        Request the trust bundle from the workload API, and cache it.
+        """
+        r = self._session.get(
             self.workload_uri + "trust-bundle",
             params={"api-version": self.api_version},
             headers={"User-Agent": urllib.parse.quote_plus(ProductInfo.get_iothub_user_agent())},
@@ -133,8 +226,43 @@ class IoTEdgeHsm(object):
             cert = bundle["certificate"]
         except KeyError as e:
             raise IoTEdgeError(message="No certificate in trust bundle", cause=e)
+        # Make sure that the certificate can be used before it is cached
+        try:
+            _validate_certificate(cert)
+        except ValueError as e:
+            raise IoTEdgeError(message="Invalid certificate in trust bundle", cause=e)
+
+        received_time = time.time()
+        with _trust_bundle_cache_lock:
+            _trust_bundle_cache[(self.workload_uri, self.api_version)] = (
+                cert,
+                received_time,
+                False,
+            )
+        if self.trust_bundle_cache_directory:
+            try:
+                trust_bundle_store.save(self._get_trust_bundle_path(), cert, received_time)
+            except (IOError, OSError) as e:
+                logger.warning("Unable to store trust bundle: %s", e)
         return cert
 
+    def _refresh_trust_bundle_in_background(self):
+        def refresh():
+            try:
+                self._request_trust_bundle()
+            except IoTEdgeError as e:
+                logger.warning("Unable to refresh stored trust bundle: %s", e)
+
+        logger.debug("Refreshing stored trust bundle in the background")
+        refresh_thread = threading.Thread(target=refresh, name="azure_iot_trust_bundle_refresh")
+        refresh_thread.daemon = True
+        refresh_thread.start()
+
+    def _get_trust_bundle_path(self):
+        return trust_bundle_store.get_path(
+            self.trust_bundle_cache_directory, self.workload_uri, self.api_version
+        )
+
     def sign(self, data_str):
         """
         Use the IoTEdge HSM to sign a piece of string data.  The caller should then insert the
@@ -159,7 +287,7 @@ class IoTEdgeHsm(object):
         )
         sign_request = {"keyId": "primary", "algo": "HMACSHA256", "data": encoded_data_str}
 
-        r = requests.post(  # TODO: can we use json field instead of data?
+        r = self._session.post(  # TODO: can we use json field instead of data?
             url=path,
             params={"api-version": self.api_version},
             headers={"User-Agent": urllib.parse.quote_plus(ProductInfo.get_iothub_user_agent())},
@@ -181,6 +309,56 @@ class IoTEdgeHsm(object):
         return urllib.parse.quote(signed_data_str)
 
 
+_workload_sessions = {}
+_workload_sessions_lock = threading.Lock()
+
+_trust_bundle_cache = {}
+_trust_bundle_cache_lock = threading.Lock()
+
+
+def _get_workload_session(workload_uri):
+    """
+    Get the requests Session which is shared by every IoTEdgeHsm in the process that uses the
+    workload API at workload_uri, creating it if necessary.
+
+    The session pools its connections to the workload API and keeps them open between requests,
+    so that signing a token does not have to open a new connection to the workload socket.
+    """
+    with _workload_sessions_lock:
+        session = _workload_sessions.get(workload_uri)
+        if not session:
+            logger.debug("Creating session for workload API at %s", workload_uri)
+            session = requests_unixsocket.Session()
+            _workload_sessions[workload_uri] = session
+        return session
+
+
+def clear_trust_bundle_cache():
+    """
+    Discard every cached trust bundle, so that the next call to get_trust_bundle requests the
+    trust bundle from the workload API.
+    """
+    with _trust_bundle_cache_lock:
+        _trust_bundle_cache.clear()
+
+
+def _validate_certificate(cert):
+    """
+    Raise ValueError if cert is not made up of one or more PEM certificates.
+    """
+    if not isinstance(cert, six.string_types):
+        raise ValueError("Certificate is not a string")
+    bodies = trust_bundle_store.pem_certificate_re.findall(cert)
+    if not bodies:
+        raise ValueError("No PEM certificates found")
+    for body in bodies:
+        if not _base64_re.match(body):
+            raise ValueError("PEM certificate is not base64 encoded")
+        # A DER certificate is an ASN.1 SEQUENCE
+        if bytearray(base64.b64decode(body))[:1] != bytearray(b"\x30"):
+            raise ValueError("PEM certificate is not a DER certificate")
+
+
 def _format_socket_uri(old_uri):
     """
     This function takes a socket URI in one form and converts it into another form.
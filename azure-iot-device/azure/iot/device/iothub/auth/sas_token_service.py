@@ -0,0 +1,174 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""This module provides a service which renews the SAS tokens of many authentication providers"""
+
+import logging
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from azure.iot.device.common.timer_wheel import Timer
+
+logger = logging.getLogger(__name__)
+
+# Largest fraction of the time until a token update that the update can be moved earlier by.
+DEFAULT_RENEWAL_JITTER = 0.1
+
+# Length of time, in seconds, before a token update that the new token is signed.
+DEFAULT_PRESIGN_LEAD = 30
+
+# Maximum number of tokens that are signed or updated at once.
+DEFAULT_PRESIGN_CONCURRENCY = 4
+
+
+class SasTokenRenewal(object):
+    """A scheduled token update for one authentication provider.
+
+    This has the same cancel() method as a Timer, so it can be stored and cancelled by the
+    authentication provider in place of its own token update timer.
+    """
+
+    def __init__(self, provider):
+        self.provider_weakref = weakref.ref(provider)
+        self.presign_timer = None
+        self.update_timer = None
+        # The presigned token and its expiry, once the token has been signed.
+        self.presigned = None
+
+    def cancel(self):
+        """Stop the token update if it hasn't happened yet."""
+        if self.presign_timer:
+            self.presign_timer.cancel()
+        if self.update_timer:
+            self.update_timer.cancel()
+
+
+class SasTokenService(object):
+    """A service which renews the SAS tokens of many authentication providers.
+
+    A process which hosts many identities creates all of their tokens at around the same time,
+    so without this service all of their tokens are renewed at around the same time too, and
+    every renewal causes a reconnect.  This service moves each token update earlier by a random
+    amount of up to renewal_jitter times the time until the update, so that the updates are
+    spread out.  It also signs each new token presign_lead seconds ahead of its update, so the
+    signing work (which can be a request to an HSM) is done before the update rather than as
+    part of it.  Tokens are signed and updated on worker threads of the service, so that a slow
+    signature does not hold up the timers of the rest of the process.
+
+    If the new token cannot be signed ahead of time, it is signed when the update is due, as it
+    would have been without this service.
+
+    All of the timers used by the service run on the shared timer wheel.
+    """
+
+    def __init__(
+        self,
+        renewal_jitter=DEFAULT_RENEWAL_JITTER,
+        presign_lead=DEFAULT_PRESIGN_LEAD,
+        presign_concurrency=DEFAULT_PRESIGN_CONCURRENCY,
+    ):
+        """Initializer for SasTokenService
+
+        :param float renewal_jitter: The largest fraction of the time until a token update that
+            the update can be moved earlier by.  Must be between 0 and 1.
+        :param float presign_lead: The number of seconds before a token update that the new
+            token is signed.
+        :param int presign_concurrency: The maximum number of tokens that are signed or updated
+            at once.
+        """
+        if not 0 <= renewal_jitter <= 1:
+            raise ValueError("'renewal_jitter' must be between 0 and 1")
+        if presign_lead < 0:
+            raise ValueError("'presign_lead' must not be negative")
+        if presign_concurrency < 1:
+            raise ValueError("'presign_concurrency' must be at least 1")
+        self.renewal_jitter = renewal_jitter
+        self.presign_lead = presign_lead
+        self.presign_concurrency = presign_concurrency
+        self._random = random.Random()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def schedule_token_update(self, provider, seconds_until_update):
+        """Schedule a token update for an authentication provider.
+
+        :param provider: The BaseRenewableTokenAuthenticationProvider to update the token of.
+        :param seconds_until_update: The latest time, in seconds from now, to update the token at.
+
+        :return: A SasTokenRenewal object which can be used to cancel the token update.
+        """
+        jitter = self._random.uniform(0, seconds_until_update * self.renewal_jitter)
+        update_delay = max(0, seconds_until_update - jitter)
+        presign_delay = max(0, update_delay - self.presign_lead)
+        logger.debug(
+            "Scheduling token update for (%s,%s) for %d seconds in the future, signed %d seconds in the future",
+            provider.device_id,
+            provider.module_id,
+            update_delay,
+            presign_delay,
+        )
+
+        # Only weak references to the provider are held, so that a scheduled update does not keep
+        # the provider (and the pipeline that it notifies) from being collected.
+        renewal = SasTokenRenewal(provider)
+        renewal.presign_timer = Timer(presign_delay, self._submit, [_presign_token, renewal])
+        renewal.update_timer = Timer(update_delay, self._submit, [_update_token, renewal])
+        renewal.presign_timer.start()
+        renewal.update_timer.start()
+        return renewal
+
+    def _submit(self, function, renewal):
+        """Run function on a worker thread of the service, so that signing a token does not hold
+        up the timers of the rest of the process"""
+        with self._executor_lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(max_workers=self.presign_concurrency)
+        self._executor.submit(function, renewal)
+
+
+def _presign_token(renewal):
+    provider = renewal.provider_weakref()
+    if not provider:
+        return
+    try:
+        renewal.presigned = provider._create_sas_token()
+    except Exception as e:
+        logger.warning(
+            "Unable to sign the next token for (%s,%s) ahead of time: %s",
+            provider.device_id,
+            provider.module_id,
+            e,
+        )
+
+
+def _update_token(renewal):
+    provider = renewal.provider_weakref()
+    if not provider:
+        return
+    logger.debug("Timed SAS update for (%s,%s)", provider.device_id, provider.module_id)
+    # If the token is still being signed, it is signed again here rather than waited for
+    presigned = renewal.presigned
+    if presigned:
+        provider._update_sas_token(*presigned)
+    else:
+        provider.generate_new_sas_token()
+
+
+_shared_sas_token_service = None
+_shared_sas_token_service_lock = threading.Lock()
+
+
+def get_shared_sas_token_service():
+    """
+    Get the SasTokenService object which is shared by every client in the process, creating it
+    if necessary.
+    """
+    global _shared_sas_token_service
+    with _shared_sas_token_service_lock:
+        if not _shared_sas_token_service:
+            logger.debug("Creating shared SAS token service")
+            _shared_sas_token_service = SasTokenService()
+        return _shared_sas_token_service
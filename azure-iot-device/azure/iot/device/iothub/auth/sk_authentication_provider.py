@@ -65,6 +65,10 @@ class SymmetricKeyAuthenticationProvider(BaseRenewableTokenAuthenticationProvide
         self.shared_access_key_name = shared_access_key_name
         self.gateway_hostname = gateway_hostname
         self.server_verification_cert = None
+        # The decoded shared_access_key, and the shared_access_key it was decoded from, so that
+        # the key is only decoded again if it changes.
+        self._signing_key = None
+        self._signing_key_source = None
 
     @staticmethod
     def parse(connection_string):
@@ -111,13 +115,18 @@ class SymmetricKeyAuthenticationProvider(BaseRenewableTokenAuthenticationProvide
         """
         try:
             message = (quoted_resource_uri + "\n" + str(expiry)).encode("utf-8")
-            signing_key = base64.b64decode(self.shared_access_key.encode("utf-8"))
-            signed_hmac = hmac.HMAC(signing_key, message, hashlib.sha256)
+            signed_hmac = hmac.HMAC(self._get_signing_key(), message, hashlib.sha256)
             signature = urllib.parse.quote(base64.b64encode(signed_hmac.digest()))
         except (TypeError, base64.binascii.Error):
             raise ValueError("Unable to build shared access signature from given values")
         return signature
 
+    def _get_signing_key(self):
+        if self._signing_key is None or self._signing_key_source is not self.shared_access_key:
+            self._signing_key = base64.b64decode(self.shared_access_key.encode("utf-8"))
+            self._signing_key_source = self.shared_access_key
+        return self._signing_key
+
 
 def _validate_keys(d):
     """Raise ValueError if incorrect combination of keys
@@ -0,0 +1,211 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""This module stores IoT Edge trust bundles on disk, so that a module which restarts can use the
+trust bundle from its last start instead of requesting it from the workload API.
+
+A stored trust bundle decides which servers the module trusts, so it is only stored in, and loaded
+from, a directory and file that are owned by the current user and can't be written by anyone else.
+The fingerprint stored with a trust bundle is kept in the same file, so it only detects a file
+that was corrupted, not one that was replaced.  Ownership and permissions are not checked on
+platforms without POSIX user IDs, such as Windows, where access is controlled by ACLs instead.
+"""
+
+import base64
+import binascii
+import calendar
+import hashlib
+import json
+import logging
+import os
+import re
+import stat
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+pem_certificate_re = re.compile(
+    r"-----BEGIN CERTIFICATE-----(.*?)-----END CERTIFICATE-----", re.DOTALL
+)
+
+
+class InsecureLocationError(OSError):
+    """Raised when a trust bundle would be stored in, or loaded from, a directory or file which
+    other users could change"""
+
+    pass
+
+
+# DER tags
+_SEQUENCE = 0x30
+_EXPLICIT_VERSION = 0xA0
+_UTC_TIME = 0x17
+_GENERALIZED_TIME = 0x18
+
+
+def get_path(directory, workload_uri, api_version):
+    """
+    Get the path of the file in directory which stores the trust bundle of the workload API at
+    workload_uri.
+    """
+    key = hashlib.sha256((workload_uri + "\n" + api_version).encode("utf-8")).hexdigest()
+    return os.path.join(directory, "trust_bundle_{}.json".format(key[:16]))
+
+
+def load(path):
+    """
+    Load a trust bundle which was stored with save().
+
+    The trust bundle is only returned if the file and its directory are private to the current
+    user, it matches the fingerprint stored with it, and none of its certificates have expired.
+
+    :return: A tuple of the trust bundle and the time it was received from the workload API, or
+        None if there is no usable trust bundle in the file.
+    """
+    try:
+        _check_private(os.path.dirname(path))
+        _check_private(path)
+    except InsecureLocationError as e:
+        logger.warning("Not using stored trust bundle: %s", e)
+        return None
+    except (IOError, OSError) as e:
+        logger.debug("No usable trust bundle stored in %s: %s", path, e)
+        return None
+    try:
+        with open(path, "r") as f:
+            stored = json.load(f)
+        certificate = stored["certificate"]
+        received_time = stored["received_time"]
+        if _get_fingerprint(certificate) != stored["fingerprint"]:
+            logger.warning("Stored trust bundle %s does not match its fingerprint", path)
+            return None
+        expiry = get_expiry(certificate)
+    except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.debug("No usable trust bundle stored in %s: %s", path, e)
+        return None
+    if expiry <= time.time():
+        logger.info("Stored trust bundle %s has expired", path)
+        return None
+    return (certificate, received_time)
+
+
+def save(path, certificate, received_time):
+    """
+    Store a trust bundle, along with its fingerprint and the time it was received from the
+    workload API.  The directory is created, private to the current user, if it does not exist.
+    The file is written to a temporary file of its own and then replaced in one step, so a module
+    which starts while it is being written never loads a partly written trust bundle.
+
+    :raises: InsecureLocationError if the directory is not private to the current user.
+    :raises: IOError or OSError if the trust bundle can't be written.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    _check_private(directory)
+    # mkstemp creates the file readable and writable only by the current user
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".trust_bundle_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "certificate": certificate,
+                    "fingerprint": _get_fingerprint(certificate),
+                    "received_time": received_time,
+                },
+                f,
+            )
+        if hasattr(os, "replace"):
+            os.replace(temp_path, path)
+        else:
+            # Python 2.7
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def get_expiry(certificate):
+    """
+    Get the time at which the first of the PEM certificates in certificate expires.
+
+    :return: The expiry, in seconds since the epoch.
+
+    :raises: ValueError if certificate does not contain PEM certificates that can be read.
+    """
+    bodies = pem_certificate_re.findall(certificate)
+    if not bodies:
+        raise ValueError("No PEM certificates found")
+    return min(_get_der_expiry(bytearray(base64.b64decode(body))) for body in bodies)
+
+
+def _check_private(path):
+    """Raise InsecureLocationError unless path is owned by the current user, and can't be written
+    by its group or other users."""
+    if not hasattr(os, "getuid"):
+        return
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise InsecureLocationError("{} is not owned by the current user".format(path))
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise InsecureLocationError("{} can be written by other users".format(path))
+
+
+def _get_fingerprint(certificate):
+    return hashlib.sha256(certificate.encode("utf-8")).hexdigest()
+
+
+def _read_der_header(der, offset, expected_tag=None):
+    """Read the tag and length of the DER element at offset.
+
+    :return: A tuple of the tag, the offset of the contents of the element and the offset of the
+        next element.
+    """
+    if offset + 2 > len(der):
+        raise ValueError("Truncated DER certificate")
+    tag = der[offset]
+    if expected_tag is not None and tag != expected_tag:
+        raise ValueError("Unexpected DER tag {:#x}".format(tag))
+    length = der[offset + 1]
+    offset += 2
+    if length & 0x80:
+        length_size = length & 0x7F
+        if not length_size or offset + length_size > len(der):
+            raise ValueError("Invalid DER length")
+        length = int(binascii.hexlify(der[offset : offset + length_size]), 16)
+        offset += length_size
+    if offset + length > len(der):
+        raise ValueError("Truncated DER certificate")
+    return tag, offset, offset + length
+
+
+def _get_der_expiry(der):
+    # Certificate ::= SEQUENCE { tbsCertificate, ... }
+    _, offset, _ = _read_der_header(der, 0, _SEQUENCE)
+    # TBSCertificate ::= SEQUENCE { [0] version OPTIONAL, serialNumber, signature, issuer,
+    #                               validity, ... }
+    _, offset, _ = _read_der_header(der, offset, _SEQUENCE)
+    tag, _, next_offset = _read_der_header(der, offset)
+    if tag == _EXPLICIT_VERSION:
+        offset = next_offset
+    for _ in range(3):
+        # serialNumber, signature and issuer
+        _, _, offset = _read_der_header(der, offset)
+    # Validity ::= SEQUENCE { notBefore Time, notAfter Time }
+    _, offset, _ = _read_der_header(der, offset, _SEQUENCE)
+    _, _, offset = _read_der_header(der, offset)
+    tag, start, end = _read_der_header(der, offset)
+    not_after = bytes(der[start:end]).decode("ascii")
+    if tag == _UTC_TIME:
+        # Two digit years 50 to 99 are 1950 to 1999 (RFC 5280)
+        century = "19" if int(not_after[:2]) >= 50 else "20"
+        not_after = century + not_after
+    elif tag != _GENERALIZED_TIME:
+        raise ValueError("Unexpected DER tag {:#x} for notAfter".format(tag))
+    return calendar.timegm(time.strptime(not_after, "%Y%m%d%H%M%SZ"))
@@ -5,10 +5,16 @@
 # --------------------------------------------------------------------------
 """This module contains a manager for inboxes."""
 
+import collections
 import logging
+import six
+from .sync_inbox import BLOCK, OVERFLOW_POLICIES
+from .sync_method_dispatcher import DispatcherClosed
 
 logger = logging.getLogger(__name__)
 
+InboxMetrics = collections.namedtuple("InboxMetrics", ["depth", "oldest_item_age", "dropped_count"])
+
 
 class InboxManager(object):
     """Manages the various Inboxes for a client.
@@ -17,20 +23,58 @@ class InboxManager(object):
     :ivar input_message_inboxes: A dictionary mapping input names to input message Inboxes.
     :ivar generic_method_request_inbox: The generic method request Inbox.
     :ivar named_method_request_inboxes: A dictionary mapping method names to method request Inboxes.
+    :ivar method_request_handlers: A dictionary mapping method names, or None for generic method
+        requests, to the handlers method requests are routed to instead of Inboxes.
     """
 
-    def __init__(self, inbox_type):
+    def __init__(self, inbox_type, capacity=None, overflow_policy=BLOCK, spill_directory=None):
         """Initializer for the InboxManager.
 
         :param inbox_type: An Inbox class that the manager will use to create Inboxes.
+        :param int capacity: The maximum number of items each Inbox can hold in memory, or None
+            for no limit.
+        :param str overflow_policy: What each Inbox does with an item when it is full.
+        :param str spill_directory: The directory that Inboxes spill items to disk in.
+        """
+        self._inbox_type = inbox_type
+        self.method_request_handlers = {}
+        self.set_capacity(capacity, overflow_policy, spill_directory)
+
+    def set_capacity(self, capacity, overflow_policy=BLOCK, spill_directory=None):
+        """Set the capacity limit of the Inboxes.
+
+        All Inboxes are replaced with new, empty ones, so this must be called before the Inboxes
+        are used.
+
+        :param int capacity: The maximum number of items each Inbox can hold in memory, or None
+            for no limit.
+        :param str overflow_policy: What each Inbox does with an item when it is full.
+        :param str spill_directory: The directory that Inboxes spill items to disk in.
+
+        :raises: TypeError if the capacity is neither an integer nor None.
+        :raises: ValueError if the capacity is less than 1, or the overflow policy is unknown.
         """
-        self._create_inbox = inbox_type
+        if capacity is not None:
+            if isinstance(capacity, bool) or not isinstance(capacity, six.integer_types):
+                raise TypeError("Invalid type for 'inbox_capacity'")
+            if capacity < 1:
+                raise ValueError("'inbox_capacity' must be greater than 0")
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError("Invalid value for 'inbox_overflow_policy'")
+        self._inbox_kwargs = {
+            "capacity": capacity,
+            "overflow_policy": overflow_policy,
+            "spill_directory": spill_directory,
+        }
         self.c2d_message_inbox = self._create_inbox()
         self.input_message_inboxes = {}
         self.generic_method_request_inbox = self._create_inbox()
         self.named_method_request_inboxes = {}
         self.twin_patch_inbox = self._create_inbox()
 
+    def _create_inbox(self):
+        return self._inbox_type(**self._inbox_kwargs)
+
     def get_input_message_inbox(self, input_name):
         """Retrieve the input message Inbox for a given input.
 
@@ -77,6 +121,22 @@ class InboxManager(object):
 
         return inbox
 
+    def set_method_request_handler(self, method_name, handler):
+        """Set the handler that method requests for a given method name if provided, or generic
+        method requests if not, are routed to instead of an Inbox.
+
+        :param str method_name: Optional. The name of the method to route requests to the handler
+        for.
+        :param handler: A function to call with each method request, or None to route method
+        requests to an Inbox again.
+        :returns: The handler that was previously set, or None.
+        """
+        if handler is None:
+            return self.method_request_handlers.pop(method_name or None, None)
+        previous_handler = self.method_request_handlers.get(method_name or None)
+        self.method_request_handlers[method_name or None] = handler
+        return previous_handler
+
     def get_twin_patch_inbox(self):
         """Retrieve the Inbox for twin patches that arrive from the service
 
@@ -84,6 +144,27 @@ class InboxManager(object):
         """
         return self.twin_patch_inbox
 
+    def get_metrics(self):
+        """Retrieve the metrics of every Inbox.
+
+        :returns: A dictionary mapping Inbox names to InboxMetrics.  The Inboxes are named "c2d",
+            "twin_patch", "method" (for generic method requests), "method:<method name>" and
+            "input:<input name>".
+        """
+        inboxes = {
+            "c2d": self.c2d_message_inbox,
+            "twin_patch": self.twin_patch_inbox,
+            "method": self.generic_method_request_inbox,
+        }
+        for method_name, inbox in list(self.named_method_request_inboxes.items()):
+            inboxes["method:" + method_name] = inbox
+        for input_name, inbox in list(self.input_message_inboxes.items()):
+            inboxes["input:" + input_name] = inbox
+        return {
+            name: InboxMetrics(inbox.depth, inbox.oldest_item_age, inbox.dropped_count)
+            for name, inbox in inboxes.items()
+        }
+
     def clear_all_method_requests(self):
         """Delete all method requests currently in inboxes.
         """
@@ -123,15 +204,31 @@ class InboxManager(object):
         return True
 
     def route_method_request(self, incoming_method_request):
-        """Route an incoming method request to the correct method request Inbox.
+        """Route an incoming method request to the correct method request handler or Inbox.
 
-        If the method name is recognized, it will be routed to a method-specific Inbox.
-        Otherwise, it will be routed to the generic method request Inbox.
+        If the method name is recognized, it will be routed to a method-specific handler or Inbox.
+        Otherwise, it will be routed to the generic method request handler or Inbox.  Handlers
+        take precedence over Inboxes.
 
         :param incoming_method_request: The method request to be routed.
 
         :returns: Boolean indicating if the method request was successfully routed or not.
         """
+        method_name = incoming_method_request.name
+        handler = self.method_request_handlers.get(method_name)
+        if handler is None and method_name not in self.named_method_request_inboxes:
+            handler = self.method_request_handlers.get(None)
+        if handler is not None:
+            try:
+                handler(incoming_method_request)
+            except DispatcherClosed:
+                # The handler was replaced and closed after it was looked up.  Routing the request
+                # again finds the handler or Inbox which replaced it.
+                logger.debug("Method request handler was replaced - routing request again")
+                return self.route_method_request(incoming_method_request)
+            logger.debug("Method request sent to handler")
+            return True
+
         try:
             inbox = self.named_method_request_inboxes[incoming_method_request.name]
         except KeyError:
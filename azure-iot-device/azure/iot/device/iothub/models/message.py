@@ -6,7 +6,30 @@
 """This module contains a class representing messages that are sent or received.
 """
 from azure.iot.device import constant
-import sys
+import six
+
+
+class _DecodedAttribute(object):
+    """
+    A Message attribute which is one of the properties of a received message.  The properties of a
+    received message are kept in their encoded form until one of them is first used.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.slot_name = "_" + name
+
+    def __get__(self, message, owner=None):
+        if message is None:
+            return self
+        if message._encoded_properties is not None:
+            message._decode_properties()
+        return getattr(message, self.slot_name)
+
+    def __set__(self, message, value):
+        if message._encoded_properties is not None:
+            message._decode_properties()
+        setattr(message, self.slot_name, value)
 
 
 # TODO: Revise this class. Does all of this REALLY need to be here?
@@ -29,6 +52,38 @@ class Message(object):
     :ivar output_name: Name of the output that the is being sent to.
     """
 
+    # __dict__ is kept so that applications can still add their own attributes.  It is only
+    # allocated for a message which is given one.
+    __slots__ = (
+        "__dict__",
+        "data",
+        "lock_token",
+        "sequence_number",
+        "expiry_time_utc",
+        "enqueued_time",
+        "ack",
+        "output_name",
+        "_custom_properties",
+        "_message_id",
+        "_to",
+        "_correlation_id",
+        "_user_id",
+        "_content_encoding",
+        "_content_type",
+        "_iothub_interface_id",
+        "_encoded_properties",
+        "_size",
+        "_size_key",
+    )
+
+    custom_properties = _DecodedAttribute("custom_properties")
+    message_id = _DecodedAttribute("message_id")
+    to = _DecodedAttribute("to")
+    correlation_id = _DecodedAttribute("correlation_id")
+    user_id = _DecodedAttribute("user_id")
+    content_encoding = _DecodedAttribute("content_encoding")
+    content_type = _DecodedAttribute("content_type")
+
     def __init__(
         self, data, message_id=None, content_encoding=None, content_type=None, output_name=None
     ):
@@ -42,20 +97,23 @@ class Message(object):
         :param str output_name: Name of the output that the is being sent to.
         """
         self.data = data
-        self.custom_properties = {}
+        self._custom_properties = {}
         self.lock_token = None
-        self.message_id = message_id
+        self._message_id = message_id
         self.sequence_number = None
-        self.to = None
+        self._to = None
         self.expiry_time_utc = None
         self.enqueued_time = None
-        self.correlation_id = None
-        self.user_id = None
+        self._correlation_id = None
+        self._user_id = None
         self.ack = None
-        self.content_encoding = content_encoding
-        self.content_type = content_type
+        self._content_encoding = content_encoding
+        self._content_type = content_type
         self.output_name = output_name
         self._iothub_interface_id = None
+        self._encoded_properties = None
+        self._size = None
+        self._size_key = None
 
     @property
     def iothub_interface_id(self):
@@ -72,15 +130,84 @@ class Message(object):
     def __str__(self):
         return str(self.data)
 
+    def _set_encoded_properties(self, encoded_properties, decoder):
+        """
+        Set the properties of a received message without decoding them.  They are decoded the
+        first time that one of them is used, by calling decoder(encoded_properties), which must
+        return a dictionary of system property attribute values and a dictionary of custom
+        properties.
+        """
+        self._encoded_properties = (encoded_properties, decoder)
+
+    def _decode_properties(self):
+        encoded_properties, decoder = self._encoded_properties
+        system_properties, custom_properties = decoder(encoded_properties)
+        for name, value in system_properties.items():
+            setattr(self, "_" + name, value)
+        self._custom_properties.update(custom_properties)
+        self._encoded_properties = None
+
     def get_size(self):
-        total = 0
-        total = total + sum(
-            sys.getsizeof(v)
-            for v in self.__dict__.values()
-            if v is not None and v is not self.custom_properties
+        """
+        Return the number of bytes this message counts for against the IoT Hub message size limit.
+        This is the size of the payload as it is sent, plus the size of the system and custom
+        properties as they are uri-encoded onto the topic the message is sent on.
+
+        The size is only calculated again if the payload or properties have changed since the last
+        call.
+        """
+        key = self._get_size_key()
+        if key is None or key != self._size_key:
+            self._size = _get_payload_size(self.data) + len(self._encode_properties())
+            self._size_key = key
+        return self._size
+
+    def _get_size_key(self):
+        data = self.data
+        if not isinstance(data, _SIZED_PAYLOAD_TYPES):
+            # The encoded size of other objects can change without the message changing
+            return None
+        return (
+            data,
+            # A bytearray can change size without being replaced
+            len(data) if isinstance(data, bytearray) else None,
+            self.output_name,
+            self.message_id,
+            self.correlation_id,
+            self.user_id,
+            self.to,
+            self.content_type,
+            self.content_encoding,
+            self._iothub_interface_id,
+            self.expiry_time_utc,
+            tuple(self.custom_properties.items()) if self.custom_properties else None,
         )
-        if self.custom_properties:
-            total = total + sum(
-                sys.getsizeof(v) for v in self.custom_properties.values() if v is not None
-            )
-        return total
+
+    def _encode_properties(self):
+        # Imported here because the pipeline package imports this module
+        from azure.iot.device.iothub.pipeline import mqtt_topic_iothub
+
+        return mqtt_topic_iothub.encode_properties(self, "")
+
+
+_SIZED_PAYLOAD_TYPES = (
+    six.text_type,
+    six.binary_type,
+    bytearray,
+    float,
+    type(None),
+) + six.integer_types
+
+
+def _get_payload_size(data):
+    """Return the number of bytes the payload is sent as, following the conversions made by Paho"""
+    if isinstance(data, six.text_type):
+        return len(data.encode("utf-8"))
+    elif isinstance(data, (six.binary_type, bytearray)):
+        return len(data)
+    elif data is None:
+        return 0
+    else:
+        # Numbers are sent as their string form.  Paho refuses to send anything else, but size it
+        # the same way so that the size limit check can still be made.
+        return len(str(data).encode("utf-8"))
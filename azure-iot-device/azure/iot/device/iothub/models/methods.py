@@ -15,6 +15,9 @@ class MethodRequest(object):
     :ivar dict payload: The JSON payload being sent with the request.
     """
 
+    # __dict__ is kept so that applications can still add their own attributes
+    __slots__ = ("_request_id", "_name", "_payload", "__dict__")
+
     def __init__(self, request_id, name, payload):
         """Initializer for a MethodRequest.
 
@@ -48,6 +51,9 @@ class MethodResponse(object):
     :type payload: dict, str, int, float, bool, or None (JSON compatible values)
     """
 
+    # __dict__ is kept so that applications can still add their own attributes
+    __slots__ = ("request_id", "status", "payload", "__dict__")
+
     def __init__(self, request_id, status, payload=None):
         """Initializer for MethodResponse.
 
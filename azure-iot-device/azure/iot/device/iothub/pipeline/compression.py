@@ -0,0 +1,178 @@
+# --------------------------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import copy
+import logging
+import zlib
+import six
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+"""
+This module contains the compression of telemetry payloads for clients which are configured with
+the "compression" option, and the decompression of received messages for those clients.
+
+A compressed payload is marked by setting the content_encoding of its message to the name of the
+compression that was used ("gzip", "deflate" or "zstd").  Compressing with zstd requires the
+zstandard package to be installed.
+
+Messages which are sent are never changed.  A compressed copy of the message is sent instead, so
+that an application can still use (or send again) the message it passed in.  Received messages
+belong to the SDK, so they are decompressed in place.
+"""
+
+GZIP = "gzip"
+DEFLATE = "deflate"
+ZSTD = "zstd"
+
+# Payloads smaller than this many bytes are not compressed by default
+DEFAULT_THRESHOLD = 1024
+
+# Received payloads which would decompress to more than this many bytes are left compressed, so
+# that a small message can't be used to make the client allocate an unbounded amount of memory.
+DEFAULT_MAX_DECOMPRESSED_SIZE = 4 * 1024 * 1024
+
+
+def _gzip_compress(data):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _zlib_decompress(data, wbits, max_size):
+    decompressor = zlib.decompressobj(wbits)
+    decompressed = decompressor.decompress(data, max_size)
+    if decompressor.unconsumed_tail:
+        raise ValueError("Payload decompresses to more than {} bytes".format(max_size))
+    if not decompressor.eof:
+        raise ValueError("Payload is truncated")
+    return decompressed
+
+
+def _gzip_decompress(data, max_size):
+    return _zlib_decompress(data, 16 + zlib.MAX_WBITS, max_size)
+
+
+def _deflate_decompress(data, max_size):
+    return _zlib_decompress(data, zlib.MAX_WBITS, max_size)
+
+
+def _zstd_compress(data):
+    # Compressor objects can't be shared between threads, and are cheap to create
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data, max_size):
+    # A frame which declares its size is decompressed into a buffer of that size, so the declared
+    # size is checked first.  Otherwise the output is limited to max_size.
+    content_size = zstandard.frame_content_size(data)
+    if content_size > max_size:
+        raise ValueError("Payload decompresses to more than {} bytes".format(max_size))
+    return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_size)
+
+
+# (compress, decompress) for each content_encoding
+_CODECS = {
+    GZIP: (_gzip_compress, _gzip_decompress),
+    DEFLATE: (zlib.compress, _deflate_decompress),
+}
+if zstandard:
+    _CODECS[ZSTD] = (_zstd_compress, _zstd_decompress)
+
+# Every encoding which marks a payload as compressed, including those that can't be used here
+COMPRESSED_ENCODINGS = (GZIP, DEFLATE, ZSTD)
+
+
+def is_supported(encoding):
+    """Return True if payloads can be compressed and decompressed with the given encoding"""
+    return encoding in _CODECS
+
+
+class MessageCompressor(object):
+    """
+    Compresses the payloads of outgoing messages with a single encoding, and decompresses the
+    payloads of incoming messages with whichever supported encoding they were compressed with.
+    """
+
+    def __init__(
+        self,
+        encoding,
+        threshold=DEFAULT_THRESHOLD,
+        max_decompressed_size=DEFAULT_MAX_DECOMPRESSED_SIZE,
+    ):
+        """
+        :param str encoding: The compression to use ("gzip", "deflate" or "zstd").
+        :param int threshold: The size in bytes below which payloads are sent uncompressed.
+        :param int max_decompressed_size: The size in bytes above which received payloads are
+            left compressed.
+
+        :raises: ValueError if the encoding is not supported.
+        """
+        if not is_supported(encoding):
+            raise ValueError("Unsupported compression '{}'".format(encoding))
+        self.encoding = encoding
+        self.threshold = threshold
+        self.max_decompressed_size = max_decompressed_size
+        self._compress = _CODECS[encoding][0]
+
+    def compress(self, message):
+        """
+        Return the message to send in place of the given message.  This is a copy of the message
+        with its payload compressed and its content_encoding set to show how it was compressed,
+        or the message itself if its payload is not text or bytes, is smaller than the threshold,
+        or would not get any smaller.  A message which already has a content_encoding (either a
+        compression or a character set) is never compressed, since there is only one
+        content_encoding to describe the payload with.
+        """
+        if message.content_encoding is not None:
+            return message
+        data = message.data
+        if isinstance(data, six.text_type):
+            data = data.encode("utf-8")
+        elif not isinstance(data, (six.binary_type, bytearray)):
+            return message
+        if len(data) < self.threshold:
+            return message
+
+        compressed = self._compress(bytes(data))
+        if len(compressed) >= len(data):
+            return message
+        logger.debug(
+            "Compressed message payload from {} to {} bytes".format(len(data), len(compressed))
+        )
+        compressed_message = copy.copy(message)
+        compressed_message.data = compressed
+        compressed_message.content_encoding = self.encoding
+        return compressed_message
+
+    def decompress(self, message):
+        """
+        Decompress the payload of the given message in place if its content_encoding shows that it
+        is compressed, and clear its content_encoding.  A message which can't be decompressed, or
+        which would decompress to more than max_decompressed_size bytes, is left as it is.
+        """
+        codec = _CODECS.get(message.content_encoding)
+        if codec is None:
+            if message.content_encoding in COMPRESSED_ENCODINGS:
+                logger.warning(
+                    "Cannot decompress message payload with unsupported compression '{}'".format(
+                        message.content_encoding
+                    )
+                )
+            return
+        try:
+            message.data = codec[1](bytes(message.data), self.max_decompressed_size)
+        except Exception as e:
+            logger.warning(
+                "Could not decompress message payload with '{}': {}".format(
+                    message.content_encoding, e
+                )
+            )
+            return
+        message.content_encoding = None
@@ -5,7 +5,10 @@
 # --------------------------------------------------------------------------
 
 import logging
+import six
 from azure.iot.device.common.pipeline.config import BasePipelineConfig
+from azure.iot.device.common import outbox, serializers
+from . import compression as payload_compression
 
 logger = logging.getLogger(__name__)
 
@@ -14,15 +17,90 @@ class IoTHubPipelineConfig(BasePipelineConfig):
     """A class for storing all configurations/options for IoTHub clients in the Azure IoT Python Device Client Library.
     """
 
-    def __init__(self, product_info="", **kwargs):
+    def __init__(
+        self,
+        product_info="",
+        outbox_directory=None,
+        outbox_max_bytes=outbox.DEFAULT_MAX_BYTES,
+        outbox_eviction_policy=outbox.DROP_OLDEST,
+        outbox_replay_concurrency=10,
+        telemetry_qos=1,
+        compression=None,
+        compression_threshold=payload_compression.DEFAULT_THRESHOLD,
+        payload_serializer=None,
+        reported_properties_window=None,
+        reported_properties_max_bytes=None,
+        **kwargs
+    ):
         """Initializer for IoTHubPipelineConfig which passes all unrecognized keyword-args down to BasePipelineConfig
         to be evaluated. This stacked options setting is to allow for unique configuration options to exist between the
         IoTHub Client and the Provisioning Client, while maintaining a base configuration class with shared config options.
 
         :param str product_info: A custom identification string for the type of device connecting to Azure IoT Hub.
+        :param str outbox_directory: A directory to store telemetry in while the client is not connected.  The
+            stored telemetry is sent, in order, once a connection is made.  None means telemetry is not stored.
+        :param int outbox_max_bytes: The maximum number of bytes of telemetry that can be stored in the outbox
+            directory.  None means no limit.
+        :param str outbox_eviction_policy: What to do with new telemetry once the outbox is full.  "drop_oldest"
+            makes room for it by discarding the oldest stored telemetry.  "reject_new" fails the send instead.
+        :param int outbox_replay_concurrency: The maximum number of stored messages that can be sent at the same
+            time once a connection is made.
+        :param int telemetry_qos: The MQTT QoS level to send telemetry at.  1 (the default) waits for the service to
+            acknowledge each message.  0 sends each message once without waiting for an acknowledgement, so messages
+            can be lost, but many more can be sent.
+        :param str compression: Compress telemetry payloads with "gzip", "deflate" or "zstd" (which requires the
+            zstandard package), and decompress received messages which are compressed.  None (the default) means
+            payloads are not compressed.
+        :param int compression_threshold: The size in bytes below which telemetry payloads are not compressed.
+        :param str payload_serializer: The name of the serializer to use for telemetry payloads which are dicts or
+            lists: "json", "orjson", "ujson", "msgpack" or "cbor" (which require the packages of the same name, or
+            cbor2), or "auto" for the fastest JSON serializer that is installed.  The content type of the message is
+            set to match, unless it is already set.  None (the default) means such payloads are not serialized.
+        :param float reported_properties_window: The number of seconds to hold a reported properties patch for, so
+            that patches made during that time are merged and sent as one.  Patches made while a merged patch is being
+            sent are held until it completes.  None (the default) means each patch is sent on its own.
+        :param int reported_properties_max_bytes: The size in bytes at which merged reported properties patches are
+            sent without waiting for the rest of the reported_properties_window.  None (the default) means no limit.
         """
         super(IoTHubPipelineConfig, self).__init__(**kwargs)
         self.product_info = product_info
+        self.outbox_directory = outbox_directory
+        self.outbox_max_bytes = self._sanitize_limit("outbox_max_bytes", outbox_max_bytes)
+        if outbox_eviction_policy not in outbox.EVICTION_POLICIES:
+            raise ValueError("Invalid value for 'outbox_eviction_policy'")
+        self.outbox_eviction_policy = outbox_eviction_policy
+        if outbox_replay_concurrency is None:
+            raise TypeError("Invalid type for 'outbox_replay_concurrency'")
+        self.outbox_replay_concurrency = self._sanitize_limit(
+            "outbox_replay_concurrency", outbox_replay_concurrency
+        )
+        if telemetry_qos not in (0, 1) or isinstance(telemetry_qos, bool):
+            raise ValueError("Invalid value for 'telemetry_qos'")
+        self.telemetry_qos = telemetry_qos
+        if compression is not None and not payload_compression.is_supported(compression):
+            raise ValueError("Invalid value for 'compression'")
+        self.compression = compression
+        if isinstance(compression_threshold, bool) or not isinstance(
+            compression_threshold, six.integer_types
+        ):
+            raise TypeError("Invalid type for 'compression_threshold'")
+        if compression_threshold < 0:
+            raise ValueError("'compression_threshold' must not be negative")
+        self.compression_threshold = compression_threshold
+        if payload_serializer is not None:
+            payload_serializer = serializers.get_serializer(payload_serializer)
+        self.payload_serializer = payload_serializer
+        if reported_properties_window is not None:
+            if isinstance(reported_properties_window, bool) or not isinstance(
+                reported_properties_window, six.integer_types + (float,)
+            ):
+                raise TypeError("Invalid type for 'reported_properties_window'")
+            if reported_properties_window < 0:
+                raise ValueError("'reported_properties_window' must not be negative")
+        self.reported_properties_window = reported_properties_window
+        self.reported_properties_max_bytes = self._sanitize_limit(
+            "reported_properties_max_bytes", reported_properties_max_bytes
+        )
 
         # Now, the parameters below are not exposed to the user via kwargs. They need to be set by manipulating the IoTHubPipelineConfig object.
         # They are not in the BasePipelineConfig because these do not apply to the provisioning client.
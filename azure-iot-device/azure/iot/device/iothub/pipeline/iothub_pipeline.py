@@ -4,15 +4,19 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import copy
 import logging
 import sys
+import threading
 from azure.iot.device.common.evented_callback import EventedCallback
 from azure.iot.device.common.pipeline import (
     pipeline_stages_base,
     pipeline_ops_base,
     pipeline_stages_mqtt,
+    pipeline_events_base,
 )
 from . import (
+    compression,
     constant,
     pipeline_stages_iothub,
     pipeline_events_iothub,
@@ -48,6 +52,23 @@ class IoTHubPipeline(object):
         self.on_method_request_received = None
         self.on_twin_patch_received = None
 
+        # Backpressure is applied by the transport when too many publishes are outstanding.
+        # Callbacks passed to wait_for_publish_window are held here until it is released.
+        self._backpressure = False
+        self._publish_window_waiters = []
+        self._publish_window_lock = threading.Lock()
+
+        self._payload_serializer = pipeline_configuration.payload_serializer
+
+        # Payloads are compressed before they are sent, so that the size limit is checked against
+        # the compressed size, and decompressed when they are received.
+        if pipeline_configuration.compression:
+            self._compressor = compression.MessageCompressor(
+                pipeline_configuration.compression, pipeline_configuration.compression_threshold
+            )
+        else:
+            self._compressor = None
+
         # Currently a single timeout stage and a single retry stage for MQTT retry only.
         # Later, a higher level timeout and a higher level retry stage.
         self._pipeline = (
@@ -61,6 +82,12 @@ class IoTHubPipeline(object):
             #
             .append_stage(pipeline_stages_iothub.UseAuthProviderStage())
             #
+            # CoalesceReportedPropertiesStage needs to be before TwinRequestResponseStage because it
+            # merges the PatchTwinReportedPropertiesOperation ops that TwinRequestResponseStage
+            # turns into requests.
+            #
+            .append_stage(pipeline_stages_iothub.CoalesceReportedPropertiesStage())
+            #
             # TwinRequestResponseStage comes near the root by default because it doesn't need to be
             # after anything
             #
@@ -79,6 +106,12 @@ class IoTHubPipeline(object):
             #
             .append_stage(pipeline_stages_iothub_mqtt.IoTHubMQTTTranslationStage())
             #
+            # StoreAndForwardStage comes after IoTHubMQTTTranslationStage because it stores
+            # publishes as MQTT topics and payloads.  It needs to be before AutoConnectStage so
+            # that publishes are stored instead of waiting for a connection.
+            #
+            .append_stage(pipeline_stages_base.StoreAndForwardStage())
+            #
             # AutoConnectStage comes here because only MQTT ops have the need_connection flag set
             # and this is the first place in the pipeline wherer we can guaranetee that all network
             # ops are MQTT ops.
@@ -95,6 +128,13 @@ class IoTHubPipeline(object):
             #
             .append_stage(pipeline_stages_base.ReconnectStage())
             #
+            # RefreshConnectionArgsStage needs to be after ReconnectStage because ReconnectStage
+            # creates the ConnectOperation for every connection attempt, including the automatic
+            # ones.  It needs to be before ConnectionLockStage, so that the connection args it
+            # refreshes are not held up by the ConnectOperation that is waiting for them.
+            #
+            .append_stage(pipeline_stages_base.RefreshConnectionArgsStage())
+            #
             # ConnectionLockStage needs to be after ReconnectStage because we want any ops that
             # ReconnectStage creates to go through the ConnectionLockStage gate
             #
@@ -117,12 +157,16 @@ class IoTHubPipeline(object):
 
         def _on_pipeline_event(event):
             if isinstance(event, pipeline_events_iothub.C2DMessageEvent):
+                if self._compressor:
+                    self._compressor.decompress(event.message)
                 if self.on_c2d_message_received:
                     self.on_c2d_message_received(event.message)
                 else:
                     logger.warning("C2D message event received with no handler.  dropping.")
 
             elif isinstance(event, pipeline_events_iothub.InputMessageEvent):
+                if self._compressor:
+                    self._compressor.decompress(event.message)
                 if self.on_input_message_received:
                     self.on_input_message_received(event.input_name, event.message)
                 else:
@@ -140,6 +184,9 @@ class IoTHubPipeline(object):
                 else:
                     logger.warning("Twin patch event received with no handler. Dropping.")
 
+            elif isinstance(event, pipeline_events_base.BackpressureChangedEvent):
+                self._on_backpressure_changed(event.backpressure)
+
             else:
                 logger.warning("Dropping unknown pipeline event {}".format(event.name))
 
@@ -208,6 +255,35 @@ class IoTHubPipeline(object):
 
         self._pipeline.run_op(pipeline_ops_base.DisconnectOperation(callback=on_complete))
 
+    def encode_message(self, message):
+        """
+        Prepare the payload of a telemetry message to be sent.  A dict or list payload is
+        serialized if the pipeline is configured with a payload serializer, and the payload is then
+        compressed if the pipeline is configured to compress payloads and the payload is worth
+        compressing.  This must be called before the size of the message is checked.
+
+        The message that is passed in is never changed.  If its payload needs to be serialized or
+        compressed, a copy of the message with the encoded payload is returned instead.
+
+        :param message: message to encode.
+
+        :returns: The message to send.
+        """
+        serializer = self._payload_serializer
+        serialized_as_json = False
+        if serializer and isinstance(message.data, (dict, list)):
+            message = copy.copy(message)
+            message.data = serializer.dumps(message.data)
+            if message.content_type is None:
+                message.content_type = serializer.content_type
+                serialized_as_json = serializer.is_json
+        if self._compressor:
+            message = self._compressor.compress(message)
+        if serialized_as_json and message.content_encoding is None:
+            # Only describe the character set of a JSON payload which wasn't compressed
+            message.content_encoding = "utf-8"
+        return message
+
     def send_message(self, message, callback):
         """
         Send a telemetry message to the service.
@@ -231,6 +307,63 @@ class IoTHubPipeline(object):
             pipeline_ops_iothub.SendD2CMessageOperation(message=message, callback=on_complete)
         )
 
+    def send_message_batch(self, messages, callback):
+        """
+        Send a batch of telemetry messages to the service as a single pipeline operation.
+
+        :param messages: list of messages to send.
+        :param callback: callback which is called when every message publish in the batch has either
+        been acknowledged by the service or has failed.  On success, this callback is called with a list
+        of per-message results (None for each message that was acknowledged, or the error that caused
+        that message to fail) and error=None.  If the batch as a whole fails, this callback is called
+        with None for the results and error set to the cause of the failure.
+
+        The following exceptions are not "raised", but rather returned via the "error" parameter
+        when invoking "callback":
+
+        :raises: :class:`azure.iot.device.iothub.pipeline.exceptions.ConnectionFailedError`
+        :raises: :class:`azure.iot.device.iothub.pipeline.exceptions.ConnectionDroppedError`
+        :raises: :class:`azure.iot.device.iothub.pipeline.exceptions.UnauthorizedError`
+        :raises: :class:`azure.iot.device.iothub.pipeline.exceptions.ProtocolClientError`
+        """
+
+        def on_complete(op, error):
+            if error:
+                callback(error=error, results=None)
+            else:
+                callback(results=op.results)
+
+        self._pipeline.run_op(
+            pipeline_ops_iothub.SendD2CMessageBatchOperation(
+                messages=messages, callback=on_complete
+            )
+        )
+
+    def wait_for_publish_window(self, callback):
+        """
+        Wait until the pipeline is ready to accept more messages to publish.
+
+        :param callback: callback which is called when the transport is not applying backpressure.
+        This is called immediately if there is no backpressure.
+        """
+        with self._publish_window_lock:
+            if self._backpressure:
+                logger.debug("Backpressure is being applied.  Waiting for publish window")
+                self._publish_window_waiters.append(callback)
+                return
+        callback()
+
+    def _on_backpressure_changed(self, backpressure):
+        with self._publish_window_lock:
+            self._backpressure = backpressure
+            if backpressure:
+                waiters = []
+            else:
+                waiters = self._publish_window_waiters
+                self._publish_window_waiters = []
+        for callback in waiters:
+            callback()
+
     def send_output_event(self, message, callback):
         """
         Send an output message to the service.
@@ -383,3 +516,22 @@ class IoTHubPipeline(object):
         Read-only property to indicate if the transport is connected or not.
         """
         return self._pipeline.connected
+
+    @property
+    def publish_window_open(self):
+        """
+        Read-only property to indicate if the pipeline is ready to accept more messages to publish
+        without waiting.
+        """
+        return not self._backpressure
+
+    @property
+    def publish_stats(self):
+        """
+        Read-only property with the delivery and latency statistics of the messages published
+        by the pipeline.  This is a dict of PublishStats objects, keyed by MQTT QoS level.
+        """
+        stage = self._pipeline
+        while stage.next:
+            stage = stage.next
+        return stage.publish_stats
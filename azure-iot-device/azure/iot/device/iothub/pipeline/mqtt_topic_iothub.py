@@ -5,6 +5,9 @@
 # --------------------------------------------------------------------------
 
 import logging
+import operator
+import six
+from collections import namedtuple
 from datetime import date
 import six.moves.urllib as urllib
 
@@ -250,9 +253,11 @@ def encode_properties(message_to_send, topic):
         system_properties.append(
             (
                 "$.exp",
-                message_to_send.expiry_time_utc.isoformat()
-                if isinstance(message_to_send.expiry_time_utc, date)
-                else message_to_send.expiry_time_utc,
+                (
+                    message_to_send.expiry_time_utc.isoformat()
+                    if isinstance(message_to_send.expiry_time_utc, date)
+                    else message_to_send.expiry_time_utc
+                ),
             )
         )
 
@@ -303,3 +308,212 @@ def get_twin_status_code_from_topic(topic):
 
 def is_twin_desired_property_patch_topic(topic):
     return topic.startswith("$iothub/twin/PATCH/properties/desired")
+
+
+# Kinds of incoming topic recognized by TopicCodec.decode()
+C2D_TOPIC = "c2d"
+INPUT_TOPIC = "input"
+METHOD_TOPIC = "method"
+TWIN_RESPONSE_TOPIC = "twin_response"
+TWIN_PATCH_TOPIC = "twin_patch"
+
+# (Message attribute, uri-encoded key, whether the encoded value is worth caching) for each of the
+# system properties that are put on the telemetry topic, in the order that they go on the topic.
+# Values are only cached for properties which are usually the same from one message to the next.
+_OUTGOING_SYSTEM_PROPERTIES = (
+    ("output_name", "%24.on=", True),
+    ("message_id", "%24.mid=", False),
+    ("correlation_id", "%24.cid=", False),
+    ("user_id", "%24.uid=", True),
+    ("to", "%24.to=", True),
+    ("content_type", "%24.ct=", True),
+    ("content_encoding", "%24.ce=", True),
+    ("iothub_interface_id", "%24.ifid=", True),
+)
+_EXPIRY_KEY = "%24.exp="
+_get_outgoing_system_properties = operator.attrgetter(
+    *(attribute for attribute, _, _ in _OUTGOING_SYSTEM_PROPERTIES)
+)
+
+# Message attribute for each of the system properties that can be received on a C2D or input
+# message topic, keyed by both the uri-encoded and decoded forms of the property key.
+_INCOMING_SYSTEM_PROPERTIES = {
+    "$.mid": "message_id",
+    "$.cid": "correlation_id",
+    "$.uid": "user_id",
+    "$.to": "to",
+    "$.ct": "content_type",
+    "$.ce": "content_encoding",
+}
+_INCOMING_SYSTEM_PROPERTIES.update(
+    [(urllib.parse.quote_plus(key), value) for key, value in _INCOMING_SYSTEM_PROPERTIES.items()]
+)
+
+_REQUEST_ID_KEYS = ("$rid", urllib.parse.quote_plus("$rid"))
+
+# Number of encoded values a TopicCodec remembers before it starts over
+_MAX_CACHED_VALUES = 1024
+
+
+def _quote(value):
+    # Matches the way urlencode() quotes each key and value
+    if not isinstance(value, (six.text_type, six.binary_type)):
+        value = str(value)
+    return urllib.parse.quote_plus(value)
+
+
+def _unquote(value):
+    if "%" in value or "+" in value:
+        return urllib.parse.unquote_plus(value)
+    return value
+
+
+def decode_message_properties(properties):
+    """
+    Decode the properties from a C2D or input message topic.
+
+    :param str properties: The uri-encoded properties, as they appear on the topic.
+    :returns: A dictionary of Message attribute values for the system properties, and a dictionary
+        of custom properties.
+    """
+    system_properties = {}
+    custom_properties = {}
+    if properties:
+        for entry in properties.split("&"):
+            key, _, value = entry.partition("=")
+            attribute = _INCOMING_SYSTEM_PROPERTIES.get(key)
+            if attribute:
+                system_properties[attribute] = _unquote(value)
+            else:
+                custom_properties[_unquote(key)] = _unquote(value)
+    return system_properties, custom_properties
+
+
+class DecodedTopic(
+    namedtuple("DecodedTopic", ["kind", "name", "request_id", "status_code", "properties"])
+):
+    """
+    The parts of an incoming topic, as returned by TopicCodec.decode().
+
+    :ivar str kind: The kind of topic (C2D_TOPIC, INPUT_TOPIC, METHOD_TOPIC, TWIN_RESPONSE_TOPIC or
+        TWIN_PATCH_TOPIC).
+    :ivar str name: The input name for input message topics, or the method name for method
+        topics.  Otherwise None.
+    :ivar str request_id: The request id for method and twin response topics.  Otherwise None.
+    :ivar int status_code: The status code for twin response topics.  Otherwise None.
+    :ivar str properties: The still uri-encoded properties for C2D and input message topics, if
+        there are any.  Otherwise None.
+    """
+
+    __slots__ = ()
+
+    def set_message_properties(self, message):
+        """
+        Set the system and custom properties from this topic on the given Message.  They are not
+        decoded until the message is first asked for one of them.
+        """
+        if self.properties:
+            message._set_encoded_properties(self.properties, decode_message_properties)
+
+
+class TopicCodec(object):
+    """
+    Encodes and decodes the topics used by a single device or module.
+
+    This does the same thing as encode_properties(), extract_properties_from_topic() and the
+    is_*_topic() and get_*_from_topic() functions, but builds every topic prefix once rather than
+    once per message, encodes system properties using a table of pre-encoded keys instead of
+    calling urlencode(), and classifies an incoming topic and extracts everything from it in a
+    single pass.  The properties of received messages are left encoded until they are used.
+    """
+
+    def __init__(self, device_id, module_id):
+        self.device_id = device_id
+        self.module_id = module_id
+        topic_base = _get_topic_base(device_id, module_id)
+        self.telemetry_topic = topic_base + "/messages/events/"
+        self._c2d_prefix = "devices/{}/messages/devicebound".format(device_id)
+        if module_id:
+            self._input_prefix = topic_base + "/inputs/"
+        else:
+            self._input_prefix = None
+        self._quoted = {}
+
+    def _quote_cached(self, value):
+        if not isinstance(value, six.string_types):
+            return _quote(value)
+        quoted = self._quoted.get(value)
+        if quoted is None:
+            if len(self._quoted) >= _MAX_CACHED_VALUES:
+                self._quoted.clear()
+            quoted = self._quoted[value] = _quote(value)
+        return quoted
+
+    def encode_telemetry_topic(self, message):
+        """
+        Return the telemetry topic with the system and custom properties of the given message
+        uri-encoded onto it.  This is the same topic that encode_properties() returns.
+        """
+        encoded = []
+        values = _get_outgoing_system_properties(message)
+        if any(values):
+            for (_, key, cache), value in zip(_OUTGOING_SYSTEM_PROPERTIES, values):
+                if value:
+                    encoded.append(key + (self._quote_cached(value) if cache else _quote(value)))
+
+        expiry_time_utc = message.expiry_time_utc
+        if expiry_time_utc:
+            if isinstance(expiry_time_utc, date):
+                expiry_time_utc = expiry_time_utc.isoformat()
+            encoded.append(_EXPIRY_KEY + _quote(expiry_time_utc))
+
+        if message.custom_properties:
+            for key, value in message.custom_properties.items():
+                encoded.append(self._quote_cached(key) + "=" + _quote(value))
+
+        return self.telemetry_topic + "&".join(encoded)
+
+    def decode(self, topic):
+        """
+        Classify the given incoming topic and extract everything from it.
+
+        :returns: A DecodedTopic, or None if the topic is not one that this device or module
+            receives messages on.
+        :raises: IndexError, KeyError or ValueError if the topic is recognized, but is missing the
+            request id or status code which belong on it.
+        """
+        if topic.startswith(self._c2d_prefix):
+            # devices/<deviceId>/messages/devicebound/<properties>
+            properties = topic[len(self._c2d_prefix) + 1 :].split("/", 1)[0]
+            return DecodedTopic(C2D_TOPIC, None, None, None, properties or None)
+
+        elif self._input_prefix and topic.startswith(self._input_prefix):
+            # devices/<deviceId>/modules/<moduleId>/inputs/<inputName>/<properties>
+            parts = topic[len(self._input_prefix) :].split("/", 2)
+            properties = parts[1] if len(parts) > 1 else None
+            return DecodedTopic(INPUT_TOPIC, parts[0], None, None, properties or None)
+
+        elif topic.startswith("$iothub/methods/POST/"):
+            # $iothub/methods/POST/<methodName>/?$rid=<requestId>
+            name = topic[len("$iothub/methods/POST/") :].split("/", 1)[0]
+            request_id = self._decode_request_id(topic.split("?", 1)[1])
+            return DecodedTopic(METHOD_TOPIC, name, request_id, None, None)
+
+        elif topic.startswith("$iothub/twin/res/"):
+            # $iothub/twin/res/<statusCode>/?$rid=<requestId>
+            request_id = self._decode_request_id(topic.split("?", 1)[1])
+            status_code = int(topic[len("$iothub/twin/res/") :].split("/", 1)[0])
+            return DecodedTopic(TWIN_RESPONSE_TOPIC, None, request_id, status_code, None)
+
+        elif topic.startswith("$iothub/twin/PATCH/properties/desired"):
+            return DecodedTopic(TWIN_PATCH_TOPIC, None, None, None, None)
+
+        else:
+            return None
+
+    def _decode_request_id(self, query):
+        for entry in query.split("&"):
+            key, _, value = entry.partition("=")
+            if key in _REQUEST_ID_KEYS:
+                return _unquote(value)
+        raise KeyError("rid")
@@ -124,6 +124,32 @@ class SendD2CMessageOperation(PipelineOperation):
         self.message = message
 
 
+class SendD2CMessageBatchOperation(PipelineOperation):
+    """
+    A PipelineOperation object which contains arguments used to send a batch of telemetry messages to an IoTHub or
+    EdgeHub server as a single pipeline operation.
+
+    This operation is in the group of IoTHub operations because it is very specific to the IoTHub client
+
+    :ivar results: Upon completion, this contains one entry for every message in messages, in the same order.  Each
+        entry is None if the message was acknowledged by the service, or the Exception that caused the send to fail.
+    :type results: list
+    """
+
+    def __init__(self, messages, callback):
+        """
+        Initializer for SendD2CMessageBatchOperation objects.
+
+        :param list messages: The list of Message objects that we're sending to the service
+        :param Function callback: The function that gets called when this operation is complete or has failed.
+         The callback function must accept A PipelineOperation object which indicates the specific operation which
+         has completed or failed.
+        """
+        super(SendD2CMessageBatchOperation, self).__init__(callback=callback)
+        self.messages = messages
+        self.results = None
+
+
 class SendOutputEventOperation(PipelineOperation):
     """
     A PipelineOperation object which contains arguments used to send an output message to an EdgeHub server.
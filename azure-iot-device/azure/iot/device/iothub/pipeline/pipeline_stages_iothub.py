@@ -4,11 +4,13 @@
 # license information.
 # --------------------------------------------------------------------------
 
-import json
+import collections
+import copy
 import logging
+import weakref
 from azure.iot.device.common.pipeline import pipeline_ops_base, PipelineStage, pipeline_thread
 from azure.iot.device import exceptions
-from azure.iot.device.common import handle_exceptions
+from azure.iot.device.common import handle_exceptions, timer_wheel
 from azure.iot.device.common.callable_weak_method import CallableWeakMethod
 from . import pipeline_ops_iothub
 from . import constant
@@ -17,6 +19,13 @@ logger = logging.getLogger(__name__)
 
 
 class UseAuthProviderStage(PipelineStage):
+    handled_op_types = (
+        pipeline_ops_iothub.SetAuthProviderOperation,
+        pipeline_ops_iothub.SetX509AuthProviderOperation,
+        pipeline_ops_base.RefreshConnectionArgsOperation,
+    )
+    handled_event_types = ()
+
     def __init__(self):
         super(UseAuthProviderStage, self).__init__()
         self.auth_provider = None
@@ -25,6 +34,11 @@ class UseAuthProviderStage(PipelineStage):
     PipelineStage which extracts relevant AuthenticationProvider values for a new
     SetIoTHubConnectionArgsOperation.
 
+    A RefreshConnectionArgsOperation (run by RefreshConnectionArgsStage when connecting fails)
+    refreshes the server verification certificate, if the authentication provider can refresh it
+    (an IoT Edge trust bundle which was loaded from disk, and which goes out of date when the Edge
+    CA is rotated), and sends a new SetIoTHubConnectionArgsOperation with it.
+
     All other operations are passed down.
     """
 
@@ -64,9 +78,52 @@ class UseAuthProviderStage(PipelineStage):
                 client_cert=self.auth_provider.get_x509_certificate(),
             )
             self.send_op_down(worker_op)
+        elif isinstance(op, pipeline_ops_base.RefreshConnectionArgsOperation):
+            if hasattr(self.auth_provider, "refresh_server_verification_cert"):
+                self._refresh_server_verification_cert(op)
+            else:
+                op.complete()
         else:
             super(UseAuthProviderStage, self)._run_op(op)
 
+    @pipeline_thread.runs_on_pipeline_thread
+    def _refresh_server_verification_cert(self, op):
+        # Requesting the certificate blocks, so it is kept off the event loop
+        self_weakref = weakref.ref(self)
+
+        def refresh():
+            this = self_weakref()
+            cert = this.auth_provider.refresh_server_verification_cert()
+            this._on_server_verification_cert_refreshed(op, cert)
+
+        @pipeline_thread.runs_on_pipeline_thread
+        def on_error(e):
+            op.complete(error=e)
+
+        pipeline_thread.invoke_blocking_call(refresh, on_error)
+
+    @pipeline_thread.invoke_on_pipeline_thread_nowait
+    def _on_server_verification_cert_refreshed(self, op, cert):
+        if not cert:
+            logger.debug(
+                "{}({}): Server verification cert not refreshed".format(self.name, op.name)
+            )
+            op.complete()
+            return
+
+        logger.info("{}({}): Server verification cert refreshed".format(self.name, op.name))
+        op.refreshed = True
+        worker_op = op.spawn_worker_op(
+            worker_op_type=pipeline_ops_iothub.SetIoTHubConnectionArgsOperation,
+            device_id=self.auth_provider.device_id,
+            module_id=self.auth_provider.module_id,
+            hostname=self.auth_provider.hostname,
+            gateway_hostname=getattr(self.auth_provider, "gateway_hostname", None),
+            server_verification_cert=cert,
+            sas_token=self.auth_provider.get_current_sas_token(),
+        )
+        self.send_op_down(worker_op)
+
     @pipeline_thread.invoke_on_pipeline_thread_nowait
     def _on_sas_token_updated(self):
         logger.info(
@@ -95,6 +152,175 @@ class UseAuthProviderStage(PipelineStage):
         )
 
 
+def _coalesce_patches(older, newer):
+    """Merge two reported properties patches, with the values of the newer patch winning at every
+    leaf.  Unlike applying a patch to a twin, None values are kept, because they remove properties
+    when the merged patch is sent."""
+    if isinstance(older, dict) and isinstance(newer, dict):
+        merged = dict(older)
+        for key, value in newer.items():
+            merged[key] = _coalesce_patches(older.get(key), value)
+        return merged
+    return copy.deepcopy(newer)
+
+
+def _can_coalesce(older, newer):
+    """Return True if sending the merge of two reported properties patches has the same effect as
+    sending them one after the other.  It does not if the older patch removes a property that the
+    newer patch sets properties inside of, since the removal clears the other properties inside of
+    it, which the merged patch would keep."""
+    if not isinstance(older, dict) or not isinstance(newer, dict):
+        return True
+    for key, value in newer.items():
+        if key not in older:
+            continue
+        if older[key] is None and isinstance(value, dict):
+            return False
+        if not _can_coalesce(older[key], value):
+            return False
+    return True
+
+
+class CoalesceReportedPropertiesStage(PipelineStage):
+    """
+    PipelineStage which merges reported properties patches into one patch, so that a burst of
+    patches costs a single request to the service.
+
+    The first patch of a batch starts a timer for the reported_properties_window of the pipeline
+    configuration.  Patches made before the timer expires are merged into the batch, which is then
+    sent down as a single PatchTwinReportedPropertiesOperation.  The batch is sent early once it
+    reaches reported_properties_max_bytes.  Only one merged patch is sent at a time, so patches
+    made while one is being sent are held, and merged, until it completes.  Every operation in a
+    batch is completed with the result of the merged patch.
+
+    A patch which sets properties inside of a property that the batch removes can't be merged
+    into it, so it closes the batch, and starts a new batch.  Closed batches are sent in order.
+
+    If reported_properties_window is None, patches are passed down as they are.
+    """
+
+    handled_op_types = (pipeline_ops_iothub.PatchTwinReportedPropertiesOperation,)
+    handled_event_types = ()
+
+    def __init__(self):
+        super(CoalesceReportedPropertiesStage, self).__init__()
+        self.pending_ops = []
+        self.pending_patch = None
+        # Batches of (ops, patch) which can't take any more patches, oldest first
+        self.closed_batches = collections.deque()
+        self.window_timer = None
+        self.batch_ready = False
+        self.in_flight = False
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _run_op(self, op):
+        config = self.pipeline_root.pipeline_configuration
+        if (
+            isinstance(op, pipeline_ops_iothub.PatchTwinReportedPropertiesOperation)
+            and config.reported_properties_window is not None
+        ):
+            if self.pending_ops and not _can_coalesce(self.pending_patch, op.patch):
+                logger.debug(
+                    "{}({}): Patch can't be merged into the batch.  Starting a new batch".format(
+                        self.name, op.name
+                    )
+                )
+                self._close_batch()
+            if self.pending_ops:
+                self.pending_patch = _coalesce_patches(self.pending_patch, op.patch)
+            else:
+                self.pending_patch = copy.deepcopy(op.patch)
+            self.pending_ops.append(op)
+            logger.debug(
+                "{}({}): Holding reported properties patch ({} in batch)".format(
+                    self.name, op.name, len(self.pending_ops)
+                )
+            )
+
+            if config.reported_properties_max_bytes is not None and (
+                len(config.json_serializer.dumps(self.pending_patch))
+                >= config.reported_properties_max_bytes
+            ):
+                logger.debug("{}: Batch has reached its size limit".format(self.name))
+                self._cancel_timer()
+                self.batch_ready = True
+                self._send_batch_if_ready()
+            elif not self.window_timer and not self.batch_ready:
+                self._start_timer(config.reported_properties_window)
+        else:
+            super(CoalesceReportedPropertiesStage, self)._run_op(op)
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _start_timer(self, interval):
+        self_weakref = weakref.ref(self)
+
+        @pipeline_thread.invoke_on_pipeline_thread_nowait
+        def on_window_expired():
+            this = self_weakref()
+            if this and this.window_timer:
+                this.window_timer = None
+                this.batch_ready = True
+                this._send_batch_if_ready()
+
+        self.window_timer = timer_wheel.Timer(interval, on_window_expired)
+        self.window_timer.start()
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _cancel_timer(self):
+        if self.window_timer:
+            self.window_timer.cancel()
+            self.window_timer = None
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _close_batch(self):
+        """Stop merging patches into the pending batch, and send it as soon as possible"""
+        self._cancel_timer()
+        self.closed_batches.append((self.pending_ops, self.pending_patch))
+        self.pending_ops = []
+        self.pending_patch = None
+        self.batch_ready = False
+        self._send_batch_if_ready()
+
+    @pipeline_thread.runs_on_pipeline_thread
+    def _send_batch_if_ready(self):
+        if self.in_flight:
+            return
+        if self.closed_batches:
+            batch_ops, patch = self.closed_batches.popleft()
+        elif self.batch_ready:
+            batch_ops = self.pending_ops
+            patch = self.pending_patch
+            self.pending_ops = []
+            self.pending_patch = None
+            self.batch_ready = False
+        else:
+            return
+        self.in_flight = True
+
+        @pipeline_thread.runs_on_pipeline_thread
+        def on_patch_complete(op, error):
+            logger.debug(
+                "{}({}): Merged patch complete.  Completing {} operations".format(
+                    self.name, op.name, len(batch_ops)
+                )
+            )
+            self.in_flight = False
+            for batch_op in batch_ops:
+                batch_op.complete(error=error)
+            self._send_batch_if_ready()
+
+        logger.debug(
+            "{}: Sending {} reported properties patches merged as one".format(
+                self.name, len(batch_ops)
+            )
+        )
+        self.send_op_down(
+            pipeline_ops_iothub.PatchTwinReportedPropertiesOperation(
+                patch=patch, callback=on_patch_complete
+            )
+        )
+
+
 class TwinRequestResponseStage(PipelineStage):
     """
     PipelineStage which handles twin operations. In particular, it converts twin GET and PATCH
@@ -105,6 +331,12 @@ class TwinRequestResponseStage(PipelineStage):
     protocol-specific receive event into an ResponseEvent event.
     """
 
+    handled_op_types = (
+        pipeline_ops_iothub.GetTwinOperation,
+        pipeline_ops_iothub.PatchTwinReportedPropertiesOperation,
+    )
+    handled_event_types = ()
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         def map_twin_error(error, twin_op):
@@ -128,7 +360,8 @@ class TwinRequestResponseStage(PipelineStage):
                 logger.debug("{}({}): Got response for GetTwinOperation".format(self.name, op.name))
                 error = map_twin_error(error=error, twin_op=op)
                 if not error:
-                    op_waiting_for_response.twin = json.loads(op.response_body.decode("utf-8"))
+                    serializer = self.pipeline_root.pipeline_configuration.json_serializer
+                    op_waiting_for_response.twin = serializer.loads(op.response_body)
                 op_waiting_for_response.complete(error=error)
 
             self.send_op_down(
@@ -165,7 +398,9 @@ class TwinRequestResponseStage(PipelineStage):
                     request_type=constant.TWIN,
                     method="PATCH",
                     resource_location="/properties/reported/",
-                    request_body=json.dumps(op.patch),
+                    request_body=self.pipeline_root.pipeline_configuration.json_serializer.dumps(
+                        op.patch
+                    ),
                     callback=on_twin_response,
                 )
             )
@@ -40,6 +40,14 @@ class IoTHubHTTPTranslationStage(PipelineStage):
     converts http pipeline events into Iot and EdgeHub pipeline events.
     """
 
+    handled_op_types = (
+        pipeline_ops_iothub.SetIoTHubConnectionArgsOperation,
+        pipeline_ops_iothub_http.MethodInvokeOperation,
+        pipeline_ops_iothub_http.GetStorageInfoOperation,
+        pipeline_ops_iothub_http.NotifyBlobUploadStatusOperation,
+    )
+    handled_event_types = ()
+
     def __init__(self):
         super(IoTHubHTTPTranslationStage, self).__init__()
         self.device_id = None
@@ -5,7 +5,6 @@
 # --------------------------------------------------------------------------
 
 import logging
-import json
 import six.moves.urllib as urllib
 from azure.iot.device.common.pipeline import (
     pipeline_events_base,
@@ -31,11 +30,25 @@ class IoTHubMQTTTranslationStage(PipelineStage):
     converts mqtt pipeline events into Iot and IoTHub pipeline events.
     """
 
+    handled_op_types = (
+        pipeline_ops_iothub.SetIoTHubConnectionArgsOperation,
+        pipeline_ops_base.UpdateSasTokenOperation,
+        pipeline_ops_iothub.SendD2CMessageOperation,
+        pipeline_ops_iothub.SendOutputEventOperation,
+        pipeline_ops_iothub.SendD2CMessageBatchOperation,
+        pipeline_ops_iothub.SendMethodResponseOperation,
+        pipeline_ops_base.EnableFeatureOperation,
+        pipeline_ops_base.DisableFeatureOperation,
+        pipeline_ops_base.RequestOperation,
+    )
+    handled_event_types = (pipeline_events_mqtt.IncomingMQTTMessageEvent,)
+
     def __init__(self):
         super(IoTHubMQTTTranslationStage, self).__init__()
         self.feature_to_topic = {}
         self.device_id = None
         self.module_id = None
+        self.topic_codec = None
 
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
@@ -128,11 +141,37 @@ class IoTHubMQTTTranslationStage(PipelineStage):
             op, pipeline_ops_iothub.SendOutputEventOperation
         ):
             # Convert SendTelementry and SendOutputEventOperation operations into MQTT Publish operations
-            topic = mqtt_topic_iothub.encode_properties(op.message, self.telemetry_topic)
+            topic = self._get_topic_codec().encode_telemetry_topic(op.message)
             worker_op = op.spawn_worker_op(
                 worker_op_type=pipeline_ops_mqtt.MQTTPublishOperation,
                 topic=topic,
                 payload=op.message.data,
+                qos=self.pipeline_root.pipeline_configuration.telemetry_qos,
+                storable=True,
+            )
+            self.send_op_down(worker_op)
+
+        elif isinstance(op, pipeline_ops_iothub.SendD2CMessageBatchOperation):
+            # Convert the whole batch into a single MQTT Publish Batch operation.  The batch is only
+            # fanned out into individual publishes by the transport stage.
+            codec = self._get_topic_codec()
+            publishes = [
+                (codec.encode_telemetry_topic(message), message.data) for message in op.messages
+            ]
+
+            # Alias to avoid overload within the callback below
+            # CT-TODO: remove the need for this with better callback semantics
+            op_waiting_for_results = op
+
+            def on_publish_batch_complete(op, error):
+                op_waiting_for_results.results = op.results
+
+            worker_op = op.spawn_worker_op(
+                worker_op_type=pipeline_ops_mqtt.MQTTPublishBatchOperation,
+                publishes=publishes,
+                callback=on_publish_batch_complete,
+                qos=self.pipeline_root.pipeline_configuration.telemetry_qos,
+                storable=True,
             )
             self.send_op_down(worker_op)
 
@@ -141,7 +180,9 @@ class IoTHubMQTTTranslationStage(PipelineStage):
             topic = mqtt_topic_iothub.get_method_topic_for_publish(
                 op.method_response.request_id, str(op.method_response.status)
             )
-            payload = json.dumps(op.method_response.payload)
+            payload = self.pipeline_root.pipeline_configuration.json_serializer.dumps(
+                op.method_response.payload
+            )
             worker_op = op.spawn_worker_op(
                 worker_op_type=pipeline_ops_mqtt.MQTTPublishOperation, topic=topic, payload=payload
             )
@@ -190,9 +231,8 @@ class IoTHubMQTTTranslationStage(PipelineStage):
         """
         Build topic names based on the device_id and module_id passed.
         """
-        self.telemetry_topic = mqtt_topic_iothub.get_telemetry_topic_for_publish(
-            device_id, module_id
-        )
+        self.topic_codec = mqtt_topic_iothub.TopicCodec(device_id, module_id)
+        self.telemetry_topic = self.topic_codec.telemetry_topic
         self.feature_to_topic = {
             pipeline_constant.C2D_MSG: (
                 mqtt_topic_iothub.get_c2d_topic_for_subscribe(device_id, module_id)
@@ -207,6 +247,16 @@ class IoTHubMQTTTranslationStage(PipelineStage):
             ),
         }
 
+    @pipeline_thread.runs_on_pipeline_thread
+    def _get_topic_codec(self):
+        """
+        Return the TopicCodec for the current device_id and module_id, creating it if necessary.
+        """
+        codec = self.topic_codec
+        if codec is None or codec.device_id != self.device_id or codec.module_id != self.module_id:
+            codec = self.topic_codec = mqtt_topic_iothub.TopicCodec(self.device_id, self.module_id)
+        return codec
+
     @pipeline_thread.runs_on_pipeline_thread
     def _handle_pipeline_event(self, event):
         """
@@ -215,41 +265,44 @@ class IoTHubMQTTTranslationStage(PipelineStage):
         """
         if isinstance(event, pipeline_events_mqtt.IncomingMQTTMessageEvent):
             topic = event.topic
+            decoded = self._get_topic_codec().decode(topic)
+            kind = decoded.kind if decoded else None
 
-            if mqtt_topic_iothub.is_c2d_topic(topic, self.device_id):
+            if kind == mqtt_topic_iothub.C2D_TOPIC:
                 message = Message(event.payload)
-                mqtt_topic_iothub.extract_properties_from_topic(topic, message)
+                decoded.set_message_properties(message)
                 self.send_event_up(pipeline_events_iothub.C2DMessageEvent(message))
 
-            elif mqtt_topic_iothub.is_input_topic(topic, self.device_id, self.module_id):
+            elif kind == mqtt_topic_iothub.INPUT_TOPIC:
                 message = Message(event.payload)
-                mqtt_topic_iothub.extract_properties_from_topic(topic, message)
-                input_name = mqtt_topic_iothub.get_input_name_from_topic(topic)
-                self.send_event_up(pipeline_events_iothub.InputMessageEvent(input_name, message))
+                decoded.set_message_properties(message)
+                self.send_event_up(pipeline_events_iothub.InputMessageEvent(decoded.name, message))
 
-            elif mqtt_topic_iothub.is_method_topic(topic):
-                request_id = mqtt_topic_iothub.get_method_request_id_from_topic(topic)
-                method_name = mqtt_topic_iothub.get_method_name_from_topic(topic)
+            elif kind == mqtt_topic_iothub.METHOD_TOPIC:
                 method_received = MethodRequest(
-                    request_id=request_id,
-                    name=method_name,
-                    payload=json.loads(event.payload.decode("utf-8")),
+                    request_id=decoded.request_id,
+                    name=decoded.name,
+                    payload=self.pipeline_root.pipeline_configuration.json_serializer.loads(
+                        event.payload
+                    ),
                 )
                 self.send_event_up(pipeline_events_iothub.MethodRequestEvent(method_received))
 
-            elif mqtt_topic_iothub.is_twin_response_topic(topic):
-                request_id = mqtt_topic_iothub.get_twin_request_id_from_topic(topic)
-                status_code = int(mqtt_topic_iothub.get_twin_status_code_from_topic(topic))
+            elif kind == mqtt_topic_iothub.TWIN_RESPONSE_TOPIC:
                 self.send_event_up(
                     pipeline_events_base.ResponseEvent(
-                        request_id=request_id, status_code=status_code, response_body=event.payload
+                        request_id=decoded.request_id,
+                        status_code=decoded.status_code,
+                        response_body=event.payload,
                     )
                 )
 
-            elif mqtt_topic_iothub.is_twin_desired_property_patch_topic(topic):
+            elif kind == mqtt_topic_iothub.TWIN_PATCH_TOPIC:
                 self.send_event_up(
                     pipeline_events_iothub.TwinDesiredPropertiesPatchEvent(
-                        patch=json.loads(event.payload.decode("utf-8"))
+                        patch=self.pipeline_root.pipeline_configuration.json_serializer.loads(
+                            event.payload
+                        )
                     )
                 )
 
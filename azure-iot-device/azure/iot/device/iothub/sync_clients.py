@@ -8,16 +8,19 @@ Azure IoTHub Device SDK for Python.
 """
 
 import logging
+from concurrent.futures import Future
 from .abstract_clients import (
     AbstractIoTHubClient,
     AbstractIoTHubDeviceClient,
     AbstractIoTHubModuleClient,
+    convert_pipeline_error,
 )
 from .models import Message
 from .inbox_manager import InboxManager
 from .sync_inbox import SyncClientInbox, InboxEmpty
+from .sync_method_dispatcher import SyncMethodDispatcher
+from .twin_cache import TwinCache
 from .pipeline import constant as pipeline_constant
-from .pipeline import exceptions as pipeline_exceptions
 from azure.iot.device import exceptions
 from azure.iot.device.common.evented_callback import EventedCallback
 from azure.iot.device.common.callable_weak_method import CallableWeakMethod
@@ -27,27 +30,24 @@ from azure.iot.device import constant as device_constant
 logger = logging.getLogger(__name__)
 
 
+def _create_future_callback(future):
+    """Return a pipeline callback which completes a Future with the result of the operation"""
+
+    def callback(error=None):
+        if error:
+            future.set_exception(convert_pipeline_error(error))
+        else:
+            future.set_result(None)
+
+    future.set_running_or_notify_cancel()
+    return callback
+
+
 def handle_result(callback):
     try:
         return callback.wait_for_completion()
-    except pipeline_exceptions.ConnectionDroppedError as e:
-        raise exceptions.ConnectionDroppedError(message="Lost connection to IoTHub", cause=e)
-    except pipeline_exceptions.ConnectionFailedError as e:
-        raise exceptions.ConnectionFailedError(message="Could not connect to IoTHub", cause=e)
-    except pipeline_exceptions.UnauthorizedError as e:
-        raise exceptions.CredentialError(message="Credentials invalid, could not connect", cause=e)
-    except pipeline_exceptions.ProtocolClientError as e:
-        raise exceptions.ClientError(message="Error in the IoTHub client", cause=e)
-    except pipeline_exceptions.TlsExchangeAuthError as e:
-        raise exceptions.ClientError(
-            message="Error in the IoTHub client due to TLS exchanges.", cause=e
-        )
-    except pipeline_exceptions.ProtocolProxyError as e:
-        raise exceptions.ClientError(
-            message="Error in the IoTHub client raised due to proxy connections.", cause=e
-        )
     except Exception as e:
-        raise exceptions.ClientError(message="Unexpected failure", cause=e)
+        raise convert_pipeline_error(e)
 
 
 class GenericIoTHubClient(AbstractIoTHubClient):
@@ -80,6 +80,23 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         self._iothub_pipeline.on_twin_patch_received = CallableWeakMethod(
             self._inbox_manager, "route_twin_patch"
         )
+        self._twin_cache = None
+        self._twin_patch_inbox_enabled = False
+
+    def _enable_twin_cache(self):
+        """Keep a copy of the twin, and serve get_twin from it"""
+        self._twin_cache = TwinCache()
+        self._iothub_pipeline.on_twin_patch_received = CallableWeakMethod(
+            self, "_on_twin_patch_received"
+        )
+
+    def _on_twin_patch_received(self, patch):
+        """Handler that is called with twin patches when the twin cache is enabled"""
+        self._twin_cache.apply_desired_properties_patch(patch)
+        # The twin cache enables twin patches on its own, so the patches are only put in the inbox
+        # once the application has asked to receive them.
+        if self._twin_patch_inbox_enabled:
+            self._inbox_manager.route_twin_patch(patch)
 
     def _on_connected(self):
         """Helper handler that is called upon an iothub pipeline connect"""
@@ -90,6 +107,17 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         logger.info("Connection State - Disconnected")
         self._inbox_manager.clear_all_method_requests()
         logger.info("Cleared all pending method requests due to disconnect")
+        if self._twin_cache is not None:
+            # Twin patches may be missed while disconnected
+            self._twin_cache.invalidate()
+
+    def _wait_for_publish_window(self):
+        """Block until the pipeline is ready to accept more messages to publish"""
+        if not self._iothub_pipeline.publish_window_open:
+            logger.info("Waiting for previously sent messages to be acknowledged...")
+            callback = EventedCallback()
+            self._iothub_pipeline.wait_for_publish_window(callback=callback)
+            callback.wait_for_completion()
 
     def connect(self):
         """Connects the client to an Azure IoT Hub or Azure IoT Edge Hub instance.
@@ -134,18 +162,32 @@ class GenericIoTHubClient(AbstractIoTHubClient):
 
         logger.info("Successfully disconnected from Hub")
 
-    def send_message(self, message):
+    def send_message(self, message, wait=True):
         """Sends a message to the default events endpoint on the Azure IoT Hub or Azure IoT Edge Hub instance.
 
         This is a synchronous event, meaning that this function will not return until the event
         has been sent to the service and the service has acknowledged receipt of the event.
 
+        If wait is False, this function returns as soon as the message has been handed to the
+        pipeline, with a Future which is completed once the service has acknowledged receipt of the
+        message.  This lets one thread have many messages waiting for acknowledgement at a time.
+        Errors sending the message are then raised by the Future instead of by this function.
+
         If the connection to the service has not previously been opened by a call to connect, this
         function will open the connection before sending the event.
 
+        If publish limits were configured when the client was created, and too many messages are
+        already waiting to be acknowledged by the service, this function will block until there is
+        room for more.
+
         :param message: The actual message to send. Anything passed that is not an instance of the
             Message class will be converted to Message object.
         :type message: :class:`azure.iot.device.Message` or str
+        :param bool wait: Indicates if the function should wait until the service has acknowledged
+            receipt of the message. Default True.
+
+        :returns: None, or a Future for the acknowledgement of the message if wait is False.
+        :rtype: None or :class:`concurrent.futures.Future`
 
         :raises: :class:`azure.iot.device.exceptions.CredentialError` if credentials are invalid
             and a connection cannot be established.
@@ -160,10 +202,17 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         if not isinstance(message, Message):
             message = Message(message)
 
+        message = self._iothub_pipeline.encode_message(message)
         if message.get_size() > device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
             raise ValueError("Size of telemetry message can not exceed 256 KB.")
 
         logger.info("Sending message to Hub...")
+        self._wait_for_publish_window()
+
+        if not wait:
+            future = Future()
+            self._iothub_pipeline.send_message(message, callback=_create_future_callback(future))
+            return future
 
         callback = EventedCallback()
         self._iothub_pipeline.send_message(message, callback=callback)
@@ -171,6 +220,64 @@ class GenericIoTHubClient(AbstractIoTHubClient):
 
         logger.info("Successfully sent message to Hub")
 
+    def send_message_batch(self, messages):
+        """Sends a batch of messages to the default events endpoint on the Azure IoT Hub or Azure IoT Edge Hub instance.
+
+        The batch is handed to the pipeline as a single operation, so sending N messages this way
+        costs one handoff to the pipeline and one wait, rather than N of each.
+
+        This is a synchronous event, meaning that this function will not return until every message
+        in the batch has either been acknowledged by the service or has failed.
+
+        If the connection to the service has not previously been opened by a call to connect, this
+        function will open the connection before sending the messages.
+
+        If publish limits were configured when the client was created, and too many messages are
+        already waiting to be acknowledged by the service, this function will block until there is
+        room for more.
+
+        :param messages: The messages to send. Anything passed that is not an instance of the
+            Message class will be converted to Message object.
+        :type messages: list of :class:`azure.iot.device.Message` or str
+
+        :returns: A list with one entry per message, in the order they were given. Each entry is
+            None if the message was sent successfully, or the
+            :class:`azure.iot.device.exceptions.ClientError` describing why that message failed.
+        :rtype: list
+
+        :raises: :class:`azure.iot.device.exceptions.CredentialError` if credentials are invalid
+            and a connection cannot be established.
+        :raises: :class:`azure.iot.device.exceptions.ConnectionFailedError` if a establishing a
+            connection results in failure.
+        :raises: :class:`azure.iot.device.exceptions.ConnectionDroppedError` if connection is lost
+            during execution.
+        :raises: :class:`azure.iot.device.exceptions.ClientError` if there is an unexpected failure
+            during execution.
+        :raises: ValueError if any message fails size validation.
+        """
+        messages = [m if isinstance(m, Message) else Message(m) for m in messages]
+
+        # Encoding returns new messages rather than changing the ones passed in, so nothing the
+        # caller owns has been changed if any of them is too big to send
+        messages = [self._iothub_pipeline.encode_message(m) for m in messages]
+        for message in messages:
+            if message.get_size() > device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
+                raise ValueError("Size of telemetry message can not exceed 256 KB.")
+
+        if not messages:
+            return []
+
+        logger.info("Sending batch of {} messages to Hub...".format(len(messages)))
+        self._wait_for_publish_window()
+
+        callback = EventedCallback(return_arg_name="results")
+        self._iothub_pipeline.send_message_batch(messages, callback=callback)
+        results = handle_result(callback)
+
+        results = [convert_pipeline_error(e) if e else None for e in results]
+        logger.info("Successfully sent batch of messages to Hub")
+        return results
+
     def receive_method_request(self, method_name=None, block=True, timeout=None):
         """Receive a method request via the Azure IoT Hub or Azure IoT Edge Hub.
 
@@ -196,6 +303,72 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         logger.info("Received method request")
         return method_request
 
+    def receive_method_requests(self, method_name=None, max_count=None, block=True, timeout=None):
+        """Receive the method requests waiting to be received, as a batch.
+
+        :param str method_name: Optionally provide the name of the method to receive requests for.
+            If this parameter is not given, all methods not already being specifically targeted by
+            a different request to receive_method will be received.
+        :param int max_count: Optionally provide the maximum number of requests to receive.
+        :param bool block: Indicates if the operation should block until a request is received.
+        :param int timeout: Optionally provide a number of seconds until blocking times out.
+
+        :returns: List of MethodRequest objects, oldest first, or an empty list if no method
+            request has been received by the end of the blocking period.
+        """
+        if not self._iothub_pipeline.feature_enabled[pipeline_constant.METHODS]:
+            self._enable_feature(pipeline_constant.METHODS)
+
+        method_inbox = self._inbox_manager.get_method_request_inbox(method_name)
+
+        logger.info("Waiting for method requests...")
+        try:
+            method_requests = method_inbox.get_batch(
+                max_items=max_count, block=block, timeout=timeout
+            )
+        except InboxEmpty:
+            method_requests = []
+        logger.info("Received {} method requests".format(len(method_requests)))
+        return method_requests
+
+    def on_method_request(self, method_name, handler, max_concurrency=1):
+        """Set a handler to be called with method requests, instead of receiving them with
+        receive_method_request.
+
+        The handler is called with each MethodRequest on one of max_concurrency worker threads
+        dedicated to it, so a slow handler does not delay requests for other methods.  It returns
+        either a MethodResponse, or the payload of a response with status 200, and the response is
+        sent automatically.  If the handler raises an exception, a response with status 500 is
+        sent.
+
+        :param str method_name: The name of the method to handle requests for, or None to handle
+            all methods which do not have their own handler or are not being specifically targeted
+            by a call to receive_method_request.
+        :param handler: The function to call with each MethodRequest, or None to remove the
+            handler for the method.
+        :param int max_concurrency: The maximum number of requests handled at a time.
+
+        :raises: TypeError if max_concurrency is not an integer.
+        :raises: ValueError if max_concurrency is less than 1.
+        """
+        if handler is not None:
+            dispatcher = SyncMethodDispatcher(
+                handler,
+                CallableWeakMethod(self, "send_method_response"),
+                max_concurrency=max_concurrency,
+            )
+            if not self._iothub_pipeline.feature_enabled[pipeline_constant.METHODS]:
+                self._enable_feature(pipeline_constant.METHODS)
+        else:
+            dispatcher = None
+
+        previous_dispatcher = self._inbox_manager.set_method_request_handler(
+            method_name, dispatcher
+        )
+        if previous_dispatcher is not None:
+            previous_dispatcher.close()
+        logger.info("Set method request handler for: {}".format(method_name or "all methods"))
+
     def send_method_response(self, method_response):
         """Send a response to a method request via the Azure IoT Hub or Azure IoT Edge Hub.
 
@@ -249,6 +422,9 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         This is a synchronous call, meaning that this function will not return until the twin
         has been retrieved from the service.
 
+        If the twin cache is enabled, the twin is only retrieved from the service the first time,
+        and whenever the cached twin could be out of date.
+
         :returns: Complete Twin as a JSON dict
         :rtype: dict
 
@@ -261,6 +437,16 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         :raises: :class:`azure.iot.device.exceptions.ClientError` if there is an unexpected failure
             during execution.
         """
+        if self._twin_cache is not None:
+            twin = self._twin_cache.get()
+            if twin is not None:
+                logger.info("Retrieved twin from cache")
+                return twin
+            # The cache is kept current from twin patches, so they must be enabled before fetching
+            if not self._iothub_pipeline.feature_enabled[pipeline_constant.TWIN_PATCHES]:
+                self._enable_feature(pipeline_constant.TWIN_PATCHES)
+            generation = self._twin_cache.generation
+
         if not self._iothub_pipeline.feature_enabled[pipeline_constant.TWIN]:
             self._enable_feature(pipeline_constant.TWIN)
 
@@ -268,6 +454,8 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         self._iothub_pipeline.get_twin(callback=callback)
         twin = handle_result(callback)
 
+        if self._twin_cache is not None:
+            self._twin_cache.set(twin, generation)
         logger.info("Successfully retrieved twin")
         return twin
 
@@ -302,6 +490,9 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         )
         handle_result(callback)
 
+        if self._twin_cache is not None:
+            # The new version of the reported properties is only known to the service
+            self._twin_cache.invalidate()
         logger.info("Successfully patched twin")
 
     def receive_twin_desired_properties_patch(self, block=True, timeout=None):
@@ -325,6 +516,7 @@ class GenericIoTHubClient(AbstractIoTHubClient):
             received by the end of the blocking period
         :rtype: dict or None
         """
+        self._twin_patch_inbox_enabled = True
         if not self._iothub_pipeline.feature_enabled[pipeline_constant.TWIN_PATCHES]:
             self._enable_feature(pipeline_constant.TWIN_PATCHES)
         twin_patch_inbox = self._inbox_manager.get_twin_patch_inbox()
@@ -337,6 +529,21 @@ class GenericIoTHubClient(AbstractIoTHubClient):
         logger.info("twin patch received")
         return patch
 
+    def get_inbox_metrics(self):
+        """
+        Get the metrics of the inboxes which hold received items until the application receives
+        them.
+
+        :returns: A dictionary mapping inbox names to metrics.  The inboxes are named "c2d",
+            "twin_patch", "method" (for method requests not received by method name),
+            "method:<method name>" and "input:<input name>".  The metrics of each inbox are its
+            depth (the number of items it holds), oldest_item_age (the number of seconds the oldest
+            item has been waiting, or None if it is empty) and dropped_count (the number of items
+            dropped because it was full).
+        :rtype: dict
+        """
+        return self._inbox_manager.get_metrics()
+
 
 class IoTHubDeviceClient(GenericIoTHubClient, AbstractIoTHubDeviceClient):
     """A synchronous device client that connects to an Azure IoT Hub instance.
@@ -382,6 +589,29 @@ class IoTHubDeviceClient(GenericIoTHubClient, AbstractIoTHubDeviceClient):
         logger.info("Message received")
         return message
 
+    def receive_messages(self, max_count=None, block=True, timeout=None):
+        """Receive the messages that have been sent from the Azure IoT Hub, as a batch.
+
+        :param int max_count: Optionally provide the maximum number of messages to receive.
+        :param bool block: Indicates if the operation should block until a message is received.
+        :param int timeout: Optionally provide a number of seconds until blocking times out.
+
+        :returns: List of messages that were sent from the Azure IoT Hub, oldest first, or an
+            empty list if no message has been received by the end of the blocking period.
+        :rtype: list of :class:`azure.iot.device.Message`
+        """
+        if not self._iothub_pipeline.feature_enabled[pipeline_constant.C2D_MSG]:
+            self._enable_feature(pipeline_constant.C2D_MSG)
+        c2d_inbox = self._inbox_manager.get_c2d_message_inbox()
+
+        logger.info("Waiting for messages from Hub...")
+        try:
+            messages = c2d_inbox.get_batch(max_items=max_count, block=block, timeout=timeout)
+        except InboxEmpty:
+            messages = []
+        logger.info("Received {} messages".format(len(messages)))
+        return messages
+
     def get_storage_info_for_blob(self, blob_name):
         """Sends a POST request over HTTP to an IoTHub endpoint that will return information for uploading via the Azure Storage Account linked to the IoTHub your device is connected to.
 
@@ -452,6 +682,10 @@ class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
         If the connection to the service has not previously been opened by a call to connect, this
         function will open the connection before sending the event.
 
+        If publish limits were configured when the client was created, and too many messages are
+        already waiting to be acknowledged by the service, this function will block until there is
+        room for more.
+
         :param message: Message to send to the given output. Anything passed that is not an instance of the
             Message class will be converted to Message object.
         :type message: :class:`azure.iot.device.Message` or str
@@ -470,12 +704,15 @@ class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
         if not isinstance(message, Message):
             message = Message(message)
 
+        # The output name is sent as a property, so it counts towards the size of the message
+        message.output_name = output_name
+
+        message = self._iothub_pipeline.encode_message(message)
         if message.get_size() > device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
             raise ValueError("Size of message can not exceed 256 KB.")
 
-        message.output_name = output_name
-
         logger.info("Sending message to output:" + output_name + "...")
+        self._wait_for_publish_window()
 
         callback = EventedCallback()
         self._iothub_pipeline.send_output_event(message, callback=callback)
@@ -505,6 +742,30 @@ class IoTHubModuleClient(GenericIoTHubClient, AbstractIoTHubModuleClient):
         logger.info("Input message received on: " + input_name)
         return message
 
+    def receive_message_on_input_batch(self, input_name, max_count=None, block=True, timeout=None):
+        """Receive the input messages that have been sent from other Modules to a specific input,
+        as a batch.
+
+        :param str input_name: The input name to receive messages on.
+        :param int max_count: Optionally provide the maximum number of messages to receive.
+        :param bool block: Indicates if the operation should block until a message is received.
+        :param int timeout: Optionally provide a number of seconds until blocking times out.
+
+        :returns: List of messages that were sent to the specified input, oldest first, or an
+            empty list if no message has been received by the end of the blocking period.
+        """
+        if not self._iothub_pipeline.feature_enabled[pipeline_constant.INPUT_MSG]:
+            self._enable_feature(pipeline_constant.INPUT_MSG)
+        input_inbox = self._inbox_manager.get_input_message_inbox(input_name)
+
+        logger.info("Waiting for input messages on: " + input_name + "...")
+        try:
+            messages = input_inbox.get_batch(max_items=max_count, block=block, timeout=timeout)
+        except InboxEmpty:
+            messages = []
+        logger.info("Received {} input messages on: {}".format(len(messages), input_name))
+        return messages
+
     def invoke_method(self, method_params, device_id, module_id=None):
         """Invoke a method from your client onto a device or module client, and receive the response to the method call.
 
@@ -5,9 +5,30 @@
 # --------------------------------------------------------------------------
 """This module contains an Inbox class for use with a synchronous client."""
 
+import collections
+import logging
+import threading
+import time
 from six.moves import queue
 import six
 from abc import ABCMeta, abstractmethod
+from azure.iot.device.common.disk_queue import DiskQueue
+from azure.iot.device.common.pipeline import pipeline_thread
+
+logger = logging.getLogger(__name__)
+
+# Action taken when an item is put into an inbox which is at its capacity
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+SPILL = "spill"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, SPILL)
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    # Python 2.7
+    _monotonic = time.time
 
 
 class InboxEmpty(Exception):
@@ -18,7 +39,7 @@ class InboxEmpty(Exception):
 class AbstractInbox:
     """Abstract Base Class for Inbox.
 
-    Holds generic incoming data for a client.
+    Holds generic incoming data for a client, optionally up to a capacity limit.
 
     All methods, when implemented, should be threadsafe.
     """
@@ -27,7 +48,7 @@ class AbstractInbox:
     def _put(self, item):
         """Put an item into the Inbox.
 
-        Implementation should block until a free slot is available.
+        Implementation should apply the overflow policy of the inbox if it is full.
         Implementation MUST be a synchronous function.
         Only to be used by the InboxManager.
 
@@ -46,6 +67,20 @@ class AbstractInbox:
         """
         pass
 
+    @abstractmethod
+    def get_batch(self, max_items=None):
+        """Remove and return the items in the inbox, up to max_items of them.
+
+        Implementation should have the capability to block until an item is available, and
+        should take all the items it returns from the inbox at once.
+        Implementation can be a synchronous function or an asynchronous coroutine.
+
+        :param int max_items: The maximum number of items to return, or None for no limit.
+
+        :returns: A list of items from the Inbox, oldest first.
+        """
+        pass
+
     @abstractmethod
     def empty(self):
         """Returns True if the inbox is empty, False otherwise
@@ -60,6 +95,121 @@ class AbstractInbox:
         """
         pass
 
+    def _init_capacity(self, sync_queue, overflow_policy, spill_directory):
+        """Set up the capacity limit of the inbox.  Must be called by the initializer of every
+        implementation.
+
+        :param sync_queue: The queue holding the items of the inbox in memory, with a synchronous
+            interface like that of queue.Queue.  Its maxsize is the capacity of the inbox.
+        :param str overflow_policy: What to do with an item put into the inbox when it is full.
+        :param str spill_directory: The directory to spill items to disk in, for the SPILL policy.
+
+        :raises: ValueError if the overflow policy is unknown, or is BLOCK for an inbox with a
+            capacity while pipeline callbacks run on an event loop.
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError("Invalid overflow policy '{}'".format(overflow_policy))
+        if overflow_policy == BLOCK and sync_queue.maxsize > 0 and pipeline_thread.get_event_loop():
+            # Items are put into inboxes by pipeline callbacks, so waiting for a free slot would
+            # block the event loop, and with it the application that would free the slot.
+            raise ValueError(
+                "The '{}' overflow policy can not be used for an inbox with a capacity while the "
+                "pipeline runs on an event loop".format(BLOCK)
+            )
+        self._sync_queue = sync_queue
+        self._overflow_policy = overflow_policy
+        self._spill = DiskQueue(spill_directory) if overflow_policy == SPILL else None
+        # The times items were put into the inbox, oldest first.  There is one time for each item,
+        # including items spilled to disk, and the times are removed as the items are.
+        self._put_times = collections.deque()
+        self._capacity_lock = threading.Lock()
+        self.dropped_count = 0
+
+    @property
+    def depth(self):
+        """The number of items in the inbox, including any spilled to disk"""
+        with self._capacity_lock:
+            spilled = len(self._spill) if self._spill is not None else 0
+            return self._sync_queue.qsize() + spilled
+
+    @property
+    def oldest_item_age(self):
+        """The number of seconds since the oldest item in the inbox was put into it, or None if
+        the inbox is empty"""
+        with self._capacity_lock:
+            if not self._put_times:
+                return None
+            return _monotonic() - self._put_times[0]
+
+    def _put_with_overflow_policy(self, item):
+        """Put an item into the inbox, applying the overflow policy if the inbox is full.
+
+        With the BLOCK policy, this waits on the thread the pipeline calls back on, so nothing
+        else is delivered by the pipeline until the application takes an item from the inbox.
+        """
+        if self._overflow_policy == BLOCK:
+            # The time is recorded first, so that it is there for the item as soon as it can be
+            # taken, and the lock is not held while waiting for a free slot.
+            with self._capacity_lock:
+                self._put_times.append(_monotonic())
+            self._sync_queue.put(item)
+            return
+
+        with self._capacity_lock:
+            if self._spill is None or not len(self._spill):
+                try:
+                    self._sync_queue.put_nowait(item)
+                except queue.Full:
+                    pass
+                else:
+                    self._put_times.append(_monotonic())
+                    return
+
+            if self._overflow_policy == DROP_NEWEST:
+                self.dropped_count += 1
+                logger.warning("Inbox is full - dropping the newest item")
+                return
+            elif self._overflow_policy == DROP_OLDEST:
+                while True:
+                    try:
+                        self._sync_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    else:
+                        self._put_times.popleft()
+                        self.dropped_count += 1
+                        logger.warning("Inbox is full - dropping the oldest item")
+                    try:
+                        self._sync_queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        pass
+            else:
+                # Items are spilled for as long as there are spilled items, so that they stay in
+                # order
+                self._spill.put(item)
+            self._put_times.append(_monotonic())
+
+    def _on_item_removed(self, count=1):
+        """Update the inbox after items have been taken from the in-memory queue
+
+        :param int count: The number of items which were taken.
+        """
+        with self._capacity_lock:
+            for _ in range(min(count, len(self._put_times))):
+                self._put_times.popleft()
+            if self._spill is not None:
+                # Move spilled items back into memory now that there is room for them
+                while len(self._spill) and not self._sync_queue.full():
+                    self._sync_queue.put_nowait(self._spill.get())
+
+    def _clear_overflow(self):
+        """Remove everything but the in-memory items from the inbox"""
+        with self._capacity_lock:
+            self._put_times.clear()
+            if self._spill is not None:
+                self._spill.close()
+
 
 class SyncClientInbox(AbstractInbox):
     """Holds generic incoming data for a synchronous client.
@@ -67,9 +217,23 @@ class SyncClientInbox(AbstractInbox):
     All methods implemented in this class are threadsafe.
     """
 
-    def __init__(self):
-        """Initializer for SyncClientInbox"""
-        self._queue = queue.Queue()
+    def __init__(self, capacity=None, overflow_policy=BLOCK, spill_directory=None):
+        """Initializer for SyncClientInbox
+
+        :param int capacity: The maximum number of items the inbox can hold in memory, or None for
+            no limit.
+        :param str overflow_policy: What to do with an item put into the inbox when it is full.
+            BLOCK waits for a free slot, which holds up everything else the pipeline delivers.
+            DROP_OLDEST drops the oldest item to make room.  DROP_NEWEST drops the new item.
+            SPILL keeps the new item on disk until there is room.
+        :param str spill_directory: The directory to spill items to disk in, or None for the
+            default temporary directory.
+
+        :raises: ValueError if the overflow policy is unknown, or is BLOCK with a capacity while
+            the pipeline runs on an event loop.
+        """
+        self._queue = queue.Queue(maxsize=capacity or 0)
+        self._init_capacity(self._queue, overflow_policy, spill_directory)
 
     def __contains__(self, item):
         """Return True if item is in Inbox, False otherwise"""
@@ -79,12 +243,12 @@ class SyncClientInbox(AbstractInbox):
     def _put(self, item):
         """Put an item into the inbox.
 
-        Block if necessary until a free slot is available.
+        If the inbox is full, apply its overflow policy.
         Only to be used by the InboxManager.
 
         :param item: The item to put in the inbox.
         """
-        self._queue.put(item)
+        self._put_with_overflow_policy(item)
 
     def get(self, block=True, timeout=None):
         """Remove and return an item from the inbox.
@@ -99,9 +263,49 @@ class SyncClientInbox(AbstractInbox):
         :returns: An item from the Inbox
         """
         try:
-            return self._queue.get(block=block, timeout=timeout)
+            item = self._queue.get(block=block, timeout=timeout)
         except queue.Empty:
             raise InboxEmpty("Inbox is empty")
+        self._on_item_removed()
+        return item
+
+    def get_batch(self, max_items=None, block=True, timeout=None):
+        """Remove and return the items in the inbox, up to max_items of them.
+
+        The items are all taken with a single acquisition of the lock of the inbox.
+
+        :param int max_items: The maximum number of items to return, or None for no limit.
+        :param bool block: Indicates if the operation should block until an item is available.
+        Default True.
+        :param int timeout: Optionally provide a number of seconds until blocking times out.
+
+        :raises: ValueError if max_items is less than 1
+        :raises: InboxEmpty if timeout occurs because the inbox is empty
+        :raises: InboxEmpty if inbox is empty in non-blocking mode
+
+        :returns: A list of items from the Inbox, oldest first
+        """
+        if max_items is not None and max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        items = self._queue.queue
+        with self._queue.not_empty:
+            if block:
+                end_time = None if timeout is None else _monotonic() + timeout
+                while not items:
+                    if end_time is None:
+                        self._queue.not_empty.wait()
+                    else:
+                        remaining = end_time - _monotonic()
+                        if remaining <= 0:
+                            break
+                        self._queue.not_empty.wait(remaining)
+            count = len(items) if max_items is None else min(max_items, len(items))
+            if not count:
+                raise InboxEmpty("Inbox is empty")
+            batch = [items.popleft() for _ in range(count)]
+            self._queue.not_full.notify_all()
+        self._on_item_removed(count)
+        return batch
 
     def empty(self):
         """Returns True if the inbox is empty, False otherwise
@@ -113,5 +317,7 @@ class SyncClientInbox(AbstractInbox):
     def clear(self):
         """Remove all items from the inbox.
         """
+        self._clear_overflow()
         with self._queue.mutex:
             self._queue.queue.clear()
+            self._queue.not_full.notify_all()
@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""This module contains a class for calling method request handlers in a synchronous client"""
+
+import logging
+import six
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from .models import MethodResponse
+
+logger = logging.getLogger(__name__)
+
+# Status and payload sent in response to a method request whose handler raised an exception.
+# The exception itself is only logged, since it can describe the internals of the application.
+HANDLER_ERROR_STATUS = 500
+HANDLER_ERROR_MESSAGE = "Method request handler failed"
+
+
+class DispatcherClosed(Exception):
+    """Raised by a MethodDispatcher which is given a method request after it has been closed"""
+
+    pass
+
+
+@six.add_metaclass(ABCMeta)
+class AbstractMethodDispatcher:
+    """Abstract Base Class for MethodDispatcher.
+
+    Calls a method request handler for each method request it is given, up to a number of requests
+    at a time, and sends the response created from what the handler returns.
+
+    A handler returns either a MethodResponse, which is sent as is, or the payload of a response
+    with status 200.  If the handler raises an exception, a response with status 500 is sent.
+    """
+
+    def __init__(self, handler, send_method_response, max_concurrency=1):
+        """Initializer for a MethodDispatcher.
+
+        :param handler: The function called with each MethodRequest.
+        :param send_method_response: The function used to send each MethodResponse.
+        :param int max_concurrency: The maximum number of method requests handled at a time.
+
+        :raises: TypeError if max_concurrency is not an integer.
+        :raises: ValueError if max_concurrency is less than 1.
+        """
+        if isinstance(max_concurrency, bool) or not isinstance(max_concurrency, six.integer_types):
+            raise TypeError("Invalid type for 'max_concurrency'")
+        if max_concurrency < 1:
+            raise ValueError("'max_concurrency' must be greater than 0")
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self._send_method_response = send_method_response
+
+    def __call__(self, method_request):
+        """Start handling a method request.  A MethodDispatcher can be used as a handler by the
+        InboxManager.
+        """
+        self.dispatch(method_request)
+
+    @abstractmethod
+    def dispatch(self, method_request):
+        """Start handling a method request.
+
+        Implementation MUST NOT block, as it is called by the pipeline.
+
+        :param method_request: The MethodRequest to handle.
+
+        :raises: DispatcherClosed if the dispatcher has been closed, and can no longer handle
+            method requests.
+        """
+        pass
+
+    def close(self):
+        """Release the resources of the dispatcher once it is no longer given method requests.
+
+        Method requests already given to the dispatcher are still handled.
+        """
+        pass
+
+    def _create_method_response(self, method_request, result):
+        """Create the response to a method request from the result of its handler"""
+        if isinstance(result, MethodResponse):
+            return result
+        return MethodResponse.create_from_method_request(method_request, 200, result)
+
+    def _create_error_method_response(self, method_request):
+        """Create the response to a method request whose handler raised an exception.  Must be
+        called while handling the exception."""
+        logger.error(
+            "Handler for method request {} ({}) raised an exception".format(
+                method_request.request_id, method_request.name
+            ),
+            exc_info=True,
+        )
+        return MethodResponse.create_from_method_request(
+            method_request, HANDLER_ERROR_STATUS, {"error": HANDLER_ERROR_MESSAGE}
+        )
+
+
+class SyncMethodDispatcher(AbstractMethodDispatcher):
+    """Calls a method request handler on a pool of worker threads for a synchronous client.
+
+    The pool has max_concurrency threads, so a slow handler only delays requests for its own
+    method.
+    """
+
+    def __init__(self, handler, send_method_response, max_concurrency=1):
+        super(SyncMethodDispatcher, self).__init__(handler, send_method_response, max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def dispatch(self, method_request):
+        """Queue a method request to be handled by the next free worker thread.
+
+        :param method_request: The MethodRequest to handle.
+
+        :raises: DispatcherClosed if the worker threads have been stopped by close().
+        """
+        try:
+            self._executor.submit(self._handle, method_request)
+        except RuntimeError:
+            # The executor only refuses work once it has been shut down
+            raise DispatcherClosed("Method dispatcher has been closed")
+
+    def close(self):
+        """Stop the worker threads once they have handled the method requests already given to
+        the dispatcher."""
+        self._executor.shutdown(wait=False)
+
+    def _handle(self, method_request):
+        try:
+            result = self.handler(method_request)
+        except Exception:
+            method_response = self._create_error_method_response(method_request)
+        else:
+            method_response = self._create_method_response(method_request, result)
+        try:
+            self._send_method_response(method_response)
+        except Exception:
+            logger.error(
+                "Failed to send response to method request {}".format(method_request.request_id),
+                exc_info=True,
+            )
@@ -0,0 +1,112 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""This module contains a cache for the twin of a client."""
+
+import collections
+import copy
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The number of desired property patches kept while there is no twin to apply them to
+MAX_UNAPPLIED_PATCHES = 32
+
+
+def _merge_patch(target, patch):
+    """Apply a JSON merge patch to a dictionary in place.  Keys set to None are removed."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_patch(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class TwinCache(object):
+    """Holds a copy of the twin of a client, kept current from desired property patches.
+
+    Patches are applied in order of their $version.  If a patch is missing, the cached twin is
+    invalidated so that it is fetched again.  Patches received while there is no cached twin are
+    kept, and those newer than the next twin cached are applied to it.
+
+    All methods are threadsafe.
+
+    :ivar int generation: The number of times the cache has been invalidated.  A twin is only
+        cached if the cache was not invalidated while it was being fetched.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._twin = None
+        self._unapplied_patches = collections.deque(maxlen=MAX_UNAPPLIED_PATCHES)
+        self.generation = 0
+
+    def get(self):
+        """Return a copy of the cached twin, or None if no twin is cached."""
+        with self._lock:
+            return copy.deepcopy(self._twin)
+
+    def set(self, twin, generation):
+        """Cache a twin fetched from the service, unless the cache was invalidated while the twin
+        was being fetched.
+
+        :param dict twin: The complete twin.
+        :param int generation: The generation of the cache when the twin started being fetched.
+        """
+        with self._lock:
+            if generation != self.generation:
+                logger.debug("Twin cache was invalidated while fetching the twin - not caching it")
+                return
+            self._twin = copy.deepcopy(twin)
+            patches = sorted(self._unapplied_patches, key=lambda patch: patch.get("$version", 0))
+            self._unapplied_patches.clear()
+            for patch in patches:
+                if self._twin is not None:
+                    self._apply_patch(patch)
+
+    def invalidate(self):
+        """Remove the cached twin, so that it is fetched again."""
+        with self._lock:
+            self._invalidate()
+
+    def apply_desired_properties_patch(self, patch):
+        """Apply a desired property patch received from the service to the cached twin.
+
+        :param dict patch: The desired property patch.
+        """
+        with self._lock:
+            if self._twin is None:
+                self._unapplied_patches.append(patch)
+            else:
+                self._apply_patch(patch)
+
+    def _invalidate(self):
+        self._twin = None
+        self._unapplied_patches.clear()
+        self.generation += 1
+
+    def _apply_patch(self, patch):
+        desired = self._twin.setdefault("desired", {})
+        current_version = desired.get("$version")
+        patch_version = patch.get("$version")
+        if current_version is None or patch_version is None:
+            logger.info("Twin cache can not order desired property patch - invalidating")
+            self._invalidate()
+        elif patch_version <= current_version:
+            logger.debug(
+                "Twin cache already has desired properties version {}".format(patch_version)
+            )
+        elif patch_version > current_version + 1:
+            logger.info(
+                "Twin cache missed desired properties versions {} to {} - invalidating".format(
+                    current_version + 1, patch_version - 1
+                )
+            )
+            self._invalidate()
+        else:
+            _merge_patch(desired, patch)
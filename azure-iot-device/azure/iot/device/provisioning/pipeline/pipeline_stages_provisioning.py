@@ -16,7 +16,7 @@ from azure.iot.device.provisioning.models.registration_result import (
 import logging
 import weakref
 import json
-from threading import Timer
+from azure.iot.device.common.timer_wheel import Timer
 import time
 from .mqtt_topic import get_optional_element
 
@@ -31,6 +31,12 @@ class UseSecurityClientStage(PipelineStage):
     All other operations are passed down.
     """
 
+    handled_op_types = (
+        pipeline_ops_provisioning.SetSymmetricKeySecurityClientOperation,
+        pipeline_ops_provisioning.SetX509SecurityClientOperation,
+    )
+    handled_event_types = ()
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         if isinstance(op, pipeline_ops_provisioning.SetSymmetricKeySecurityClientOperation):
@@ -68,6 +74,8 @@ class CommonProvisioningStage(PipelineStage):
     and forming a complete result.
     """
 
+    handled_event_types = ()
+
     @pipeline_thread.runs_on_pipeline_thread
     def _clear_timeout_timer(self, op, error):
         """
@@ -215,6 +223,8 @@ class PollingStatusStage(CommonProvisioningStage):
     to send another query request or complete the procedure.
     """
 
+    handled_op_types = (pipeline_ops_provisioning.PollStatusOperation,)
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         if isinstance(op, pipeline_ops_provisioning.PollStatusOperation):
@@ -353,6 +363,8 @@ class RegistrationStage(CommonProvisioningStage):
     this stage may also complete the registration process.
     """
 
+    handled_op_types = (pipeline_ops_provisioning.RegisterOperation,)
+
     @pipeline_thread.runs_on_pipeline_thread
     def _run_op(self, op):
         if isinstance(op, pipeline_ops_provisioning.RegisterOperation):
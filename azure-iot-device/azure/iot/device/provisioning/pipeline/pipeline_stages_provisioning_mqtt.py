@@ -29,6 +29,14 @@ class ProvisioningMQTTTranslationStage(PipelineStage):
     converts MQTT pipeline events into Provisioning pipeline events.
     """
 
+    handled_op_types = (
+        pipeline_ops_provisioning.SetProvisioningClientConnectionArgsOperation,
+        pipeline_ops_base.RequestOperation,
+        pipeline_ops_base.EnableFeatureOperation,
+        pipeline_ops_base.DisableFeatureOperation,
+    )
+    handled_event_types = (pipeline_events_mqtt.IncomingMQTTMessageEvent,)
+
     def __init__(self):
         super(ProvisioningMQTTTranslationStage, self).__init__()
         self.action_to_topic = {}
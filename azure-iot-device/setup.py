@@ -70,7 +70,6 @@ setup(
         "transitions>=0.6.8,<1.0.0",
         "requests>=2.20.0,<3.0.0",
         "requests-unixsocket>=0.1.5,<1.0.0",
-        "janus>=0.4.0,<1.0.0;python_version>='3.5'",
         "futures;python_version == '2.7'",
         "PySocks",
         "win-inet-pton;python_version == '2.7'",
@@ -6,6 +6,7 @@
 
 import pytest
 import sys
+from azure.iot.device.common import ssl_context_cache
 
 collect_ignore = []
 
@@ -18,3 +19,11 @@ if sys.version_info < (3, 5):
 @pytest.fixture
 def fake_return_arg_value():
     return "__fake_return_arg_value__"
+
+
+@pytest.fixture(autouse=True)
+def clear_ssl_context_cache():
+    # Transports share cached SSLContexts, which would otherwise leak mocks between tests
+    ssl_context_cache.clear()
+    yield
+    ssl_context_cache.clear()
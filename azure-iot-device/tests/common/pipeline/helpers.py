@@ -97,6 +97,7 @@ all_common_ops = [
     pipeline_ops_base.RequestOperation,
     pipeline_ops_mqtt.SetMQTTConnectionArgsOperation,
     pipeline_ops_mqtt.MQTTPublishOperation,
+    pipeline_ops_mqtt.MQTTPublishBatchOperation,
     pipeline_ops_mqtt.MQTTSubscribeOperation,
     pipeline_ops_mqtt.MQTTUnsubscribeOperation,
 ]
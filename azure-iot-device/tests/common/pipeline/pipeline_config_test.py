@@ -4,6 +4,7 @@
 # license information.
 # --------------------------------------------------------------------------
 import pytest
+from azure.iot.device.common import serializers
 
 
 class PipelineConfigInstantiationTestBase(object):
@@ -90,3 +91,91 @@ class PipelineConfigInstantiationTestBase(object):
     def test_invalid_cipher_param(self, config_cls, cipher):
         with pytest.raises(TypeError):
             config_cls(cipher=cipher)
+
+    @pytest.mark.it(
+        "Instantiates with the 'max_in_flight_publishes' and 'max_queued_publish_bytes' attributes set to the provided parameters"
+    )
+    def test_publish_limits_set(self, config_cls):
+        config = config_cls(max_in_flight_publishes=10, max_queued_publish_bytes=1024)
+        assert config.max_in_flight_publishes == 10
+        assert config.max_queued_publish_bytes == 1024
+
+    @pytest.mark.it(
+        "Instantiates with the 'max_in_flight_publishes' and 'max_queued_publish_bytes' attributes defaulting to None (no limit)"
+    )
+    def test_publish_limits_default(self, config_cls):
+        config = config_cls()
+        assert config.max_in_flight_publishes is None
+        assert config.max_queued_publish_bytes is None
+
+    @pytest.mark.it(
+        "Instantiates with the 'shared_network_loop' attribute set to the provided parameter"
+    )
+    def test_shared_network_loop_set(self, config_cls):
+        config = config_cls(shared_network_loop=True)
+        assert config.shared_network_loop is True
+
+    @pytest.mark.it("Instantiates with the 'shared_network_loop' attribute defaulting to False")
+    def test_shared_network_loop_default(self, config_cls):
+        config = config_cls()
+        assert config.shared_network_loop is False
+
+    @pytest.mark.it(
+        "Instantiates with the 'json_serializer' attribute set to the serializer with the provided name"
+    )
+    def test_json_serializer_set(self, config_cls):
+        config = config_cls(json_serializer="json")
+        assert config.json_serializer is serializers.get_serializer("json")
+
+    @pytest.mark.it(
+        "Instantiates with the 'json_serializer' attribute set to the fastest installed JSON serializer if 'auto' is provided"
+    )
+    def test_json_serializer_auto(self, config_cls):
+        config = config_cls(json_serializer="auto")
+        assert config.json_serializer is serializers.get_serializer("auto")
+        assert config.json_serializer.is_json
+
+    @pytest.mark.it(
+        "Instantiates with the 'json_serializer' attribute defaulting to the standard library serializer"
+    )
+    def test_json_serializer_default(self, config_cls):
+        config = config_cls()
+        assert config.json_serializer.name == "json"
+
+    @pytest.mark.it(
+        "Raises ValueError if the provided 'json_serializer' is unknown or is not a JSON serializer"
+    )
+    @pytest.mark.parametrize("name", ["yaml", None])
+    def test_json_serializer_invalid(self, config_cls, name):
+        with pytest.raises(ValueError):
+            config_cls(json_serializer=name)
+
+    @pytest.mark.it("Raises ValueError if the provided 'json_serializer' does not produce JSON")
+    def test_json_serializer_not_json(self, mocker, config_cls):
+        mocker.patch.dict(serializers._serializers)
+        serializers.register_serializer(
+            serializers.Serializer("binary", "application/octet-stream", bytes, bytes)
+        )
+        with pytest.raises(ValueError):
+            config_cls(json_serializer="binary")
+
+    @pytest.mark.it("Raises TypeError if a provided publish limit is neither an integer nor None")
+    @pytest.mark.parametrize("kwarg", ["max_in_flight_publishes", "max_queued_publish_bytes"])
+    @pytest.mark.parametrize(
+        "limit",
+        [
+            pytest.param("10", id="str"),
+            pytest.param(1.5, id="float"),
+            pytest.param(True, id="bool"),
+        ],
+    )
+    def test_invalid_publish_limit_type(self, config_cls, kwarg, limit):
+        with pytest.raises(TypeError):
+            config_cls(**{kwarg: limit})
+
+    @pytest.mark.it("Raises ValueError if a provided publish limit is less than 1")
+    @pytest.mark.parametrize("kwarg", ["max_in_flight_publishes", "max_queued_publish_bytes"])
+    @pytest.mark.parametrize("limit", [pytest.param(0, id="0"), pytest.param(-1, id="negative")])
+    def test_invalid_publish_limit_value(self, config_cls, kwarg, limit):
+        with pytest.raises(ValueError):
+            config_cls(**{kwarg: limit})
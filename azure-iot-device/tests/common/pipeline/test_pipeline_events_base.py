@@ -27,3 +27,10 @@ pipeline_event_test.add_event_test(
     positional_arguments=["request_id", "status_code", "response_body"],
     keyword_arguments={},
 )
+
+pipeline_event_test.add_event_test(
+    cls=pipeline_events_base.BackpressureChangedEvent,
+    module=this_module,
+    positional_arguments=["backpressure"],
+    keyword_arguments={},
+)
@@ -150,6 +150,32 @@ pipeline_ops_test.add_operation_tests(
 )
 
 
+class RefreshConnectionArgsOperationTestConfig(object):
+    @pytest.fixture
+    def cls_type(self):
+        return pipeline_ops_base.RefreshConnectionArgsOperation
+
+    @pytest.fixture
+    def init_kwargs(self, mocker):
+        kwargs = {"callback": mocker.MagicMock()}
+        return kwargs
+
+
+class RefreshConnectionArgsOperationInstantiationTests(RefreshConnectionArgsOperationTestConfig):
+    @pytest.mark.it("Initializes 'refreshed' attribute as False")
+    def test_refreshed(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.refreshed is False
+
+
+pipeline_ops_test.add_operation_tests(
+    test_module=this_module,
+    op_class_under_test=pipeline_ops_base.RefreshConnectionArgsOperation,
+    op_test_config_class=RefreshConnectionArgsOperationTestConfig,
+    extended_op_instantiation_test_class=RefreshConnectionArgsOperationInstantiationTests,
+)
+
+
 class RequestAndResponseOperationTestConfig(object):
     @pytest.fixture
     def cls_type(self):
@@ -121,6 +121,30 @@ class MQTTPublishOperationInstantiationTests(MQTTPublishOperationTestConfig):
         op = cls_type(**init_kwargs)
         assert op.payload == init_kwargs["payload"]
 
+    @pytest.mark.it("Initializes 'qos' attribute with the provided 'qos' parameter")
+    def test_qos(self, cls_type, init_kwargs):
+        init_kwargs["qos"] = 0
+        op = cls_type(**init_kwargs)
+        assert op.qos == 0
+
+    @pytest.mark.it("Initializes 'qos' attribute as 1 if no 'qos' parameter is provided")
+    def test_qos_default(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.qos == 1
+
+    @pytest.mark.it("Initializes 'storable' attribute with the provided 'storable' parameter")
+    def test_storable(self, cls_type, init_kwargs):
+        init_kwargs["storable"] = True
+        op = cls_type(**init_kwargs)
+        assert op.storable is True
+
+    @pytest.mark.it(
+        "Initializes 'storable' attribute as False if no 'storable' parameter is provided"
+    )
+    def test_storable_default(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.storable is False
+
     @pytest.mark.it("Initializes 'needs_connection' attribute as True")
     def test_needs_connection(self, cls_type, init_kwargs):
         op = cls_type(**init_kwargs)
@@ -135,6 +159,74 @@ pipeline_ops_test.add_operation_tests(
 )
 
 
+class MQTTPublishBatchOperationTestConfig(object):
+    @pytest.fixture
+    def cls_type(self):
+        return pipeline_ops_mqtt.MQTTPublishBatchOperation
+
+    @pytest.fixture
+    def init_kwargs(self, mocker):
+        kwargs = {
+            "publishes": [("some_topic", "some_payload"), ("other_topic", "other_payload")],
+            "callback": mocker.MagicMock(),
+        }
+        return kwargs
+
+
+class MQTTPublishBatchOperationInstantiationTests(MQTTPublishBatchOperationTestConfig):
+    @pytest.mark.it("Initializes 'publishes' attribute with the provided 'publishes' parameter")
+    def test_publishes(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.publishes is init_kwargs["publishes"]
+
+    @pytest.mark.it("Initializes 'qos' attribute with the provided 'qos' parameter")
+    def test_qos(self, cls_type, init_kwargs):
+        init_kwargs["qos"] = 0
+        op = cls_type(**init_kwargs)
+        assert op.qos == 0
+
+    @pytest.mark.it("Initializes 'qos' attribute as 1 if no 'qos' parameter is provided")
+    def test_qos_default(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.qos == 1
+
+    @pytest.mark.it("Initializes 'storable' attribute with the provided 'storable' parameter")
+    def test_storable(self, cls_type, init_kwargs):
+        init_kwargs["storable"] = True
+        op = cls_type(**init_kwargs)
+        assert op.storable is True
+
+    @pytest.mark.it(
+        "Initializes 'storable' attribute as False if no 'storable' parameter is provided"
+    )
+    def test_storable_default(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.storable is False
+
+    @pytest.mark.it("Initializes 'results' attribute as None")
+    def test_results(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.results is None
+
+    @pytest.mark.it("Initializes 'needs_connection' attribute as True")
+    def test_needs_connection(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.needs_connection is True
+
+    @pytest.mark.it("Initializes 'retry_timer' attribute as None")
+    def test_retry_timer(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.retry_timer is None
+
+
+pipeline_ops_test.add_operation_tests(
+    test_module=this_module,
+    op_class_under_test=pipeline_ops_mqtt.MQTTPublishBatchOperation,
+    op_test_config_class=MQTTPublishBatchOperationTestConfig,
+    extended_op_instantiation_test_class=MQTTPublishBatchOperationInstantiationTests,
+)
+
+
 class MQTTSubscribeOperationTestConfig(object):
     @pytest.fixture
     def cls_type(self):
@@ -9,11 +9,10 @@ import time
 import pytest
 import sys
 import six
-import threading
 import random
 import uuid
 from six.moves import queue
-from azure.iot.device.common import transport_exceptions, handle_exceptions
+from azure.iot.device.common import transport_exceptions, handle_exceptions, timer_wheel, outbox
 from azure.iot.device.common.pipeline import (
     pipeline_stages_base,
     pipeline_ops_base,
@@ -35,7 +34,7 @@ pytestmark = pytest.mark.usefixtures("fake_pipeline_thread")
 ###################
 @pytest.fixture
 def mock_timer(mocker):
-    return mocker.patch.object(threading, "Timer")
+    return mocker.patch.object(timer_wheel, "Timer")
 
 
 # Not a fixture, but useful for sharing
@@ -132,6 +131,140 @@ class TestPipelineRootStageAppendStage(PipelineRootStageTestConfig):
             prev_tail = new_stage
 
 
+class OtherArbitraryOperation(ArbitraryOperation):
+    pass
+
+
+class RoutingTestStage(pipeline_stages_base.PipelineStage):
+    def __init__(self, handled_op_types=None, handled_event_types=None):
+        super(RoutingTestStage, self).__init__()
+        self.handled_op_types = handled_op_types
+        self.handled_event_types = handled_event_types
+        self.ops = []
+        self.events = []
+
+    def _run_op(self, op):
+        self.ops.append(op)
+        self.send_op_down(op)
+
+    def _handle_pipeline_event(self, event):
+        self.events.append(event)
+        self.send_event_up(event)
+
+
+@pytest.mark.describe("PipelineStage - routing of operations and events between stages")
+class TestPipelineStageRouting(PipelineRootStageTestConfig):
+    @pytest.fixture
+    def stage(self, mocker, cls_type, init_kwargs):
+        stage = cls_type(**init_kwargs)
+        mocker.spy(stage, "_handle_pipeline_event")
+        return stage
+
+    @pytest.fixture
+    def tail(self, mocker):
+        tail = RoutingTestStage(handled_op_types=(), handled_event_types=())
+        tail._run_op = mocker.MagicMock()
+        return tail
+
+    @pytest.mark.it(
+        "Passes operations directly to the next stage that handles their type, skipping stages that do not"
+    )
+    def test_op_skips_stages(self, stage, tail, arbitrary_op):
+        first = RoutingTestStage(handled_op_types=(ArbitraryOperation,))
+        skipped = RoutingTestStage(handled_op_types=(pipeline_ops_base.ConnectOperation,))
+        last = RoutingTestStage(handled_op_types=(ArbitraryOperation,))
+        stage.append_stage(first).append_stage(skipped).append_stage(last).append_stage(tail)
+
+        first.send_op_down(arbitrary_op)
+        assert skipped.ops == []
+        assert last.ops == [arbitrary_op]
+        assert tail._run_op.call_count == 1
+
+    @pytest.mark.it("Passes operations to stages that handle a base class of the operation type")
+    def test_op_subclass(self, stage, tail, mocker):
+        first = RoutingTestStage()
+        handler = RoutingTestStage(handled_op_types=(ArbitraryOperation,))
+        stage.append_stage(first).append_stage(handler).append_stage(tail)
+
+        op = OtherArbitraryOperation(callback=mocker.MagicMock())
+        first.send_op_down(op)
+        assert handler.ops == [op]
+
+    @pytest.mark.it("Passes every operation to stages that do not declare the types they handle")
+    def test_op_stage_handles_all(self, stage, tail, arbitrary_op):
+        first = RoutingTestStage()
+        handler = RoutingTestStage(handled_op_types=None)
+        stage.append_stage(first).append_stage(handler).append_stage(tail)
+
+        first.send_op_down(arbitrary_op)
+        assert handler.ops == [arbitrary_op]
+
+    @pytest.mark.it(
+        "Passes operations to the last stage in the pipeline if no other stage handles their type"
+    )
+    def test_op_to_tail(self, stage, tail, arbitrary_op):
+        first = RoutingTestStage()
+        skipped = RoutingTestStage(handled_op_types=())
+        stage.append_stage(first).append_stage(skipped).append_stage(tail)
+
+        first.send_op_down(arbitrary_op)
+        assert skipped.ops == []
+        assert tail._run_op.call_count == 1
+        assert tail._run_op.call_args[0][0] is arbitrary_op
+
+    @pytest.mark.it(
+        "Passes events directly to the previous stage that handles their type, skipping stages that do not"
+    )
+    def test_event_skips_stages(self, stage, tail, arbitrary_event):
+        handler = RoutingTestStage(handled_event_types=(type(arbitrary_event),))
+        skipped = RoutingTestStage(handled_event_types=(pipeline_events_base.ConnectedEvent,))
+        stage.append_stage(handler).append_stage(skipped).append_stage(tail)
+
+        tail.send_event_up(arbitrary_event)
+        assert skipped.events == []
+        assert handler.events == [arbitrary_event]
+        assert stage._handle_pipeline_event.call_count == 1
+
+    @pytest.mark.it(
+        "Passes events to the root of the pipeline if no other stage handles their type"
+    )
+    def test_event_to_root(self, stage, tail, arbitrary_event):
+        skipped = RoutingTestStage(handled_event_types=())
+        stage.append_stage(skipped).append_stage(tail)
+
+        tail.send_event_up(arbitrary_event)
+        assert skipped.events == []
+        assert stage._handle_pipeline_event.call_count == 1
+        assert stage._handle_pipeline_event.call_args[0][0] is arbitrary_event
+
+    @pytest.mark.it("Recalculates the routes when a stage is appended to the pipeline")
+    def test_append_stage(self, stage, tail, mocker):
+        first = RoutingTestStage()
+        skipped = RoutingTestStage(handled_op_types=())
+        stage.append_stage(first).append_stage(skipped)
+
+        op1 = ArbitraryOperation(callback=mocker.MagicMock())
+        first.send_op_down(op1)
+        assert skipped.ops == [op1]
+
+        stage.append_stage(tail)
+        op2 = ArbitraryOperation(callback=mocker.MagicMock())
+        first.send_op_down(op2)
+        assert skipped.ops == [op1]
+        assert tail._run_op.call_args[0][0] is op2
+
+    @pytest.mark.it("Recalculates the routes when the next stage is replaced")
+    def test_next_replaced(self, stage, tail, arbitrary_op, mocker):
+        first = RoutingTestStage()
+        stage.append_stage(first).append_stage(tail)
+        first.send_op_down(ArbitraryOperation(callback=mocker.MagicMock()))
+
+        first.next = mocker.MagicMock()
+        first.send_op_down(arbitrary_op)
+        assert first.next.run_op.call_count == 1
+        assert first.next.run_op.call_args == mocker.call(arbitrary_op)
+
+
 # NOTE 1: Because the Root stage overrides the parent implementation, we must test it here
 # (even though it's the same test).
 # NOTE 2: Currently this implementation does some other things with threads, but we do not
@@ -219,6 +352,331 @@ class TestPipelineRootStageHandlePipelineEventWithArbitraryEvent(
         assert mock_handler.call_args == mocker.call(event)
 
 
+###########################
+# STORE AND FORWARD STAGE #
+###########################
+
+
+class StoreAndForwardStageTestConfig(object):
+    @pytest.fixture
+    def cls_type(self):
+        return pipeline_stages_base.StoreAndForwardStage
+
+    @pytest.fixture
+    def init_kwargs(self, mocker):
+        return {}
+
+    @pytest.fixture
+    def outbox_directory(self, tmpdir):
+        return str(tmpdir.join("outbox"))
+
+    @pytest.fixture
+    def pipeline_configuration(self, mocker, outbox_directory):
+        config = mocker.MagicMock()
+        config.outbox_directory = outbox_directory
+        config.outbox_max_bytes = None
+        config.outbox_eviction_policy = outbox.DROP_OLDEST
+        config.outbox_replay_concurrency = 2
+        return config
+
+    @pytest.fixture
+    def stage(self, mocker, cls_type, init_kwargs, pipeline_configuration):
+        stage = cls_type(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
+            pipeline_configuration=pipeline_configuration
+        )
+        # Mock flow methods
+        stage.send_op_down = mocker.MagicMock()
+        stage.send_event_up = mocker.MagicMock()
+        return stage
+
+
+class StoreAndForwardStageInstantiationTests(StoreAndForwardStageTestConfig):
+    @pytest.mark.it("Initializes 'outbox' attribute as None")
+    def test_outbox(self, init_kwargs):
+        stage = pipeline_stages_base.StoreAndForwardStage(**init_kwargs)
+        assert stage.outbox is None
+
+
+pipeline_stage_test.add_base_pipeline_stage_tests(
+    test_module=this_module,
+    stage_class_under_test=pipeline_stages_base.StoreAndForwardStage,
+    stage_test_config_class=StoreAndForwardStageTestConfig,
+    extended_stage_instantiation_test_class=StoreAndForwardStageInstantiationTests,
+)
+
+
+def make_publish_op(mocker, payload, topic="__fake_topic__", storable=True):
+    return pipeline_ops_mqtt.MQTTPublishOperation(
+        topic=topic, payload=payload, callback=mocker.MagicMock(), storable=storable
+    )
+
+
+def sent_payloads(stage):
+    return [call[0][0].payload for call in stage.send_op_down.call_args_list]
+
+
+@pytest.mark.describe(
+    "StoreAndForwardStage - .run_op() -- Called with a publish while no outbox directory is configured"
+)
+class TestStoreAndForwardStageRunOpWithoutOutbox(
+    StoreAndForwardStageTestConfig, StageRunOpTestBase
+):
+    @pytest.fixture
+    def outbox_directory(self):
+        return None
+
+    @pytest.fixture
+    def op(self, mocker):
+        return make_publish_op(mocker, b"payload")
+
+    @pytest.mark.it("Sends the operation down the pipeline")
+    @pytest.mark.parametrize("connected", [True, False], ids=["Connected", "Disconnected"])
+    def test_sends_down(self, mocker, stage, op, connected):
+        stage.pipeline_root.connected = connected
+        stage.run_op(op)
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+        assert stage.outbox is None
+
+
+@pytest.mark.describe(
+    "StoreAndForwardStage - .run_op() -- Called with a publish while an outbox directory is configured"
+)
+class TestStoreAndForwardStageRunOpWithOutbox(StoreAndForwardStageTestConfig, StageRunOpTestBase):
+    @pytest.fixture
+    def op(self, mocker):
+        return make_publish_op(mocker, b"payload")
+
+    @pytest.mark.it(
+        "Sends the operation down the pipeline if the pipeline is connected and the outbox is empty"
+    )
+    def test_connected_empty(self, mocker, stage, op):
+        stage.pipeline_root.connected = True
+        stage.run_op(op)
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+        assert stage.outbox.is_empty
+
+    @pytest.mark.it(
+        "Stores the publish in the outbox and completes the operation successfully if the pipeline is not connected"
+    )
+    def test_disconnected(self, mocker, stage, op):
+        assert not stage.pipeline_root.connected
+        stage.run_op(op)
+        assert op.completed
+        assert op.error is None
+        record = stage.outbox.read(stage.outbox.committed_position)
+        assert record.topic == op.topic
+        assert record.payload == op.payload
+
+    @pytest.mark.it(
+        "Sends a single stored publish down the pipeline, to trigger a connection, if the pipeline is not connected"
+    )
+    def test_disconnected_sends_one(self, mocker, stage):
+        for payload in [b"one", b"two", b"three"]:
+            stage.run_op(make_publish_op(mocker, payload))
+        assert sent_payloads(stage) == [b"one"]
+        assert isinstance(
+            stage.send_op_down.call_args[0][0], pipeline_ops_mqtt.MQTTPublishOperation
+        )
+
+    @pytest.mark.it("Sends QoS 0 publishes down the pipeline instead of storing them")
+    @pytest.mark.parametrize("connected", [True, False], ids=["Connected", "Disconnected"])
+    def test_qos_0(self, mocker, stage, op, connected):
+        stage.run_op(make_publish_op(mocker, b"stored"))
+        stage.send_op_down.reset_mock()
+        stage.pipeline_root.connected = connected
+        op.qos = 0
+        stage.run_op(op)
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+
+    @pytest.mark.it(
+        "Sends publishes which are not storable, such as method responses and twin requests, down the pipeline instead of storing them"
+    )
+    @pytest.mark.parametrize("connected", [True, False], ids=["Connected", "Disconnected"])
+    @pytest.mark.parametrize(
+        "topic",
+        [
+            pytest.param("$iothub/methods/res/200/?$rid=1", id="Method response"),
+            pytest.param("$iothub/twin/PATCH/properties/reported/?$rid=2", id="Twin PATCH"),
+        ],
+    )
+    def test_not_storable(self, mocker, stage, connected, topic):
+        stage.run_op(make_publish_op(mocker, b"stored"))
+        stage.send_op_down.reset_mock()
+        stage.pipeline_root.connected = connected
+        op = make_publish_op(mocker, b"response", topic=topic, storable=False)
+        stage.run_op(op)
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+        record = stage.outbox.read(stage.outbox.committed_position)
+        assert record.payload == b"stored"
+        assert stage.outbox.read(record.next_position) is None
+
+    @pytest.mark.it(
+        "Stores the publish behind the publishes already in the outbox if the pipeline is connected"
+    )
+    def test_connected_not_empty(self, mocker, stage, op):
+        stage.run_op(make_publish_op(mocker, b"stored"))
+        stage.pipeline_root.connected = True
+        stage.run_op(op)
+        assert op.completed
+        payloads = []
+        record = stage.outbox.read(stage.outbox.committed_position)
+        while record:
+            payloads.append(record.payload)
+            record = stage.outbox.read(record.next_position)
+        assert payloads == [b"stored", b"payload"]
+
+    @pytest.mark.it(
+        "Completes the operation with a PublishQueueFullError if the outbox is full and rejects new publishes"
+    )
+    def test_outbox_full(self, mocker, stage, op, pipeline_configuration):
+        pipeline_configuration.outbox_max_bytes = 100
+        pipeline_configuration.outbox_eviction_policy = outbox.REJECT_NEW
+        stage.run_op(make_publish_op(mocker, b"x" * 60))
+        stage.run_op(op)
+        assert op.completed
+        assert isinstance(op.error, pipeline_exceptions.PublishQueueFullError)
+
+
+@pytest.mark.describe(
+    "StoreAndForwardStage - .run_op() -- Called with a publish batch while an outbox directory is configured"
+)
+class TestStoreAndForwardStageRunOpWithBatchAndOutbox(
+    StoreAndForwardStageTestConfig, StageRunOpTestBase
+):
+    @pytest.fixture
+    def op(self, mocker):
+        return pipeline_ops_mqtt.MQTTPublishBatchOperation(
+            publishes=[("topic/1", b"one"), ("topic/2", b"two")],
+            callback=mocker.MagicMock(),
+            storable=True,
+        )
+
+    @pytest.mark.it(
+        "Stores every publish in the batch and completes the operation successfully if the pipeline is not connected"
+    )
+    def test_disconnected(self, mocker, stage, op):
+        stage.run_op(op)
+        assert op.completed
+        assert op.error is None
+        assert op.results == [None, None]
+        first = stage.outbox.read(stage.outbox.committed_position)
+        second = stage.outbox.read(first.next_position)
+        assert (first.topic, first.payload) == ("topic/1", b"one")
+        assert (second.topic, second.payload) == ("topic/2", b"two")
+
+    @pytest.mark.it(
+        "Records a PublishQueueFullError in the results for each publish that does not fit in the outbox"
+    )
+    def test_outbox_full(self, mocker, stage, op, pipeline_configuration):
+        pipeline_configuration.outbox_max_bytes = outbox.RECORD_HEADER.size + len("topic/1") + 3
+        pipeline_configuration.outbox_eviction_policy = outbox.REJECT_NEW
+        stage.run_op(op)
+        assert op.completed
+        assert op.results[0] is None
+        assert isinstance(op.results[1], pipeline_exceptions.PublishQueueFullError)
+
+
+@pytest.mark.describe("StoreAndForwardStage - Replaying stored publishes")
+class TestStoreAndForwardStageReplay(StoreAndForwardStageTestConfig):
+    @pytest.fixture
+    def stored_stage(self, mocker, stage):
+        for payload in [b"one", b"two", b"three", b"four"]:
+            stage.run_op(make_publish_op(mocker, payload))
+        # Fail the publish that was sent to trigger a connection
+        stage.send_op_down.call_args[0][0].complete(error=Exception())
+        stage.send_op_down.reset_mock()
+        return stage
+
+    def connect(self, stage):
+        # The root is marked as connected while the event is being sent up the pipeline,
+        # before StoreAndForwardStage starts replaying.
+        stage.pipeline_root.connected = True
+        stage.handle_pipeline_event(pipeline_events_base.ConnectedEvent())
+
+    @pytest.mark.it("Sends ConnectedEvents up the pipeline")
+    def test_sends_event_up(self, mocker, stage):
+        event = pipeline_events_base.ConnectedEvent()
+        stage.handle_pipeline_event(event)
+        assert stage.send_event_up.call_count == 1
+        assert stage.send_event_up.call_args == mocker.call(event)
+
+    @pytest.mark.it(
+        "Sends stored publishes down the pipeline in order, up to the replay concurrency, when the pipeline connects"
+    )
+    def test_replays_on_connect(self, mocker, stored_stage):
+        stored_stage.pipeline_root.connected = True
+        stored_stage.handle_pipeline_event(pipeline_events_base.ConnectedEvent())
+        assert sent_payloads(stored_stage) == [b"one", b"two"]
+
+    @pytest.mark.it("Sends the next stored publish down each time a replayed publish completes")
+    def test_replays_next(self, mocker, stored_stage):
+        self.connect(stored_stage)
+        stored_stage.send_op_down.call_args_list[0][0][0].complete()
+        assert sent_payloads(stored_stage) == [b"one", b"two", b"three"]
+        stored_stage.send_op_down.call_args_list[1][0][0].complete()
+        assert sent_payloads(stored_stage) == [b"one", b"two", b"three", b"four"]
+
+    @pytest.mark.it("Removes publishes from the outbox once they have been replayed successfully")
+    def test_empties_outbox(self, mocker, stored_stage):
+        self.connect(stored_stage)
+        for i in range(4):
+            stored_stage.send_op_down.call_args_list[i][0][0].complete()
+        assert stored_stage.outbox.is_empty
+
+        # New publishes go straight down the pipeline once the outbox is empty
+        op = make_publish_op(mocker, b"five")
+        stored_stage.run_op(op)
+        assert stored_stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+
+    @pytest.mark.it(
+        "Stops replaying when a replayed publish fails, and starts again from the oldest publish that was not sent when the pipeline connects again"
+    )
+    def test_replay_failure(self, mocker, stored_stage):
+        self.connect(stored_stage)
+        first, second = [call[0][0] for call in stored_stage.send_op_down.call_args_list]
+        first.complete()
+        third = stored_stage.send_op_down.call_args[0][0]
+        second.complete(error=Exception())
+        third.complete()
+        assert sent_payloads(stored_stage) == [b"one", b"two", b"three"]
+
+        stored_stage.send_op_down.reset_mock()
+        self.connect(stored_stage)
+        assert sent_payloads(stored_stage) == [b"two", b"three"]
+
+    @pytest.mark.it(
+        "Starts replaying again once failed publishes are done, if the pipeline connected again while they were outstanding"
+    )
+    def test_connect_while_failing(self, mocker, stored_stage):
+        self.connect(stored_stage)
+        first, second = [call[0][0] for call in stored_stage.send_op_down.call_args_list]
+        first.complete(error=Exception())
+        self.connect(stored_stage)
+        assert sent_payloads(stored_stage) == [b"one", b"two"]
+
+        second.complete(error=Exception())
+        assert sent_payloads(stored_stage) == [b"one", b"two", b"one", b"two"]
+
+    @pytest.mark.it("Replays publishes that were stored by an earlier pipeline")
+    def test_replays_from_earlier_pipeline(self, mocker, stored_stage, cls_type, init_kwargs):
+        new_stage = cls_type(**init_kwargs)
+        new_stage.pipeline_root = stored_stage.pipeline_root
+        new_stage.send_op_down = mocker.MagicMock()
+        new_stage.send_event_up = mocker.MagicMock()
+        self.connect(new_stage)
+        assert sent_payloads(new_stage) == [b"one", b"two"]
+
+
 ######################
 # AUTO CONNECT STAGE #
 ######################
@@ -403,7 +861,7 @@ class ConnectionLockStageTestConfig(object):
     def stage(self, mocker, cls_type, init_kwargs):
         stage = cls_type(**init_kwargs)
         stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
-            pipeline_configuration=mocker.MagicMock()
+            pipeline_configuration=mocker.MagicMock(make_before_break_reauthorization=False)
         )
         stage.send_op_down = mocker.MagicMock()
         return stage
@@ -599,7 +1057,7 @@ class TestConnectionLockStageRunOpWhileBlocked(ConnectionLockStageTestConfig, St
     def stage(self, mocker, init_kwargs, blocking_op):
         stage = pipeline_stages_base.ConnectionLockStage(**init_kwargs)
         stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
-            pipeline_configuration=mocker.MagicMock()
+            pipeline_configuration=mocker.MagicMock(make_before_break_reauthorization=False)
         )
         stage.send_op_down = mocker.MagicMock()
         mocker.spy(stage, "run_op")
@@ -692,6 +1150,80 @@ class TestConnectionLockStageRunOpWhileBlocked(ConnectionLockStageTestConfig, St
         assert not op4.completed
 
 
+@pytest.mark.describe(
+    "ConnectionLockStage - .run_op() -- Called while blocked by a ReauthorizeConnectionOperation with make-before-break reauthorization"
+)
+class TestConnectionLockStageRunOpWhileBlockedForMakeBeforeBreak(
+    ConnectionLockStageTestConfig, StageRunOpTestBase
+):
+    @pytest.fixture
+    def blocking_op(self, mocker):
+        return pipeline_ops_base.ReauthorizeConnectionOperation(callback=mocker.MagicMock())
+
+    @pytest.fixture
+    def stage(self, mocker, init_kwargs, blocking_op):
+        stage = pipeline_stages_base.ConnectionLockStage(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
+            pipeline_configuration=mocker.MagicMock(make_before_break_reauthorization=True)
+        )
+        stage.pipeline_root.connected = True
+        stage.send_op_down = mocker.MagicMock()
+
+        stage.run_op(blocking_op)
+        assert stage.blocked
+        assert stage.blocked_for_make_before_break
+
+        stage.send_op_down.reset_mock()
+        return stage
+
+    @pytest.fixture
+    def op(self, arbitrary_op):
+        return arbitrary_op
+
+    @pytest.mark.it("Sends the operation down the pipeline, if it is not a connection operation")
+    def test_sends_down(self, mocker, stage, op):
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert stage.queue.empty()
+
+    @pytest.mark.it("Adds the operation to the queue, if it is a connection operation")
+    @pytest.mark.parametrize("op_cls", connection_ops)
+    def test_queues_connection_ops(self, mocker, stage, op_cls):
+        op = op_cls(callback=mocker.MagicMock())
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 0
+        assert stage.queue.get(block=False) is op
+
+    @pytest.mark.it("Queues all operations again once the blocking operation is completed")
+    def test_resets_after_completion(self, mocker, stage, blocking_op):
+        blocking_op.complete()
+        assert not stage.blocked_for_make_before_break
+
+        stage.pipeline_root.connected = False
+        stage.run_op(pipeline_ops_base.ConnectOperation(callback=mocker.MagicMock()))
+        op = ArbitraryOperation(callback=mocker.MagicMock())
+        stage.run_op(op)
+        assert stage.queue.get(block=False) is op
+
+    @pytest.mark.it(
+        "Does not send operations down while blocked by a ReauthorizeConnectionOperation, if make-before-break reauthorization is not configured"
+    )
+    def test_not_configured(self, mocker, init_kwargs, blocking_op, op):
+        stage = pipeline_stages_base.ConnectionLockStage(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
+            pipeline_configuration=mocker.MagicMock(make_before_break_reauthorization=False)
+        )
+        stage.send_op_down = mocker.MagicMock()
+        stage.run_op(blocking_op)
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 1
+        assert stage.queue.get(block=False) is op
+
+
 class ConnectionLockStageBlockingOpCompletedTestConfig(ConnectionLockStageTestConfig):
     @pytest.fixture(params=connection_ops)
     def blocking_op(self, mocker, request):
@@ -710,7 +1242,7 @@ class ConnectionLockStageBlockingOpCompletedTestConfig(ConnectionLockStageTestCo
     def blocked_stage(self, mocker, init_kwargs, blocking_op, pending_ops):
         stage = pipeline_stages_base.ConnectionLockStage(**init_kwargs)
         stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
-            pipeline_configuration=mocker.MagicMock()
+            pipeline_configuration=mocker.MagicMock(make_before_break_reauthorization=False)
         )
         stage.send_op_down = mocker.MagicMock()
         mocker.spy(stage, "run_op")
@@ -1365,6 +1897,10 @@ retryable_ops = [
         pipeline_ops_mqtt.MQTTPublishOperation,
         {"topic": "fake_topic", "payload": "fake_payload", "callback": fake_callback},
     ),
+    (
+        pipeline_ops_mqtt.MQTTPublishBatchOperation,
+        {"publishes": [("fake_topic", "fake_payload")], "callback": fake_callback},
+    ),
 ]
 
 retryable_exceptions = [pipeline_exceptions.PipelineTimeoutError]
@@ -1394,13 +1930,14 @@ class RetryStageTestConfig(object):
 class RetryStageInstantiationTests(RetryStageTestConfig):
     # TODO: this will no longer be necessary once these are implemented as part of a more robust retry policy
     @pytest.mark.it(
-        "Sets default retry intervals to 20 seconds for MQTTSubscribeOperation, MQTTUnsubscribeOperation, and MQTTPublishOperation"
+        "Sets default retry intervals to 20 seconds for MQTTSubscribeOperation, MQTTUnsubscribeOperation, MQTTPublishOperation, and MQTTPublishBatchOperation"
     )
     def test_retry_intervals(self, init_kwargs):
         stage = pipeline_stages_base.RetryStage(**init_kwargs)
         assert stage.retry_intervals[pipeline_ops_mqtt.MQTTSubscribeOperation] == 20
         assert stage.retry_intervals[pipeline_ops_mqtt.MQTTUnsubscribeOperation] == 20
         assert stage.retry_intervals[pipeline_ops_mqtt.MQTTPublishOperation] == 20
+        assert stage.retry_intervals[pipeline_ops_mqtt.MQTTPublishBatchOperation] == 20
 
     @pytest.mark.it("Initializes 'ops_waiting_to_retry' as an empty list")
     def test_ops_waiting_to_retry(self, init_kwargs):
@@ -1673,7 +2210,7 @@ class TestRetryStageRetryableOperationCompletedWithNonRetryableError(RetryStageT
         stage.run_op(op)
 
         # Artificially add a timer. Note that this is already mocked due to the 'mock_timer' fixture
-        op.retry_timer = threading.Timer(20, fake_callback)
+        op.retry_timer = timer_wheel.Timer(20, fake_callback)
         assert op.retry_timer is mock_timer.return_value
 
         op.complete(error=error)
@@ -1709,7 +2246,7 @@ class TestRetryStageRetryableOperationCompletedSuccessfully(RetryStageTestConfig
         stage.run_op(op)
 
         # Artificially add a timer. Note that this is already mocked due to the 'mock_timer' fixture
-        op.retry_timer = threading.Timer(20, fake_callback)
+        op.retry_timer = timer_wheel.Timer(20, fake_callback)
         assert op.retry_timer is mock_timer.return_value
 
         op.complete()
@@ -2789,3 +3326,139 @@ class TestReconnectStageConnectOperationForReconnectIsCompleted(ReconnectStageTe
         connect_op.complete(error=transient_connect_exception)
         assert mock_timer.call_count == 1
         assert mock_timer.return_value.start.call_count == 1
+
+
+#################################
+# REFRESH CONNECTION ARGS STAGE #
+#################################
+
+
+class RefreshConnectionArgsStageTestConfig(object):
+    @pytest.fixture
+    def cls_type(self):
+        return pipeline_stages_base.RefreshConnectionArgsStage
+
+    @pytest.fixture
+    def init_kwargs(self):
+        return {}
+
+    @pytest.fixture
+    def stage(self, mocker, cls_type, init_kwargs):
+        stage = cls_type(**init_kwargs)
+        stage.pipeline_root = mocker.MagicMock()
+        stage.send_op_down = mocker.MagicMock()
+        return stage
+
+
+pipeline_stage_test.add_base_pipeline_stage_tests(
+    test_module=this_module,
+    stage_class_under_test=pipeline_stages_base.RefreshConnectionArgsStage,
+    stage_test_config_class=RefreshConnectionArgsStageTestConfig,
+)
+
+
+@pytest.mark.describe("RefreshConnectionArgsStage - .run_op() -- Called with ConnectOperation")
+class TestRefreshConnectionArgsStageRunOpWithConnectOperation(
+    RefreshConnectionArgsStageTestConfig, StageRunOpTestBase
+):
+    @pytest.fixture
+    def op(self, mocker):
+        return pipeline_ops_base.ConnectOperation(callback=mocker.MagicMock())
+
+    @pytest.fixture(
+        params=[
+            transport_exceptions.TlsExchangeAuthError(),
+            transport_exceptions.ConnectionFailedError(),
+        ],
+        ids=["TlsExchangeAuthError", "ConnectionFailedError"],
+    )
+    def connect_error(self, request):
+        return request.param
+
+    @pytest.mark.it("Sends the operation down the pipeline")
+    def test_sends_down(self, mocker, stage, op):
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+
+    @pytest.mark.it(
+        "Completes the operation without refreshing the connection args, if the connection succeeds or fails for another reason"
+    )
+    @pytest.mark.parametrize(
+        "error",
+        [None, pipeline_exceptions.OperationCancelled(), transport_exceptions.UnauthorizedError()],
+        ids=["No error", "OperationCancelled", "UnauthorizedError"],
+    )
+    def test_other_completion(self, stage, op, error):
+        stage.run_op(op)
+        op.complete(error=error)
+
+        assert op.completed
+        assert op.error is error
+        assert stage.pipeline_root.send_op_down.call_count == 0
+
+    @pytest.mark.it(
+        "Sends a RefreshConnectionArgsOperation down from the root of the pipeline, if the connection fails"
+    )
+    def test_refreshes(self, stage, op, connect_error):
+        stage.run_op(op)
+        op.complete(error=connect_error)
+
+        assert not op.completed
+        assert stage.pipeline_root.send_op_down.call_count == 1
+        refresh_op = stage.pipeline_root.send_op_down.call_args[0][0]
+        assert isinstance(refresh_op, pipeline_ops_base.RefreshConnectionArgsOperation)
+
+    @pytest.mark.it(
+        "Sends the operation down the pipeline again, if the RefreshConnectionArgsOperation refreshes the connection args"
+    )
+    def test_retries(self, mocker, stage, op, connect_error):
+        stage.run_op(op)
+        op.complete(error=connect_error)
+        refresh_op = stage.pipeline_root.send_op_down.call_args[0][0]
+        refresh_op.refreshed = True
+        refresh_op.complete()
+
+        assert stage.send_op_down.call_count == 2
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert not op.completed
+
+    @pytest.mark.it("Does not refresh the connection args again if the retried connection fails")
+    def test_retries_once(self, stage, op, connect_error):
+        stage.run_op(op)
+        op.complete(error=connect_error)
+        refresh_op = stage.pipeline_root.send_op_down.call_args[0][0]
+        refresh_op.refreshed = True
+        refresh_op.complete()
+
+        op.complete(error=connect_error)
+
+        assert op.completed
+        assert op.error is connect_error
+        assert stage.pipeline_root.send_op_down.call_count == 1
+
+    @pytest.mark.it(
+        "Completes the operation with the connection error, if the RefreshConnectionArgsOperation does not refresh the connection args"
+    )
+    def test_not_refreshed(self, stage, op, connect_error):
+        stage.run_op(op)
+        op.complete(error=connect_error)
+        stage.pipeline_root.send_op_down.call_args[0][0].complete()
+
+        assert op.completed
+        assert op.error is connect_error
+        assert stage.send_op_down.call_count == 1
+
+    @pytest.mark.it(
+        "Completes the operation with the connection error, if the RefreshConnectionArgsOperation fails"
+    )
+    def test_refresh_fails(self, stage, op, connect_error, arbitrary_exception):
+        stage.run_op(op)
+        op.complete(error=connect_error)
+        stage.pipeline_root.send_op_down.call_args[0][0].complete(error=arbitrary_exception)
+
+        assert op.completed
+        assert op.error is connect_error
+        assert stage.send_op_down.call_count == 1
@@ -16,6 +16,7 @@ from azure.iot.device.common.pipeline import (
     pipeline_events_mqtt,
     pipeline_stages_mqtt,
     pipeline_exceptions,
+    pipeline_thread,
     config,
 )
 from tests.common.pipeline.helpers import StageRunOpTestBase
@@ -60,7 +61,7 @@ class MQTTTransportStageTestConfig(object):
     def stage(self, mocker, cls_type, init_kwargs):
         stage = cls_type(**init_kwargs)
         stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
-            pipeline_configuration=mocker.MagicMock()
+            pipeline_configuration=config.BasePipelineConfig()
         )
         stage.send_op_down = mocker.MagicMock()
         stage.send_event_up = mocker.MagicMock()
@@ -166,9 +167,37 @@ class TestMQTTTransportStageRunOpCalledWithSetMQTTConnectionArgsOperation(
             websockets=websockets,
             cipher=cipher,
             proxy_options=proxy_options,
+            shared_network_loop=stage.pipeline_root.pipeline_configuration.shared_network_loop,
+            make_before_break=(
+                stage.pipeline_root.pipeline_configuration.make_before_break_reauthorization
+            ),
         )
         assert stage.transport is mock_transport.return_value
 
+    @pytest.mark.it(
+        "Creates the MQTTTransport using a shared network loop if the pipeline is configured to"
+    )
+    @pytest.mark.parametrize("shared_network_loop", [True, False])
+    def test_creates_transport_shared_network_loop(
+        self, stage, op, mock_transport, shared_network_loop
+    ):
+        stage.pipeline_root.pipeline_configuration.shared_network_loop = shared_network_loop
+        stage.run_op(op)
+        assert mock_transport.call_args[1]["shared_network_loop"] is shared_network_loop
+
+    @pytest.mark.it(
+        "Creates the MQTTTransport with make-before-break reauthorization if the pipeline is configured to"
+    )
+    @pytest.mark.parametrize("make_before_break", [True, False])
+    def test_creates_transport_make_before_break(
+        self, stage, op, mock_transport, make_before_break
+    ):
+        stage.pipeline_root.pipeline_configuration.make_before_break_reauthorization = (
+            make_before_break
+        )
+        stage.run_op(op)
+        assert mock_transport.call_args[1]["make_before_break"] is make_before_break
+
     @pytest.mark.it("Sets event handlers on the newly created MQTTTransport")
     def test_sets_transport_handlers(self, mocker, stage, op, mock_transport):
         stage.run_op(op)
@@ -180,6 +209,14 @@ class TestMQTTTransportStageRunOpCalledWithSetMQTTConnectionArgsOperation(
         )
         assert stage.transport.on_mqtt_message_received_handler == stage._on_mqtt_message_received
 
+    @pytest.mark.it("Sets the stage's publish limits from the pipeline configuration")
+    def test_publish_limits(self, stage, op, mock_transport):
+        stage.pipeline_root.pipeline_configuration.max_in_flight_publishes = 5
+        stage.pipeline_root.pipeline_configuration.max_queued_publish_bytes = 1000
+        stage.run_op(op)
+        assert stage.max_in_flight_publishes == 5
+        assert stage.max_queued_publish_bytes == 1000
+
     # CT-TODO: does this even need to be happening in this stage? Shouldn't this be part of init?
     @pytest.mark.it("Sets the stage's pending connection operation to None")
     def test_pending_conn_op(self, stage, op, mock_transport):
@@ -208,7 +245,7 @@ class MQTTTransportStageTestConfigComplex(MQTTTransportStageTestConfig):
     def stage(self, mocker, cls_type, init_kwargs, mock_transport):
         stage = cls_type(**init_kwargs)
         stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
-            pipeline_configuration=mocker.MagicMock()
+            pipeline_configuration=config.BasePipelineConfig()
         )
         stage.send_op_down = mocker.MagicMock()
         stage.send_event_up = mocker.MagicMock()
@@ -306,6 +343,17 @@ class TestMQTTTransportStageRunOpCalledWithConnectOperation(
         assert stage.transport.connect.call_count == 1
         assert stage.transport.connect.call_args == mocker.call(password=stage.sas_token)
 
+    @pytest.mark.it(
+        "Performs the MQTT connect with pipeline_thread.invoke_blocking_call, so that it does not block an event loop"
+    )
+    def test_mqtt_connect_blocking_call(self, mocker, stage, op):
+        invoke_blocking_call = mocker.patch.object(pipeline_thread, "invoke_blocking_call")
+        stage.run_op(op)
+        assert invoke_blocking_call.call_count == 1
+        assert stage.transport.connect.call_count == 0
+        invoke_blocking_call.call_args[0][0]()
+        assert stage.transport.connect.call_args == mocker.call(password=stage.sas_token)
+
     @pytest.mark.it(
         "Completes the operation unsucessfully if there is a failure connecting via the MQTTTransport, using the error raised by the MQTTTransport"
     )
@@ -478,12 +526,16 @@ class TestMQTTTransportStageRunOpCalledWithMQTTPublishOperation(
             topic="fake_topic", payload="fake_payload", callback=mocker.MagicMock()
         )
 
-    @pytest.mark.it("Performs an MQTT publish via the MQTTTransport")
-    def test_mqtt_publish(self, mocker, stage, op):
+    @pytest.mark.it(
+        "Performs an MQTT publish via the MQTTTransport, at the QoS level of the operation"
+    )
+    @pytest.mark.parametrize("qos", [0, 1])
+    def test_mqtt_publish(self, mocker, stage, op, qos):
+        op.qos = qos
         stage.run_op(op)
         assert stage.transport.publish.call_count == 1
         assert stage.transport.publish.call_args == mocker.call(
-            topic=op.topic, payload=op.payload, callback=mocker.ANY
+            topic=op.topic, payload=op.payload, qos=qos, callback=mocker.ANY
         )
 
     @pytest.mark.it(
@@ -501,6 +553,256 @@ class TestMQTTTransportStageRunOpCalledWithMQTTPublishOperation(
         assert op.completed
         assert op.error is None
 
+    @pytest.mark.it(
+        "Records the publish in the delivery and latency statistics for the QoS level of the operation"
+    )
+    @pytest.mark.parametrize("qos", [0, 1])
+    def test_stats(self, mocker, stage, op, qos):
+        op.qos = qos
+        mock_time = mocker.patch.object(pipeline_stages_mqtt, "time").time
+        mock_time.return_value = 100.0
+        stage.run_op(op)
+        stats = stage.publish_stats[qos]
+        assert stats.sent == 1
+        assert stats.delivered == 0
+        assert stats.average_latency is None
+
+        mock_time.return_value = 100.5
+        stage.transport.publish.call_args[1]["callback"]()
+        assert stats.delivered == 1
+        assert stats.failed == 0
+        assert stats.average_latency == 0.5
+        assert stats.max_latency == 0.5
+
+        other_stats = stage.publish_stats[1 - qos]
+        assert other_stats.sent == 0
+        assert other_stats.delivered == 0
+
+    @pytest.mark.it("Records a failure in the statistics if the MQTTTransport raises")
+    def test_stats_failure(self, mocker, stage, op, arbitrary_exception):
+        stage.transport.publish.side_effect = arbitrary_exception
+        stage.run_op(op)
+        assert op.error is arbitrary_exception
+        assert stage.publish_stats[1].sent == 1
+        assert stage.publish_stats[1].failed == 1
+        assert stage.publish_stats[1].delivered == 0
+
+
+@pytest.mark.describe("MQTTTransportStage - .run_op() -- called with MQTTPublishBatchOperation")
+class TestMQTTTransportStageRunOpCalledWithMQTTPublishBatchOperation(
+    MQTTTransportStageTestConfigComplex, StageRunOpTestBase
+):
+    @pytest.fixture
+    def op(self, mocker):
+        return pipeline_ops_mqtt.MQTTPublishBatchOperation(
+            publishes=[("fake_topic_1", "fake_payload_1"), ("fake_topic_2", "fake_payload_2")],
+            callback=mocker.MagicMock(),
+        )
+
+    @pytest.mark.it(
+        "Performs an MQTT publish via the MQTTTransport for each item in the batch, at the QoS level of the operation"
+    )
+    @pytest.mark.parametrize("qos", [0, 1])
+    def test_mqtt_publish(self, mocker, stage, op, qos):
+        op.qos = qos
+        stage.run_op(op)
+        assert stage.transport.publish.call_count == 2
+        assert stage.transport.publish.call_args_list[0] == mocker.call(
+            topic="fake_topic_1", payload="fake_payload_1", qos=qos, callback=mocker.ANY
+        )
+        assert stage.transport.publish.call_args_list[1] == mocker.call(
+            topic="fake_topic_2", payload="fake_payload_2", qos=qos, callback=mocker.ANY
+        )
+
+    @pytest.mark.it(
+        "Successfully completes the operation once every MQTT publish in the batch has been completed by the MQTTTransport"
+    )
+    def test_complete(self, mocker, stage, op):
+        stage.run_op(op)
+
+        stage.transport.publish.call_args_list[1][1]["callback"]()
+        assert not op.completed
+
+        stage.transport.publish.call_args_list[0][1]["callback"]()
+        assert op.completed
+        assert op.error is None
+        assert op.results == [None, None]
+
+    @pytest.mark.it(
+        "Records the error for an individual publish that raises, without failing the rest of the batch"
+    )
+    def test_publish_raises(self, mocker, stage, op, arbitrary_exception):
+        stage.transport.publish.side_effect = [arbitrary_exception, None]
+        stage.run_op(op)
+
+        assert stage.transport.publish.call_count == 2
+        assert not op.completed
+
+        stage.transport.publish.call_args_list[1][1]["callback"]()
+        assert op.completed
+        assert op.error is None
+        assert op.results == [arbitrary_exception, None]
+
+    @pytest.mark.it("Completes the operation immediately if every publish in the batch raises")
+    def test_all_publishes_raise(self, mocker, stage, op, arbitrary_exception):
+        stage.transport.publish.side_effect = arbitrary_exception
+        stage.run_op(op)
+
+        assert op.completed
+        assert op.error is None
+        assert op.results == [arbitrary_exception, arbitrary_exception]
+
+    @pytest.mark.it("Completes the operation immediately if the batch is empty")
+    def test_empty_batch(self, mocker, stage):
+        op = pipeline_ops_mqtt.MQTTPublishBatchOperation(publishes=[], callback=mocker.MagicMock())
+        stage.run_op(op)
+
+        assert stage.transport.publish.call_count == 0
+        assert op.completed
+        assert op.error is None
+        assert op.results == []
+
+
+@pytest.mark.describe(
+    "MQTTTransportStage - .run_op() -- called with publishes while publish limits are set"
+)
+class TestMQTTTransportStageRunOpWithPublishLimits(MQTTTransportStageTestConfigComplex):
+    @pytest.fixture
+    def make_op(self, mocker):
+        def make_op(payload="fake_payload"):
+            return pipeline_ops_mqtt.MQTTPublishOperation(
+                topic="fake_topic", payload=payload, callback=mocker.MagicMock()
+            )
+
+        return make_op
+
+    def puback(self, stage, index):
+        stage.transport.publish.call_args_list[index][1]["callback"]()
+
+    def backpressure_events(self, stage):
+        return [
+            call[0][0].backpressure
+            for call in stage.send_event_up.call_args_list
+            if isinstance(call[0][0], pipeline_events_base.BackpressureChangedEvent)
+        ]
+
+    @pytest.mark.it(
+        "Holds publishes that do not fit in the publish window until earlier publishes are acknowledged"
+    )
+    def test_holds_publishes(self, stage, make_op):
+        stage.max_in_flight_publishes = 2
+        ops = [make_op() for _ in range(3)]
+        for op in ops:
+            stage.run_op(op)
+        assert stage.transport.publish.call_count == 2
+
+        self.puback(stage, 0)
+        assert ops[0].completed
+        assert stage.transport.publish.call_count == 3
+
+        self.puback(stage, 1)
+        self.puback(stage, 2)
+        assert all(op.completed and op.error is None for op in ops)
+
+    @pytest.mark.it(
+        "Sends a BackpressureChangedEvent when the publish window fills up, and another when there is room again"
+    )
+    def test_window_backpressure_events(self, stage, make_op):
+        stage.max_in_flight_publishes = 2
+        stage.run_op(make_op())
+        assert self.backpressure_events(stage) == []
+        stage.run_op(make_op())
+        assert self.backpressure_events(stage) == [True]
+        stage.run_op(make_op())
+        assert self.backpressure_events(stage) == [True]
+
+        # The held publish takes the freed spot, so the window is still full
+        self.puback(stage, 0)
+        assert self.backpressure_events(stage) == [True]
+        self.puback(stage, 1)
+        assert self.backpressure_events(stage) == [True, False]
+
+    @pytest.mark.it(
+        "Completes a publish with PublishQueueFullError if it would go over the queued byte limit"
+    )
+    def test_byte_limit(self, stage, make_op):
+        stage.max_queued_publish_bytes = 10
+        first = make_op(payload="123456")
+        second = make_op(payload="12345")
+        stage.run_op(first)
+        stage.run_op(second)
+
+        assert stage.transport.publish.call_count == 1
+        assert second.completed
+        assert isinstance(second.error, pipeline_exceptions.PublishQueueFullError)
+
+    @pytest.mark.it("Accepts a publish larger than the queued byte limit if nothing else is queued")
+    def test_byte_limit_large_publish(self, stage, make_op):
+        stage.max_queued_publish_bytes = 10
+        op = make_op(payload="12345678901234567890")
+        stage.run_op(op)
+        assert stage.transport.publish.call_count == 1
+        assert not op.completed
+
+    @pytest.mark.it("Frees the bytes of a publish once it has been acknowledged")
+    def test_byte_limit_freed(self, stage, make_op):
+        stage.max_queued_publish_bytes = 10
+        stage.run_op(make_op(payload="123456"))
+        self.puback(stage, 0)
+
+        op = make_op(payload="12345")
+        stage.run_op(op)
+        assert stage.transport.publish.call_count == 2
+        assert not op.completed
+
+    @pytest.mark.it(
+        "Sends a BackpressureChangedEvent when the queued byte limit is reached, and another when bytes are freed"
+    )
+    def test_byte_limit_backpressure_events(self, stage, make_op):
+        stage.max_queued_publish_bytes = 10
+        stage.run_op(make_op(payload="12345"))
+        assert self.backpressure_events(stage) == []
+        stage.run_op(make_op(payload="12345"))
+        assert self.backpressure_events(stage) == [True]
+        self.puback(stage, 0)
+        assert self.backpressure_events(stage) == [True, False]
+
+    @pytest.mark.it("Frees the space used by a publish if the MQTTTransport raises")
+    def test_publish_raises(self, stage, make_op, arbitrary_exception):
+        stage.max_in_flight_publishes = 1
+        stage.max_queued_publish_bytes = 100
+        stage.transport.publish.side_effect = [arbitrary_exception, None]
+        failed_op = make_op()
+        stage.run_op(failed_op)
+        assert failed_op.completed
+        assert failed_op.error is arbitrary_exception
+
+        op = make_op()
+        stage.run_op(op)
+        assert stage.transport.publish.call_count == 2
+        assert stage._queued_publish_bytes == len("fake_payload")
+
+    @pytest.mark.it(
+        "Applies the limits to each publish in a MQTTPublishBatchOperation, recording rejected publishes in the results"
+    )
+    def test_batch(self, mocker, stage):
+        stage.max_in_flight_publishes = 1
+        stage.max_queued_publish_bytes = 10
+        op = pipeline_ops_mqtt.MQTTPublishBatchOperation(
+            publishes=[("topic", "12345"), ("topic", "12345"), ("topic", "1")],
+            callback=mocker.MagicMock(),
+        )
+        stage.run_op(op)
+        assert stage.transport.publish.call_count == 1
+
+        self.puback(stage, 0)
+        assert stage.transport.publish.call_count == 2
+        self.puback(stage, 1)
+
+        assert op.completed
+        assert op.results[:2] == [None, None]
+        assert isinstance(op.results[2], pipeline_exceptions.PublishQueueFullError)
+
 
 @pytest.mark.describe("MQTTTransportStage - .run_op() -- called with MQTTSubscribeOperation")
 class TestMQTTTransportStageRunOpCalledWithMQTTSubscribeOperation(
@@ -0,0 +1,242 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import logging
+import pytest
+import threading
+from azure.iot.device.common import handle_exceptions
+from azure.iot.device.common.pipeline import pipeline_thread
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeEventLoop(object):
+    """Stands in for an asyncio event loop.  Callbacks only run when run_pending is called"""
+
+    def __init__(self):
+        self.pending = []
+        self.pending_added = threading.Event()
+
+    def call_soon_threadsafe(self, callback, *args):
+        self.pending.append((callback, args))
+        self.pending_added.set()
+
+    def run_in_executor(self, executor, func, *args):
+        call_on_other_thread(lambda: func(*args))
+
+    def run_pending(self):
+        pending = self.pending
+        self.pending = []
+        self.pending_added.clear()
+        for callback, args in pending:
+            callback(*args)
+
+
+@pytest.fixture
+def loop():
+    loop = FakeEventLoop()
+    pipeline_thread.run_on_event_loop(loop)
+    yield loop
+    pipeline_thread.run_on_event_loop(None)
+
+
+def call_on_other_thread(fn):
+    t = threading.Thread(target=fn)
+    t.start()
+    t.join()
+
+
+@pytest.mark.describe("pipeline_thread - .run_on_event_loop()")
+class TestRunOnEventLoop(object):
+    @pytest.mark.it("Sets the event loop which is returned by .get_event_loop()")
+    def test_sets_loop(self, loop):
+        assert pipeline_thread.get_event_loop() is loop
+
+    @pytest.mark.it("Goes back to using the pipeline and callback threads when called with None")
+    def test_clears_loop(self, loop):
+        pipeline_thread.run_on_event_loop(None)
+        assert pipeline_thread.get_event_loop() is None
+
+
+@pytest.mark.describe("pipeline_thread - decorators -- running on an event loop")
+class TestDecoratorsOnEventLoop(object):
+    @pytest.fixture(
+        params=[
+            pipeline_thread.invoke_on_pipeline_thread,
+            pipeline_thread.invoke_on_pipeline_thread_nowait,
+            pipeline_thread.invoke_on_callback_thread_nowait,
+        ],
+        ids=[
+            "invoke_on_pipeline_thread",
+            "invoke_on_pipeline_thread_nowait",
+            "invoke_on_callback_thread_nowait",
+        ],
+    )
+    def decorator(self, request):
+        return request.param
+
+    @pytest.fixture(
+        params=[
+            pipeline_thread.invoke_on_pipeline_thread_nowait,
+            pipeline_thread.invoke_on_callback_thread_nowait,
+        ],
+        ids=["invoke_on_pipeline_thread_nowait", "invoke_on_callback_thread_nowait"],
+    )
+    def nowait_decorator(self, request):
+        return request.param
+
+    @pytest.mark.it("Runs the function immediately when called from the event loop thread")
+    def test_on_loop_thread(self, mocker, loop, decorator):
+        func = mocker.MagicMock(__name__="func")
+        decorator(func)(1, two=2)
+        assert func.call_count == 1
+        assert func.call_args == mocker.call(1, two=2)
+        assert loop.pending == []
+
+    @pytest.mark.it("Schedules the function on the event loop when called from a different thread")
+    def test_on_other_thread(self, mocker, loop, nowait_decorator):
+        func = mocker.MagicMock(__name__="func")
+        call_on_other_thread(lambda: nowait_decorator(func)(1, two=2))
+        assert func.call_count == 0
+
+        loop.run_pending()
+        assert func.call_count == 1
+        assert func.call_args == mocker.call(1, two=2)
+
+    @pytest.mark.it(
+        "Sends exceptions raised by a function scheduled without waiting to the background exception handler"
+    )
+    def test_nowait_raises(self, mocker, loop, nowait_decorator, arbitrary_exception):
+        mock_handler = mocker.patch.object(handle_exceptions, "handle_background_exception")
+        func = mocker.MagicMock(__name__="func", side_effect=arbitrary_exception)
+        call_on_other_thread(lambda: nowait_decorator(func)())
+
+        loop.run_pending()
+        assert mock_handler.call_count == 1
+        assert mock_handler.call_args == mocker.call(arbitrary_exception)
+
+    @pytest.mark.it(
+        "Blocks a caller on a different thread until the event loop has run the function, and returns the result"
+    )
+    def test_blocking_on_other_thread(self, mocker, loop):
+        func = mocker.MagicMock(__name__="func", return_value="result")
+        results = []
+        t = threading.Thread(
+            target=lambda: results.append(pipeline_thread.invoke_on_pipeline_thread(func)())
+        )
+        t.start()
+
+        assert loop.pending_added.wait(5)
+        assert results == []
+        loop.run_pending()
+        t.join()
+        assert results == ["result"]
+
+    @pytest.mark.it("Raises exceptions from the function in a blocked caller on a different thread")
+    def test_blocking_on_other_thread_raises(self, mocker, loop, arbitrary_exception):
+        func = mocker.MagicMock(__name__="func", side_effect=arbitrary_exception)
+        raised = []
+
+        def call():
+            try:
+                pipeline_thread.invoke_on_pipeline_thread(func)()
+            except Exception as e:
+                raised.append(e)
+
+        t = threading.Thread(target=call)
+        t.start()
+        assert loop.pending_added.wait(5)
+        loop.run_pending()
+        t.join()
+        assert raised == [arbitrary_exception]
+
+    @pytest.mark.it(
+        "Allows functions marked with runs_on_pipeline_thread to run on the event loop thread"
+    )
+    def test_runs_on_pipeline_thread(self, mocker, loop):
+        @pipeline_thread.runs_on_pipeline_thread
+        def func():
+            return "result"
+
+        assert func() == "result"
+
+    @pytest.mark.it(
+        "Does not allow functions marked with runs_on_pipeline_thread to run on a different thread"
+    )
+    def test_runs_on_pipeline_thread_other_thread(self, mocker, loop):
+        @pipeline_thread.runs_on_pipeline_thread
+        def func():
+            pass
+
+        raised = []
+
+        def call():
+            try:
+                func()
+            except AssertionError as e:
+                raised.append(e)
+
+        call_on_other_thread(call)
+        assert len(raised) == 1
+
+    @pytest.mark.it("Does not run functions decorated to run on the http thread on the event loop")
+    def test_http_thread(self, mocker, loop):
+        called = threading.Event()
+        calling_threads = []
+
+        def func():
+            calling_threads.append(threading.current_thread())
+            called.set()
+
+        pipeline_thread.invoke_on_http_thread_nowait(func)()
+        assert called.wait(5)
+        assert calling_threads[0] is not threading.current_thread()
+        assert loop.pending == []
+
+
+@pytest.mark.describe("pipeline_thread - .invoke_blocking_call()")
+class TestInvokeBlockingCall(object):
+    @pytest.mark.it("Calls the function right away when not running on an event loop")
+    def test_no_loop(self, mocker):
+        calling_threads = []
+        on_error = mocker.MagicMock()
+        pipeline_thread.invoke_blocking_call(
+            lambda: calling_threads.append(threading.current_thread()), on_error
+        )
+        assert calling_threads == [threading.current_thread()]
+        assert on_error.call_count == 0
+
+    @pytest.mark.it(
+        "Calls on_error with the exception raised by the function when not running on an event loop"
+    )
+    def test_no_loop_raises(self, mocker, arbitrary_exception):
+        on_error = mocker.MagicMock()
+        func = mocker.MagicMock(side_effect=arbitrary_exception)
+        pipeline_thread.invoke_blocking_call(func, on_error)
+        assert on_error.call_args == mocker.call(arbitrary_exception)
+
+    @pytest.mark.it("Calls the function on the executor of the event loop, off the loop thread")
+    def test_loop(self, mocker, loop):
+        calling_threads = []
+        on_error = mocker.MagicMock()
+        pipeline_thread.invoke_blocking_call(
+            lambda: calling_threads.append(threading.current_thread()), on_error
+        )
+        assert len(calling_threads) == 1
+        assert calling_threads[0] is not threading.current_thread()
+        assert loop.pending == []
+        assert on_error.call_count == 0
+
+    @pytest.mark.it(
+        "Calls on_error on the event loop with the exception raised by the function when running on an event loop"
+    )
+    def test_loop_raises(self, mocker, loop, arbitrary_exception):
+        on_error = mocker.MagicMock()
+        func = mocker.MagicMock(side_effect=arbitrary_exception)
+        pipeline_thread.invoke_blocking_call(func, on_error)
+        assert on_error.call_count == 0
+
+        loop.run_pending()
+        assert on_error.call_args == mocker.call(arbitrary_exception)
@@ -8,12 +8,21 @@ import pytest
 import inspect
 import asyncio
 import logging
+import threading
 import azure.iot.device.common.async_adapter as async_adapter
+from azure.iot.device.common.pipeline import pipeline_thread
 
 logging.basicConfig(level=logging.DEBUG)
 pytestmark = pytest.mark.asyncio
 
 
+@pytest.fixture
+def restore_pipeline_threads():
+    """Go back to running the pipeline on its own threads after the test"""
+    yield
+    pipeline_thread.run_on_event_loop(None)
+
+
 @pytest.fixture
 def dummy_value():
     return 123
@@ -63,6 +72,34 @@ class TestEmulateAsync(object):
         assert result == "foo"
 
 
+@pytest.mark.describe("emulate_async() -- pipeline running on the event loop")
+class TestEmulateAsyncWithAsyncioPipeline(object):
+    @pytest.mark.it("Calls the input function directly on the event loop thread")
+    async def test_calls_directly(self, mocker, restore_pipeline_threads, dummy_value):
+        async_adapter.enable_asyncio_pipeline()
+        calling_threads = []
+
+        def some_function(value):
+            calling_threads.append(threading.current_thread())
+            return value
+
+        mock_run_in_executor = mocker.spy(asyncio.get_event_loop(), "run_in_executor")
+        async_fn = async_adapter.emulate_async(some_function)
+        result = await async_fn(dummy_value)
+
+        assert result == dummy_value
+        assert calling_threads == [threading.current_thread()]
+        assert mock_run_in_executor.call_count == 0
+
+
+@pytest.mark.describe("enable_asyncio_pipeline()")
+class TestEnableAsyncioPipeline(object):
+    @pytest.mark.it("Sets the pipeline to run on the currently running event loop")
+    async def test_runs_pipeline_on_loop(self, restore_pipeline_threads):
+        async_adapter.enable_asyncio_pipeline()
+        assert pipeline_thread.get_event_loop() is asyncio.get_event_loop()
+
+
 @pytest.mark.describe("AwaitableCallback")
 class TestAwaitableCallback(object):
     @pytest.mark.it("Can be instantiated with no args")
@@ -143,3 +180,22 @@ class TestAwaitableCallback(object):
         with pytest.raises(arbitrary_exception.__class__) as e_info:
             await callback.completion()
         assert e_info.value is arbitrary_exception
+
+    @pytest.mark.it(
+        "Completes the instance Future immediately when a call is invoked on the event loop thread"
+    )
+    async def test_completes_immediately_on_loop(self, fake_return_arg_value):
+        callback = async_adapter.AwaitableCallback(return_arg_name="arg_name")
+        callback(arg_name=fake_return_arg_value)
+        assert callback.future.done()
+        assert await callback.completion() == fake_return_arg_value
+
+    @pytest.mark.it(
+        "Completes the instance Future on the event loop when a call is invoked on a different thread"
+    )
+    async def test_completes_from_other_thread(self, fake_return_arg_value):
+        callback = async_adapter.AwaitableCallback(return_arg_name="arg_name")
+        t = threading.Thread(target=callback, kwargs={"arg_name": fake_return_arg_value})
+        t.start()
+        t.join()
+        assert await callback.completion() == fake_return_arg_value
@@ -0,0 +1,81 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import pytest
+import logging
+import os
+from azure.iot.device.common.disk_queue import DiskQueue
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+@pytest.mark.describe("DiskQueue")
+class TestDiskQueue(object):
+    @pytest.mark.it("Instantiates empty, without creating a file")
+    def test_instantiates_empty(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        assert len(queue) == 0
+        assert os.listdir(str(tmpdir)) == []
+
+    @pytest.mark.it("Returns items in the order they were added")
+    def test_fifo(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        items = [{"key": "value"}, "text", b"bytes", None, 12]
+        for item in items:
+            queue.put(item)
+        assert len(queue) == len(items)
+        assert [queue.get() for _ in items] == items
+        assert len(queue) == 0
+
+    @pytest.mark.it("Returns items added after some have been removed in order")
+    def test_interleaved(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        queue.put(1)
+        queue.put(2)
+        assert queue.get() == 1
+        queue.put(3)
+        assert queue.get() == 2
+        assert queue.get() == 3
+        queue.put(4)
+        assert queue.get() == 4
+
+    @pytest.mark.it("Raises IndexError when getting from an empty queue")
+    def test_get_empty(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        with pytest.raises(IndexError):
+            queue.get()
+        queue.put(1)
+        queue.get()
+        with pytest.raises(IndexError):
+            queue.get()
+
+    @pytest.mark.it("Truncates its file once it becomes empty")
+    def test_truncates(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        queue.put(b"x" * 4096)
+        queue.get()
+        queue._file.seek(0, os.SEEK_END)
+        assert queue._file.tell() == 0
+
+    @pytest.mark.it("Removes all items when cleared")
+    def test_clear(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        queue.put(1)
+        queue.put(2)
+        queue.clear()
+        assert len(queue) == 0
+        queue.put(3)
+        assert queue.get() == 3
+
+    @pytest.mark.it("Removes all items and closes its file when closed, and can still be used")
+    def test_close(self, tmpdir):
+        queue = DiskQueue(str(tmpdir))
+        queue.put(1)
+        file = queue._file
+        queue.close()
+        assert len(queue) == 0
+        assert file.closed
+        queue.put(2)
+        assert queue.get() == 2
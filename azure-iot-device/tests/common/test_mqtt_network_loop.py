@@ -0,0 +1,261 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import socket
+import struct
+import threading
+import paho.mqtt.client as mqtt
+from six.moves import socketserver
+from azure.iot.device.common import mqtt_network_loop
+from azure.iot.device.common.mqtt_network_loop import NetworkLoop
+
+logging.basicConfig(level=logging.DEBUG)
+
+pytestmark = pytest.mark.skipif(
+    not mqtt_network_loop.is_supported(), reason="NetworkLoop is not supported on this platform"
+)
+
+CONNACK = b"\x20\x02\x00\x00"
+PINGRESP = b"\xd0\x00"
+
+
+class FakeBrokerHandler(socketserver.BaseRequestHandler):
+    """
+    Speaks just enough MQTT to accept a connection, acknowledge QoS 1 publishes and answer pings
+    """
+
+    def read_exactly(self, count):
+        data = b""
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def read_packet(self):
+        packet_type = ord(self.read_exactly(1))
+        length = 0
+        shift = 0
+        while True:
+            byte = ord(self.read_exactly(1))
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return packet_type, self.read_exactly(length)
+
+    def handle(self):
+        self.server.connections.append(self.request)
+        try:
+            while True:
+                packet_type, body = self.read_packet()
+                command = packet_type & 0xF0
+                if command == mqtt.CONNECT:
+                    self.request.sendall(CONNACK)
+                elif command == mqtt.PUBLISH and (packet_type >> 1) & 0x03:
+                    (topic_length,) = struct.unpack(">H", body[:2])
+                    mid = body[2 + topic_length : 4 + topic_length]
+                    self.request.sendall(b"\x40\x02" + mid)
+                elif command == mqtt.PINGREQ:
+                    self.request.sendall(PINGRESP)
+                elif command == mqtt.DISCONNECT:
+                    return
+        except (EOFError, socket.error):
+            return
+
+
+class FakeBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0), FakeBrokerHandler)
+        self.connections = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def drop_connections(self):
+        for connection in self.connections:
+            connection.shutdown(socket.SHUT_RDWR)
+
+
+@pytest.fixture
+def broker():
+    broker = FakeBroker()
+    thread = threading.Thread(target=broker.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield broker
+    broker.shutdown()
+    broker.server_close()
+
+
+@pytest.fixture
+def network_loop():
+    return NetworkLoop(name="test-network-loop")
+
+
+class ClientEvents(object):
+    """Records the Paho callbacks made for a client, and the threads they were made on"""
+
+    def __init__(self, client):
+        self.connected = threading.Event()
+        self.disconnected = threading.Event()
+        self.disconnect_rc = None
+        self.published = []
+        self.published_event = threading.Event()
+        self.callback_threads = set()
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_publish = self.on_publish
+
+    def on_connect(self, client, userdata, flags, rc):
+        self.callback_threads.add(threading.current_thread().name)
+        self.connected.set()
+
+    def on_disconnect(self, client, userdata, rc):
+        self.callback_threads.add(threading.current_thread().name)
+        self.disconnect_rc = rc
+        self.disconnected.set()
+
+    def on_publish(self, client, userdata, mid):
+        self.callback_threads.add(threading.current_thread().name)
+        self.published.append(mid)
+        self.published_event.set()
+
+
+def create_clients(network_loop, count):
+    clients = []
+    for i in range(count):
+        client = mqtt.Client(client_id="client{}".format(i), protocol=mqtt.MQTTv311)
+        client.events = ClientEvents(client)
+        network_loop.attach(client)
+        clients.append(client)
+    return clients
+
+
+def connect_all(broker, clients):
+    for client in clients:
+        assert client.connect("127.0.0.1", port=broker.port) == mqtt.MQTT_ERR_SUCCESS
+    for client in clients:
+        assert client.events.connected.wait(5)
+
+
+def registered_clients(network_loop):
+    """Return the clients whose sockets the loop is watching, once it has finished its current work"""
+    result = []
+    done = threading.Event()
+
+    def get_clients():
+        result.extend(key.data for key in network_loop._selector.get_map().values() if key.data)
+        done.set()
+
+    network_loop._call_on_loop_thread(get_clients)
+    assert done.wait(5)
+    return result
+
+
+@pytest.mark.describe("NetworkLoop - .attach()")
+class TestNetworkLoopAttach(object):
+    @pytest.mark.it("Connects every attached client using a single network loop thread")
+    def test_connects_clients(self, broker, network_loop):
+        threads_before = threading.active_count()
+        clients = create_clients(network_loop, 20)
+        connect_all(broker, clients)
+
+        for client in clients:
+            assert client.events.callback_threads == set([network_loop.name])
+            assert client._thread is None
+        assert network_loop.client_count == 20
+        assert len(registered_clients(network_loop)) == 20
+        # The network loop's thread, plus one fake broker thread per connection
+        assert threading.active_count() == threads_before + 1 + 20
+
+    @pytest.mark.it("Sends publishes made on other threads and reports when they are acknowledged")
+    def test_publish(self, broker, network_loop):
+        clients = create_clients(network_loop, 5)
+        connect_all(broker, clients)
+
+        for client in clients:
+            info = client.publish("topic", b"payload", qos=1)
+            assert client.events.published_event.wait(5)
+            assert client.events.published == [info.mid]
+            assert client.events.callback_threads == set([network_loop.name])
+
+    @pytest.mark.it("Stops watching the socket of a client that disconnects")
+    def test_disconnect(self, broker, network_loop):
+        client, other_client = create_clients(network_loop, 2)
+        connect_all(broker, [client, other_client])
+
+        client.disconnect()
+        assert client.events.disconnected.wait(5)
+        assert client.events.disconnect_rc == mqtt.MQTT_ERR_SUCCESS
+        assert registered_clients(network_loop) == [other_client]
+
+    @pytest.mark.it(
+        "Reports an error and stops watching the socket of a client whose connection is dropped"
+    )
+    def test_connection_dropped(self, broker, network_loop):
+        clients = create_clients(network_loop, 3)
+        connect_all(broker, clients)
+
+        broker.drop_connections()
+        for client in clients:
+            assert client.events.disconnected.wait(5)
+            assert client.events.disconnect_rc != mqtt.MQTT_ERR_SUCCESS
+        assert registered_clients(network_loop) == []
+
+    @pytest.mark.it("Watches the new socket of a client that reconnects")
+    def test_reconnect(self, broker, network_loop):
+        (client,) = create_clients(network_loop, 1)
+        connect_all(broker, [client])
+        client.events.connected.clear()
+
+        assert client.reconnect() == mqtt.MQTT_ERR_SUCCESS
+        assert client.events.connected.wait(5)
+        assert registered_clients(network_loop) == [client]
+
+        info = client.publish("topic", b"payload", qos=1)
+        assert client.events.published_event.wait(5)
+        assert client.events.published == [info.mid]
+
+
+@pytest.mark.describe("NetworkLoop - get_shared_network_loop()")
+class TestGetSharedNetworkLoop(object):
+    @pytest.fixture(autouse=True)
+    def empty_pool(self, mocker):
+        mocker.patch.object(mqtt_network_loop, "_shared_loops", [])
+
+    @pytest.mark.it("Returns the same pool of loops each time it is called")
+    def test_pool(self):
+        loops = set(
+            mqtt_network_loop.get_shared_network_loop()
+            for _ in range(mqtt_network_loop.SHARED_POOL_SIZE * 2)
+        )
+        assert loops.issubset(set(mqtt_network_loop._shared_loops))
+        assert len(mqtt_network_loop._shared_loops) == mqtt_network_loop.SHARED_POOL_SIZE
+
+    @pytest.mark.it("Returns the loop with the fewest attached clients")
+    def test_least_loaded(self, mocker):
+        mocker.patch.object(mqtt_network_loop, "SHARED_POOL_SIZE", 2)
+        clients = [mqtt.Client(client_id="client{}".format(i)) for i in range(3)]
+        first = mqtt_network_loop.get_shared_network_loop()
+        first.attach(clients[0])
+        first.attach(clients[1])
+        second = mqtt_network_loop.get_shared_network_loop()
+        assert second is not first
+        second.attach(clients[2])
+        assert mqtt_network_loop.get_shared_network_loop() is second
+
+    @pytest.mark.it("Returns None if the selectors module is not available")
+    def test_not_supported(self, mocker):
+        mocker.patch.object(mqtt_network_loop, "selectors", None)
+        assert mqtt_network_loop.get_shared_network_loop() is None
@@ -188,7 +188,9 @@ class TestInstantiation(object):
         mock_ssl_context_constructor = mocker.patch.object(ssl, "SSLContext")
         mock_ssl_context = mock_ssl_context_constructor.return_value
 
-        MQTTTransport(client_id=fake_device_id, hostname=fake_hostname, username=fake_username)
+        transport = MQTTTransport(
+            client_id=fake_device_id, hostname=fake_hostname, username=fake_username
+        )
 
         # Verify correctness of TLS/SSL Context
         assert mock_ssl_context_constructor.call_count == 1
@@ -198,7 +200,9 @@ class TestInstantiation(object):
 
         # Verify context has been set
         assert mock_mqtt_client.tls_set_context.call_count == 1
-        assert mock_mqtt_client.tls_set_context.call_args == mocker.call(context=mock_ssl_context)
+        context = mock_mqtt_client.tls_set_context.call_args[1]["context"]
+        assert context is transport._ssl_context
+        assert context.ssl_context is mock_ssl_context
 
     @pytest.mark.it(
         "Configures TLS/SSL context using default certificates if protocol wrapper not instantiated with a server verification certificate"
@@ -272,6 +276,23 @@ class TestInstantiation(object):
             fake_client_cert.pass_phrase,
         )
 
+    @pytest.mark.it(
+        "Shares the TLS/SSL context with other transports that use the same certificates and cipher"
+    )
+    def test_shares_tls_context(self, mocker, mock_mqtt_client):
+        mock_ssl_context_constructor = mocker.patch.object(ssl, "SSLContext")
+
+        transport1 = MQTTTransport(
+            client_id=fake_device_id, hostname=fake_hostname, username=fake_username
+        )
+        transport2 = MQTTTransport(
+            client_id="other_device", hostname=fake_hostname, username=fake_username
+        )
+
+        assert mock_ssl_context_constructor.call_count == 1
+        assert transport1._ssl_context is not transport2._ssl_context
+        assert transport1._ssl_context.ssl_context is transport2._ssl_context.ssl_context
+
     @pytest.mark.it("Sets Paho MQTT Client callbacks")
     def test_sets_paho_callbacks(self, mocker):
         mock_mqtt_client = mocker.patch.object(mqtt, "Client").return_value
@@ -553,8 +574,174 @@ class TestReauthorizeConnection(object):
             transport.reauthorize_connection(fake_password)
 
 
+@pytest.mark.describe("MQTTTransport - .reauthorize_connection() -- make-before-break")
+class TestReauthorizeConnectionMakeBeforeBreak(object):
+    @pytest.fixture
+    def paho_clients(self, mocker):
+        """The Paho clients created by the transport, in order"""
+        clients = []
+
+        def create_client(*args, **kwargs):
+            client = mocker.MagicMock()
+            client.connect.return_value = 0
+            client.disconnect.return_value = 0
+            client.publish.return_value = (fake_rc, fake_mid)
+            client.subscribe.return_value = (fake_rc, fake_mid)
+            clients.append(client)
+            return client
+
+        mocker.patch.object(mqtt, "Client", side_effect=create_client)
+        return clients
+
+    @pytest.fixture
+    def transport(self, mocker, paho_clients):
+        transport = MQTTTransport(
+            client_id=fake_device_id,
+            hostname=fake_hostname,
+            username=fake_username,
+            make_before_break=True,
+        )
+        transport.on_mqtt_connected_handler = mocker.MagicMock()
+        transport.on_mqtt_disconnected_handler = mocker.MagicMock()
+        transport.on_mqtt_connection_failure_handler = mocker.MagicMock()
+        return transport
+
+    @pytest.mark.it(
+        "Connects a new Paho client with the stored username and provided password, without reconnecting the current client"
+    )
+    def test_connects_replacement(self, mocker, transport, paho_clients):
+        current = paho_clients[0]
+        transport.reauthorize_connection(new_fake_password)
+
+        assert len(paho_clients) == 2
+        replacement = paho_clients[1]
+        assert replacement.username_pw_set.call_args == mocker.call(
+            username=fake_username, password=new_fake_password
+        )
+        assert replacement.connect.call_count == 1
+        assert current.reconnect.call_count == 0
+        assert current.disconnect.call_count == 0
+        assert transport._mqtt_client is current
+
+    @pytest.mark.it(
+        "Switches to the new client, closes the current client and triggers on_mqtt_connected_handler once the new client connects"
+    )
+    def test_switches_on_connect(self, transport, paho_clients):
+        current = paho_clients[0]
+        transport.reauthorize_connection(new_fake_password)
+        replacement = paho_clients[1]
+
+        replacement.on_connect(client=replacement, userdata=None, flags=None, rc=fake_success_rc)
+
+        assert transport._mqtt_client is replacement
+        assert current.disconnect.call_count == 1
+        assert current.on_disconnect is None
+        assert transport.on_mqtt_connected_handler.call_count == 1
+        assert transport.on_mqtt_disconnected_handler.call_count == 0
+
+    @pytest.mark.it(
+        "Sends publishes which are waiting for a PUBACK again on the new client, and completes them when the new client receives the PUBACK"
+    )
+    def test_resends_pending_publishes(self, mocker, transport, paho_clients):
+        current = paho_clients[0]
+        callback = mocker.MagicMock()
+        transport.publish(topic=fake_topic, payload=fake_payload, qos=fake_qos, callback=callback)
+
+        transport.reauthorize_connection(new_fake_password)
+        replacement = paho_clients[1]
+        replacement.on_connect(client=replacement, userdata=None, flags=None, rc=fake_success_rc)
+
+        assert replacement.publish.call_args == mocker.call(
+            topic=fake_topic, payload=fake_payload, qos=fake_qos
+        )
+        assert callback.call_count == 0
+        replacement.on_publish(client=replacement, userdata=None, mid=fake_mid)
+        assert callback.call_count == 1
+        # The old client no longer completes operations
+        assert current.on_publish is None
+
+    @pytest.mark.it(
+        "Keeps the current client and triggers on_mqtt_connection_failure_handler if the new client fails to connect"
+    )
+    def test_replacement_connection_failure(self, transport, paho_clients):
+        current = paho_clients[0]
+        transport.reauthorize_connection(new_fake_password)
+        replacement = paho_clients[1]
+
+        replacement.on_connect(
+            client=replacement,
+            userdata=None,
+            flags=None,
+            rc=mqtt.CONNACK_REFUSED_NOT_AUTHORIZED,
+        )
+
+        assert transport._mqtt_client is current
+        assert current.disconnect.call_count == 0
+        assert replacement.disconnect.call_count == 1
+        assert transport.on_mqtt_connection_failure_handler.call_count == 1
+        error = transport.on_mqtt_connection_failure_handler.call_args[0][0]
+        assert isinstance(error, errors.UnauthorizedError)
+        assert transport.on_mqtt_connected_handler.call_count == 0
+
+    @pytest.mark.it(
+        "Keeps the current client and raises an error if the new client cannot start connecting"
+    )
+    def test_replacement_connect_raises(self, transport, paho_clients):
+        current = paho_clients[0]
+        mqtt.Client.side_effect = None
+        replacement = mqtt.Client.return_value
+        replacement.connect.side_effect = socket.error()
+
+        with pytest.raises(errors.ConnectionFailedError):
+            transport.reauthorize_connection(new_fake_password)
+        assert transport._mqtt_client is current
+        assert transport._replacement_client is None
+
+    @pytest.mark.it(
+        "Does not report a disconnection of the current client while the new client is connecting, if the new client connects"
+    )
+    def test_ignores_expected_disconnect(self, transport, paho_clients):
+        current = paho_clients[0]
+        transport.reauthorize_connection(new_fake_password)
+        replacement = paho_clients[1]
+
+        current.on_disconnect(client=current, userdata=None, rc=mqtt.MQTT_ERR_CONN_LOST)
+        replacement.on_connect(client=replacement, userdata=None, flags=None, rc=fake_success_rc)
+
+        assert transport.on_mqtt_disconnected_handler.call_count == 0
+        assert transport.on_mqtt_connected_handler.call_count == 1
+
+    @pytest.mark.it(
+        "Reports a disconnection of the current client while the new client is connecting, after the connection failure, if the new client fails to connect"
+    )
+    def test_reports_disconnect_after_failure(self, mocker, transport, paho_clients):
+        current = paho_clients[0]
+        transport.reauthorize_connection(new_fake_password)
+        replacement = paho_clients[1]
+        events = []
+        failure_handler = transport.on_mqtt_connection_failure_handler
+        failure_handler.side_effect = lambda cause: events.append("failure")
+        disconnected_handler = transport.on_mqtt_disconnected_handler
+        disconnected_handler.side_effect = lambda cause: events.append("disconnected")
+
+        current.on_disconnect(client=current, userdata=None, rc=mqtt.MQTT_ERR_CONN_LOST)
+        assert transport.on_mqtt_disconnected_handler.call_count == 0
+        replacement.on_disconnect(client=replacement, userdata=None, rc=mqtt.MQTT_ERR_CONN_LOST)
+
+        assert events == ["failure", "disconnected"]
+        assert transport._mqtt_client is current
+
+
 @pytest.mark.describe("MQTTTransport - OCCURANCE: Connect Completed")
 class TestEventConnectComplete(object):
+    @pytest.mark.it("Saves the TLS session so that it can be resumed when reconnecting")
+    def test_saves_tls_session(self, mocker, mock_mqtt_client, transport):
+        mock_save_session = mocker.patch.object(transport._ssl_context, "save_session")
+
+        mock_mqtt_client.on_connect(client=mock_mqtt_client, userdata=None, flags=None, rc=fake_rc)
+
+        assert mock_save_session.call_count == 1
+
     @pytest.mark.it(
         "Triggers on_mqtt_connected_handler event handler upon successful connect completion"
     )
@@ -1832,6 +2019,74 @@ class TestMessageReceived(object):
         assert e_info.value is arbitrary_base_exception
 
 
+@pytest.mark.describe("MQTTTransport - Shared network loop")
+class TestSharedNetworkLoop(object):
+    @pytest.fixture
+    def mock_network_loop(self, mocker):
+        return mocker.patch.object(
+            mqtt_transport.mqtt_network_loop, "get_shared_network_loop"
+        ).return_value
+
+    @pytest.fixture
+    def transport(self, mock_mqtt_client, mock_network_loop):
+        return MQTTTransport(
+            client_id=fake_device_id,
+            hostname=fake_hostname,
+            username=fake_username,
+            shared_network_loop=True,
+        )
+
+    @pytest.mark.it(
+        "Attaches the Paho client to a shared network loop if shared_network_loop is True"
+    )
+    def test_attaches(self, mocker, mock_mqtt_client, mock_network_loop, transport):
+        assert mock_network_loop.attach.call_count == 1
+        assert mock_network_loop.attach.call_args == mocker.call(mock_mqtt_client)
+
+    @pytest.mark.it("Does not use a shared network loop if shared_network_loop is not provided")
+    def test_default(self, mock_mqtt_client, mock_network_loop):
+        MQTTTransport(client_id=fake_device_id, hostname=fake_hostname, username=fake_username)
+        assert mock_network_loop.attach.call_count == 0
+
+    @pytest.mark.it("Does not start a Paho network thread when connecting")
+    def test_connect(self, mock_mqtt_client, transport):
+        transport.connect(fake_password)
+        assert mock_mqtt_client.connect.call_count == 1
+        assert mock_mqtt_client.loop_start.call_count == 0
+
+    @pytest.mark.it("Does not stop a Paho network thread when disconnecting")
+    def test_disconnect(self, mock_mqtt_client, transport):
+        transport.disconnect()
+        assert mock_mqtt_client.disconnect.call_count == 1
+        assert mock_mqtt_client.loop_stop.call_count == 0
+
+    @pytest.mark.it(
+        "Does not call Paho's disconnect() or loop_stop() when the connection is dropped with a cause"
+    )
+    def test_connection_dropped(self, mock_mqtt_client, transport):
+        mock_mqtt_client.on_disconnect(client=mock_mqtt_client, userdata=None, rc=fake_failed_rc)
+        assert mock_mqtt_client.disconnect.call_count == 0
+        assert mock_mqtt_client.loop_stop.call_count == 0
+
+    @pytest.mark.it(
+        "Uses a Paho network thread if a shared network loop is not supported on this platform"
+    )
+    def test_not_supported(self, mocker, mock_mqtt_client):
+        mocker.patch.object(
+            mqtt_transport.mqtt_network_loop, "get_shared_network_loop", return_value=None
+        )
+        transport = MQTTTransport(
+            client_id=fake_device_id,
+            hostname=fake_hostname,
+            username=fake_username,
+            shared_network_loop=True,
+        )
+        transport.connect(fake_password)
+        assert mock_mqtt_client.loop_start.call_count == 1
+        transport.disconnect()
+        assert mock_mqtt_client.loop_stop.call_count == 1
+
+
 @pytest.mark.describe("MQTTTransport - Misc.")
 class TestMisc(object):
     @pytest.mark.it(
@@ -2115,3 +2370,38 @@ class TestOperationManagerCompleteOperation(object):
 
         # Callback WAS NOT called while the lock was held
         assert mocker.call.cb() not in calls_during_lock
+
+
+@pytest.mark.describe("OperationManager - .take_pending_operations()")
+class TestOperationManagerTakePendingOperations(object):
+    @pytest.mark.it(
+        "Returns the resend function and callback of each pending operation which can be sent again, in the order they were established"
+    )
+    def test_returns_resendable_ops(self, mocker):
+        manager = OperationManager()
+        cb1, cb2, cb3 = mocker.MagicMock(), mocker.MagicMock(), mocker.MagicMock()
+        resend1, resend3 = mocker.MagicMock(), mocker.MagicMock()
+        manager.establish_operation(3, cb1, resend1)
+        manager.establish_operation(2, cb2)
+        manager.establish_operation(1, cb3, resend3)
+
+        assert manager.take_pending_operations() == [(resend1, cb1), (resend3, cb3)]
+
+    @pytest.mark.it("Stops tracking the operations it returns")
+    def test_stops_tracking(self, mocker):
+        manager = OperationManager()
+        callback = mocker.MagicMock()
+        manager.establish_operation(fake_mid, callback, mocker.MagicMock())
+        manager.take_pending_operations()
+
+        assert manager.take_pending_operations() == []
+        manager.complete_operation(fake_mid)
+        assert callback.call_count == 0
+
+    @pytest.mark.it("Does not return operations which have completed")
+    def test_completed_ops(self, mocker):
+        manager = OperationManager()
+        manager.establish_operation(fake_mid, mocker.MagicMock(), mocker.MagicMock())
+        manager.complete_operation(fake_mid)
+
+        assert manager.take_pending_operations() == []
@@ -0,0 +1,234 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import os
+from azure.iot.device.common import outbox
+from azure.iot.device.common.outbox import Outbox, OutboxFullError
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+@pytest.fixture
+def directory(tmpdir):
+    return str(tmpdir.join("outbox"))
+
+
+def read_all(box, position=None):
+    """Read every record from position (or the committed position) to the end of the outbox"""
+    records = []
+    record = box.read(position or box.committed_position)
+    while record:
+        records.append(record)
+        record = box.read(record.next_position)
+    return records
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(outbox.SEGMENT_SUFFIX))
+
+
+@pytest.mark.describe("Outbox - Instantiation")
+class TestOutboxInstantiation(object):
+    @pytest.mark.it("Creates the directory if it does not exist")
+    def test_creates_directory(self, directory):
+        Outbox(directory)
+        assert os.path.isdir(directory)
+
+    @pytest.mark.it("Is empty when it is first created")
+    def test_empty(self, directory):
+        box = Outbox(directory)
+        assert box.is_empty
+        assert box.read(box.committed_position) is None
+
+    @pytest.mark.it("Raises ValueError if the eviction policy is not recognized")
+    def test_invalid_eviction_policy(self, directory):
+        with pytest.raises(ValueError):
+            Outbox(directory, eviction_policy="drop_newest")
+
+    @pytest.mark.it("Keeps records that were not acknowledged when reopened")
+    def test_reopen(self, directory):
+        box = Outbox(directory)
+        box.append("topic", b"one")
+        box.append("topic", b"two")
+        box.close()
+
+        box = Outbox(directory)
+        assert [record.payload for record in read_all(box)] == [b"one", b"two"]
+
+    @pytest.mark.it(
+        "Does not keep records from fully acknowledged segments when reopened, even if the outbox was not closed"
+    )
+    def test_reopen_after_segment_acked(self, directory):
+        box = Outbox(directory, segment_bytes=1)
+        box.append("topic", b"one")
+        box.append("topic", b"two")
+        box.append("topic", b"three")
+        box.ack(box.read(box.committed_position))
+
+        box = Outbox(directory)
+        assert [record.payload for record in read_all(box)] == [b"two", b"three"]
+
+    @pytest.mark.it("Discards a partially written record at the end of the last segment")
+    def test_torn_record(self, directory):
+        box = Outbox(directory)
+        box.append("topic", b"one")
+        box.append("topic", b"two")
+        box.close()
+        segment = os.path.join(directory, segment_files(directory)[-1])
+        with open(segment, "r+b") as f:
+            f.truncate(os.path.getsize(segment) - 1)
+
+        box = Outbox(directory)
+        assert [record.payload for record in read_all(box)] == [b"one"]
+        box.append("topic", b"three")
+        assert [record.payload for record in read_all(box)] == [b"one", b"three"]
+
+
+@pytest.mark.describe("Outbox - .append() and .read()")
+class TestOutboxAppendAndRead(object):
+    @pytest.mark.it("Reads records back in the order they were appended")
+    def test_order(self, directory):
+        box = Outbox(directory)
+        for i in range(10):
+            box.append("topic/{}".format(i), "payload {}".format(i))
+        records = read_all(box)
+        assert [record.topic for record in records] == ["topic/{}".format(i) for i in range(10)]
+        assert [record.payload for record in records] == [
+            "payload {}".format(i).encode("utf-8") for i in range(10)
+        ]
+
+    @pytest.mark.it("Returns the position that each record can be read from")
+    def test_position(self, directory):
+        box = Outbox(directory)
+        box.append("topic", b"one")
+        position = box.append("topic", b"two")
+        assert box.read(position).payload == b"two"
+        assert box.read(position).position == position
+
+    @pytest.mark.it("Reads records which were appended after the last read")
+    def test_read_after_append(self, directory):
+        box = Outbox(directory)
+        box.append("topic", b"one")
+        record = box.read(box.committed_position)
+        assert box.read(record.next_position) is None
+        box.append("topic", b"two")
+        assert box.read(record.next_position).payload == b"two"
+
+    @pytest.mark.it("Stores payloads of different types as bytes")
+    @pytest.mark.parametrize(
+        "payload, expected",
+        [
+            pytest.param(b"\x00\x01", b"\x00\x01", id="bytes"),
+            pytest.param("été", "été".encode("utf-8"), id="text"),
+            pytest.param(bytearray(b"data"), b"data", id="bytearray"),
+            pytest.param(42, b"42", id="int"),
+            pytest.param(None, b"", id="None"),
+        ],
+    )
+    def test_payload_types(self, directory, payload, expected):
+        box = Outbox(directory)
+        box.append("topic", payload)
+        assert box.read(box.committed_position).payload == expected
+
+    @pytest.mark.it("Starts a new segment file once the last one is full")
+    def test_segments(self, directory):
+        box = Outbox(directory, segment_bytes=40)
+        for _ in range(5):
+            box.append("topic", b"x" * 20)
+        assert len(segment_files(directory)) == 5
+        assert len(read_all(box)) == 5
+
+
+@pytest.mark.describe("Outbox - .ack()")
+class TestOutboxAck(object):
+    @pytest.mark.it("Moves the committed position past acknowledged records")
+    def test_ack(self, directory):
+        box = Outbox(directory)
+        box.append("topic", b"one")
+        box.append("topic", b"two")
+        first, second = read_all(box)
+        box.ack(first)
+        assert box.committed_position == second.position
+        assert not box.is_empty
+        box.ack(second)
+        assert box.is_empty
+
+    @pytest.mark.it(
+        "Does not move the committed position past a record that has not been acknowledged"
+    )
+    def test_ack_out_of_order(self, directory):
+        box = Outbox(directory)
+        for payload in [b"one", b"two", b"three"]:
+            box.append("topic", payload)
+        first, second, third = read_all(box)
+        box.ack(second)
+        box.ack(third)
+        assert box.committed_position == first.position
+        box.ack(first)
+        assert box.is_empty
+
+    @pytest.mark.it("Deletes segment files once every record in them has been acknowledged")
+    def test_deletes_segments(self, directory):
+        box = Outbox(directory, segment_bytes=1)
+        for payload in [b"one", b"two", b"three"]:
+            box.append("topic", payload)
+        assert len(segment_files(directory)) == 3
+        for record in read_all(box):
+            box.ack(record)
+        assert len(segment_files(directory)) == 1
+        assert box.is_empty
+
+
+@pytest.mark.describe("Outbox - Size limit")
+class TestOutboxSizeLimit(object):
+    @pytest.fixture
+    def record_size(self):
+        return outbox.RECORD_HEADER.size + len("topic") + 20
+
+    @pytest.mark.it(
+        "Drops the oldest records to make room for new ones when using the 'drop_oldest' eviction policy"
+    )
+    def test_drop_oldest(self, directory, record_size):
+        box = Outbox(directory, max_bytes=record_size * 4, eviction_policy=outbox.DROP_OLDEST)
+        for i in range(10):
+            box.append("topic", "{:020d}".format(i))
+        assert box.size_bytes <= record_size * 4
+        payloads = [int(record.payload) for record in read_all(box)]
+        assert payloads == list(range(10 - len(payloads), 10))
+
+    @pytest.mark.it("Moves reads of dropped records forward to the oldest record still stored")
+    def test_read_dropped(self, directory, record_size):
+        box = Outbox(directory, max_bytes=record_size * 4, eviction_policy=outbox.DROP_OLDEST)
+        first = box.append("topic", "{:020d}".format(0))
+        for i in range(1, 10):
+            box.append("topic", "{:020d}".format(i))
+        assert box.read(first).position == box.committed_position
+
+    @pytest.mark.it(
+        "Raises OutboxFullError instead of storing a new record when using the 'reject_new' eviction policy"
+    )
+    def test_reject_new(self, directory, record_size):
+        box = Outbox(directory, max_bytes=record_size * 4, eviction_policy=outbox.REJECT_NEW)
+        for i in range(4):
+            box.append("topic", "{:020d}".format(i))
+        with pytest.raises(OutboxFullError):
+            box.append("topic", "{:020d}".format(4))
+        assert [int(record.payload) for record in read_all(box)] == [0, 1, 2, 3]
+
+    @pytest.mark.it("Raises OutboxFullError if a single record is larger than the size limit")
+    def test_record_too_large(self, directory, record_size):
+        box = Outbox(directory, max_bytes=record_size)
+        with pytest.raises(OutboxFullError):
+            box.append("topic", b"x" * record_size)
+
+    @pytest.mark.it("Does not limit the size if max_bytes is None")
+    def test_no_limit(self, directory):
+        box = Outbox(directory, max_bytes=None, segment_bytes=1024)
+        for _ in range(100):
+            box.append("topic", b"x" * 100)
+        assert len(read_all(box)) == 100
@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import pytest
+import logging
+import json
+from azure.iot.device.common import serializers
+
+logging.basicConfig(level=logging.DEBUG)
+
+document = {"reported": {"temperature": 21.5, "firmware": "1.2.3", "sensors": [1, 2, 3]}}
+
+
+def requires(module, name):
+    return pytest.mark.skipif(module is None, reason="{} is not installed".format(name))
+
+
+json_serializers = [
+    pytest.param("json", id="json"),
+    pytest.param("orjson", id="orjson", marks=requires(serializers.orjson, "orjson")),
+    pytest.param("ujson", id="ujson", marks=requires(serializers.ujson, "ujson")),
+]
+
+all_serializers = json_serializers + [
+    pytest.param("msgpack", id="msgpack", marks=requires(serializers.msgpack, "msgpack")),
+    pytest.param("cbor", id="cbor", marks=requires(serializers.cbor2, "cbor2")),
+]
+
+
+@pytest.mark.describe("Serializer - .dumps() and .loads()")
+class TestSerializerRoundTrip(object):
+    @pytest.mark.it("Deserializes what it serializes")
+    @pytest.mark.parametrize("name", all_serializers)
+    def test_round_trip(self, name):
+        serializer = serializers.get_serializer(name)
+        assert serializer.loads(serializer.dumps(document)) == document
+
+    @pytest.mark.it("Deserializes JSON documents from bytes and from str")
+    @pytest.mark.parametrize("name", json_serializers)
+    def test_loads_json(self, name):
+        serializer = serializers.get_serializer(name)
+        text = json.dumps(document)
+        assert serializer.loads(text.encode("utf-8")) == document
+        assert serializer.loads(text) == document
+
+    @pytest.mark.it("Raises ValueError when deserializing a payload which is not JSON")
+    @pytest.mark.parametrize("name", json_serializers)
+    def test_loads_invalid_json(self, name):
+        with pytest.raises(ValueError):
+            serializers.get_serializer(name).loads(b"__not_json__")
+
+    @pytest.mark.it("Serializes JSON documents which the standard library json module can read")
+    @pytest.mark.parametrize("name", json_serializers)
+    def test_dumps_json(self, name):
+        data = serializers.get_serializer(name).dumps(document)
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        assert json.loads(data) == document
+
+    @pytest.mark.it("Serializes exactly what json.dumps() does when using the json serializer")
+    def test_stdlib_dumps(self):
+        assert serializers.get_serializer("json").dumps(document) == json.dumps(document)
+
+
+@pytest.mark.describe("Serializer - .is_json")
+class TestSerializerIsJson(object):
+    @pytest.mark.it("Is True for JSON serializers")
+    @pytest.mark.parametrize("name", json_serializers)
+    def test_json(self, name):
+        assert serializers.get_serializer(name).is_json
+
+    @pytest.mark.it("Is False for binary serializers")
+    @pytest.mark.parametrize("name", all_serializers[len(json_serializers) :])
+    def test_binary(self, name):
+        assert not serializers.get_serializer(name).is_json
+
+
+@pytest.mark.describe("serializers - .get_serializer()")
+class TestGetSerializer(object):
+    @pytest.mark.it("Returns the serializer registered with the given name")
+    @pytest.mark.parametrize("name", all_serializers)
+    def test_returns_serializer(self, name):
+        assert serializers.get_serializer(name).name == name
+
+    @pytest.mark.it("Returns the fastest installed JSON serializer for 'auto'")
+    def test_auto(self):
+        if serializers.orjson:
+            expected = "orjson"
+        elif serializers.ujson:
+            expected = "ujson"
+        else:
+            expected = "json"
+        assert serializers.get_serializer("auto").name == expected
+
+    @pytest.mark.it("Returns the standard library serializer for 'auto' if no other is installed")
+    def test_auto_fallback(self, mocker):
+        mocker.patch.dict(serializers._serializers)
+        serializers._serializers.pop("orjson", None)
+        serializers._serializers.pop("ujson", None)
+        assert serializers.get_serializer("auto").name == "json"
+
+    @pytest.mark.it("Raises ValueError if no serializer is registered with the given name")
+    @pytest.mark.parametrize("name", ["yaml", None, ["json"]])
+    def test_unknown(self, name):
+        with pytest.raises(ValueError):
+            serializers.get_serializer(name)
+
+
+@pytest.mark.describe("serializers - .register_serializer()")
+class TestRegisterSerializer(object):
+    @pytest.mark.it("Makes the serializer available by name")
+    def test_registers(self, mocker):
+        mocker.patch.dict(serializers._serializers)
+        serializer = serializers.Serializer("custom", "application/json", str, str)
+        serializers.register_serializer(serializer)
+        assert serializers.get_serializer("custom") is serializer
+
+    @pytest.mark.it("Replaces a serializer already registered with the same name")
+    def test_replaces(self, mocker):
+        mocker.patch.dict(serializers._serializers)
+        serializer = serializers.Serializer("json", "application/json", str, str)
+        serializers.register_serializer(serializer)
+        assert serializers.get_serializer("json") is serializer
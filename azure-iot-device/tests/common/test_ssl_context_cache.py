@@ -0,0 +1,192 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import os
+import gc
+import ssl
+from azure.iot.device.common import ssl_context_cache
+from azure.iot.device.common.ssl_context_cache import SessionResumingContext
+from azure.iot.device.common.models.x509 import X509
+
+logging.basicConfig(level=logging.DEBUG)
+
+fake_server_verification_cert = "__fake_server_verification_cert__"
+fake_cipher = "DHE-RSA-AES128-SHA"
+
+
+@pytest.fixture
+def mock_ssl_context_constructor(mocker):
+    # Return a new mock context each time one is created
+    return mocker.patch.object(ssl, "SSLContext", side_effect=lambda **kwargs: mocker.MagicMock())
+
+
+@pytest.fixture
+def x509_cert(tmpdir):
+    cert_file = tmpdir.join("cert.pem")
+    cert_file.write("certificate")
+    key_file = tmpdir.join("key.pem")
+    key_file.write("key")
+    return X509(str(cert_file), str(key_file), "pass_phrase")
+
+
+@pytest.mark.describe("ssl_context_cache - .get_ssl_context()")
+class TestGetSSLContext(object):
+    @pytest.mark.it(
+        "Creates an SSLContext which uses TLS 1.2, requires certificates and checks hostnames"
+    )
+    def test_creates_context(self, mocker, mock_ssl_context_constructor):
+        ssl_context = ssl_context_cache.get_ssl_context()
+        assert mock_ssl_context_constructor.call_count == 1
+        assert mock_ssl_context_constructor.call_args == mocker.call(protocol=ssl.PROTOCOL_TLSv1_2)
+        assert ssl_context.verify_mode == ssl.CERT_REQUIRED
+        assert ssl_context.check_hostname is True
+        assert ssl_context.load_default_certs.call_count == 1
+
+    @pytest.mark.it("Configures the SSLContext with the provided certificates and cipher")
+    def test_configures_context(self, mocker, mock_ssl_context_constructor, x509_cert):
+        ssl_context = ssl_context_cache.get_ssl_context(
+            server_verification_cert=fake_server_verification_cert,
+            x509_cert=x509_cert,
+            cipher=fake_cipher,
+        )
+        assert ssl_context.load_default_certs.call_count == 0
+        assert ssl_context.load_verify_locations.call_args == mocker.call(
+            cadata=fake_server_verification_cert
+        )
+        assert ssl_context.set_ciphers.call_args == mocker.call(fake_cipher)
+        assert ssl_context.load_cert_chain.call_args == mocker.call(
+            x509_cert.certificate_file, x509_cert.key_file, x509_cert.pass_phrase
+        )
+
+    @pytest.mark.it(
+        "Returns the same SSLContext when called again with the same certificates and cipher"
+    )
+    def test_cached(self, mock_ssl_context_constructor, x509_cert):
+        first = ssl_context_cache.get_ssl_context(
+            server_verification_cert=fake_server_verification_cert,
+            x509_cert=x509_cert,
+            cipher=fake_cipher,
+        )
+        second = ssl_context_cache.get_ssl_context(
+            server_verification_cert=fake_server_verification_cert,
+            x509_cert=X509(x509_cert.certificate_file, x509_cert.key_file, x509_cert.pass_phrase),
+            cipher=fake_cipher,
+        )
+        assert second is first
+        assert mock_ssl_context_constructor.call_count == 1
+
+    @pytest.mark.it("Creates a new SSLContext when called with a different certificate or cipher")
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            pytest.param({"server_verification_cert": "other_cert"}, id="server cert"),
+            pytest.param({"x509_cert": X509("other_cert", "other_key")}, id="client cert"),
+            pytest.param({"cipher": "DHE-RSA-AES256-SHA"}, id="cipher"),
+        ],
+    )
+    def test_different_key(self, mock_ssl_context_constructor, kwargs):
+        first = ssl_context_cache.get_ssl_context()
+        second = ssl_context_cache.get_ssl_context(**kwargs)
+        assert second is not first
+        assert mock_ssl_context_constructor.call_count == 2
+
+    @pytest.mark.it("Creates a new SSLContext once the client certificate file has been replaced")
+    def test_cert_replaced(self, mock_ssl_context_constructor, x509_cert):
+        first = ssl_context_cache.get_ssl_context(x509_cert=x509_cert)
+        with open(x509_cert.certificate_file, "w") as f:
+            f.write("new certificate")
+        stat = os.stat(x509_cert.certificate_file)
+        os.utime(x509_cert.certificate_file, (stat.st_atime, stat.st_mtime + 10))
+
+        second = ssl_context_cache.get_ssl_context(x509_cert=x509_cert)
+        assert second is not first
+        assert second.load_cert_chain.call_count == 1
+
+    @pytest.mark.it("Does not keep SSLContexts which are no longer being used")
+    def test_not_kept(self, mock_ssl_context_constructor):
+        ssl_context_cache.get_ssl_context()
+        gc.collect()
+        ssl_context_cache.get_ssl_context()
+        # The first context was released before the second call, so it could not be reused
+        assert mock_ssl_context_constructor.call_count == 2
+
+    @pytest.mark.it("Does not cache an SSLContext that could not be configured")
+    def test_error(self, mocker, mock_ssl_context_constructor, arbitrary_exception):
+        ssl_context = mocker.MagicMock()
+        ssl_context.set_ciphers.side_effect = arbitrary_exception
+        mock_ssl_context_constructor.side_effect = None
+        mock_ssl_context_constructor.return_value = ssl_context
+        with pytest.raises(type(arbitrary_exception)):
+            ssl_context_cache.get_ssl_context(cipher=fake_cipher)
+        ssl_context.set_ciphers.side_effect = None
+        ssl_context_cache.get_ssl_context(cipher=fake_cipher)
+        assert mock_ssl_context_constructor.call_count == 2
+
+
+@pytest.mark.describe("SessionResumingContext")
+class TestSessionResumingContext(object):
+    @pytest.fixture
+    def ssl_context(self, mocker):
+        return mocker.MagicMock()
+
+    @pytest.fixture
+    def context(self, ssl_context):
+        return SessionResumingContext(ssl_context)
+
+    @pytest.mark.it("Passes attributes through to the wrapped SSLContext")
+    def test_attributes(self, context, ssl_context):
+        ssl_context.check_hostname = True
+        assert context.check_hostname is True
+        assert context.verify_mode is ssl_context.verify_mode
+
+    @pytest.mark.it("Wraps sockets without a session until a session has been saved")
+    def test_first_wrap(self, mocker, context, ssl_context):
+        sock = mocker.MagicMock()
+        ssl_sock = context.wrap_socket(
+            sock, server_hostname="hostname", do_handshake_on_connect=False
+        )
+        assert ssl_sock is ssl_context.wrap_socket.return_value
+        assert ssl_context.wrap_socket.call_args == mocker.call(
+            sock, server_hostname="hostname", do_handshake_on_connect=False
+        )
+        assert context.session is None
+
+    @pytest.mark.it(
+        "Saves the session of the last wrapped socket when .save_session() is called, and resumes it when the next socket is wrapped"
+    )
+    def test_resume(self, mocker, context, ssl_context):
+        ssl_context.wrap_socket.return_value.session = "__session__"
+        context.wrap_socket(mocker.MagicMock(), do_handshake_on_connect=False)
+        context.save_session()
+        assert context.session == "__session__"
+
+        sock = mocker.MagicMock()
+        context.wrap_socket(sock, server_hostname="hostname", do_handshake_on_connect=False)
+        assert ssl_context.wrap_socket.call_args == mocker.call(
+            sock, server_hostname="hostname", do_handshake_on_connect=False, session="__session__"
+        )
+
+    @pytest.mark.it(
+        "Saves the session immediately if the handshake is done when the socket is wrapped"
+    )
+    def test_handshake_on_connect(self, mocker, context, ssl_context):
+        ssl_context.wrap_socket.return_value.session = "__session__"
+        context.wrap_socket(mocker.MagicMock(), server_hostname="hostname")
+        assert context.session == "__session__"
+
+    @pytest.mark.it("Keeps the saved session if the last wrapped socket does not have one")
+    def test_no_session(self, mocker, context, ssl_context):
+        context.session = "__session__"
+        ssl_context.wrap_socket.return_value = mocker.MagicMock(spec=[])
+        context.wrap_socket(mocker.MagicMock())
+        assert context.session == "__session__"
+
+    @pytest.mark.it("Does nothing when .save_session() is called before any socket is wrapped")
+    def test_save_before_wrap(self, context):
+        context.save_session()
+        assert context.session is None
@@ -0,0 +1,209 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import threading
+import time
+from azure.iot.device.common import timer_wheel, handle_exceptions
+from azure.iot.device.common.timer_wheel import Timer, TimerWheel
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def wheel(mocker, clock):
+    """TimerWheel driven manually with a fake clock, without starting its threads"""
+    wheel = TimerWheel(resolution=0.01, time_function=clock)
+    mocker.patch.object(wheel, "_ensure_threads")
+    return wheel
+
+
+def schedule(wheel, interval):
+    timer = Timer(interval, lambda: None)
+    wheel.schedule(timer)
+    return timer
+
+
+def advance(wheel, clock, seconds):
+    clock.now += seconds
+    return wheel._advance(wheel._get_tick(clock.now))
+
+
+@pytest.mark.describe("TimerWheel")
+class TestTimerWheel(object):
+    @pytest.mark.it("Expires a timer once its interval has passed, and not before")
+    @pytest.mark.parametrize(
+        "interval",
+        [
+            pytest.param(0.05, id="Level 0"),
+            pytest.param(10, id="Level 1"),
+            pytest.param(1000, id="Level 2"),
+            pytest.param(100000, id="Level 3"),
+            pytest.param(1000000, id="Beyond the end of the wheel"),
+        ],
+    )
+    def test_expires(self, wheel, clock, interval):
+        timer = schedule(wheel, interval)
+        assert advance(wheel, clock, interval - 0.02) == []
+        assert wheel.pending_count == 1
+        assert advance(wheel, clock, 0.05) == [timer]
+        assert wheel.pending_count == 0
+
+    @pytest.mark.it("Expires a timer when the wheel is advanced in many small steps")
+    def test_expires_small_steps(self, wheel, clock):
+        timer = schedule(wheel, 5)
+        expired = []
+        for _ in range(510):
+            expired += advance(wheel, clock, 0.01)
+        assert expired == [timer]
+
+    @pytest.mark.it("Expires timers in the order of their intervals")
+    def test_expires_in_order(self, wheel, clock):
+        timers = [schedule(wheel, interval) for interval in [300, 0.5, 20, 3, 0.02]]
+        expired = []
+        for _ in range(400):
+            expired += advance(wheel, clock, 1)
+        assert expired == sorted(timers, key=lambda t: t.interval)
+
+    @pytest.mark.it("Does not expire a timer that has been cancelled")
+    @pytest.mark.parametrize("interval", [0.05, 10, 1000])
+    def test_cancel(self, wheel, clock, interval):
+        timer = schedule(wheel, interval)
+        wheel.cancel(timer)
+        assert wheel.pending_count == 0
+        assert advance(wheel, clock, interval + 1) == []
+
+    @pytest.mark.it("Does nothing when cancelling a timer which has already expired")
+    def test_cancel_after_expire(self, wheel, clock):
+        timer = schedule(wheel, 1)
+        assert advance(wheel, clock, 2) == [timer]
+        wheel.cancel(timer)
+        assert wheel.pending_count == 0
+
+    @pytest.mark.it("Reports no next event when no timers are pending")
+    def test_no_next_event(self, wheel):
+        assert wheel._get_next_event_tick() is None
+
+
+@pytest.mark.describe("Timer")
+class TestTimer(object):
+    @pytest.fixture
+    def shared_wheel(self, mocker):
+        wheel = TimerWheel(resolution=0.001)
+        mocker.patch.object(timer_wheel, "get_shared_timer_wheel", return_value=wheel)
+        return wheel
+
+    @pytest.mark.it("Calls the function with the provided args and kwargs after the interval")
+    def test_calls_function(self, mocker, shared_wheel):
+        called = threading.Event()
+        function = mocker.MagicMock(side_effect=lambda *args, **kwargs: called.set())
+        start = time.time()
+        timer = Timer(0.05, function, args=[1, 2], kwargs={"three": 3})
+        timer.start()
+        assert called.wait(5)
+        assert time.time() - start >= 0.05
+        assert function.call_args == mocker.call(1, 2, three=3)
+
+    @pytest.mark.it("Does not call the function if cancelled before the interval passes")
+    def test_cancel(self, mocker, shared_wheel):
+        function = mocker.MagicMock()
+        timer = Timer(0.05, function)
+        timer.start()
+        timer.cancel()
+        time.sleep(0.2)
+        assert function.call_count == 0
+
+    @pytest.mark.it("Can be cancelled before it is started")
+    def test_cancel_unstarted(self, mocker, shared_wheel):
+        function = mocker.MagicMock()
+        timer = Timer(0.05, function)
+        timer.cancel()
+        assert function.call_count == 0
+
+    @pytest.mark.it("Raises a RuntimeError if started more than once")
+    def test_start_twice(self, mocker, shared_wheel):
+        timer = Timer(10, mocker.MagicMock())
+        timer.start()
+        with pytest.raises(RuntimeError):
+            timer.start()
+        timer.cancel()
+
+    @pytest.mark.it("Sends exceptions raised by the function to the background exception handler")
+    def test_function_raises(self, mocker, shared_wheel, arbitrary_exception):
+        handled = threading.Event()
+        mock_handler = mocker.patch.object(
+            handle_exceptions,
+            "handle_background_exception",
+            side_effect=lambda e: handled.set(),
+        )
+        Timer(0.01, mocker.MagicMock(side_effect=arbitrary_exception)).start()
+        assert handled.wait(5)
+        assert mock_handler.call_args == mocker.call(arbitrary_exception)
+
+    @pytest.mark.it("Does not start a new thread for each timer")
+    def test_thread_count(self, mocker, shared_wheel):
+        # Run one timer first so that the wheel's own threads are already running
+        called = threading.Event()
+        Timer(0.01, called.set).start()
+        assert called.wait(5)
+
+        timers = [Timer(60, mocker.MagicMock()) for _ in range(100)]
+        for timer in timers:
+            timer.start()
+        # The timer wheel thread, and the one callback thread that ran the first timer
+        assert len(get_wheel_threads(shared_wheel)) <= 2
+
+        for timer in timers:
+            timer.cancel()
+        assert shared_wheel.pending_count == 0
+
+    @pytest.mark.it("Runs no more timer functions at once than it has callback threads")
+    def test_callback_thread_count(self, mocker, shared_wheel):
+        release = threading.Event()
+        running = []
+        all_running = threading.Event()
+
+        def function():
+            running.append(threading.current_thread())
+            if len(running) == shared_wheel.callback_threads:
+                all_running.set()
+            release.wait(5)
+
+        for _ in range(shared_wheel.callback_threads * 3):
+            Timer(0.01, function).start()
+        assert all_running.wait(5)
+        time.sleep(0.1)
+        assert len(running) == shared_wheel.callback_threads
+        assert len(set(running)) == shared_wheel.callback_threads
+        release.set()
+
+    @pytest.mark.it("Runs timer functions while another timer function is blocked")
+    def test_blocked_function(self, mocker, shared_wheel):
+        release = threading.Event()
+        called = threading.Event()
+        Timer(0.01, release.wait, args=[5]).start()
+        Timer(0.02, called.set).start()
+        assert called.wait(5)
+        release.set()
+
+
+def get_wheel_threads(wheel):
+    """The threads started by a TimerWheel, as opposed to every thread in the process"""
+    return [wheel._thread] + list(wheel._executor._threads)
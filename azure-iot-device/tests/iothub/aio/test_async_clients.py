@@ -17,8 +17,13 @@ from azure.iot.device.iothub.pipeline import IoTHubPipeline, constant
 from azure.iot.device.iothub.pipeline import exceptions as pipeline_exceptions
 from azure.iot.device.iothub.models import Message, MethodRequest
 from azure.iot.device.iothub.aio.async_inbox import AsyncClientInbox
+from azure.iot.device.iothub.aio.async_method_dispatcher import AsyncMethodDispatcher
+from azure.iot.device.iothub.twin_cache import TwinCache
+from azure.iot.device.iothub.inbox_manager import InboxManager
 from azure.iot.device.common import async_adapter
+from azure.iot.device.common.pipeline import pipeline_thread
 from azure.iot.device.iothub.auth import IoTEdgeError
+from azure.iot.device.iothub.auth import sas_token_service
 import sys
 from azure.iot.device import constant as device_constant
 
@@ -161,6 +166,244 @@ class SharedClientCreateMethodUserOptionTests(object):
 
         assert config.cipher == cipher
 
+    @pytest.mark.it(
+        "Sets the 'max_in_flight_publishes' and 'max_queued_publish_bytes' user option parameters on the PipelineConfig, if provided"
+    )
+    async def test_publish_limit_options(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(
+            *create_method_args, max_in_flight_publishes=10, max_queued_publish_bytes=4096
+        )
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.max_in_flight_publishes == 10
+        assert config.max_queued_publish_bytes == 4096
+
+    @pytest.mark.it("Sets the outbox user option parameters on the PipelineConfig, if provided")
+    async def test_outbox_options(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(
+            *create_method_args,
+            outbox_directory="/var/outbox",
+            outbox_max_bytes=4096,
+            outbox_eviction_policy="reject_new",
+            outbox_replay_concurrency=2
+        )
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.outbox_directory == "/var/outbox"
+        assert config.outbox_max_bytes == 4096
+        assert config.outbox_eviction_policy == "reject_new"
+        assert config.outbox_replay_concurrency == 2
+
+    @pytest.mark.it(
+        "Sets the 'telemetry_qos' user option parameter on the PipelineConfig, if provided"
+    )
+    async def test_telemetry_qos_option(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(*create_method_args, telemetry_qos=0)
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.telemetry_qos == 0
+
+    @pytest.mark.it(
+        "Sets the 'shared_network_loop' user option parameter on the PipelineConfig, if provided"
+    )
+    async def test_shared_network_loop_option(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(*create_method_args, shared_network_loop=True)
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.shared_network_loop is True
+
+    @pytest.mark.it(
+        "Sets the 'make_before_break_reauthorization' user option parameter on the PipelineConfig, if provided"
+    )
+    async def test_make_before_break_reauthorization_option(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(*create_method_args, make_before_break_reauthorization=True)
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.make_before_break_reauthorization is True
+
+    @pytest.mark.it(
+        "Sets the 'compression' and 'compression_threshold' user option parameters on the PipelineConfig, if provided"
+    )
+    async def test_compression_options(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(*create_method_args, compression="gzip", compression_threshold=256)
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.compression == "gzip"
+        assert config.compression_threshold == 256
+
+    @pytest.mark.it(
+        "Sets the 'reported_properties_window' and 'reported_properties_max_bytes' user option parameters on the PipelineConfig, if provided"
+    )
+    async def test_reported_properties_options(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(
+            *create_method_args, reported_properties_window=0.5, reported_properties_max_bytes=4096
+        )
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.reported_properties_window == 0.5
+        assert config.reported_properties_max_bytes == 4096
+
+    @pytest.mark.it(
+        "Sets the 'json_serializer' and 'payload_serializer' user option parameters on the PipelineConfig, if provided"
+    )
+    async def test_serializer_options(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        client_create_method(*create_method_args, json_serializer="json", payload_serializer="json")
+
+        # Get configuration object, and ensure it was used for both protocol pipelines
+        assert mock_mqtt_pipeline_init.call_count == 1
+        config = mock_mqtt_pipeline_init.call_args[0][1]
+        assert config == mock_http_pipeline_init.call_args[0][1]
+
+        assert config.json_serializer.name == "json"
+        assert config.payload_serializer.name == "json"
+
+    @pytest.mark.it(
+        "Applies the 'inbox_capacity', 'inbox_overflow_policy' and 'inbox_spill_directory' user option parameters to the inboxes of the client, if provided"
+    )
+    async def test_inbox_options(
+        self, mocker, option_test_required_patching, client_create_method, create_method_args
+    ):
+        spy_set_capacity = mocker.spy(InboxManager, "set_capacity")
+        client = client_create_method(
+            *create_method_args,
+            inbox_capacity=100,
+            inbox_overflow_policy="spill",
+            inbox_spill_directory="some_directory"
+        )
+
+        # Called once by the initializer of the client, and again to apply the options
+        assert spy_set_capacity.call_count == 2
+        assert spy_set_capacity.call_args == mocker.call(
+            client._inbox_manager,
+            capacity=100,
+            overflow_policy="spill",
+            spill_directory="some_directory",
+        )
+
+    @pytest.mark.it(
+        "Raises ValueError if the 'inbox_overflow_policy' user option is 'block' with an 'inbox_capacity' after the asyncio pipeline has been enabled"
+    )
+    async def test_block_inbox_option_with_asyncio_pipeline(
+        self, mocker, option_test_required_patching, client_create_method, create_method_args
+    ):
+        mocker.patch.object(
+            pipeline_thread, "get_event_loop", return_value=asyncio.get_event_loop()
+        )
+        with pytest.raises(ValueError):
+            client_create_method(
+                *create_method_args, inbox_capacity=100, inbox_overflow_policy="block"
+            )
+
+    @pytest.mark.it("Enables the twin cache of the client, if the 'twin_cache' option is True")
+    async def test_twin_cache_option(
+        self, option_test_required_patching, client_create_method, create_method_args
+    ):
+        client = client_create_method(*create_method_args, twin_cache=True)
+        assert isinstance(client._twin_cache, TwinCache)
+
+    @pytest.mark.it("Does not enable the twin cache of the client by default")
+    async def test_twin_cache_default(
+        self, option_test_required_patching, client_create_method, create_method_args
+    ):
+        client = client_create_method(*create_method_args)
+        assert client._twin_cache is None
+
+    @pytest.mark.it("Does not limit the capacity of the inboxes of the client by default")
+    async def test_inbox_default(
+        self, mocker, option_test_required_patching, client_create_method, create_method_args
+    ):
+        spy_set_capacity = mocker.spy(InboxManager, "set_capacity")
+        client = client_create_method(*create_method_args)
+
+        assert spy_set_capacity.call_count == 1
+        assert spy_set_capacity.call_args[0][1] is None
+        client._inbox_manager.c2d_message_inbox._put("item")
+        assert client._inbox_manager.c2d_message_inbox.dropped_count == 0
+
     @pytest.mark.it(
         "Sets the 'server_verification_cert' user option parameter on the AuthenticationProvider, if provided"
     )
@@ -181,6 +424,15 @@ class SharedClientCreateMethodUserOptionTests(object):
 
         assert auth.server_verification_cert == server_verification_cert
 
+    @pytest.mark.it(
+        "Raises a TypeError if the 'trust_bundle_cache_directory' user option parameter is provided"
+    )
+    async def test_trust_bundle_cache_directory_option(
+        self, option_test_required_patching, client_create_method, create_method_args
+    ):
+        with pytest.raises(TypeError):
+            client_create_method(*create_method_args, trust_bundle_cache_directory="fake/directory")
+
     @pytest.mark.it("Raises a TypeError if an invalid user option parameter is provided")
     async def test_invalid_option(
         self,
@@ -280,6 +532,24 @@ class SharedClientCreateFromConnectionStringTests(object):
 
         assert isinstance(client, client_class)
 
+    @pytest.mark.it(
+        "Has the SymmetricKeyAuthenticationProvider renew its SAS token from the shared SasTokenService, if the 'shared_sas_token_service' user option parameter is True"
+    )
+    async def test_shared_sas_token_service_option(
+        self, client_class, connection_string, mock_mqtt_pipeline_init
+    ):
+        client_class.create_from_connection_string(connection_string, shared_sas_token_service=True)
+        auth_provider = mock_mqtt_pipeline_init.call_args[0][0]
+        assert auth_provider.token_service is sas_token_service.get_shared_sas_token_service()
+
+    @pytest.mark.it("Has the SymmetricKeyAuthenticationProvider renew its own SAS token by default")
+    async def test_shared_sas_token_service_default(
+        self, client_class, connection_string, mock_mqtt_pipeline_init
+    ):
+        client_class.create_from_connection_string(connection_string)
+        auth_provider = mock_mqtt_pipeline_init.call_args[0][0]
+        assert auth_provider.token_service is None
+
     # TODO: If auth package was refactored to use ConnectionString class, tests from that
     # class would increase the coverage here.
     @pytest.mark.it("Raises ValueError when given an invalid connection string")
@@ -414,30 +684,274 @@ class SharedClientDisconnectTests(object):
         def fail_disconnect(callback):
             callback(error=my_pipeline_error)
 
-        iothub_pipeline.disconnect = mocker.MagicMock(side_effect=fail_disconnect)
-        with pytest.raises(client_error) as e_info:
-            await client.disconnect()
-        assert e_info.value.__cause__ is my_pipeline_error
-        assert iothub_pipeline.disconnect.call_count == 1
+        iothub_pipeline.disconnect = mocker.MagicMock(side_effect=fail_disconnect)
+        with pytest.raises(client_error) as e_info:
+            await client.disconnect()
+        assert e_info.value.__cause__ is my_pipeline_error
+        assert iothub_pipeline.disconnect.call_count == 1
+
+
+class SharedClientDisconnectEventTests(object):
+    @pytest.mark.it("Clears all pending MethodRequests upon disconnect")
+    async def test_state_change_handler_clears_method_request_inboxes_on_disconnect(
+        self, client, mocker
+    ):
+        clear_method_request_spy = mocker.spy(client._inbox_manager, "clear_all_method_requests")
+        client._on_disconnected()
+        assert clear_method_request_spy.call_count == 1
+
+
+class SharedClientSendD2CMessageBatchTests(object):
+    @pytest.fixture
+    def messages(self):
+        return [Message("msg1"), Message("msg2")]
+
+    @pytest.mark.it(
+        "Compresses each message with the pipeline before checking its size, so that the size limit applies to the compressed message"
+    )
+    async def test_compresses_before_size_check(self, client, iothub_pipeline, messages):
+        messages.append(Message("a" * 300000))
+
+        def compress(message):
+            return Message(b"compressed", content_encoding="gzip")
+
+        iothub_pipeline.encode_message.side_effect = compress
+        await client.send_message_batch(messages)
+        assert iothub_pipeline.encode_message.call_count == 3
+        assert iothub_pipeline.send_message_batch.call_count == 1
+        sent_messages = iothub_pipeline.send_message_batch.call_args[0][0]
+        assert [m.data for m in sent_messages] == [b"compressed"] * 3
+
+    @pytest.mark.it("Begins a single 'send_message_batch' pipeline operation")
+    async def test_calls_pipeline_send_message_batch(self, client, iothub_pipeline, messages):
+        await client.send_message_batch(messages)
+        assert iothub_pipeline.send_message_batch.call_count == 1
+        assert iothub_pipeline.send_message_batch.call_args[0][0] == messages
+        assert iothub_pipeline.send_message.call_count == 0
+
+    @pytest.mark.it(
+        "Waits for the pipeline's publish window before beginning the 'send_message_batch' pipeline operation, if the pipeline is applying backpressure"
+    )
+    async def test_waits_for_publish_window(self, mocker, client, iothub_pipeline, messages):
+        iothub_pipeline.publish_window_open = False
+
+        def check_not_sent(callback):
+            assert iothub_pipeline.send_message_batch.call_count == 0
+            callback()
+
+        iothub_pipeline.wait_for_publish_window.side_effect = check_not_sent
+        await client.send_message_batch(messages)
+        assert iothub_pipeline.wait_for_publish_window.call_count == 1
+        assert iothub_pipeline.send_message_batch.call_count == 1
+
+    @pytest.mark.it(
+        "Does not wait for the pipeline's publish window if the pipeline is not applying backpressure"
+    )
+    async def test_no_backpressure(self, client, iothub_pipeline, messages):
+        iothub_pipeline.publish_window_open = True
+        await client.send_message_batch(messages)
+        assert iothub_pipeline.wait_for_publish_window.call_count == 0
+        assert iothub_pipeline.send_message_batch.call_count == 1
+
+    @pytest.mark.it(
+        "Waits for the completion of the 'send_message_batch' pipeline operation before returning"
+    )
+    async def test_waits_for_pipeline_op_completion(
+        self, mocker, client, iothub_pipeline, messages
+    ):
+        cb_mock = mocker.patch.object(async_adapter, "AwaitableCallback").return_value
+        cb_mock.completion.return_value = await create_completed_future([None, None])
+
+        await client.send_message_batch(messages)
+
+        # Assert callback is sent to pipeline
+        assert iothub_pipeline.send_message_batch.call_args[1]["callback"] is cb_mock
+        # Assert callback completion is waited upon
+        assert cb_mock.completion.call_count == 1
+
+    @pytest.mark.it("Returns None for each message that was sent successfully")
+    async def test_returns_results(self, client, iothub_pipeline, messages):
+        results = await client.send_message_batch(messages)
+        assert results == [None, None]
+
+    @pytest.mark.it(
+        "Returns a client error in place of each message whose publish failed with a pipeline error"
+    )
+    @pytest.mark.parametrize(
+        "pipeline_error,client_error",
+        [
+            pytest.param(
+                pipeline_exceptions.ConnectionDroppedError,
+                client_exceptions.ConnectionDroppedError,
+                id="ConnectionDroppedError->ConnectionDroppedError",
+            ),
+            pytest.param(
+                pipeline_exceptions.ConnectionFailedError,
+                client_exceptions.ConnectionFailedError,
+                id="ConnectionFailedError->ConnectionFailedError",
+            ),
+            pytest.param(
+                pipeline_exceptions.UnauthorizedError,
+                client_exceptions.CredentialError,
+                id="UnauthorizedError->CredentialError",
+            ),
+            pytest.param(
+                pipeline_exceptions.ProtocolClientError,
+                client_exceptions.ClientError,
+                id="ProtocolClientError->ClientError",
+            ),
+            pytest.param(Exception, client_exceptions.ClientError, id="Exception->ClientError"),
+        ],
+    )
+    async def test_returns_per_message_error(
+        self, mocker, client, iothub_pipeline, messages, client_error, pipeline_error
+    ):
+        my_pipeline_error = pipeline_error()
+
+        def partially_fail_send_message_batch(messages, callback):
+            callback(results=[None, my_pipeline_error])
+
+        iothub_pipeline.send_message_batch = mocker.MagicMock(
+            side_effect=partially_fail_send_message_batch
+        )
+        results = await client.send_message_batch(messages)
+        assert results[0] is None
+        assert isinstance(results[1], client_error)
+        assert results[1].__cause__ is my_pipeline_error
+
+    @pytest.mark.it(
+        "Raises a client error if the `send_message_batch` pipeline operation calls back with a pipeline error"
+    )
+    @pytest.mark.parametrize(
+        "pipeline_error,client_error",
+        [
+            pytest.param(
+                pipeline_exceptions.ConnectionDroppedError,
+                client_exceptions.ConnectionDroppedError,
+                id="ConnectionDroppedError->ConnectionDroppedError",
+            ),
+            pytest.param(
+                pipeline_exceptions.ConnectionFailedError,
+                client_exceptions.ConnectionFailedError,
+                id="ConnectionFailedError->ConnectionFailedError",
+            ),
+            pytest.param(
+                pipeline_exceptions.UnauthorizedError,
+                client_exceptions.CredentialError,
+                id="UnauthorizedError->CredentialError",
+            ),
+            pytest.param(
+                pipeline_exceptions.ProtocolClientError,
+                client_exceptions.ClientError,
+                id="ProtocolClientError->ClientError",
+            ),
+            pytest.param(Exception, client_exceptions.ClientError, id="Exception->ClientError"),
+        ],
+    )
+    async def test_raises_error_on_pipeline_op_error(
+        self, mocker, client, iothub_pipeline, messages, client_error, pipeline_error
+    ):
+        my_pipeline_error = pipeline_error()
+
+        def fail_send_message_batch(messages, callback):
+            callback(error=my_pipeline_error, results=None)
+
+        iothub_pipeline.send_message_batch = mocker.MagicMock(side_effect=fail_send_message_batch)
+        with pytest.raises(client_error) as e_info:
+            await client.send_message_batch(messages)
+        assert e_info.value.__cause__ is my_pipeline_error
+        assert iothub_pipeline.send_message_batch.call_count == 1
+
+    @pytest.mark.it(
+        "Wraps each item in the 'messages' input parameter in a Message object if it is not a Message object"
+    )
+    async def test_wraps_data_in_message(self, client, iothub_pipeline):
+        message_inputs = ["message", 222, {"a": 2}]
+        await client.send_message_batch(message_inputs)
+        sent_messages = iothub_pipeline.send_message_batch.call_args[0][0]
+        assert len(sent_messages) == len(message_inputs)
+        for sent_message, message_input in zip(sent_messages, message_inputs):
+            assert isinstance(sent_message, Message)
+            assert sent_message.data == message_input
+
+    @pytest.mark.it(
+        "Raises error without sending anything when any message size is greater than 256 KB"
+    )
+    async def test_raises_error_when_message_size_greater_than_256(
+        self, client, iothub_pipeline, messages
+    ):
+        messages.append(Message("serpensortia" * 256000))
+        with pytest.raises(ValueError) as e_info:
+            await client.send_message_batch(messages)
+        assert "256 KB" in e_info.value.args[0]
+        assert iothub_pipeline.send_message_batch.call_count == 0
+
+    @pytest.mark.it(
+        "Sends the messages returned by the pipeline's encoding, and leaves the messages passed in unchanged"
+    )
+    async def test_sends_encoded_messages(self, client, iothub_pipeline, messages):
+        def compress(message):
+            return Message(b"compressed", content_encoding="gzip")
 
+        iothub_pipeline.encode_message.side_effect = compress
+        await client.send_message_batch(messages)
+        sent_messages = iothub_pipeline.send_message_batch.call_args[0][0]
+        assert [m.data for m in sent_messages] == [b"compressed", b"compressed"]
+        assert [m.data for m in messages] == ["msg1", "msg2"]
+        assert [m.content_encoding for m in messages] == [None, None]
 
-class SharedClientDisconnectEventTests(object):
-    @pytest.mark.it("Clears all pending MethodRequests upon disconnect")
-    async def test_state_change_handler_clears_method_request_inboxes_on_disconnect(
-        self, client, mocker
-    ):
-        clear_method_request_spy = mocker.spy(client._inbox_manager, "clear_all_method_requests")
-        client._on_disconnected()
-        assert clear_method_request_spy.call_count == 1
+    @pytest.mark.it("Returns an empty list without calling the pipeline if the batch is empty")
+    async def test_empty_batch(self, client, iothub_pipeline):
+        assert await client.send_message_batch([]) == []
+        assert iothub_pipeline.send_message_batch.call_count == 0
 
 
 class SharedClientSendD2CMessageTests(object):
+    @pytest.mark.it(
+        "Compresses the message with the pipeline before checking its size, so that the size limit applies to the compressed message"
+    )
+    async def test_compresses_before_size_check(self, client, iothub_pipeline):
+        message = Message("a" * 300000)
+
+        def compress(message):
+            return Message(b"compressed", content_encoding="gzip")
+
+        iothub_pipeline.encode_message.side_effect = compress
+        await client.send_message(message)
+        assert iothub_pipeline.encode_message.call_count == 1
+        assert iothub_pipeline.send_message.call_count == 1
+        assert iothub_pipeline.send_message.call_args[0][0].data == b"compressed"
+
     @pytest.mark.it("Begins a 'send_message' pipeline operation")
     async def test_calls_pipeline_send_message(self, client, iothub_pipeline, message):
         await client.send_message(message)
         assert iothub_pipeline.send_message.call_count == 1
         assert iothub_pipeline.send_message.call_args[0][0] is message
 
+    @pytest.mark.it(
+        "Waits for the pipeline's publish window before beginning the 'send_message' pipeline operation, if the pipeline is applying backpressure"
+    )
+    async def test_waits_for_publish_window(self, mocker, client, iothub_pipeline, message):
+        iothub_pipeline.publish_window_open = False
+
+        def check_not_sent(callback):
+            assert iothub_pipeline.send_message.call_count == 0
+            callback()
+
+        iothub_pipeline.wait_for_publish_window.side_effect = check_not_sent
+        await client.send_message(message)
+        assert iothub_pipeline.wait_for_publish_window.call_count == 1
+        assert iothub_pipeline.send_message.call_count == 1
+
+    @pytest.mark.it(
+        "Does not wait for the pipeline's publish window if the pipeline is not applying backpressure"
+    )
+    async def test_no_backpressure(self, client, iothub_pipeline, message):
+        iothub_pipeline.publish_window_open = True
+        await client.send_message(message)
+        assert iothub_pipeline.wait_for_publish_window.call_count == 0
+        assert iothub_pipeline.send_message.call_count == 1
+
     @pytest.mark.it(
         "Waits for the completion of the 'send_message' pipeline operation before returning"
     )
@@ -478,6 +992,11 @@ class SharedClientSendD2CMessageTests(object):
                 client_exceptions.ClientError,
                 id="ProtocolClientError->ClientError",
             ),
+            pytest.param(
+                pipeline_exceptions.PublishQueueFullError,
+                client_exceptions.ClientError,
+                id="PublishQueueFullError->ClientError",
+            ),
             pytest.param(Exception, client_exceptions.ClientError, id="Exception->ClientError"),
         ],
     )
@@ -539,12 +1058,9 @@ class SharedClientSendD2CMessageTests(object):
 
     @pytest.mark.it("Does not raises error when message data size is equal to 256 KB")
     async def test_raises_error_when_message_data_equal_to_256(self, client, iothub_pipeline):
-        data_input = "a" * 262095
+        data_input = "a" * 262144
         message = Message(data_input)
-        # This check was put as message class may undergo the default content type encoding change
-        # and the above calculation will change.
-        if message.get_size() != device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
-            assert False
+        assert message.get_size() == device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT
 
         await client.send_message(message)
 
@@ -629,6 +1145,131 @@ class SharedClientReceiveMethodRequestTests(object):
         assert received_request is received_request
 
 
+class SharedClientReceiveMethodRequestsTests(object):
+    @pytest.mark.it("Implicitly enables methods feature if not already enabled")
+    async def test_enables_methods_only_if_not_already_enabled(
+        self, mocker, client, iothub_pipeline
+    ):
+        # patch this so receive_method_requests won't block
+        mocker.patch.object(
+            AsyncClientInbox,
+            "get_batch",
+            new=mocker.MagicMock(return_value=(await create_completed_future([]))),
+        )
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = False
+        await client.receive_method_requests()
+        assert iothub_pipeline.enable_feature.call_count == 1
+        assert iothub_pipeline.enable_feature.call_args[0][0] == constant.METHODS
+
+        iothub_pipeline.enable_feature.reset_mock()
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = True
+        await client.receive_method_requests()
+        assert iothub_pipeline.enable_feature.call_count == 0
+
+    @pytest.mark.it("Returns a batch of MethodRequests from the corresponding method inbox")
+    @pytest.mark.parametrize(
+        "method_name",
+        [pytest.param(None, id="Generic Method"), pytest.param("method_x", id="Named Method")],
+    )
+    async def test_returns_batch_from_method_inbox(self, mocker, client, method_name):
+        requests = [
+            MethodRequest(request_id=str(i), name="some_method", payload={"key": "value"})
+            for i in range(3)
+        ]
+        inbox_mock = mocker.MagicMock(autospec=AsyncClientInbox)
+        inbox_mock.get_batch.return_value = await create_completed_future(requests)
+        manager_get_inbox_mock = mocker.patch.object(
+            target=client._inbox_manager,
+            attribute="get_method_request_inbox",
+            return_value=inbox_mock,
+        )
+
+        received_requests = await client.receive_method_requests(method_name, max_count=5)
+        assert manager_get_inbox_mock.call_args == mocker.call(method_name)
+        assert inbox_mock.get_batch.call_count == 1
+        assert inbox_mock.get_batch.call_args == mocker.call(max_items=5)
+        assert received_requests is requests
+
+    @pytest.mark.it("Returns an empty list if no method request arrives before the timeout")
+    async def test_times_out(self, client):
+        assert await client.receive_method_requests(timeout=0.01) == []
+
+
+class SharedClientOnMethodRequestTests(object):
+    @pytest.mark.it("Implicitly enables methods feature if not already enabled")
+    async def test_enables_methods_only_if_not_already_enabled(self, client, iothub_pipeline):
+        iothub_pipeline.feature_enabled.__getitem__.return_value = False
+        await client.on_method_request("some_method", lambda request: None)
+        assert iothub_pipeline.enable_feature.call_count == 1
+        assert iothub_pipeline.enable_feature.call_args[0][0] == constant.METHODS
+
+        iothub_pipeline.enable_feature.reset_mock()
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = True
+        await client.on_method_request("some_other_method", lambda request: None)
+        assert iothub_pipeline.enable_feature.call_count == 0
+
+    @pytest.mark.it(
+        "Sets an AsyncMethodDispatcher for the handler as the method request handler of the inbox manager"
+    )
+    @pytest.mark.parametrize(
+        "method_name",
+        [pytest.param(None, id="Generic Method"), pytest.param("method_x", id="Named Method")],
+    )
+    async def test_sets_dispatcher(self, mocker, client, method_name):
+        handler = mocker.MagicMock()
+        set_handler_spy = mocker.spy(client._inbox_manager, "set_method_request_handler")
+        await client.on_method_request(method_name, handler, max_concurrency=4)
+
+        assert set_handler_spy.call_count == 1
+        assert set_handler_spy.call_args[0][0] == method_name
+        dispatcher = set_handler_spy.call_args[0][1]
+        assert isinstance(dispatcher, AsyncMethodDispatcher)
+        assert dispatcher.handler is handler
+        assert dispatcher.max_concurrency == 4
+
+    @pytest.mark.it(
+        "Calls the handler with received method requests, and sends the response through the pipeline"
+    )
+    async def test_handles_method_requests(self, client, iothub_pipeline):
+        method_request = MethodRequest(request_id="1", name="some_method", payload=None)
+
+        async def handler(request):
+            return {"handled": request.request_id}
+
+        await client.on_method_request("some_method", handler)
+
+        client._inbox_manager.route_method_request(method_request)
+        for _ in range(100):
+            if iothub_pipeline.send_method_response.call_count:
+                break
+            await asyncio.sleep(0.01)
+        assert iothub_pipeline.send_method_response.call_count == 1
+        method_response = iothub_pipeline.send_method_response.call_args[0][0]
+        assert method_response.request_id == "1"
+        assert method_response.status == 200
+        assert method_response.payload == {"handled": "1"}
+
+    @pytest.mark.it(
+        "Closes the dispatcher of the previous handler, and routes method requests to an inbox again, when the handler is None"
+    )
+    async def test_removes_handler(self, mocker, client):
+        await client.on_method_request("some_method", mocker.MagicMock())
+        dispatcher = client._inbox_manager.method_request_handlers["some_method"]
+        close_spy = mocker.spy(dispatcher, "close")
+
+        await client.on_method_request("some_method", None)
+        assert close_spy.call_count == 1
+        assert "some_method" not in client._inbox_manager.method_request_handlers
+
+    @pytest.mark.it("Raises ValueError if max_concurrency is less than 1")
+    async def test_invalid_max_concurrency(self, client):
+        with pytest.raises(ValueError):
+            await client.on_method_request("some_method", lambda request: None, max_concurrency=0)
+
+
 class SharedClientSendMethodResponseTests(object):
     @pytest.mark.it("Begins a 'send_method_response' pipeline operation")
     async def test_send_method_response_calls_pipeline(
@@ -700,6 +1341,79 @@ class SharedClientSendMethodResponseTests(object):
         assert iothub_pipeline.send_method_response.call_count == 1
 
 
+class SharedClientTwinCacheTests(object):
+    @pytest.fixture
+    def twin_client(self, client, iothub_pipeline):
+        """A client with the twin cache enabled, whose pipeline returns twins by version"""
+        client._enable_twin_cache()
+        self.twin_version = 1
+
+        def get_twin(callback):
+            callback(twin={"desired": {"interval": 30, "$version": self.twin_version}})
+
+        iothub_pipeline.get_twin.side_effect = get_twin
+        return client
+
+    @pytest.mark.it("Retrieves the twin from the pipeline only the first time")
+    async def test_fetches_once(self, twin_client, iothub_pipeline):
+        twin1 = await twin_client.get_twin()
+        twin2 = await twin_client.get_twin()
+        assert iothub_pipeline.get_twin.call_count == 1
+        assert twin1 == twin2
+        assert twin1 is not twin2
+
+    @pytest.mark.it("Enables twin patches before retrieving the twin, if not already enabled")
+    async def test_enables_twin_patches(self, twin_client, iothub_pipeline):
+        iothub_pipeline.feature_enabled.__getitem__.return_value = False
+        await twin_client.get_twin()
+        enabled = [call[0][0] for call in iothub_pipeline.enable_feature.call_args_list]
+        assert enabled == [constant.TWIN_PATCHES, constant.TWIN]
+
+    @pytest.mark.it("Applies desired property patches to the cached twin")
+    async def test_applies_patches(self, twin_client, iothub_pipeline):
+        await twin_client.get_twin()
+        iothub_pipeline.on_twin_patch_received({"interval": 10, "$version": 2})
+        twin = await twin_client.get_twin()
+        assert twin["desired"] == {"interval": 10, "$version": 2}
+        assert iothub_pipeline.get_twin.call_count == 1
+
+    @pytest.mark.it("Retrieves the twin again if a desired property patch was missed")
+    async def test_refetches_on_gap(self, twin_client, iothub_pipeline):
+        await twin_client.get_twin()
+        self.twin_version = 3
+        iothub_pipeline.on_twin_patch_received({"interval": 10, "$version": 3})
+        twin = await twin_client.get_twin()
+        assert iothub_pipeline.get_twin.call_count == 2
+        assert twin["desired"]["$version"] == 3
+
+    @pytest.mark.it("Retrieves the twin again after the connection is lost")
+    async def test_refetches_after_disconnect(self, twin_client, iothub_pipeline):
+        await twin_client.get_twin()
+        iothub_pipeline.on_disconnected()
+        await twin_client.get_twin()
+        assert iothub_pipeline.get_twin.call_count == 2
+
+    @pytest.mark.it("Retrieves the twin again after reported properties are patched")
+    async def test_refetches_after_reported_patch(self, twin_client, iothub_pipeline):
+        await twin_client.get_twin()
+        await twin_client.patch_twin_reported_properties({"firmware": "2.0"})
+        await twin_client.get_twin()
+        assert iothub_pipeline.get_twin.call_count == 2
+
+    @pytest.mark.it(
+        "Only puts desired property patches in the twin patch inbox once the application has asked to receive them"
+    )
+    async def test_routes_to_inbox_once_requested(self, twin_client, iothub_pipeline):
+        iothub_pipeline.on_twin_patch_received({"interval": 10, "$version": 2})
+        assert twin_client._inbox_manager.get_twin_patch_inbox().empty()
+
+        receiver = asyncio.ensure_future(twin_client.receive_twin_desired_properties_patch())
+        await asyncio.sleep(0.01)
+        patch = {"interval": 20, "$version": 3}
+        iothub_pipeline.on_twin_patch_received(patch)
+        assert await asyncio.wait_for(receiver, 1) == patch
+
+
 class SharedClientGetTwinTests(object):
     @pytest.mark.it("Implicitly enables twin messaging feature if not already enabled")
     async def test_enables_twin_only_if_not_already_enabled(
@@ -949,6 +1663,18 @@ class SharedClientReceiveTwinDesiredPropertiesPatchTests(object):
         assert received_patch is twin_patch_desired
 
 
+class SharedClientGetInboxMetricsTests(object):
+    @pytest.mark.it("Returns the metrics of the inboxes of the client")
+    async def test_returns_metrics(self, mocker, client):
+        client._inbox_manager.route_twin_patch({"properties": "some_patch"})
+        spy_get_metrics = mocker.spy(client._inbox_manager, "get_metrics")
+        metrics = client.get_inbox_metrics()
+        assert spy_get_metrics.call_count == 1
+        assert metrics is spy_get_metrics.spy_return
+        assert metrics["twin_patch"].depth == 1
+        assert metrics["c2d"].depth == 0
+
+
 class SharedClientPROPERTYConnectedTests(object):
     @pytest.mark.it("Cannot be changed")
     async def test_read_only(self, client):
@@ -1056,6 +1782,15 @@ class TestIoTHubDeviceClientCreateFromX509Certificate(
         """Provides the specific create method args for use in universal tests"""
         return [x509, self.hostname, self.device_id]
 
+    @pytest.mark.it(
+        "Raises a TypeError if the 'shared_sas_token_service' user option parameter is provided"
+    )
+    async def test_shared_sas_token_service_option(
+        self, option_test_required_patching, client_create_method, create_method_args
+    ):
+        with pytest.raises(TypeError):
+            client_create_method(*create_method_args, shared_sas_token_service=True)
+
     @pytest.mark.it("Uses the provided arguments to create a X509AuthenticationProvider")
     async def test_auth_provider_creation(self, mocker, client_class, x509):
         mock_auth_init = mocker.patch("azure.iot.device.iothub.auth.X509AuthenticationProvider")
@@ -1134,6 +1869,13 @@ class TestIoTHubDeviceClientSendD2CMessage(
     pass
 
 
+@pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .send_message_batch()")
+class TestIoTHubDeviceClientSendD2CMessageBatch(
+    IoTHubDeviceClientTestsConfig, SharedClientSendD2CMessageBatchTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .receive_message()")
 class TestIoTHubDeviceClientReceiveC2DMessage(IoTHubDeviceClientTestsConfig):
     @pytest.mark.it("Implicitly enables C2D messaging feature if not already enabled")
@@ -1172,6 +1914,63 @@ class TestIoTHubDeviceClientReceiveC2DMessage(IoTHubDeviceClientTestsConfig):
         assert received_message is message
 
 
+@pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .receive_messages()")
+class TestIoTHubDeviceClientReceiveC2DMessages(IoTHubDeviceClientTestsConfig):
+    @pytest.mark.it("Implicitly enables C2D messaging feature if not already enabled")
+    async def test_enables_c2d_messaging_only_if_not_already_enabled(
+        self, mocker, client, iothub_pipeline
+    ):
+        # patch this so receive_messages won't block
+        mocker.patch.object(
+            AsyncClientInbox,
+            "get_batch",
+            new=mocker.MagicMock(return_value=(await create_completed_future([]))),
+        )
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = False  # C2D will appear disabled
+        await client.receive_messages()
+        assert iothub_pipeline.enable_feature.call_count == 1
+        assert iothub_pipeline.enable_feature.call_args[0][0] == constant.C2D_MSG
+
+        iothub_pipeline.enable_feature.reset_mock()
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = True  # C2D will appear enabled
+        await client.receive_messages()
+        assert iothub_pipeline.enable_feature.call_count == 0
+
+    @pytest.mark.it("Returns a batch of messages from the C2D inbox, up to max_count")
+    async def test_returns_batch_from_c2d_inbox(self, mocker, client, message):
+        inbox_mock = mocker.MagicMock(autospec=AsyncClientInbox)
+        inbox_mock.get_batch.return_value = await create_completed_future([message])
+        mocker.patch.object(client._inbox_manager, "get_c2d_message_inbox", return_value=inbox_mock)
+
+        received_messages = await client.receive_messages(max_count=10)
+        assert inbox_mock.get_batch.call_count == 1
+        assert inbox_mock.get_batch.call_args == mocker.call(max_items=10)
+        assert received_messages == [message]
+
+    @pytest.mark.it("Returns all the messages in the inbox, up to max_count")
+    async def test_drains_inbox(self, client):
+        c2d_inbox = client._inbox_manager.get_c2d_message_inbox()
+        messages = [Message("message {}".format(i)) for i in range(3)]
+        for message in messages:
+            c2d_inbox._put(message)
+
+        assert await client.receive_messages(max_count=2) == messages[:2]
+        assert await client.receive_messages() == messages[2:]
+
+    @pytest.mark.it("Returns an empty list if no message arrives before the timeout")
+    async def test_times_out(self, client):
+        assert await client.receive_messages(timeout=0.01) == []
+
+
+@pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .receive_method_requests()")
+class TestIoTHubDeviceClientReceiveMethodRequests(
+    IoTHubDeviceClientTestsConfig, SharedClientReceiveMethodRequestsTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .receive_method_request()")
 class TestIoTHubDeviceClientReceiveMethodRequest(
     IoTHubDeviceClientTestsConfig, SharedClientReceiveMethodRequestTests
@@ -1179,6 +1978,13 @@ class TestIoTHubDeviceClientReceiveMethodRequest(
     pass
 
 
+@pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .on_method_request()")
+class TestIoTHubDeviceClientOnMethodRequest(
+    IoTHubDeviceClientTestsConfig, SharedClientOnMethodRequestTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .send_method_response()")
 class TestIoTHubDeviceClientSendMethodResponse(
     IoTHubDeviceClientTestsConfig, SharedClientSendMethodResponseTests
@@ -1186,6 +1992,11 @@ class TestIoTHubDeviceClientSendMethodResponse(
     pass
 
 
+@pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .get_twin() -- twin cache enabled")
+class TestIoTHubDeviceClientTwinCache(IoTHubDeviceClientTestsConfig, SharedClientTwinCacheTests):
+    pass
+
+
 @pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .get_twin()")
 class TestIoTHubDeviceClientGetTwin(IoTHubDeviceClientTestsConfig, SharedClientGetTwinTests):
     pass
@@ -1207,6 +2018,13 @@ class TestIoTHubDeviceClientReceiveTwinDesiredPropertiesPatch(
     pass
 
 
+@pytest.mark.describe("IoTHubDeviceClient (Asynchronous) - .get_inbox_metrics()")
+class TestIoTHubDeviceClientGetInboxMetrics(
+    IoTHubDeviceClientTestsConfig, SharedClientGetInboxMetricsTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubDeviceClient (Asynchronous) -.get_storage_info_for_blob()")
 class TestIoTHubDeviceClientGetStorageInfo(IoTHubDeviceClientTestsConfig):
     @pytest.mark.it("Begins a 'get_storage_info_for_blob' HTTPPipeline operation")
@@ -1459,6 +2277,20 @@ class IoTHubModuleClientClientCreateFromEdgeEnvironmentUserOptionTests(
                 *create_method_args, server_verification_cert="fake_server_verification_cert"
             )
 
+    @pytest.mark.it("Accepts the 'trust_bundle_cache_directory' user option parameter")
+    async def test_trust_bundle_cache_directory_option(
+        self,
+        option_test_required_patching,
+        client_create_method,
+        create_method_args,
+        mock_mqtt_pipeline_init,
+        mock_http_pipeline_init,
+    ):
+        """THIS TEST OVERRIDES AN INHERITED TEST"""
+        client_create_method(*create_method_args, trust_bundle_cache_directory="fake/directory")
+
+        assert mock_mqtt_pipeline_init.call_count == 1
+
     @pytest.mark.it("Sets default user options if none are provided")
     async def test_default_options(
         self,
@@ -1515,8 +2347,23 @@ class TestIoTHubModuleClientCreateFromEdgeEnvironmentWithContainerEnv(
             module_generation_id=edge_container_environment["IOTEDGE_MODULEGENERATIONID"],
             workload_uri=edge_container_environment["IOTEDGE_WORKLOADURI"],
             api_version=edge_container_environment["IOTEDGE_APIVERSION"],
+            trust_bundle_cache_directory=None,
         )
 
+    @pytest.mark.it(
+        "Passes the 'trust_bundle_cache_directory' user option parameter to the IoTEdgeAuthenticationProvider, if provided"
+    )
+    async def test_trust_bundle_cache_directory_option(
+        self, mocker, client_class, edge_container_environment
+    ):
+        mocker.patch.dict(os.environ, edge_container_environment, clear=True)
+        mock_auth_init = mocker.patch("azure.iot.device.iothub.auth.IoTEdgeAuthenticationProvider")
+
+        client_class.create_from_edge_environment(trust_bundle_cache_directory="fake/directory")
+
+        assert mock_auth_init.call_count == 1
+        assert mock_auth_init.call_args[1]["trust_bundle_cache_directory"] == "fake/directory"
+
     @pytest.mark.it(
         "Ignores any Edge local debug environment variables that may be present, in favor of using Edge container variables"
     )
@@ -1546,6 +2393,7 @@ class TestIoTHubModuleClientCreateFromEdgeEnvironmentWithContainerEnv(
             module_generation_id=edge_container_environment["IOTEDGE_MODULEGENERATIONID"],
             workload_uri=edge_container_environment["IOTEDGE_WORKLOADURI"],
             api_version=edge_container_environment["IOTEDGE_APIVERSION"],
+            trust_bundle_cache_directory=None,
         )
 
     @pytest.mark.it(
@@ -1720,6 +2568,7 @@ class TestIoTHubModuleClientCreateFromEdgeEnvironmentWithDebugEnv(
             module_generation_id=edge_container_environment["IOTEDGE_MODULEGENERATIONID"],
             workload_uri=edge_container_environment["IOTEDGE_WORKLOADURI"],
             api_version=edge_container_environment["IOTEDGE_APIVERSION"],
+            trust_bundle_cache_directory=None,
         )
 
     @pytest.mark.it(
@@ -1858,6 +2707,15 @@ class TestIoTHubModuleClientCreateFromX509Certificate(
         """Provides the specific create method args for use in universal tests"""
         return [x509, self.hostname, self.device_id, self.module_id]
 
+    @pytest.mark.it(
+        "Raises a TypeError if the 'shared_sas_token_service' user option parameter is provided"
+    )
+    async def test_shared_sas_token_service_option(
+        self, option_test_required_patching, client_create_method, create_method_args
+    ):
+        with pytest.raises(TypeError):
+            client_create_method(*create_method_args, shared_sas_token_service=True)
+
     @pytest.mark.it("Uses the provided arguments to create a X509AuthenticationProvider")
     async def test_auth_provider_creation(self, mocker, client_class, x509):
         mock_auth_init = mocker.patch("azure.iot.device.iothub.auth.X509AuthenticationProvider")
@@ -1936,8 +2794,30 @@ class TestIoTHubNModuleClientSendD2CMessage(
     pass
 
 
+@pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .send_message_batch()")
+class TestIoTHubModuleClientSendD2CMessageBatch(
+    IoTHubModuleClientTestsConfig, SharedClientSendD2CMessageBatchTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .send_message_to_output()")
 class TestIoTHubModuleClientSendToOutput(IoTHubModuleClientTestsConfig):
+    @pytest.mark.it(
+        "Compresses the message with the pipeline before checking its size, so that the size limit applies to the compressed message"
+    )
+    async def test_compresses_before_size_check(self, client, iothub_pipeline):
+        message = Message("a" * 300000)
+
+        def compress(message):
+            return Message(b"compressed", content_encoding="gzip")
+
+        iothub_pipeline.encode_message.side_effect = compress
+        await client.send_message_to_output(message, "some_output")
+        assert iothub_pipeline.encode_message.call_count == 1
+        assert iothub_pipeline.send_output_event.call_count == 1
+        assert iothub_pipeline.send_output_event.call_args[0][0].data == b"compressed"
+
     @pytest.mark.it("Begins a 'send_output_event' pipeline operation")
     async def test_calls_pipeline_send_message_to_output(self, client, iothub_pipeline, message):
         output_name = "some_output"
@@ -1946,6 +2826,30 @@ class TestIoTHubModuleClientSendToOutput(IoTHubModuleClientTestsConfig):
         assert iothub_pipeline.send_output_event.call_args[0][0] is message
         assert message.output_name == output_name
 
+    @pytest.mark.it(
+        "Waits for the pipeline's publish window before beginning the 'send_output_event' pipeline operation, if the pipeline is applying backpressure"
+    )
+    async def test_waits_for_publish_window(self, mocker, client, iothub_pipeline, message):
+        iothub_pipeline.publish_window_open = False
+
+        def check_not_sent(callback):
+            assert iothub_pipeline.send_output_event.call_count == 0
+            callback()
+
+        iothub_pipeline.wait_for_publish_window.side_effect = check_not_sent
+        await client.send_message_to_output(message, "some_output")
+        assert iothub_pipeline.wait_for_publish_window.call_count == 1
+        assert iothub_pipeline.send_output_event.call_count == 1
+
+    @pytest.mark.it(
+        "Does not wait for the pipeline's publish window if the pipeline is not applying backpressure"
+    )
+    async def test_no_backpressure(self, client, iothub_pipeline, message):
+        iothub_pipeline.publish_window_open = True
+        await client.send_message_to_output(message, "some_output")
+        assert iothub_pipeline.wait_for_publish_window.call_count == 0
+        assert iothub_pipeline.send_output_event.call_count == 1
+
     @pytest.mark.it(
         "Waits for the completion of the 'send_output_event' pipeline operation before returning"
     )
@@ -2054,17 +2958,26 @@ class TestIoTHubModuleClientSendToOutput(IoTHubModuleClientTestsConfig):
         assert "256 KB" in e_info.value.args[0]
         assert iothub_pipeline.send_output_event.call_count == 0
 
+    @pytest.mark.it("Counts the output name towards the size of the message")
+    async def test_raises_error_when_output_name_makes_message_greater_than_256(
+        self, client, iothub_pipeline
+    ):
+        output_name = "some_output"
+        message = Message("a" * 262144)
+        with pytest.raises(ValueError) as e_info:
+            await client.send_message_to_output(message, output_name)
+        assert "256 KB" in e_info.value.args[0]
+        assert iothub_pipeline.send_output_event.call_count == 0
+
     @pytest.mark.it("Does not raises error when message data size is equal to 256 KB")
     async def test_raises_error_when_message_to_output_data_equal_to_256(
         self, client, iothub_pipeline
     ):
         output_name = "some_output"
-        data_input = "a" * 262095
-        message = Message(data_input)
-        # This check was put as message class may undergo the default content type encoding change
-        # and the above calculation will change.
-        if message.get_size() != device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
-            assert False
+        # The output name is sent as the "$.on" property
+        data_input = "a" * (262144 - len("%24.on=some_output"))
+        message = Message(data_input, output_name=output_name)
+        assert message.get_size() == device_constant.TELEMETRY_MESSAGE_SIZE_LIMIT
 
         await client.send_message_to_output(message, output_name)
 
@@ -2119,6 +3032,68 @@ class TestIoTHubModuleClientReceiveInputMessage(IoTHubModuleClientTestsConfig):
         assert received_message is message
 
 
+@pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .receive_message_on_input_batch()")
+class TestIoTHubModuleClientReceiveInputMessageBatch(IoTHubModuleClientTestsConfig):
+    @pytest.mark.it("Implicitly enables input messaging feature if not already enabled")
+    async def test_enables_input_messaging_only_if_not_already_enabled(
+        self, mocker, client, iothub_pipeline
+    ):
+        # patch this so receive_message_on_input_batch won't block
+        mocker.patch.object(
+            AsyncClientInbox,
+            "get_batch",
+            new=mocker.MagicMock(return_value=(await create_completed_future([]))),
+        )
+        input_name = "some_input"
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = False
+        await client.receive_message_on_input_batch(input_name)
+        assert iothub_pipeline.enable_feature.call_count == 1
+        assert iothub_pipeline.enable_feature.call_args[0][0] == constant.INPUT_MSG
+
+        iothub_pipeline.enable_feature.reset_mock()
+
+        iothub_pipeline.feature_enabled.__getitem__.return_value = True
+        await client.receive_message_on_input_batch(input_name)
+        assert iothub_pipeline.enable_feature.call_count == 0
+
+    @pytest.mark.it("Returns a batch of messages from the input inbox, up to max_count")
+    async def test_returns_batch_from_input_inbox(self, mocker, client, message):
+        inbox_mock = mocker.MagicMock(autospec=AsyncClientInbox)
+        inbox_mock.get_batch.return_value = await create_completed_future([message])
+        manager_get_inbox_mock = mocker.patch.object(
+            client._inbox_manager, "get_input_message_inbox", return_value=inbox_mock
+        )
+
+        input_name = "some_input"
+        received_messages = await client.receive_message_on_input_batch(input_name, max_count=10)
+        assert manager_get_inbox_mock.call_args == mocker.call(input_name)
+        assert inbox_mock.get_batch.call_args == mocker.call(max_items=10)
+        assert received_messages == [message]
+
+    @pytest.mark.it("Returns all the messages in the inbox, up to max_count")
+    async def test_drains_inbox(self, client):
+        input_name = "some_input"
+        input_inbox = client._inbox_manager.get_input_message_inbox(input_name)
+        messages = [Message("message {}".format(i)) for i in range(3)]
+        for message in messages:
+            input_inbox._put(message)
+
+        assert await client.receive_message_on_input_batch(input_name, max_count=2) == messages[:2]
+        assert await client.receive_message_on_input_batch(input_name) == messages[2:]
+
+    @pytest.mark.it("Returns an empty list if no message arrives before the timeout")
+    async def test_times_out(self, client):
+        assert await client.receive_message_on_input_batch("some_input", timeout=0.01) == []
+
+
+@pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .receive_method_requests()")
+class TestIoTHubModuleClientReceiveMethodRequests(
+    IoTHubModuleClientTestsConfig, SharedClientReceiveMethodRequestsTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .receive_method_request()")
 class TestIoTHubModuleClientReceiveMethodRequest(
     IoTHubModuleClientTestsConfig, SharedClientReceiveMethodRequestTests
@@ -2126,6 +3101,13 @@ class TestIoTHubModuleClientReceiveMethodRequest(
     pass
 
 
+@pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .on_method_request()")
+class TestIoTHubModuleClientOnMethodRequest(
+    IoTHubModuleClientTestsConfig, SharedClientOnMethodRequestTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .send_method_response()")
 class TestIoTHubModuleClientSendMethodResponse(
     IoTHubModuleClientTestsConfig, SharedClientSendMethodResponseTests
@@ -2133,6 +3115,11 @@ class TestIoTHubModuleClientSendMethodResponse(
     pass
 
 
+@pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .get_twin() -- twin cache enabled")
+class TestIoTHubModuleClientTwinCache(IoTHubModuleClientTestsConfig, SharedClientTwinCacheTests):
+    pass
+
+
 @pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .get_twin()")
 class TestIoTHubModuleClientGetTwin(IoTHubModuleClientTestsConfig, SharedClientGetTwinTests):
     pass
@@ -2154,6 +3141,13 @@ class TestIoTHubModuleClientReceiveTwinDesiredPropertiesPatch(
     pass
 
 
+@pytest.mark.describe("IoTHubModuleClient (Asynchronous) - .get_inbox_metrics()")
+class TestIoTHubModuleClientGetInboxMetrics(
+    IoTHubModuleClientTestsConfig, SharedClientGetInboxMetricsTests
+):
+    pass
+
+
 @pytest.mark.describe("IoTHubModuleClient (Synchronous) -.invoke_method()")
 class TestIoTHubModuleClientInvokeMethod(IoTHubModuleClientTestsConfig):
     @pytest.mark.it("Begins a 'invoke_method' HTTPPipeline operation where the target is a device")
@@ -7,14 +7,12 @@
 import pytest
 import asyncio
 import logging
+import threading
+from azure.iot.device.iothub import sync_inbox
 from azure.iot.device.iothub.aio.async_inbox import AsyncClientInbox
 
 logging.basicConfig(level=logging.DEBUG)
 
-# Note that some small delays need to be added at the end of async tests due to
-# RuntimeWarnings being thrown by the test ending before janus can correctly
-# resolve its Futures. This may be a bug in janus.
-
 
 @pytest.mark.describe("AsyncClientInbox")
 class TestAsyncClientInbox(object):
@@ -41,7 +39,6 @@ class TestAsyncClientInbox(object):
         assert not inbox.empty()
         await inbox.get()
         assert inbox.empty()
-        await asyncio.sleep(0.01)  # Do this to prevent RuntimeWarning from janus
 
     @pytest.mark.it("Operates according to FIFO")
     @pytest.mark.asyncio
@@ -58,8 +55,6 @@ class TestAsyncClientInbox(object):
         assert await inbox.get() is item2
         assert await inbox.get() is item3
 
-        await asyncio.sleep(0.01)  # Do this to prevent RuntimeWarning from janus
-
 
 @pytest.mark.describe("AsyncClientInbox - ._put()")
 class TestAsyncClientInboxPut(object):
@@ -87,8 +82,6 @@ class TestAsyncClientInboxGet(object):
         assert retrieved_item is item
         assert inbox.empty()
 
-        await asyncio.sleep(0.01)  # Do this to prevent RuntimeWarning from janus
-
     @pytest.mark.it(
         "Blocks on an empty inbox until an item is available to remove and return, if using blocking mode"
     )
@@ -107,6 +100,89 @@ class TestAsyncClientInboxGet(object):
 
         await asyncio.gather(wait_for_item(), insert_item())
 
+    @pytest.mark.it("Returns an item put into the inbox from another thread")
+    async def test_item_put_from_other_thread(self, mocker):
+        inbox = AsyncClientInbox()
+        item = mocker.MagicMock()
+        getter = asyncio.ensure_future(inbox.get())
+        await asyncio.sleep(0.1)
+        thread = threading.Thread(target=inbox._put, args=(item,))
+        thread.start()
+        assert await asyncio.wait_for(getter, 1) is item
+        thread.join()
+
+    @pytest.mark.it(
+        "Wakes up waiting coroutines once for a burst of items put into the inbox from another thread"
+    )
+    async def test_one_wakeup_per_burst(self, mocker):
+        inbox = AsyncClientInbox()
+        loop = asyncio.get_event_loop()
+        call_soon_threadsafe_spy = mocker.spy(loop, "call_soon_threadsafe")
+        getter = asyncio.ensure_future(inbox.get())
+        await asyncio.sleep(0.1)
+
+        def put_burst():
+            for item in ("item1", "item2", "item3"):
+                inbox._put(item)
+
+        thread = threading.Thread(target=put_burst)
+        thread.start()
+        thread.join()
+        assert await asyncio.wait_for(getter, 1) == "item1"
+        assert call_soon_threadsafe_spy.call_count == 1
+
+
+@pytest.mark.describe("AsyncClientInbox - .get_batch()")
+@pytest.mark.asyncio
+class TestAsyncClientInboxGetBatch(object):
+    @pytest.mark.it("Returns and removes all items in the inbox, in FIFO order")
+    async def test_returns_all_items(self):
+        inbox = AsyncClientInbox()
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert await inbox.get_batch() == ["item1", "item2", "item3"]
+        assert inbox.empty()
+
+    @pytest.mark.it("Returns and removes no more than max_items items")
+    async def test_max_items(self):
+        inbox = AsyncClientInbox()
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert await inbox.get_batch(max_items=2) == ["item1", "item2"]
+        assert await inbox.get_batch(max_items=2) == ["item3"]
+        assert inbox.empty()
+
+    @pytest.mark.it("Raises ValueError if max_items is less than 1")
+    @pytest.mark.parametrize("max_items", [0, -1])
+    async def test_invalid_max_items(self, max_items):
+        inbox = AsyncClientInbox()
+        inbox._put("item1")
+        with pytest.raises(ValueError):
+            await inbox.get_batch(max_items=max_items)
+
+    @pytest.mark.it("Waits on an empty inbox until an item is available")
+    async def test_waits_for_item(self):
+        inbox = AsyncClientInbox()
+
+        async def insert_items():
+            await asyncio.sleep(0.1)
+            inbox._put("item1")
+            inbox._put("item2")
+
+        batch, _ = await asyncio.gather(inbox.get_batch(), insert_items())
+        assert batch == ["item1", "item2"]
+
+    @pytest.mark.it("Updates the depth of the inbox and refills it from disk")
+    async def test_spill(self):
+        inbox = AsyncClientInbox(capacity=2, overflow_policy=sync_inbox.SPILL)
+        for item in ("item1", "item2", "item3", "item4"):
+            inbox._put(item)
+        assert await inbox.get_batch() == ["item1", "item2"]
+        assert inbox.depth == 2
+        assert await inbox.get_batch() == ["item3", "item4"]
+        assert inbox.depth == 0
+        assert inbox.oldest_item_age is None
+
 
 @pytest.mark.describe("AsyncClientInbox - .clear()")
 class TestAsyncClientInboxClear(object):
@@ -123,3 +199,71 @@ class TestAsyncClientInboxClear(object):
 
         inbox.clear()
         assert inbox.empty()
+
+
+@pytest.mark.describe("AsyncClientInbox - ._put() -- inbox is at capacity")
+class TestAsyncClientInboxPutAtCapacity(object):
+    @pytest.mark.it(
+        "Drops the oldest item to make room for the new one, if the overflow policy is DROP_OLDEST"
+    )
+    @pytest.mark.asyncio
+    async def test_drop_oldest(self):
+        inbox = AsyncClientInbox(capacity=2, overflow_policy=sync_inbox.DROP_OLDEST)
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert inbox.dropped_count == 1
+        assert await inbox.get() == "item2"
+        assert await inbox.get() == "item3"
+
+    @pytest.mark.it("Drops the new item, if the overflow policy is DROP_NEWEST")
+    @pytest.mark.asyncio
+    async def test_drop_newest(self):
+        inbox = AsyncClientInbox(capacity=2, overflow_policy=sync_inbox.DROP_NEWEST)
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert inbox.dropped_count == 1
+        assert await inbox.get() == "item1"
+        assert await inbox.get() == "item2"
+
+    @pytest.mark.it(
+        "Spills the new item to disk, and returns it in order once there is room, if the overflow policy is SPILL"
+    )
+    @pytest.mark.asyncio
+    async def test_spill(self):
+        inbox = AsyncClientInbox(capacity=1, overflow_policy=sync_inbox.SPILL)
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert inbox.depth == 3
+        assert await inbox.get() == "item1"
+        assert await inbox.get() == "item2"
+        assert await inbox.get() == "item3"
+        assert inbox.empty()
+        assert inbox.oldest_item_age is None
+
+    @pytest.mark.it(
+        "Adds the new item over capacity instead of waiting, if the overflow policy is BLOCK and the item is put on a thread running an event loop"
+    )
+    @pytest.mark.asyncio
+    async def test_block_on_event_loop(self):
+        inbox = AsyncClientInbox(capacity=1, overflow_policy=sync_inbox.BLOCK)
+        inbox._put("item1")
+        inbox._put("item2")
+        assert inbox.depth == 2
+        assert await inbox.get() == "item1"
+        assert await inbox.get() == "item2"
+
+    @pytest.mark.it(
+        "Waits for a free slot before adding the new item, if the overflow policy is BLOCK"
+    )
+    @pytest.mark.asyncio
+    async def test_block(self):
+        inbox = AsyncClientInbox(capacity=1, overflow_policy=sync_inbox.BLOCK)
+        inbox._put("item1")
+        thread = threading.Thread(target=inbox._put, args=("item2",))
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()
+        assert await inbox.get() == "item1"
+        thread.join(1)
+        assert not thread.is_alive()
+        assert await inbox.get() == "item2"
@@ -0,0 +1,144 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import asyncio
+import logging
+import threading
+from azure.iot.device.iothub.models import MethodRequest, MethodResponse
+from azure.iot.device.iothub.aio.async_method_dispatcher import AsyncMethodDispatcher
+
+pytestmark = pytest.mark.asyncio
+logging.basicConfig(level=logging.DEBUG)
+
+
+@pytest.fixture
+def method_request():
+    return MethodRequest(request_id="1", name="some_method", payload={"key": "value"})
+
+
+class ResponseList(list):
+    """The responses sent by a dispatcher, with an event set once a number of them are sent"""
+
+    def __init__(self, expected_count=1):
+        super().__init__()
+        self.expected_count = expected_count
+        self.event = asyncio.Event()
+
+    async def send(self, method_response):
+        self.append(method_response)
+        if len(self) >= self.expected_count:
+            self.event.set()
+
+    async def wait(self):
+        await asyncio.wait_for(self.event.wait(), 1)
+
+
+@pytest.mark.describe("AsyncMethodDispatcher - .dispatch()")
+class TestAsyncMethodDispatcherDispatch(object):
+    @pytest.mark.it("Calls a coroutine function handler with the MethodRequest in a task")
+    async def test_calls_coroutine_handler(self, method_request):
+        handled = []
+
+        async def handler(request):
+            handled.append(request)
+
+        sent_responses = ResponseList()
+        dispatcher = AsyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        await sent_responses.wait()
+        assert handled == [method_request]
+
+    @pytest.mark.it("Calls a function handler with the MethodRequest on the event loop")
+    async def test_calls_function_handler(self, method_request):
+        handler_threads = []
+
+        def handler(request):
+            handler_threads.append(threading.current_thread())
+
+        sent_responses = ResponseList()
+        dispatcher = AsyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        await sent_responses.wait()
+        assert handler_threads == [threading.current_thread()]
+
+    @pytest.mark.it("Can be called from another thread")
+    async def test_called_from_other_thread(self, method_request):
+        sent_responses = ResponseList()
+        dispatcher = AsyncMethodDispatcher(lambda request: "done", sent_responses.send)
+        thread = threading.Thread(target=dispatcher.dispatch, args=(method_request,))
+        thread.start()
+        await sent_responses.wait()
+        thread.join()
+        assert sent_responses[0].payload == "done"
+
+    @pytest.mark.it(
+        "Sends a response with status 200 and the value returned by the handler as its payload"
+    )
+    async def test_sends_payload_response(self, method_request):
+        async def handler(request):
+            return {"result": 1}
+
+        sent_responses = ResponseList()
+        dispatcher = AsyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        await sent_responses.wait()
+        assert sent_responses[0].request_id == method_request.request_id
+        assert sent_responses[0].status == 200
+        assert sent_responses[0].payload == {"result": 1}
+
+    @pytest.mark.it("Sends the MethodResponse returned by the handler as is")
+    async def test_sends_method_response(self, method_request):
+        method_response = MethodResponse(method_request.request_id, 404, "not found")
+
+        async def handler(request):
+            return method_response
+
+        sent_responses = ResponseList()
+        dispatcher = AsyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        await sent_responses.wait()
+        assert sent_responses[0] is method_response
+
+    @pytest.mark.it(
+        "Sends a response with status 500 and a generic error message if the handler raises an exception"
+    )
+    async def test_sends_error_response(self, method_request):
+        async def handler(request):
+            raise ValueError("secret details")
+
+        sent_responses = ResponseList()
+        dispatcher = AsyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        await sent_responses.wait()
+        assert sent_responses[0].request_id == method_request.request_id
+        assert sent_responses[0].status == 500
+        assert sent_responses[0].payload == {"error": "Method request handler failed"}
+
+    @pytest.mark.it("Handles up to max_concurrency MethodRequests at a time")
+    @pytest.mark.parametrize("max_concurrency", [1, 3])
+    async def test_max_concurrency(self, max_concurrency):
+        release = asyncio.Event()
+        running = [0]
+        max_running = [0]
+
+        async def handler(request):
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+            await release.wait()
+            running[0] -= 1
+
+        sent_responses = ResponseList(expected_count=5)
+        dispatcher = AsyncMethodDispatcher(
+            handler, sent_responses.send, max_concurrency=max_concurrency
+        )
+        for i in range(5):
+            dispatcher.dispatch(MethodRequest(str(i), "some_method", None))
+        await asyncio.sleep(0.1)
+        assert running[0] == max_concurrency
+        release.set()
+        await sent_responses.wait()
+        assert max_running[0] == max_concurrency
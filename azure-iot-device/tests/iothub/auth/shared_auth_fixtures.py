@@ -4,6 +4,7 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import base64
 import pytest
 
 
@@ -20,3 +21,37 @@ def device_id():
 @pytest.fixture
 def module_id():
     return "__FAKE_MODULE__ID__"
+
+
+def _der(tag, content):
+    if len(content) < 0x80:
+        length = bytearray([len(content)])
+    else:
+        length = bytearray([0x82, len(content) >> 8, len(content) & 0xFF])
+    return bytearray([tag]) + length + content
+
+
+@pytest.fixture
+def make_certificate():
+    """Factory for PEM certificates which only contain the fields needed to find their expiry"""
+
+    def make_certificate(not_after, generalized_time=False, version=True):
+        if generalized_time:
+            not_after_time = _der(0x18, bytearray(not_after.encode("ascii")))
+        else:
+            not_after_time = _der(0x17, bytearray(not_after[2:].encode("ascii")))
+        tbs_certificate = (
+            (_der(0xA0, _der(0x02, bytearray([2]))) if version else bytearray())
+            + _der(0x02, bytearray([1]))
+            + _der(0x30, bytearray(b"\x06\x01\x00"))
+            + _der(0x30, bytearray(b"\x00" * 200))
+            + _der(0x30, _der(0x17, bytearray(b"000101000000Z")) + not_after_time)
+        )
+        der = _der(0x30, _der(0x30, tbs_certificate))
+        return (
+            "-----BEGIN CERTIFICATE-----\n"
+            + base64.b64encode(bytes(der)).decode()
+            + "\n-----END CERTIFICATE-----\n"
+        )
+
+    return make_certificate
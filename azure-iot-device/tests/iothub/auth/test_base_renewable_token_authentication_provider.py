@@ -5,8 +5,9 @@
 # --------------------------------------------------------------------------
 import pytest
 import logging
+import threading
 from mock import MagicMock, patch
-from threading import Timer
+from azure.iot.device.common.timer_wheel import Timer
 from azure.iot.device.iothub.auth.base_renewable_token_authentication_provider import (
     BaseRenewableTokenAuthenticationProvider,
     DEFAULT_TOKEN_VALIDITY_PERIOD,
@@ -165,12 +166,29 @@ def test_update_timer_generates_new_sas_token_and_calls_on_sas_token_updated_han
     device_auth_provider.on_sas_token_updated_handler_list = update_callback_list
     timer_callback = fake_timer_object.call_args[0][1]
     device_auth_provider._sign.reset_mock()
-    timer_callback()
+    timer_callback().result()
     for x in update_callback_list:
         x.assert_called_once_with()
     assert device_auth_provider._sign.call_count == 1
 
 
+def test_update_timer_generates_new_sas_token_on_worker_thread(
+    device_auth_provider, fake_timer_object
+):
+    device_auth_provider.generate_new_sas_token()
+    timer_callback = fake_timer_object.call_args[0][1]
+    signing_threads = []
+
+    def sign(*args):
+        signing_threads.append(threading.current_thread())
+        return fake_signature
+
+    device_auth_provider._sign.side_effect = sign
+    timer_callback().result()
+    assert len(signing_threads) == 1
+    assert signing_threads[0] is not threading.current_thread()
+
+
 def test_finalizer_cancels_update_timer(fake_timer_object):
     # can't use the device_auth_provider fixture here because the fixture adds
     # to the object refcount and prevents del from calling the finalizer
@@ -178,3 +196,49 @@ def test_finalizer_cancels_update_timer(fake_timer_object):
     device_auth_provider.generate_new_sas_token()
     del device_auth_provider
     fake_timer_object.return_value.cancel.assert_called_once_with()
+
+
+def test_generate_new_sas_token_schedules_update_with_token_service_if_set(
+    device_auth_provider, fake_timer_object
+):
+    token_service = MagicMock()
+    device_auth_provider.token_service = token_service
+    device_auth_provider.generate_new_sas_token()
+    assert fake_timer_object.call_count == 0
+    token_service.schedule_token_update.assert_called_once_with(
+        device_auth_provider, DEFAULT_TOKEN_VALIDITY_PERIOD - DEFAULT_TOKEN_RENEWAL_MARGIN
+    )
+
+
+def test_generate_new_sas_token_cancels_update_scheduled_with_token_service(device_auth_provider):
+    token_service = MagicMock()
+    device_auth_provider.token_service = token_service
+    device_auth_provider.generate_new_sas_token()
+    renewal = token_service.schedule_token_update.return_value
+    device_auth_provider.generate_new_sas_token()
+    renewal.cancel.assert_called_once_with()
+
+
+def test_create_sas_token_returns_token_and_expiry_without_using_it(
+    device_auth_provider, fake_get_current_time_function, fake_timer_object
+):
+    update_callback = MagicMock()
+    device_auth_provider.on_sas_token_updated_handler_list = [update_callback]
+    token, expiry = device_auth_provider._create_sas_token()
+    assert expiry == fake_current_time + DEFAULT_TOKEN_VALIDITY_PERIOD
+    assert token == fake_device_token_base + str(expiry)
+    assert device_auth_provider.sas_token_str is None
+    assert fake_timer_object.call_count == 0
+    assert update_callback.call_count == 0
+
+
+def test_update_sas_token_uses_token_and_schedules_update_before_its_expiry(
+    device_auth_provider, fake_get_current_time_function, fake_timer_object
+):
+    update_callback = MagicMock()
+    device_auth_provider.on_sas_token_updated_handler_list = [update_callback]
+    device_auth_provider._update_sas_token("__PRESIGNED_TOKEN__", fake_current_time + 1000)
+    assert device_auth_provider.get_current_sas_token() == "__PRESIGNED_TOKEN__"
+    assert fake_timer_object.call_args[0][0] == 1000 - DEFAULT_TOKEN_RENEWAL_MARGIN
+    update_callback.assert_called_once_with()
+    assert device_auth_provider._sign.call_count == 0
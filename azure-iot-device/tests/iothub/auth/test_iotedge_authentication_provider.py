@@ -9,7 +9,11 @@ import requests
 import json
 import base64
 import logging
+import threading
+import time
 import six.moves.urllib as urllib
+import requests_unixsocket
+from azure.iot.device.iothub.auth import iotedge_authentication_provider, trust_bundle_store
 from azure.iot.device.iothub.auth.iotedge_authentication_provider import (
     IoTEdgeAuthenticationProvider,
     IoTEdgeHsm,
@@ -43,7 +47,18 @@ def api_version():
 
 @pytest.fixture
 def certificate():
-    return "__FAKE_CERTIFICATE__"
+    return (
+        "-----BEGIN CERTIFICATE-----\n"
+        + base64.b64encode(b"\x30__FAKE_CERTIFICATE__").decode()
+        + "\n-----END CERTIFICATE-----\n"
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_trust_bundle_cache():
+    iotedge_authentication_provider.clear_trust_bundle_cache()
+    yield
+    iotedge_authentication_provider.clear_trust_bundle_cache()
 
 
 @pytest.fixture
@@ -107,6 +122,33 @@ class TestIoTEdgeAuthenticationProviderInstantiation(
     def test_creates_edge_hsm(self, auth_provider, mock_hsm):
         assert auth_provider.hsm is mock_hsm
 
+    @pytest.mark.it("Passes the trust_bundle_cache_directory parameter to the IoTEdgeHsm")
+    def test_trust_bundle_cache_directory(
+        self,
+        mocker,
+        hostname,
+        device_id,
+        module_id,
+        gateway_hostname,
+        module_generation_id,
+        workload_uri,
+        api_version,
+    ):
+        mock_hsm_init = mocker.patch(
+            "azure.iot.device.iothub.auth.iotedge_authentication_provider.IoTEdgeHsm"
+        )
+        IoTEdgeAuthenticationProvider(
+            hostname=hostname,
+            device_id=device_id,
+            module_id=module_id,
+            gateway_hostname=gateway_hostname,
+            module_generation_id=module_generation_id,
+            workload_uri=workload_uri,
+            api_version=api_version,
+            trust_bundle_cache_directory="fake/directory",
+        )
+        assert mock_hsm_init.call_args[1]["trust_bundle_cache_directory"] == "fake/directory"
+
     @pytest.mark.it(
         "Sets a certificate acquired from the IoTEdgeHsm as the server_verification_cert instance attribute"
     )
@@ -115,6 +157,48 @@ class TestIoTEdgeAuthenticationProviderInstantiation(
         assert mock_hsm.get_trust_bundle.call_count == 1
 
 
+@pytest.mark.describe("IoTEdgeAuthenticationProvider - .refresh_server_verification_cert()")
+class TestIoTEdgeAuthenticationProviderRefreshServerVerificationCert(object):
+    @pytest.fixture
+    def auth_provider(self, mock_hsm, auth_provider):
+        mock_hsm.trust_bundle_is_stored = True
+        auth_provider._server_verification_cert_is_stored = True
+        return auth_provider
+
+    @pytest.mark.it(
+        "Requests the trust bundle from the IoTEdgeHsm again and sets it as the server_verification_cert instance attribute, if the current one was stored"
+    )
+    def test_refreshes_stored(self, auth_provider, mock_hsm):
+        cert = auth_provider.refresh_server_verification_cert()
+
+        assert mock_hsm.refresh_trust_bundle.call_count == 1
+        assert cert is mock_hsm.refresh_trust_bundle.return_value
+        assert auth_provider.server_verification_cert is cert
+
+    @pytest.mark.it(
+        "Returns None without making a request if the current certificate was not stored"
+    )
+    def test_not_stored(self, auth_provider, mock_hsm):
+        auth_provider._server_verification_cert_is_stored = False
+        old_cert = auth_provider.server_verification_cert
+
+        assert auth_provider.refresh_server_verification_cert() is None
+        assert mock_hsm.refresh_trust_bundle.call_count == 0
+        assert auth_provider.server_verification_cert is old_cert
+
+    @pytest.mark.it("Only refreshes the certificate once")
+    def test_once(self, auth_provider, mock_hsm):
+        auth_provider.refresh_server_verification_cert()
+        assert auth_provider.refresh_server_verification_cert() is None
+        assert mock_hsm.refresh_trust_bundle.call_count == 1
+
+    @pytest.mark.it("Raises an IoTEdgeError if the certificate cannot be requested")
+    def test_failure(self, auth_provider, mock_hsm):
+        mock_hsm.refresh_trust_bundle.side_effect = IoTEdgeError("fake error")
+        with pytest.raises(IoTEdgeError):
+            auth_provider.refresh_server_verification_cert()
+
+
 # TODO: Potentially get rid of this test class depending on how the parent class is tested/refactored.
 # After all, we really shouldn't be testing convention-private methods.
 @pytest.mark.describe("IoTEdgeAuthenticationProvider - ._sign()")
@@ -184,12 +268,33 @@ class TestIoTEdgeHsmInstantiation(object):
     def test_api_version(self, hsm, api_version):
         assert hsm.api_version == api_version
 
+    @pytest.mark.it(
+        "Uses a requests-unixsocket Session which is shared by every IoTEdgeHsm using the same workload_uri"
+    )
+    def test_session(self, hsm, module_id, module_generation_id, workload_uri, api_version):
+        assert isinstance(hsm._session, requests_unixsocket.Session)
+        same_uri_hsm = IoTEdgeHsm(
+            module_id=module_id,
+            module_generation_id=module_generation_id,
+            workload_uri=workload_uri,
+            api_version=api_version,
+        )
+        other_uri_hsm = IoTEdgeHsm(
+            module_id=module_id,
+            module_generation_id=module_generation_id,
+            workload_uri="unix:///var/run/iotedge/workload.sock",
+            api_version=api_version,
+        )
+        assert same_uri_hsm._session is hsm._session
+        assert other_uri_hsm._session is not hsm._session
+
 
 @pytest.mark.describe("IoTEdgeHsm - .get_trust_bundle()")
 class TestIoTEdgeHsmGetTrustBundle(object):
     @pytest.mark.it("Makes an HTTP request to EdgeHub for the trust bundle")
-    def test_requests_trust_bundle(self, mocker, hsm):
-        mock_request_get = mocker.patch.object(requests, "get")
+    def test_requests_trust_bundle(self, mocker, hsm, certificate):
+        mock_request_get = mocker.patch.object(hsm._session, "get")
+        mock_request_get.return_value.json.return_value = {"certificate": certificate}
         expected_url = hsm.workload_uri + "trust-bundle"
         expected_params = {"api-version": hsm.api_version}
         expected_headers = {
@@ -205,7 +310,7 @@ class TestIoTEdgeHsmGetTrustBundle(object):
 
     @pytest.mark.it("Returns the certificate from the trust bundle received from EdgeHub")
     def test_returns_received_trust_bundle(self, mocker, hsm, certificate):
-        mock_request_get = mocker.patch.object(requests, "get")
+        mock_request_get = mocker.patch.object(hsm._session, "get")
         mock_response = mock_request_get.return_value
         mock_response.json.return_value = {"certificate": certificate}
 
@@ -215,7 +320,7 @@ class TestIoTEdgeHsmGetTrustBundle(object):
 
     @pytest.mark.it("Raises IoTEdgeError if a bad request is made to EdgeHub")
     def test_bad_request(self, mocker, hsm):
-        mock_request_get = mocker.patch.object(requests, "get")
+        mock_request_get = mocker.patch.object(hsm._session, "get")
         mock_response = mock_request_get.return_value
         error = requests.exceptions.HTTPError()
         mock_response.raise_for_status.side_effect = error
@@ -226,7 +331,7 @@ class TestIoTEdgeHsmGetTrustBundle(object):
 
     @pytest.mark.it("Raises IoTEdgeError if there is an error in json decoding the trust bundle")
     def test_bad_json(self, mocker, hsm):
-        mock_request_get = mocker.patch.object(requests, "get")
+        mock_request_get = mocker.patch.object(hsm._session, "get")
         mock_response = mock_request_get.return_value
         error = ValueError()
         mock_response.json.side_effect = error
@@ -237,7 +342,7 @@ class TestIoTEdgeHsmGetTrustBundle(object):
 
     @pytest.mark.it("Raises IoTEdgeError if the certificate is missing from the trust bundle")
     def test_bad_trust_bundle(self, mocker, hsm):
-        mock_request_get = mocker.patch.object(requests, "get")
+        mock_request_get = mocker.patch.object(hsm._session, "get")
         mock_response = mock_request_get.return_value
         # Return an empty json dict with no 'certificate' key
         mock_response.json.return_value = {}
@@ -245,6 +350,208 @@ class TestIoTEdgeHsmGetTrustBundle(object):
         with pytest.raises(IoTEdgeError):
             hsm.get_trust_bundle()
 
+    @pytest.mark.it(
+        "Raises IoTEdgeError if the trust bundle does not contain a valid PEM certificate"
+    )
+    @pytest.mark.parametrize(
+        "bad_certificate",
+        [
+            pytest.param(None, id="Not a string"),
+            pytest.param("__FAKE_CERTIFICATE__", id="Not PEM"),
+            pytest.param(
+                "-----BEGIN CERTIFICATE-----\n!!!!\n-----END CERTIFICATE-----\n", id="Not base64"
+            ),
+            pytest.param(
+                "-----BEGIN CERTIFICATE-----\nZm9vYmFy\n-----END CERTIFICATE-----\n",
+                id="Not DER",
+            ),
+        ],
+    )
+    def test_invalid_certificate(self, mocker, hsm, bad_certificate):
+        mock_request_get = mocker.patch.object(hsm._session, "get")
+        mock_request_get.return_value.json.return_value = {"certificate": bad_certificate}
+
+        with pytest.raises(IoTEdgeError):
+            hsm.get_trust_bundle()
+
+    @pytest.mark.it(
+        "Returns the trust bundle received earlier without making a request, if it was received less than TRUST_BUNDLE_CACHE_TTL seconds ago"
+    )
+    def test_cached(
+        self, mocker, hsm, certificate, module_id, module_generation_id, workload_uri, api_version
+    ):
+        mock_request_get = mocker.patch.object(hsm._session, "get")
+        mock_request_get.return_value.json.return_value = {"certificate": certificate}
+        mock_time = mocker.patch.object(iotedge_authentication_provider.time, "time")
+        mock_time.return_value = 1000
+        hsm.get_trust_bundle()
+
+        # The cached trust bundle is also used by other IoTEdgeHsm objects for the same workload API
+        other_hsm = IoTEdgeHsm(
+            module_id=module_id,
+            module_generation_id=module_generation_id,
+            workload_uri=workload_uri,
+            api_version=api_version,
+        )
+        mock_time.return_value = 1000 + iotedge_authentication_provider.TRUST_BUNDLE_CACHE_TTL - 1
+        assert other_hsm.get_trust_bundle() is certificate
+        assert mock_request_get.call_count == 1
+
+        mock_time.return_value = 1000 + iotedge_authentication_provider.TRUST_BUNDLE_CACHE_TTL
+        assert other_hsm.get_trust_bundle() is certificate
+        assert mock_request_get.call_count == 2
+
+    @pytest.mark.it("Does not cache a trust bundle which could not be retrieved")
+    def test_not_cached_on_failure(self, mocker, hsm, certificate):
+        mock_request_get = mocker.patch.object(hsm._session, "get")
+        mock_request_get.return_value.json.return_value = {}
+        with pytest.raises(IoTEdgeError):
+            hsm.get_trust_bundle()
+
+        mock_request_get.return_value.json.return_value = {"certificate": certificate}
+        assert hsm.get_trust_bundle() is certificate
+        assert mock_request_get.call_count == 2
+
+    @pytest.mark.it("Makes a new request after the trust bundle cache is cleared")
+    def test_clear_cache(self, mocker, hsm, certificate):
+        mock_request_get = mocker.patch.object(hsm._session, "get")
+        mock_request_get.return_value.json.return_value = {"certificate": certificate}
+        hsm.get_trust_bundle()
+        iotedge_authentication_provider.clear_trust_bundle_cache()
+        hsm.get_trust_bundle()
+        assert mock_request_get.call_count == 2
+
+
+@pytest.mark.describe("IoTEdgeHsm - .get_trust_bundle() with a trust_bundle_cache_directory")
+class TestIoTEdgeHsmGetTrustBundleWithCacheDirectory(object):
+    @pytest.fixture
+    def stored_certificate(self, make_certificate):
+        return make_certificate("20491231235959Z")
+
+    @pytest.fixture
+    def hsm(self, tmpdir, module_id, module_generation_id, workload_uri, api_version):
+        return IoTEdgeHsm(
+            module_id=module_id,
+            module_generation_id=module_generation_id,
+            workload_uri=workload_uri,
+            api_version=api_version,
+            trust_bundle_cache_directory=str(tmpdir),
+        )
+
+    @pytest.fixture
+    def mock_request_get(self, mocker, hsm, make_certificate):
+        mock_request_get = mocker.patch.object(hsm._session, "get")
+        mock_request_get.return_value.json.return_value = {
+            "certificate": make_certificate("20401231235959Z")
+        }
+        return mock_request_get
+
+    @pytest.mark.it("Stores the trust bundle received from EdgeHub in the directory")
+    def test_stores(self, hsm, mock_request_get):
+        cert = hsm.get_trust_bundle()
+        stored = trust_bundle_store.load(hsm._get_trust_bundle_path())
+        assert stored[0] == cert
+
+    @pytest.mark.it("Returns the stored trust bundle without making a request")
+    def test_uses_stored(self, mocker, hsm, mock_request_get, stored_certificate):
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), stored_certificate, time.time())
+        mock_refresh = mocker.patch.object(hsm, "_refresh_trust_bundle_in_background")
+
+        assert hsm.get_trust_bundle() == stored_certificate
+        assert mock_request_get.call_count == 0
+        assert mock_refresh.call_count == 0
+
+    @pytest.mark.it(
+        "Returns the stored trust bundle, and requests it again in the background, if it is more than TRUST_BUNDLE_CACHE_TTL seconds old"
+    )
+    def test_refreshes_old(self, mocker, hsm, mock_request_get, stored_certificate):
+        received_time = time.time() - iotedge_authentication_provider.TRUST_BUNDLE_CACHE_TTL
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), stored_certificate, received_time)
+        mock_refresh = mocker.patch.object(hsm, "_refresh_trust_bundle_in_background")
+
+        assert hsm.get_trust_bundle() == stored_certificate
+        assert mock_request_get.call_count == 0
+        assert mock_refresh.call_count == 1
+
+    @pytest.mark.it("Makes a request if the stored trust bundle has expired")
+    def test_expired(self, hsm, mock_request_get, make_certificate):
+        expired_certificate = make_certificate("20190101000000Z")
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), expired_certificate, time.time())
+
+        cert = hsm.get_trust_bundle()
+
+        assert mock_request_get.call_count == 1
+        assert cert == mock_request_get.return_value.json.return_value["certificate"]
+        assert trust_bundle_store.load(hsm._get_trust_bundle_path())[0] == cert
+
+    @pytest.mark.it("Returns the received trust bundle even if it cannot be stored")
+    def test_store_failure(self, mocker, hsm, mock_request_get):
+        mocker.patch.object(trust_bundle_store, "save", side_effect=OSError())
+        cert = hsm.get_trust_bundle()
+        assert cert == mock_request_get.return_value.json.return_value["certificate"]
+
+    @pytest.mark.it(
+        "Sets the trust_bundle_is_stored attribute if it returns the stored trust bundle"
+    )
+    def test_is_stored(self, hsm, mock_request_get, stored_certificate):
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), stored_certificate, time.time())
+
+        hsm.get_trust_bundle()
+        assert hsm.trust_bundle_is_stored
+        # The stored trust bundle is now cached, but it is still a stored one
+        hsm.get_trust_bundle()
+        assert hsm.trust_bundle_is_stored
+
+    @pytest.mark.it("Does not set the trust_bundle_is_stored attribute if it makes a request")
+    def test_is_not_stored(self, hsm, mock_request_get):
+        hsm.get_trust_bundle()
+        assert not hsm.trust_bundle_is_stored
+        hsm.get_trust_bundle()
+        assert not hsm.trust_bundle_is_stored
+
+    @pytest.mark.it(
+        "Requests the trust bundle again and replaces the stored trust bundle when .refresh_trust_bundle() is called"
+    )
+    def test_refresh_trust_bundle(self, hsm, mock_request_get, stored_certificate):
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), stored_certificate, time.time())
+        hsm.get_trust_bundle()
+
+        cert = hsm.refresh_trust_bundle()
+
+        assert mock_request_get.call_count == 1
+        assert cert == mock_request_get.return_value.json.return_value["certificate"]
+        assert not hsm.trust_bundle_is_stored
+        assert trust_bundle_store.load(hsm._get_trust_bundle_path())[0] == cert
+        assert hsm.get_trust_bundle() == cert
+
+    @pytest.mark.it("Stores the trust bundle received by a background refresh")
+    def test_background_refresh(self, hsm, mock_request_get, stored_certificate):
+        received_time = time.time() - iotedge_authentication_provider.TRUST_BUNDLE_CACHE_TTL
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), stored_certificate, received_time)
+
+        hsm._refresh_trust_bundle_in_background()
+        for thread in threading.enumerate():
+            if thread.name == "azure_iot_trust_bundle_refresh":
+                thread.join()
+
+        assert mock_request_get.call_count == 1
+        cert, new_received_time = trust_bundle_store.load(hsm._get_trust_bundle_path())
+        assert cert == mock_request_get.return_value.json.return_value["certificate"]
+        assert new_received_time > received_time
+
+    @pytest.mark.it("Keeps the stored trust bundle if the background refresh fails")
+    def test_background_refresh_failure(self, hsm, mock_request_get, stored_certificate):
+        trust_bundle_store.save(hsm._get_trust_bundle_path(), stored_certificate, 1000)
+        mock_request_get.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError()
+
+        hsm._refresh_trust_bundle_in_background()
+        for thread in threading.enumerate():
+            if thread.name == "azure_iot_trust_bundle_refresh":
+                thread.join()
+
+        assert mock_request_get.call_count == 1
+        assert trust_bundle_store.load(hsm._get_trust_bundle_path()) == (stored_certificate, 1000)
+
 
 @pytest.mark.describe("IoTEdgeHsm - .sign()")
 class TestIoTEdgeHsmSign(object):
@@ -252,7 +559,7 @@ class TestIoTEdgeHsmSign(object):
     def test_requests_data_signing(self, mocker, hsm):
         data_str = "somedata"
         data_str_b64 = "c29tZWRhdGE="
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_request_post.return_value.json.return_value = {"digest": "somedigest"}
         expected_url = "{workload_uri}modules/{module_id}/genid/{module_generation_id}/sign".format(
             workload_uri=hsm.workload_uri,
@@ -278,7 +585,7 @@ class TestIoTEdgeHsmSign(object):
         # important to have an explicit test for it since it's a requirement
         data_str = "somedata"
         data_str_b64 = base64.b64encode(data_str.encode("utf-8")).decode()
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_request_post.return_value.json.return_value = {"digest": "somedigest"}
 
         hsm.sign(data_str)
@@ -291,7 +598,7 @@ class TestIoTEdgeHsmSign(object):
     @pytest.mark.it("Returns the signed data received from EdgeHub")
     def test_returns_signed_data(self, mocker, hsm):
         expected_digest = "somedigest"
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_request_post.return_value.json.return_value = {"digest": expected_digest}
 
         signed_data = hsm.sign("somedata")
@@ -302,7 +609,7 @@ class TestIoTEdgeHsmSign(object):
     def test_url_encodes_signed_data(self, mocker, hsm):
         raw_signed_data = "this digest will be encoded"
         expected_signed_data = urllib.parse.quote(raw_signed_data)
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_request_post.return_value.json.return_value = {"digest": raw_signed_data}
 
         signed_data = hsm.sign("somedata")
@@ -312,7 +619,7 @@ class TestIoTEdgeHsmSign(object):
 
     @pytest.mark.it("Raises IoTEdgeError if a bad request is made to EdgeHub")
     def test_bad_request(self, mocker, hsm):
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_response = mock_request_post.return_value
         error = requests.exceptions.HTTPError()
         mock_response.raise_for_status.side_effect = error
@@ -323,7 +630,7 @@ class TestIoTEdgeHsmSign(object):
 
     @pytest.mark.it("Raises IoTEdgeError if there is an error in json decoding the signed response")
     def test_bad_json(self, mocker, hsm):
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_response = mock_request_post.return_value
         error = ValueError()
         mock_response.json.side_effect = error
@@ -333,7 +640,7 @@ class TestIoTEdgeHsmSign(object):
 
     @pytest.mark.it("Raises IoTEdgeError if the signed data is missing from the response")
     def test_bad_response(self, mocker, hsm):
-        mock_request_post = mocker.patch.object(requests, "post")
+        mock_request_post = mocker.patch.object(hsm._session, "post")
         mock_response = mock_request_post.return_value
         mock_response.json.return_value = {}
 
@@ -0,0 +1,235 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import threading
+from mock import MagicMock
+from azure.iot.device.iothub.auth import sas_token_service
+from azure.iot.device.iothub.auth.sas_token_service import (
+    SasTokenService,
+    DEFAULT_RENEWAL_JITTER,
+    DEFAULT_PRESIGN_LEAD,
+    DEFAULT_PRESIGN_CONCURRENCY,
+)
+from azure.iot.device.iothub.auth.base_renewable_token_authentication_provider import (
+    BaseRenewableTokenAuthenticationProvider,
+)
+
+logging.basicConfig(level=logging.DEBUG)
+
+fake_signature = "__FAKE_SIGNATURE__"
+
+
+class FakeAuthProvider(BaseRenewableTokenAuthenticationProvider):
+    def __init__(self):
+        super(FakeAuthProvider, self).__init__("__FAKE_HOSTNAME__", "__FAKE_DEVICE_ID__")
+        self.sign_error = None
+
+    def _sign(self, quoted_resource_uri, expiry):
+        if self.sign_error:
+            raise self.sign_error
+        return fake_signature
+
+
+@pytest.fixture
+def timers(mocker):
+    """The Timer objects created by the service, in the order they were created"""
+    created = []
+
+    def create_timer(interval, function, args=None):
+        timer = MagicMock(interval=interval, function=function, args=args)
+        created.append(timer)
+        return timer
+
+    mocker.patch.object(sas_token_service, "Timer", side_effect=create_timer)
+    return created
+
+
+def fire(timer):
+    timer.function(*timer.args)
+
+
+class InlineExecutor(object):
+    """Stands in for the ThreadPoolExecutor of the service, running functions immediately"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def service():
+    service = SasTokenService(renewal_jitter=0)
+    service._executor = InlineExecutor()
+    return service
+
+
+@pytest.fixture
+def provider():
+    return FakeAuthProvider()
+
+
+@pytest.mark.describe("SasTokenService - Instantiation")
+class TestSasTokenServiceInstantiation(object):
+    @pytest.mark.it("Uses the default renewal jitter and presign lead if none are given")
+    def test_defaults(self):
+        service = SasTokenService()
+        assert service.renewal_jitter == DEFAULT_RENEWAL_JITTER
+        assert service.presign_lead == DEFAULT_PRESIGN_LEAD
+        assert service.presign_concurrency == DEFAULT_PRESIGN_CONCURRENCY
+
+    @pytest.mark.it("Raises a ValueError if the renewal jitter is not between 0 and 1")
+    @pytest.mark.parametrize("renewal_jitter", [-0.1, 1.1])
+    def test_bad_jitter(self, renewal_jitter):
+        with pytest.raises(ValueError):
+            SasTokenService(renewal_jitter=renewal_jitter)
+
+    @pytest.mark.it("Raises a ValueError if the presign lead is negative")
+    def test_bad_presign_lead(self):
+        with pytest.raises(ValueError):
+            SasTokenService(presign_lead=-1)
+
+    @pytest.mark.it("Raises a ValueError if the presign concurrency is less than 1")
+    def test_bad_presign_concurrency(self):
+        with pytest.raises(ValueError):
+            SasTokenService(presign_concurrency=0)
+
+
+@pytest.mark.describe("SasTokenService - .schedule_token_update()")
+class TestSasTokenServiceScheduleTokenUpdate(object):
+    @pytest.mark.it(
+        "Starts a timer to sign the next token presign_lead seconds before a timer for the token update"
+    )
+    def test_starts_timers(self, service, provider, timers):
+        service.schedule_token_update(provider, 1000)
+        assert len(timers) == 2
+        assert timers[0].interval == 1000 - DEFAULT_PRESIGN_LEAD
+        assert timers[1].interval == 1000
+        timers[0].start.assert_called_once_with()
+        timers[1].start.assert_called_once_with()
+
+    @pytest.mark.it("Signs the next token immediately if the update is less than presign_lead away")
+    def test_presign_now(self, service, provider, timers):
+        service.schedule_token_update(provider, DEFAULT_PRESIGN_LEAD / 2)
+        assert timers[0].interval == 0
+        assert timers[1].interval == DEFAULT_PRESIGN_LEAD / 2
+
+    @pytest.mark.it(
+        "Moves the update earlier by a random amount of up to renewal_jitter of the delay"
+    )
+    @pytest.mark.parametrize("random_jitter", [0, 50, 100])
+    def test_jitter(self, mocker, provider, timers, random_jitter):
+        service = SasTokenService(renewal_jitter=0.1)
+        uniform = mocker.patch.object(service._random, "uniform", return_value=random_jitter)
+        service.schedule_token_update(provider, 1000)
+        uniform.assert_called_once_with(0, 100)
+        assert timers[1].interval == 1000 - random_jitter
+        assert timers[0].interval == 1000 - random_jitter - DEFAULT_PRESIGN_LEAD
+
+    @pytest.mark.it("Returns a renewal which cancels both timers when it is cancelled")
+    def test_cancel(self, service, provider, timers):
+        renewal = service.schedule_token_update(provider, 1000)
+        renewal.cancel()
+        timers[0].cancel.assert_called_once_with()
+        timers[1].cancel.assert_called_once_with()
+
+    @pytest.mark.it("Signs the next token on a worker thread when the presign timer expires")
+    def test_presign_thread(self, provider, timers):
+        service = SasTokenService(renewal_jitter=0)
+        provider.token_validity_period += 10
+        renewal = service.schedule_token_update(provider, 1000)
+        signing_threads = []
+
+        def create_sas_token():
+            signing_threads.append(threading.current_thread())
+            return ("__PRESIGNED_TOKEN__", 1000)
+
+        provider._create_sas_token = create_sas_token
+        fire(timers[0])
+        service._executor.shutdown(wait=True)
+        assert renewal.presigned == ("__PRESIGNED_TOKEN__", 1000)
+        assert signing_threads[0] is not threading.current_thread()
+
+    @pytest.mark.it("Updates the token on a worker thread when the update timer expires")
+    def test_update_thread(self, provider, timers):
+        service = SasTokenService(renewal_jitter=0)
+        service.schedule_token_update(provider, 1000)
+        update_threads = []
+        provider.generate_new_sas_token = lambda: update_threads.append(threading.current_thread())
+        fire(timers[1])
+        service._executor.shutdown(wait=True)
+        assert len(update_threads) == 1
+        assert update_threads[0] is not threading.current_thread()
+
+    @pytest.mark.it("Does not keep the provider from being collected")
+    def test_weak_reference(self, service, timers):
+        provider = FakeAuthProvider()
+        service.schedule_token_update(provider, 1000)
+        del provider
+        fire(timers[0])
+        fire(timers[1])
+
+
+@pytest.mark.describe("SasTokenService - Token update")
+class TestSasTokenServiceTokenUpdate(object):
+    @pytest.fixture
+    def scheduled_provider(self, service, provider, timers):
+        provider.token_service = service
+        provider.get_current_sas_token()
+        provider.on_sas_token_updated_handler_list = [MagicMock()]
+        del timers[:]
+        return provider
+
+    @pytest.mark.it("Signs the next token without using it when the presign timer expires")
+    def test_presign(self, scheduled_provider, timers):
+        renewal = scheduled_provider._token_update_timer
+        current_token = scheduled_provider.get_current_sas_token()
+        scheduled_provider.token_validity_period += 10
+        fire(renewal.presign_timer)
+        assert renewal.presigned is not None
+        assert renewal.presigned[0] != current_token
+        assert scheduled_provider.get_current_sas_token() == current_token
+        assert scheduled_provider.on_sas_token_updated_handler_list[0].call_count == 0
+
+    @pytest.mark.it(
+        "Uses the presigned token, notifies the pipeline and schedules the next update when the update timer expires"
+    )
+    def test_update(self, mocker, scheduled_provider, timers):
+        renewal = scheduled_provider._token_update_timer
+        scheduled_provider.token_validity_period += 10
+        fire(renewal.presign_timer)
+        sign = mocker.spy(scheduled_provider, "_sign")
+        fire(renewal.update_timer)
+        assert scheduled_provider.get_current_sas_token() == renewal.presigned[0]
+        assert sign.call_count == 0
+        scheduled_provider.on_sas_token_updated_handler_list[0].assert_called_once_with()
+        assert scheduled_provider._token_update_timer is not renewal
+        assert len(timers) == 2
+
+    @pytest.mark.it(
+        "Signs the new token when the update timer expires if it could not be presigned"
+    )
+    def test_presign_failure(self, mocker, scheduled_provider, timers):
+        renewal = scheduled_provider._token_update_timer
+        current_token = scheduled_provider.get_current_sas_token()
+        scheduled_provider.token_validity_period += 10
+        scheduled_provider.sign_error = RuntimeError("HSM unavailable")
+        fire(renewal.presign_timer)
+        assert renewal.presigned is None
+
+        scheduled_provider.sign_error = None
+        fire(renewal.update_timer)
+        assert scheduled_provider.get_current_sas_token() != current_token
+        scheduled_provider.on_sas_token_updated_handler_list[0].assert_called_once_with()
+
+
+@pytest.mark.describe("get_shared_sas_token_service()")
+class TestGetSharedSasTokenService(object):
+    @pytest.mark.it("Returns the same SasTokenService every time")
+    def test_shared(self):
+        service = sas_token_service.get_shared_sas_token_service()
+        assert isinstance(service, SasTokenService)
+        assert sas_token_service.get_shared_sas_token_service() is service
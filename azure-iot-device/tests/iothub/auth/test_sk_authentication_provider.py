@@ -4,6 +4,7 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import base64
 import pytest
 import logging
 from azure.iot.device.iothub.auth.sk_authentication_provider import (
@@ -141,3 +142,20 @@ def test_raises_when_auth_provider_created_from_connection_string_with_bad_keys(
     with pytest.raises(ValueError, match="Invalid Connection String - Invalid Key"):
         connection_string = "BadHostName=beauxbatons.academy-net;BadDeviceId=TheDeluminator;SharedAccessKey=Zm9vYmFy"
         SymmetricKeyAuthenticationProvider.parse(connection_string)
+
+
+def test_sign_decodes_shared_access_key_only_when_it_changes(mocker):
+    b64decode = mocker.spy(base64, "b64decode")
+    sym_key_auth_provider = SymmetricKeyAuthenticationProvider(
+        hostname, device_id, None, shared_access_key
+    )
+    sym_key_auth_provider._sign("fake_uri", 1000)
+    sym_key_auth_provider._sign("fake_uri", 2000)
+    assert b64decode.call_count == 1
+
+    sym_key_auth_provider.shared_access_key = "YmF6"
+    signature = sym_key_auth_provider._sign("fake_uri", 2000)
+    assert b64decode.call_count == 2
+    assert signature == SymmetricKeyAuthenticationProvider(hostname, device_id, None, "YmF6")._sign(
+        "fake_uri", 2000
+    )
@@ -0,0 +1,195 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import calendar
+import json
+import logging
+import os
+import stat
+from azure.iot.device.iothub.auth import trust_bundle_store
+
+logging.basicConfig(level=logging.DEBUG)
+
+# 2049-12-31T23:59:59Z
+expiry_2049 = calendar.timegm((2049, 12, 31, 23, 59, 59, 0, 0, 0))
+
+
+@pytest.fixture
+def certificate(make_certificate):
+    return make_certificate("20491231235959Z")
+
+
+@pytest.fixture
+def path(tmpdir):
+    return os.path.join(str(tmpdir), "trust_bundles", "trust_bundle.json")
+
+
+posix_only = pytest.mark.skipif(
+    not hasattr(os, "getuid"), reason="Ownership and permissions are only checked on POSIX"
+)
+
+
+@pytest.mark.describe("trust_bundle_store - .get_expiry()")
+class TestGetExpiry(object):
+    @pytest.mark.it("Returns the notAfter time of a certificate, in seconds since the epoch")
+    @pytest.mark.parametrize("generalized_time", [False, True], ids=["UTCTime", "GeneralizedTime"])
+    def test_expiry(self, make_certificate, generalized_time):
+        certificate = make_certificate("20491231235959Z", generalized_time=generalized_time)
+        assert trust_bundle_store.get_expiry(certificate) == expiry_2049
+
+    @pytest.mark.it("Reads two digit years of 50 and above as 19xx")
+    def test_utc_time_century(self, make_certificate):
+        certificate = make_certificate("19991231235959Z")
+        expected = calendar.timegm((1999, 12, 31, 23, 59, 59, 0, 0, 0))
+        assert trust_bundle_store.get_expiry(certificate) == expected
+
+    @pytest.mark.it("Reads certificates without a version field")
+    def test_no_version(self, make_certificate):
+        certificate = make_certificate("20491231235959Z", version=False)
+        assert trust_bundle_store.get_expiry(certificate) == expiry_2049
+
+    @pytest.mark.it("Returns the earliest expiry of a bundle of several certificates")
+    def test_bundle(self, make_certificate):
+        bundle = (
+            make_certificate("20491231235959Z")
+            + make_certificate("20301231235959Z")
+            + make_certificate("20401231235959Z")
+        )
+        expected = calendar.timegm((2030, 12, 31, 23, 59, 59, 0, 0, 0))
+        assert trust_bundle_store.get_expiry(bundle) == expected
+
+    @pytest.mark.it("Raises a ValueError if the certificate cannot be read")
+    @pytest.mark.parametrize(
+        "bad_certificate",
+        [
+            pytest.param("__FAKE_CERTIFICATE__", id="Not PEM"),
+            pytest.param(
+                "-----BEGIN CERTIFICATE-----\nMAUwAw==\n-----END CERTIFICATE-----\n",
+                id="Truncated DER",
+            ),
+            pytest.param(
+                "-----BEGIN CERTIFICATE-----\nAgEB\n-----END CERTIFICATE-----\n", id="Not DER"
+            ),
+        ],
+    )
+    def test_bad_certificate(self, bad_certificate):
+        with pytest.raises(ValueError):
+            trust_bundle_store.get_expiry(bad_certificate)
+
+
+@pytest.mark.describe("trust_bundle_store - .get_path()")
+class TestGetPath(object):
+    @pytest.mark.it("Returns the same path in the directory for the same workload API")
+    def test_same(self):
+        path = trust_bundle_store.get_path("fake_directory", "fake_uri", "fake_api_version")
+        assert os.path.dirname(path) == "fake_directory"
+        assert path == trust_bundle_store.get_path("fake_directory", "fake_uri", "fake_api_version")
+
+    @pytest.mark.it("Returns different paths for different workload URIs and API versions")
+    def test_different(self):
+        path = trust_bundle_store.get_path("fake_directory", "fake_uri", "fake_api_version")
+        assert path != trust_bundle_store.get_path(
+            "fake_directory", "other_fake_uri", "fake_api_version"
+        )
+        assert path != trust_bundle_store.get_path(
+            "fake_directory", "fake_uri", "other_fake_api_version"
+        )
+
+
+@pytest.mark.describe("trust_bundle_store - .save() and .load()")
+class TestSaveAndLoad(object):
+    @pytest.mark.it(
+        "Loads the trust bundle and the time it was received, after creating the directory to save it in"
+    )
+    def test_round_trip(self, path, certificate):
+        trust_bundle_store.save(path, certificate, 1000)
+        assert trust_bundle_store.load(path) == (certificate, 1000)
+        assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+    @pytest.mark.it("Replaces a trust bundle that was saved earlier")
+    def test_replace(self, path, certificate, make_certificate):
+        trust_bundle_store.save(path, make_certificate("20401231235959Z"), 1000)
+        trust_bundle_store.save(path, certificate, 2000)
+        assert trust_bundle_store.load(path) == (certificate, 2000)
+
+    @pytest.mark.it("Returns None if there is no trust bundle saved")
+    def test_missing(self, path):
+        assert trust_bundle_store.load(path) is None
+
+    @pytest.mark.it("Returns None if the file is not a saved trust bundle")
+    @pytest.mark.parametrize(
+        "content", ["", "not json", "[]", '{"certificate": "fake"}'], ids=lambda c: repr(c)
+    )
+    def test_corrupt(self, path, certificate, content):
+        trust_bundle_store.save(path, certificate, 1000)
+        with open(path, "w") as f:
+            f.write(content)
+        assert trust_bundle_store.load(path) is None
+
+    @pytest.mark.it("Returns None if the trust bundle does not match its fingerprint")
+    def test_fingerprint(self, path, certificate, make_certificate):
+        trust_bundle_store.save(path, certificate, 1000)
+        with open(path, "r") as f:
+            stored = json.load(f)
+        stored["certificate"] = make_certificate("20401231235959Z")
+        with open(path, "w") as f:
+            json.dump(stored, f)
+        assert trust_bundle_store.load(path) is None
+
+    @pytest.mark.it("Returns None if any certificate in the trust bundle has expired")
+    def test_expired(self, path, certificate, make_certificate):
+        trust_bundle_store.save(path, certificate + make_certificate("20190101000000Z"), 1000)
+        assert trust_bundle_store.load(path) is None
+
+    @pytest.mark.it("Writes each trust bundle through a temporary file of its own")
+    def test_unique_temporary_file(self, path, certificate):
+        # A fixed temporary file name would collide with this
+        os.makedirs(path + ".tmp", 0o700)
+        trust_bundle_store.save(path, certificate, 1000)
+        assert trust_bundle_store.load(path) == (certificate, 1000)
+        assert sorted(os.listdir(os.path.dirname(path))) == sorted(
+            [os.path.basename(path), os.path.basename(path) + ".tmp"]
+        )
+
+    @pytest.mark.it("Creates the directory and the file readable and writable only by the user")
+    @posix_only
+    def test_private_permissions(self, path, certificate):
+        trust_bundle_store.save(path, certificate, 1000)
+        assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) & 0o077 == 0
+        assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+
+
+@pytest.mark.describe("trust_bundle_store - .save() and .load() -- location is not private")
+@posix_only
+class TestSaveAndLoadInsecureLocation(object):
+    @pytest.mark.it(
+        "Raises InsecureLocationError from save(), without writing anything, if the directory can be written by other users"
+    )
+    @pytest.mark.parametrize("mode", [0o770, 0o707], ids=["Group", "Other"])
+    def test_save_writable_directory(self, path, certificate, mode):
+        os.makedirs(os.path.dirname(path))
+        os.chmod(os.path.dirname(path), mode)
+        with pytest.raises(trust_bundle_store.InsecureLocationError):
+            trust_bundle_store.save(path, certificate, 1000)
+        assert os.listdir(os.path.dirname(path)) == []
+
+    @pytest.mark.it(
+        "Returns None from load() if the directory or the file can be written by other users"
+    )
+    @pytest.mark.parametrize("mode", [0o020, 0o002], ids=["Group", "Other"])
+    @pytest.mark.parametrize("target", ["directory", "file"])
+    def test_load_writable(self, path, certificate, mode, target):
+        trust_bundle_store.save(path, certificate, 1000)
+        target_path = os.path.dirname(path) if target == "directory" else path
+        os.chmod(target_path, stat.S_IMODE(os.stat(target_path).st_mode) | mode)
+        assert trust_bundle_store.load(path) is None
+
+    @pytest.mark.it("Returns None from load() if the file is owned by another user")
+    def test_load_other_owner(self, mocker, path, certificate):
+        trust_bundle_store.save(path, certificate, 1000)
+        mocker.patch.object(os, "getuid", return_value=os.stat(path).st_uid + 1)
+        assert trust_bundle_store.load(path) is None
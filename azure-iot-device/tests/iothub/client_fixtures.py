@@ -176,6 +176,7 @@ def edge_local_debug_environment():
 class FakeIoTHubPipeline:
     def __init__(self):
         self.feature_enabled = {}  # This just has to be here for the spec
+        self.publish_window_open = True
 
     def connect(self, callback):
         callback()
@@ -189,9 +190,18 @@ class FakeIoTHubPipeline:
     def disable_feature(self, feature_name, callback):
         callback()
 
+    def encode_message(self, message):
+        return message
+
     def send_message(self, event, callback):
         callback()
 
+    def send_message_batch(self, messages, callback):
+        callback(results=[None] * len(messages))
+
+    def wait_for_publish_window(self, callback):
+        callback()
+
     def send_output_event(self, event, callback):
         callback()
 
@@ -234,7 +244,9 @@ def iothub_pipeline_manual_cb(mocker):
     """This fixture is for use in tests where manual triggering of a
     callback is required
     """
-    return mocker.MagicMock()
+    pipeline = mocker.MagicMock()
+    pipeline.encode_message.side_effect = lambda message: message
+    return pipeline
 
 
 @pytest.fixture
@@ -250,7 +262,9 @@ def http_pipeline_manual_cb(mocker):
     """This fixture is for use in tests where manual triggering of a
     callback is required
     """
-    return mocker.MagicMock()
+    pipeline = mocker.MagicMock()
+    pipeline.encode_message.side_effect = lambda message: message
+    return pipeline
 
 
 @pytest.fixture
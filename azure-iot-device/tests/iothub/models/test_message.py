@@ -6,7 +6,9 @@
 
 import pytest
 import logging
+import datetime
 from azure.iot.device.iothub.models import Message
+from azure.iot.device.iothub.pipeline import mqtt_topic_iothub
 from azure.iot.device import constant
 
 logging.basicConfig(level=logging.DEBUG)
@@ -62,3 +64,164 @@ class TestMessage(object):
     def test_str_rep(self, data):
         msg = Message(data)
         assert str(msg) == str(data)
+
+    @pytest.mark.it("Allows attributes other than those of a message to be added")
+    def test_other_attributes(self):
+        msg = Message("After all this time? Always")
+        msg.spell = "expecto patronum"
+        assert msg.spell == "expecto patronum"
+
+    @pytest.mark.it(
+        "Reports its size as the size of its payload plus the size of its properties as they are encoded onto the topic it is sent on"
+    )
+    @pytest.mark.parametrize(
+        "data, payload_size",
+        [
+            pytest.param("After all this time? Always", 27, id="String"),
+            pytest.param("été", 5, id="Non-ASCII string"),
+            pytest.param(b"\x00\x01\x02", 3, id="Bytes"),
+            pytest.param(bytearray(10), 10, id="Bytearray"),
+            pytest.param(987, 3, id="Integer"),
+            pytest.param(None, 0, id="None"),
+        ],
+    )
+    @pytest.mark.parametrize(
+        "properties",
+        [
+            pytest.param({}, id="No properties"),
+            pytest.param(
+                {
+                    "message_id": "Postage12323",
+                    "correlation_id": "correlation/id",
+                    "user_id": "user",
+                    "to": "/devices/device/messages",
+                    "content_type": "application/json",
+                    "content_encoding": "utf-8",
+                    "output_name": "output 1",
+                    "expiry_time_utc": datetime.datetime(2020, 1, 2, 3, 4, 5),
+                },
+                id="System properties",
+            ),
+        ],
+    )
+    @pytest.mark.parametrize(
+        "custom_properties",
+        [
+            pytest.param({}, id="No custom properties"),
+            pytest.param({"is-muggle": "yes", "house?": "huffle puff&co"}, id="Custom properties"),
+        ],
+    )
+    def test_get_size(self, data, payload_size, properties, custom_properties):
+        msg = Message(data)
+        for name, value in properties.items():
+            setattr(msg, name, value)
+        msg.custom_properties.update(custom_properties)
+
+        topic = mqtt_topic_iothub.encode_properties(msg, "")
+        assert msg.get_size() == payload_size + len(topic)
+
+    @pytest.mark.it("Includes the security message interface id in its size")
+    def test_get_size_security_message(self):
+        msg = Message("After all this time? Always")
+        size = msg.get_size()
+        msg.set_as_security_message()
+        assert msg.get_size() == size + len(
+            mqtt_topic_iothub.encode_properties(msg, "").split("&")[0]
+        )
+
+    @pytest.mark.it("Does not calculate its size again if it has not changed since the last time")
+    def test_get_size_cached(self, mocker):
+        msg = Message("After all this time? Always", message_id="Postage12323")
+        msg.custom_properties["spell"] = "expecto patronum"
+        size = msg.get_size()
+        encode_spy = mocker.spy(Message, "_encode_properties")
+        assert msg.get_size() == size
+        assert encode_spy.call_count == 0
+
+    @pytest.mark.it("Calculates its size again once its payload or properties have changed")
+    @pytest.mark.parametrize(
+        "change, size_change",
+        [
+            pytest.param(lambda msg: setattr(msg, "data", "Always"), -21, id="Payload replaced"),
+            pytest.param(lambda msg: msg.data.extend(b"more"), 4, id="Payload extended"),
+            pytest.param(
+                lambda msg: setattr(msg, "content_type", "text"),
+                len("%24.ct=text&"),
+                id="System property",
+            ),
+            pytest.param(
+                lambda msg: msg.custom_properties.update({"spell": "lumos"}),
+                -11,
+                id="Custom property",
+            ),
+            pytest.param(
+                lambda msg: msg.custom_properties.update({"house": "slytherin"}),
+                len("&house=slytherin"),
+                id="Custom property added",
+            ),
+        ],
+    )
+    def test_get_size_changed(self, change, size_change):
+        msg = Message(bytearray(b"After all this time? Always"))
+        msg.custom_properties["spell"] = "expecto patronum"
+        size = msg.get_size()
+        change(msg)
+        assert msg.get_size() == size + size_change
+
+
+@pytest.mark.describe("Message - Received properties")
+class TestMessageReceivedProperties(object):
+    encoded_properties = "%24.mid=Postage12323&%24.ct=application%2Fjson&spell=expecto+patronum"
+
+    @pytest.fixture
+    def decoder(self, mocker):
+        return mocker.MagicMock(
+            return_value=(
+                {"message_id": "Postage12323", "content_type": "application/json"},
+                {"spell": "expecto patronum"},
+            )
+        )
+
+    @pytest.fixture
+    def msg(self, decoder):
+        msg = Message("After all this time? Always")
+        msg._set_encoded_properties(self.encoded_properties, decoder)
+        return msg
+
+    @pytest.mark.it("Does not decode received properties until one of them is used")
+    def test_not_decoded(self, msg, decoder):
+        assert msg.data == "After all this time? Always"
+        assert msg.lock_token is None
+        assert decoder.call_count == 0
+
+    @pytest.mark.it("Decodes received properties once, when any one of them is first used")
+    @pytest.mark.parametrize(
+        "attribute",
+        [
+            "message_id",
+            "to",
+            "correlation_id",
+            "user_id",
+            "content_type",
+            "content_encoding",
+            "custom_properties",
+        ],
+    )
+    def test_decoded(self, mocker, msg, decoder, attribute):
+        getattr(msg, attribute)
+        assert decoder.call_args == mocker.call(self.encoded_properties)
+        assert msg.message_id == "Postage12323"
+        assert msg.content_type == "application/json"
+        assert msg.to is None
+        assert msg.custom_properties == {"spell": "expecto patronum"}
+        assert decoder.call_count == 1
+
+    @pytest.mark.it("Keeps a property which is set before the received properties are decoded")
+    def test_set_before_decoded(self, msg):
+        msg.message_id = "Postage45654"
+        assert msg.message_id == "Postage45654"
+        assert msg.content_type == "application/json"
+
+    @pytest.mark.it("Includes received properties in its size")
+    def test_get_size(self, msg):
+        assert msg.get_size() == len("After all this time? Always") + len(self.encoded_properties)
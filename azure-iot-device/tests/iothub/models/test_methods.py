@@ -48,6 +48,12 @@ class TestMethodRequest(object):
         assert m_req.payload != new_payload
         assert m_req.payload == dummy_payload
 
+    @pytest.mark.it("Allows other attributes to be added")
+    def test_other_attributes(self):
+        m_req = MethodRequest(request_id=dummy_rid, name=dummy_name, payload=dummy_payload)
+        m_req.other = "other"
+        assert m_req.other == "other"
+
 
 @pytest.mark.describe("MethodResponse - Instantiation")
 class TestMethodResponseInstantiation(object):
@@ -88,6 +94,12 @@ class TestMethodResponseInstantiation(object):
         assert response.status == dummy_status
         assert response.payload is None
 
+    @pytest.mark.it("Allows other attributes to be added")
+    def test_other_attributes(self):
+        response = MethodResponse(request_id=dummy_rid, status=dummy_status)
+        response.other = "other"
+        assert response.other == "other"
+
 
 @pytest.mark.describe("MethodResponse - .create_from_method_request()")
 class TestMethodResponseCreateFromMethodRequest(object):
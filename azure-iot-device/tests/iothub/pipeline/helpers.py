@@ -9,6 +9,7 @@ all_iothub_ops = [
     pipeline_ops_iothub.SetAuthProviderOperation,
     pipeline_ops_iothub.SetIoTHubConnectionArgsOperation,
     pipeline_ops_iothub.SendD2CMessageOperation,
+    pipeline_ops_iothub.SendD2CMessageBatchOperation,
     pipeline_ops_iothub.SendOutputEventOperation,
 ]
 
@@ -0,0 +1,184 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import json
+from azure.iot.device.iothub.pipeline import compression
+from azure.iot.device.iothub.pipeline.compression import MessageCompressor
+from azure.iot.device.iothub.models import Message
+
+logging.basicConfig(level=logging.DEBUG)
+
+telemetry = json.dumps([{"temperature": 21.5, "humidity": 40, "sensor": i} for i in range(50)])
+
+supported_encodings = [
+    pytest.param("gzip", id="gzip"),
+    pytest.param("deflate", id="deflate"),
+    pytest.param(
+        "zstd",
+        id="zstd",
+        marks=pytest.mark.skipif(
+            not compression.is_supported("zstd"), reason="zstandard is not installed"
+        ),
+    ),
+]
+
+
+@pytest.mark.describe("compression - .is_supported()")
+class TestIsSupported(object):
+    @pytest.mark.it("Returns True for gzip and deflate")
+    @pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+    def test_supported(self, encoding):
+        assert compression.is_supported(encoding)
+
+    @pytest.mark.it("Returns True for zstd only if the zstandard package is installed")
+    def test_zstd(self):
+        assert compression.is_supported("zstd") == (compression.zstandard is not None)
+
+    @pytest.mark.it("Returns False for other encodings")
+    @pytest.mark.parametrize("encoding", ["utf-8", "brotli", None])
+    def test_unsupported(self, encoding):
+        assert not compression.is_supported(encoding)
+
+
+@pytest.mark.describe("MessageCompressor - Instantiation")
+class TestMessageCompressorInstantiation(object):
+    @pytest.mark.it("Raises ValueError if the encoding is not supported")
+    def test_unsupported(self):
+        with pytest.raises(ValueError):
+            MessageCompressor("brotli")
+
+
+@pytest.mark.describe("MessageCompressor - .compress()")
+class TestMessageCompressorCompress(object):
+    @pytest.mark.it(
+        "Returns a copy of the message with text and bytes payloads compressed, and the content encoding set to the compression used"
+    )
+    @pytest.mark.parametrize("encoding", supported_encodings)
+    @pytest.mark.parametrize(
+        "data",
+        [
+            pytest.param(telemetry, id="text"),
+            pytest.param(telemetry.encode("utf-8"), id="bytes"),
+            pytest.param(bytearray(telemetry.encode("utf-8")), id="bytearray"),
+        ],
+    )
+    def test_compresses(self, encoding, data):
+        message = Message(data, message_id="fake_id")
+        compressed = MessageCompressor(encoding).compress(message)
+        assert compressed is not message
+        assert compressed.content_encoding == encoding
+        assert compressed.message_id == "fake_id"
+        assert compressed.get_size() < len(telemetry)
+
+        MessageCompressor(encoding).decompress(compressed)
+        assert compressed.data == telemetry.encode("utf-8")
+        assert compressed.content_encoding is None
+
+    @pytest.mark.it("Leaves the message that is passed in unchanged")
+    def test_original_unchanged(self):
+        message = Message(telemetry)
+        MessageCompressor("gzip").compress(message)
+        assert message.data == telemetry
+        assert message.content_encoding is None
+
+    @pytest.mark.it("Returns messages with payloads smaller than the threshold uncompressed")
+    def test_threshold(self):
+        message = Message(telemetry)
+        assert MessageCompressor("gzip", threshold=len(telemetry) + 1).compress(message) is message
+        assert message.data == telemetry
+        assert message.content_encoding is None
+
+        compressed = MessageCompressor("gzip", threshold=len(telemetry)).compress(message)
+        assert compressed.content_encoding == "gzip"
+
+    @pytest.mark.it("Returns messages with payloads which would not get smaller uncompressed")
+    def test_incompressible(self):
+        message = Message(b"\x8f\x03\xa2\x11")
+        assert MessageCompressor("gzip", threshold=0).compress(message) is message
+        assert message.data == b"\x8f\x03\xa2\x11"
+        assert message.content_encoding is None
+
+    @pytest.mark.it(
+        "Returns messages which already have a content encoding uncompressed, including messages which are already compressed"
+    )
+    @pytest.mark.parametrize("content_encoding", ["utf-8", "gzip", "deflate", "zstd"])
+    def test_content_encoding_set(self, content_encoding):
+        message = Message(telemetry, content_encoding=content_encoding)
+        assert MessageCompressor("gzip").compress(message) is message
+        assert message.data == telemetry
+        assert message.content_encoding == content_encoding
+
+    @pytest.mark.it("Returns messages with payloads which are not text or bytes uncompressed")
+    @pytest.mark.parametrize("data", [None, 12345, {"key": "value"}])
+    def test_other_payloads(self, data):
+        message = Message(data)
+        assert MessageCompressor("gzip", threshold=0).compress(message) is message
+        assert message.data is data
+        assert message.content_encoding is None
+
+
+@pytest.mark.describe("MessageCompressor - .decompress()")
+class TestMessageCompressorDecompress(object):
+    @pytest.mark.it(
+        "Decompresses payloads compressed with any supported compression, whichever compression it is configured with"
+    )
+    @pytest.mark.parametrize("encoding", supported_encodings)
+    def test_decompresses(self, encoding):
+        message = MessageCompressor(encoding).compress(Message(telemetry))
+        MessageCompressor("deflate" if encoding == "gzip" else "gzip").decompress(message)
+        assert message.data == telemetry.encode("utf-8")
+        assert message.content_encoding is None
+
+    @pytest.mark.it("Leaves messages which are not compressed unchanged")
+    @pytest.mark.parametrize("content_encoding", [None, "utf-8"])
+    def test_not_compressed(self, content_encoding):
+        message = Message(telemetry, content_encoding=content_encoding)
+        MessageCompressor("gzip").decompress(message)
+        assert message.data == telemetry
+        assert message.content_encoding == content_encoding
+
+    @pytest.mark.it("Leaves messages which cannot be decompressed unchanged")
+    def test_corrupt(self):
+        message = Message(b"not really gzip", content_encoding="gzip")
+        MessageCompressor("gzip").decompress(message)
+        assert message.data == b"not really gzip"
+        assert message.content_encoding == "gzip"
+
+    @pytest.mark.it("Leaves messages compressed with an unsupported compression unchanged")
+    def test_unsupported(self, mocker):
+        mocker.patch.dict(compression._CODECS, clear=False)
+        compression._CODECS.pop("zstd", None)
+        message = Message(b"zstd frame", content_encoding="zstd")
+        MessageCompressor("gzip").decompress(message)
+        assert message.data == b"zstd frame"
+        assert message.content_encoding == "zstd"
+
+    @pytest.mark.it(
+        "Leaves messages which would decompress to more than the maximum decompressed size unchanged"
+    )
+    @pytest.mark.parametrize("encoding", supported_encodings)
+    def test_max_decompressed_size(self, encoding):
+        message = MessageCompressor(encoding).compress(Message(telemetry))
+        data = message.data
+
+        MessageCompressor(encoding, max_decompressed_size=len(telemetry) - 1).decompress(message)
+        assert message.data == data
+        assert message.content_encoding == encoding
+
+        MessageCompressor(encoding, max_decompressed_size=len(telemetry)).decompress(message)
+        assert message.data == telemetry.encode("utf-8")
+        assert message.content_encoding is None
+
+    @pytest.mark.it("Limits received payloads to 4 MiB when decompressed by default")
+    def test_default_max_decompressed_size(self):
+        assert compression.DEFAULT_MAX_DECOMPRESSED_SIZE == 4 * 1024 * 1024
+        bomb = MessageCompressor("gzip").compress(Message(b"\0" * (8 * 1024 * 1024)))
+        data = bomb.data
+        MessageCompressor("gzip").decompress(bomb)
+        assert bomb.data == data
+        assert bomb.content_encoding == "gzip"
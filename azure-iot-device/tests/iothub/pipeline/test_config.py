@@ -7,6 +7,7 @@ import pytest
 import logging
 from tests.common.pipeline.pipeline_config_test import PipelineConfigInstantiationTestBase
 from azure.iot.device.iothub.pipeline.config import IoTHubPipelineConfig
+from azure.iot.device.common import outbox, serializers
 
 
 @pytest.mark.describe("IoTHubPipelineConfig - Instantiation")
@@ -41,3 +42,188 @@ class TestIoTHubPipelineConfigInstantiation(PipelineConfigInstantiationTestBase)
     def test_method_invoke(self):
         config = IoTHubPipelineConfig()
         assert config.method_invoke is False
+
+    @pytest.mark.it("Instantiates with the outbox attributes set to the provided parameters")
+    def test_outbox_set(self):
+        config = IoTHubPipelineConfig(
+            outbox_directory="/var/outbox",
+            outbox_max_bytes=1024,
+            outbox_eviction_policy=outbox.REJECT_NEW,
+            outbox_replay_concurrency=3,
+        )
+        assert config.outbox_directory == "/var/outbox"
+        assert config.outbox_max_bytes == 1024
+        assert config.outbox_eviction_policy == outbox.REJECT_NEW
+        assert config.outbox_replay_concurrency == 3
+
+    @pytest.mark.it(
+        "Instantiates without an outbox directory, and with the default outbox settings, if no outbox parameters are provided"
+    )
+    def test_outbox_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.outbox_directory is None
+        assert config.outbox_max_bytes == outbox.DEFAULT_MAX_BYTES
+        assert config.outbox_eviction_policy == outbox.DROP_OLDEST
+        assert config.outbox_replay_concurrency == 10
+
+    @pytest.mark.it("Allows the outbox to have no size limit")
+    def test_outbox_max_bytes_none(self):
+        config = IoTHubPipelineConfig(outbox_max_bytes=None)
+        assert config.outbox_max_bytes is None
+
+    @pytest.mark.it("Raises ValueError if the provided outbox eviction policy is not recognized")
+    def test_outbox_eviction_policy_invalid(self):
+        with pytest.raises(ValueError):
+            IoTHubPipelineConfig(outbox_eviction_policy="drop_newest")
+
+    @pytest.mark.it(
+        "Raises an error if the provided outbox replay concurrency is not a positive integer"
+    )
+    @pytest.mark.parametrize(
+        "concurrency, expected_error",
+        [
+            pytest.param(None, TypeError, id="None"),
+            pytest.param("4", TypeError, id="str"),
+            pytest.param(0, ValueError, id="0"),
+        ],
+    )
+    def test_outbox_replay_concurrency_invalid(self, concurrency, expected_error):
+        with pytest.raises(expected_error):
+            IoTHubPipelineConfig(outbox_replay_concurrency=concurrency)
+
+    @pytest.mark.it(
+        "Instantiates with the 'telemetry_qos' attribute set to the provided 'telemetry_qos'"
+    )
+    @pytest.mark.parametrize("qos", [0, 1])
+    def test_telemetry_qos_set(self, qos):
+        config = IoTHubPipelineConfig(telemetry_qos=qos)
+        assert config.telemetry_qos == qos
+
+    @pytest.mark.it("Instantiates with the 'telemetry_qos' attribute defaulting to 1")
+    def test_telemetry_qos_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.telemetry_qos == 1
+
+    @pytest.mark.it("Raises ValueError if the provided 'telemetry_qos' is not 0 or 1")
+    @pytest.mark.parametrize("qos", [2, -1, "1", True, None])
+    def test_telemetry_qos_invalid(self, qos):
+        with pytest.raises(ValueError):
+            IoTHubPipelineConfig(telemetry_qos=qos)
+
+    @pytest.mark.it(
+        "Instantiates with the 'compression' attribute set to the provided 'compression'"
+    )
+    @pytest.mark.parametrize("compression", ["gzip", "deflate"])
+    def test_compression_set(self, compression):
+        config = IoTHubPipelineConfig(compression=compression)
+        assert config.compression == compression
+
+    @pytest.mark.it("Instantiates with the 'compression' attribute defaulting to None")
+    def test_compression_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.compression is None
+
+    @pytest.mark.it("Raises ValueError if the provided 'compression' is not supported")
+    @pytest.mark.parametrize("compression", ["brotli", "GZIP", ""])
+    def test_compression_invalid(self, compression):
+        with pytest.raises(ValueError):
+            IoTHubPipelineConfig(compression=compression)
+
+    @pytest.mark.it(
+        "Instantiates with the 'compression_threshold' attribute set to the provided 'compression_threshold'"
+    )
+    @pytest.mark.parametrize("threshold", [0, 1, 4096])
+    def test_compression_threshold_set(self, threshold):
+        config = IoTHubPipelineConfig(compression_threshold=threshold)
+        assert config.compression_threshold == threshold
+
+    @pytest.mark.it("Instantiates with the 'compression_threshold' attribute defaulting to 1024")
+    def test_compression_threshold_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.compression_threshold == 1024
+
+    @pytest.mark.it("Raises an error if the provided 'compression_threshold' is invalid")
+    @pytest.mark.parametrize(
+        "threshold, expected_error",
+        [
+            pytest.param(-1, ValueError, id="Negative"),
+            pytest.param("1024", TypeError, id="String"),
+            pytest.param(None, TypeError, id="None"),
+            pytest.param(True, TypeError, id="Boolean"),
+        ],
+    )
+    def test_compression_threshold_invalid(self, threshold, expected_error):
+        with pytest.raises(expected_error):
+            IoTHubPipelineConfig(compression_threshold=threshold)
+
+    @pytest.mark.it(
+        "Instantiates with the 'payload_serializer' attribute set to the serializer with the provided name"
+    )
+    @pytest.mark.parametrize("name", ["json", "auto"])
+    def test_payload_serializer_set(self, name):
+        config = IoTHubPipelineConfig(payload_serializer=name)
+        assert config.payload_serializer is serializers.get_serializer(name)
+
+    @pytest.mark.it("Instantiates with the 'payload_serializer' attribute defaulting to None")
+    def test_payload_serializer_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.payload_serializer is None
+
+    @pytest.mark.it("Raises ValueError if the provided 'payload_serializer' is unknown")
+    def test_payload_serializer_invalid(self):
+        with pytest.raises(ValueError):
+            IoTHubPipelineConfig(payload_serializer="yaml")
+
+    @pytest.mark.it(
+        "Instantiates with the 'reported_properties_window' attribute set to the provided 'reported_properties_window'"
+    )
+    @pytest.mark.parametrize("window", [0, 1, 0.5])
+    def test_reported_properties_window_set(self, window):
+        config = IoTHubPipelineConfig(reported_properties_window=window)
+        assert config.reported_properties_window == window
+
+    @pytest.mark.it(
+        "Instantiates with the 'reported_properties_window' attribute defaulting to None"
+    )
+    def test_reported_properties_window_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.reported_properties_window is None
+
+    @pytest.mark.it("Raises an error if the provided 'reported_properties_window' is invalid")
+    @pytest.mark.parametrize(
+        "window, expected_error",
+        [
+            pytest.param(-1, ValueError, id="Negative"),
+            pytest.param("1", TypeError, id="String"),
+            pytest.param(True, TypeError, id="Boolean"),
+        ],
+    )
+    def test_reported_properties_window_invalid(self, window, expected_error):
+        with pytest.raises(expected_error):
+            IoTHubPipelineConfig(reported_properties_window=window)
+
+    @pytest.mark.it(
+        "Instantiates with the 'reported_properties_max_bytes' attribute set to the provided 'reported_properties_max_bytes'"
+    )
+    def test_reported_properties_max_bytes_set(self):
+        config = IoTHubPipelineConfig(reported_properties_max_bytes=4096)
+        assert config.reported_properties_max_bytes == 4096
+
+    @pytest.mark.it(
+        "Instantiates with the 'reported_properties_max_bytes' attribute defaulting to None"
+    )
+    def test_reported_properties_max_bytes_default(self):
+        config = IoTHubPipelineConfig()
+        assert config.reported_properties_max_bytes is None
+
+    @pytest.mark.it("Raises an error if the provided 'reported_properties_max_bytes' is invalid")
+    @pytest.mark.parametrize(
+        "max_bytes, expected_error",
+        [
+            pytest.param(0, ValueError, id="Zero"),
+            pytest.param("1", TypeError, id="String"),
+        ],
+    )
+    def test_reported_properties_max_bytes_invalid(self, max_bytes, expected_error):
+        with pytest.raises(expected_error):
+            IoTHubPipelineConfig(reported_properties_max_bytes=max_bytes)
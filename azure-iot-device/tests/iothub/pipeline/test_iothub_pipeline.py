@@ -6,12 +6,16 @@
 
 import pytest
 import logging
+import zlib
+import json
 import six.moves.urllib as urllib
-from azure.iot.device.common import handle_exceptions
+from azure.iot.device.common import handle_exceptions, serializers, transport_exceptions
+from azure.iot.device.common.evented_callback import EventedCallback
 from azure.iot.device.common.pipeline import (
     pipeline_stages_base,
     pipeline_stages_mqtt,
     pipeline_ops_base,
+    pipeline_events_base,
 )
 from azure.iot.device.iothub.pipeline import (
     pipeline_stages_iothub,
@@ -24,6 +28,7 @@ from azure.iot.device.iothub.pipeline import IoTHubPipeline, constant
 from azure.iot.device.iothub.auth import (
     SymmetricKeyAuthenticationProvider,
     X509AuthenticationProvider,
+    IoTEdgeAuthenticationProvider,
 )
 
 logging.basicConfig(level=logging.DEBUG)
@@ -46,7 +51,17 @@ def auth_provider(mocker):
 
 @pytest.fixture
 def pipeline_configuration(mocker):
-    return mocker.MagicMock()
+    mock_config = mocker.MagicMock()
+    # Don't limit publishes
+    mock_config.max_in_flight_publishes = None
+    mock_config.max_queued_publish_bytes = None
+    # Don't store publishes in an outbox
+    mock_config.outbox_directory = None
+    # Don't compress payloads
+    mock_config.compression = None
+    # Don't serialize payloads
+    mock_config.payload_serializer = None
+    return mock_config
 
 
 @pytest.fixture
@@ -110,11 +125,14 @@ class TestIoTHubPipelineInstantiation(object):
         expected_stage_order = [
             pipeline_stages_base.PipelineRootStage,
             pipeline_stages_iothub.UseAuthProviderStage,
+            pipeline_stages_iothub.CoalesceReportedPropertiesStage,
             pipeline_stages_iothub.TwinRequestResponseStage,
             pipeline_stages_base.CoordinateRequestAndResponseStage,
             pipeline_stages_iothub_mqtt.IoTHubMQTTTranslationStage,
+            pipeline_stages_base.StoreAndForwardStage,
             pipeline_stages_base.AutoConnectStage,
             pipeline_stages_base.ReconnectStage,
+            pipeline_stages_base.RefreshConnectionArgsStage,
             pipeline_stages_base.ConnectionLockStage,
             pipeline_stages_base.RetryStage,
             pipeline_stages_base.OpTimeoutStage,
@@ -253,6 +271,95 @@ class TestIoTHubPipelineConnect(object):
         assert cb.call_args == mocker.call(error=arbitrary_exception)
 
 
+@pytest.mark.describe(
+    "IoTHubPipeline - OCCURANCE: Connection fails while using a stored IoT Edge trust bundle"
+)
+class TestIoTHubPipelineConnectionFailsWithStoredTrustBundle(object):
+    @pytest.fixture
+    def mock_hsm(self, mocker):
+        mock_hsm = mocker.patch(
+            "azure.iot.device.iothub.auth.iotedge_authentication_provider.IoTEdgeHsm"
+        ).return_value
+        mock_hsm.get_trust_bundle.return_value = "__fake_stored_trust_bundle__"
+        mock_hsm.trust_bundle_is_stored = True
+        mock_hsm.refresh_trust_bundle.return_value = "__fake_refreshed_trust_bundle__"
+        mock_hsm.sign.return_value = "__fake_signature__"
+        return mock_hsm
+
+    @pytest.fixture
+    def pipeline(self, mock_hsm, pipeline_configuration):
+        auth_provider = IoTEdgeAuthenticationProvider(
+            hostname="__fake_hostname__",
+            device_id="__fake_device_id__",
+            module_id="__fake_module_id__",
+            gateway_hostname="__fake_gateway_hostname__",
+            module_generation_id="__fake_module_generation_id__",
+            workload_uri="http://__fake_workload_uri__/",
+            api_version="__fake_api_version__",
+        )
+        return IoTHubPipeline(auth_provider, pipeline_configuration)
+
+    @pytest.fixture
+    def transport(self, pipeline):
+        # MQTTTransport is mocked for every test in this file, so each transport is this mock
+        transport = pipeline_stages_mqtt.MQTTTransport.return_value
+        transport.connect.side_effect = [
+            transport_exceptions.TlsExchangeAuthError(),
+            transport_exceptions.TlsExchangeAuthError(),
+        ]
+        return transport
+
+    def assert_refreshed(self, mock_hsm, transport):
+        assert mock_hsm.refresh_trust_bundle.call_count == 1
+        assert transport.connect.call_count == 2
+        assert (
+            pipeline_stages_mqtt.MQTTTransport.call_args[1]["server_verification_cert"]
+            == "__fake_refreshed_trust_bundle__"
+        )
+
+    @pytest.mark.it(
+        "Requests the trust bundle again and connects with it, if an explicit connect fails"
+    )
+    def test_connect(self, pipeline, mock_hsm, transport):
+        transport.connect.side_effect = [transport_exceptions.TlsExchangeAuthError(), None]
+        cb = EventedCallback()
+
+        pipeline.connect(callback=cb)
+
+        self.assert_refreshed(mock_hsm, transport)
+        assert not cb.completion_event.is_set()
+        transport.on_mqtt_connected_handler()
+        cb.wait_for_completion()
+
+    @pytest.mark.it(
+        "Requests the trust bundle again and connects with it, if an automatic connect fails"
+    )
+    def test_auto_connect(
+        self, mocker, pipeline_configuration, pipeline, mock_hsm, transport, message
+    ):
+        transport.connect.side_effect = [transport_exceptions.TlsExchangeAuthError(), None]
+        pipeline_configuration.telemetry_qos = 1
+
+        pipeline.send_message(message, callback=mocker.MagicMock())
+
+        self.assert_refreshed(mock_hsm, transport)
+        assert transport.publish.call_count == 0
+        transport.on_mqtt_connected_handler()
+        assert transport.publish.call_count == 1
+
+    @pytest.mark.it(
+        "Fails the connect with the connection error if connecting with the new trust bundle also fails"
+    )
+    def test_retry_fails(self, pipeline, mock_hsm, transport):
+        cb = EventedCallback()
+
+        pipeline.connect(callback=cb)
+
+        self.assert_refreshed(mock_hsm, transport)
+        with pytest.raises(transport_exceptions.TlsExchangeAuthError):
+            cb.wait_for_completion()
+
+
 @pytest.mark.describe("IoTHubPipeline - .disconnect()")
 class TestIoTHubPipelineDisconnect(object):
     @pytest.mark.it("Runs a DisconnectOperation on the pipeline")
@@ -292,6 +399,112 @@ class TestIoTHubPipelineDisconnect(object):
         assert cb.call_args == mocker.call(error=arbitrary_exception)
 
 
+@pytest.mark.describe("IoTHubPipeline - .encode_message()")
+class TestIoTHubPipelineEncodeMessage(object):
+    @pytest.mark.it(
+        "Returns a copy of the message with its payload compressed, if the pipeline is configured for compression"
+    )
+    def test_compresses(self, auth_provider, pipeline_configuration):
+        pipeline_configuration.compression = "gzip"
+        pipeline_configuration.compression_threshold = 0
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        message = Message("compressible " * 100)
+
+        encoded = pipeline.encode_message(message)
+        assert encoded is not message
+        assert encoded.content_encoding == "gzip"
+        assert zlib.decompress(encoded.data, 16 + zlib.MAX_WBITS) == b"compressible " * 100
+        assert message.content_encoding is None
+        assert message.data == "compressible " * 100
+
+    @pytest.mark.it(
+        "Returns the message unchanged if the pipeline is not configured for compression"
+    )
+    def test_not_configured(self, pipeline):
+        message = Message("compressible " * 100)
+        assert pipeline.encode_message(message) is message
+        assert message.content_encoding is None
+        assert message.data == "compressible " * 100
+
+    @pytest.mark.it(
+        "Returns a copy of the message with a dict or list payload serialized with the payload serializer the pipeline is configured with, and the content type and encoding set to match"
+    )
+    @pytest.mark.parametrize("data", [{"temperature": 21.5}, [1, 2, 3]], ids=["dict", "list"])
+    def test_serializes(self, auth_provider, pipeline_configuration, data):
+        pipeline_configuration.payload_serializer = serializers.get_serializer("json")
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        message = Message(data)
+
+        encoded = pipeline.encode_message(message)
+        assert encoded.data == json.dumps(data)
+        assert encoded.content_type == "application/json"
+        assert encoded.content_encoding == "utf-8"
+        assert message.data is data
+        assert message.content_type is None
+        assert message.content_encoding is None
+
+    @pytest.mark.it("Does not replace a content type or encoding which is already set")
+    def test_keeps_content_type(self, auth_provider, pipeline_configuration):
+        pipeline_configuration.payload_serializer = serializers.get_serializer("json")
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        message = Message({"temperature": 21.5}, content_encoding="utf-16")
+        message.content_type = "application/vnd.contoso+json"
+
+        encoded = pipeline.encode_message(message)
+        assert encoded.content_type == "application/vnd.contoso+json"
+        assert encoded.content_encoding == "utf-16"
+
+    @pytest.mark.it("Returns messages whose payloads are not dicts or lists unchanged")
+    @pytest.mark.parametrize("data", ["text", b"bytes", 12, None])
+    def test_other_payloads(self, auth_provider, pipeline_configuration, data):
+        pipeline_configuration.payload_serializer = serializers.get_serializer("json")
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        message = Message(data)
+
+        assert pipeline.encode_message(message) is message
+        assert message.data is data
+        assert message.content_type is None
+
+    @pytest.mark.it(
+        "Returns messages with dict and list payloads unchanged if the pipeline is not configured with a payload serializer"
+    )
+    def test_no_serializer(self, pipeline):
+        data = {"temperature": 21.5}
+        message = Message(data)
+        assert pipeline.encode_message(message) is message
+        assert message.data is data
+        assert message.content_type is None
+
+    @pytest.mark.it(
+        "Compresses the payload after serializing it, and sets the content encoding to the compression used"
+    )
+    def test_serializes_then_compresses(self, auth_provider, pipeline_configuration):
+        pipeline_configuration.payload_serializer = serializers.get_serializer("json")
+        pipeline_configuration.compression = "gzip"
+        pipeline_configuration.compression_threshold = 0
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        data = [{"temperature": 21.5}] * 100
+        message = Message(data)
+
+        encoded = pipeline.encode_message(message)
+        assert encoded.content_type == "application/json"
+        assert encoded.content_encoding == "gzip"
+        decompressed = zlib.decompress(encoded.data, 16 + zlib.MAX_WBITS)
+        assert json.loads(decompressed.decode("utf-8")) == data
+        assert message.data is data
+
+    @pytest.mark.it("Does not compress a message whose content encoding is already set")
+    def test_keeps_content_encoding(self, auth_provider, pipeline_configuration):
+        pipeline_configuration.compression = "gzip"
+        pipeline_configuration.compression_threshold = 0
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        message = Message("compressible " * 100, content_encoding="utf-8")
+
+        assert pipeline.encode_message(message) is message
+        assert message.content_encoding == "utf-8"
+        assert message.data == "compressible " * 100
+
+
 @pytest.mark.describe("IoTHubPipeline - .send_message()")
 class TestIoTHubPipelineSendD2CMessage(object):
     @pytest.mark.it("Runs a SendD2CMessageOperation with the provided message on the pipeline")
@@ -334,6 +547,91 @@ class TestIoTHubPipelineSendD2CMessage(object):
         assert cb.call_args == mocker.call(error=arbitrary_exception)
 
 
+@pytest.mark.describe("IoTHubPipeline - .send_message_batch()")
+class TestIoTHubPipelineSendD2CMessageBatch(object):
+    @pytest.fixture
+    def messages(self, message):
+        return [message, message]
+
+    @pytest.mark.it(
+        "Runs a SendD2CMessageBatchOperation with the provided messages on the pipeline"
+    )
+    def test_runs_op(self, pipeline, messages, mocker):
+        pipeline.send_message_batch(messages, callback=mocker.MagicMock())
+        op = pipeline._pipeline.run_op.call_args[0][0]
+
+        assert pipeline._pipeline.run_op.call_count == 1
+        assert isinstance(op, pipeline_ops_iothub.SendD2CMessageBatchOperation)
+        assert op.messages == messages
+
+    @pytest.mark.it(
+        "Triggers the callback with the per-message results upon successful completion of the SendD2CMessageBatchOperation"
+    )
+    def test_op_success_with_callback(self, mocker, pipeline, messages, arbitrary_exception):
+        cb = mocker.MagicMock()
+
+        # Begin operation
+        pipeline.send_message_batch(messages, callback=cb)
+        assert cb.call_count == 0
+
+        # Trigger op completion callback
+        op = pipeline._pipeline.run_op.call_args[0][0]
+        op.results = [None, arbitrary_exception]
+        op.complete(error=None)
+
+        assert cb.call_count == 1
+        assert cb.call_args == mocker.call(results=[None, arbitrary_exception])
+
+    @pytest.mark.it(
+        "Calls the callback with the error upon unsuccessful completion of the SendD2CMessageBatchOperation"
+    )
+    def test_op_fail(self, mocker, pipeline, messages, arbitrary_exception):
+        cb = mocker.MagicMock()
+        pipeline.send_message_batch(messages, callback=cb)
+
+        op = pipeline._pipeline.run_op.call_args[0][0]
+        op.complete(error=arbitrary_exception)
+
+        assert cb.call_count == 1
+        assert cb.call_args == mocker.call(error=arbitrary_exception, results=None)
+
+
+@pytest.mark.describe("IoTHubPipeline - .wait_for_publish_window()")
+class TestIoTHubPipelineWaitForPublishWindow(object):
+    def set_backpressure(self, pipeline, backpressure):
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_base.BackpressureChangedEvent(backpressure)
+        )
+
+    @pytest.mark.it("Calls the callback immediately if the pipeline is not applying backpressure")
+    def test_no_backpressure(self, mocker, pipeline):
+        cb = mocker.MagicMock()
+        pipeline.wait_for_publish_window(callback=cb)
+        assert cb.call_count == 1
+
+    @pytest.mark.it(
+        "Calls the callback once the pipeline stops applying backpressure, if it is currently applying backpressure"
+    )
+    def test_backpressure(self, mocker, pipeline):
+        self.set_backpressure(pipeline, True)
+        cb1 = mocker.MagicMock()
+        cb2 = mocker.MagicMock()
+        pipeline.wait_for_publish_window(callback=cb1)
+        pipeline.wait_for_publish_window(callback=cb2)
+        assert cb1.call_count == 0
+        assert cb2.call_count == 0
+
+        self.set_backpressure(pipeline, False)
+        assert cb1.call_count == 1
+        assert cb2.call_count == 1
+
+        # Callbacks are only called once
+        self.set_backpressure(pipeline, True)
+        self.set_backpressure(pipeline, False)
+        assert cb1.call_count == 1
+        assert cb2.call_count == 1
+
+
 @pytest.mark.describe("IoTHubPipeline - .send_output_event()")
 class TestIoTHubPipelineSendOutputEvent(object):
     @pytest.fixture
@@ -709,6 +1007,40 @@ class TestIoTHubPipelineEVENTRecieveC2DMessage(object):
 
         # No assertions required - not throwing an exception means the test passed
 
+    @pytest.mark.it(
+        "Decompresses the message payload before triggering the 'on_c2d_message_received' handler, if the pipeline is configured for compression"
+    )
+    def test_decompresses(self, mocker, auth_provider, pipeline_configuration):
+        pipeline_configuration.compression = "deflate"
+        pipeline_configuration.compression_threshold = 0
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        pipeline.on_c2d_message_received = mocker.MagicMock()
+        message = Message(zlib.compress(b"some payload"))
+        message.content_encoding = "deflate"
+
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_iothub.C2DMessageEvent(message)
+        )
+
+        assert pipeline.on_c2d_message_received.call_count == 1
+        assert message.data == b"some payload"
+        assert message.content_encoding is None
+
+    @pytest.mark.it(
+        "Does not decompress the message payload if the pipeline is not configured for compression"
+    )
+    def test_not_configured(self, mocker, pipeline):
+        pipeline.on_c2d_message_received = mocker.MagicMock()
+        message = Message(zlib.compress(b"some payload"))
+        message.content_encoding = "deflate"
+
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_iothub.C2DMessageEvent(message)
+        )
+
+        assert message.data == zlib.compress(b"some payload")
+        assert message.content_encoding == "deflate"
+
 
 @pytest.mark.describe("IoTHubPipeline - OCCURANCE: Input Message Received")
 class TestIoTHubPipelineEVENTReceiveInputMessage(object):
@@ -739,6 +1071,40 @@ class TestIoTHubPipelineEVENTReceiveInputMessage(object):
 
         # No assertions required - not throwing an exception means the test passed
 
+    @pytest.mark.it(
+        "Decompresses the message payload before triggering the 'on_input_message_received' handler, if the pipeline is configured for compression"
+    )
+    def test_decompresses(self, mocker, auth_provider, pipeline_configuration):
+        pipeline_configuration.compression = "deflate"
+        pipeline_configuration.compression_threshold = 0
+        pipeline = IoTHubPipeline(auth_provider, pipeline_configuration)
+        pipeline.on_input_message_received = mocker.MagicMock()
+        message = Message(zlib.compress(b"some payload"))
+        message.content_encoding = "deflate"
+
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_iothub.InputMessageEvent("some_input", message)
+        )
+
+        assert pipeline.on_input_message_received.call_count == 1
+        assert message.data == b"some payload"
+        assert message.content_encoding is None
+
+    @pytest.mark.it(
+        "Does not decompress the message payload if the pipeline is not configured for compression"
+    )
+    def test_not_configured(self, mocker, pipeline):
+        pipeline.on_input_message_received = mocker.MagicMock()
+        message = Message(zlib.compress(b"some payload"))
+        message.content_encoding = "deflate"
+
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_iothub.InputMessageEvent("some_input", message)
+        )
+
+        assert message.data == zlib.compress(b"some payload")
+        assert message.content_encoding == "deflate"
+
 
 @pytest.mark.describe("IoTHubPipeline - OCCURANCE: Method Request Received")
 class TestIoTHubPipelineEVENTReceiveMethodRequest(object):
@@ -811,3 +1177,40 @@ class TestIotHubPipelinePROPERTYConnected(object):
         assert pipeline.connected
         pipeline._pipeline.connected = False
         assert not pipeline.connected
+
+
+@pytest.mark.describe("IoTHubPipeline - PROPERTY .publish_window_open")
+class TestIotHubPipelinePROPERTYPublishWindowOpen(object):
+    @pytest.mark.it("Cannot be changed")
+    def test_read_only(self, pipeline):
+        with pytest.raises(AttributeError):
+            pipeline.publish_window_open = False
+
+    @pytest.mark.it("Is False while the pipeline is applying backpressure, and True otherwise")
+    def test_reflects_backpressure(self, pipeline):
+        assert pipeline.publish_window_open
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_base.BackpressureChangedEvent(True)
+        )
+        assert not pipeline.publish_window_open
+        pipeline._pipeline.on_pipeline_event_handler(
+            pipeline_events_base.BackpressureChangedEvent(False)
+        )
+        assert pipeline.publish_window_open
+
+
+@pytest.mark.describe("IoTHubPipeline - PROPERTY .publish_stats")
+class TestIotHubPipelinePROPERTYPublishStats(object):
+    @pytest.mark.it("Returns the publish statistics of the MQTTTransportStage, keyed by QoS level")
+    def test_returns_transport_stats(self, pipeline):
+        stage = pipeline._pipeline
+        while stage.next:
+            stage = stage.next
+        assert isinstance(stage, pipeline_stages_mqtt.MQTTTransportStage)
+        assert pipeline.publish_stats is stage.publish_stats
+        assert set(pipeline.publish_stats) == {0, 1}
+
+    @pytest.mark.it("Cannot be changed")
+    def test_read_only(self, pipeline):
+        with pytest.raises(AttributeError):
+            pipeline.publish_stats = {}
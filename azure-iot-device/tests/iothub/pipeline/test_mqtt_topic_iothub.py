@@ -0,0 +1,239 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import datetime
+from azure.iot.device.iothub.pipeline import mqtt_topic_iothub
+from azure.iot.device.iothub.pipeline.mqtt_topic_iothub import TopicCodec
+from azure.iot.device.iothub.models.message import Message
+
+logging.basicConfig(level=logging.DEBUG)
+
+fake_device_id = "__fake_device_id__"
+fake_module_id = "__fake_module_id__"
+
+
+def make_message(**attributes):
+    custom_properties = attributes.pop("custom_properties", {})
+    security_message = attributes.pop("security_message", False)
+    message = Message("__fake_message_body__")
+    if security_message:
+        message.set_as_security_message()
+    for attribute, value in attributes.items():
+        setattr(message, attribute, value)
+    message.custom_properties.update(custom_properties)
+    return message
+
+
+@pytest.fixture(params=[None, fake_module_id], ids=["device", "module"])
+def module_id(request):
+    return request.param
+
+
+@pytest.fixture
+def codec(module_id):
+    return TopicCodec(fake_device_id, module_id)
+
+
+@pytest.mark.describe("TopicCodec - .encode_telemetry_topic()")
+class TestTopicCodecEncodeTelemetryTopic(object):
+    @pytest.mark.it(
+        "Returns the same topic as encode_properties() called with the telemetry topic for the device or module"
+    )
+    @pytest.mark.parametrize(
+        "message",
+        [
+            pytest.param(make_message(), id="no properties"),
+            pytest.param(make_message(message_id="ee9e738b-4f47"), id="message id"),
+            pytest.param(
+                make_message(
+                    output_name="output 1",
+                    message_id="id",
+                    correlation_id="correlation/id",
+                    user_id="user",
+                    to="/devices/device/messages",
+                    content_type="application/json",
+                    content_encoding="utf-8",
+                    security_message=True,
+                ),
+                id="every system property",
+            ),
+            pytest.param(
+                make_message(expiry_time_utc=datetime.datetime(2020, 1, 2, 3, 4, 5)),
+                id="expiry time as datetime",
+            ),
+            pytest.param(
+                make_message(expiry_time_utc="2020-01-02T03:04:05"), id="expiry time as string"
+            ),
+            pytest.param(
+                make_message(custom_properties={"is-muggle": "yes", "house?": "huffle puff&co"}),
+                id="custom properties",
+            ),
+            pytest.param(
+                make_message(
+                    content_type="text/plain",
+                    custom_properties={"temperature": 21.5, "count": 3, "unicode": "été"},
+                ),
+                id="system and non-string custom properties",
+            ),
+        ],
+    )
+    def test_matches_encode_properties(self, codec, module_id, message):
+        telemetry_topic = mqtt_topic_iothub.get_telemetry_topic_for_publish(
+            fake_device_id, module_id
+        )
+        expected = mqtt_topic_iothub.encode_properties(message, telemetry_topic)
+        assert codec.encode_telemetry_topic(message) == expected
+        # A second message with the same values (which may now be cached) encodes the same way
+        assert codec.encode_telemetry_topic(message) == expected
+
+    @pytest.mark.it("Limits the number of encoded values it remembers")
+    def test_cache_limit(self, mocker, codec):
+        mocker.patch.object(mqtt_topic_iothub, "_MAX_CACHED_VALUES", 4)
+        for i in range(10):
+            message = make_message(content_type="type/{}".format(i))
+            assert codec.encode_telemetry_topic(message).endswith("%24.ct=type%2F{}".format(i))
+            assert len(codec._quoted) <= 4
+
+
+@pytest.mark.describe("TopicCodec - .decode()")
+class TestTopicCodecDecode(object):
+    @pytest.mark.it("Decodes C2D message topics, including their system and custom properties")
+    def test_c2d(self, codec):
+        topic = "devices/{}/messages/devicebound/%24.mid=id%2B1&%24.to=%2Fdevices%2Fd&%24.ct=text%2Fjson&%24.ce=utf-8&%24.cid=cid&%24.uid=me&iothub-ack=full&my+key=my%26value".format(
+            fake_device_id
+        )
+        decoded = codec.decode(topic)
+        assert decoded.kind == mqtt_topic_iothub.C2D_TOPIC
+
+        message = Message("body")
+        decoded.set_message_properties(message)
+        expected = Message("body")
+        mqtt_topic_iothub.extract_properties_from_topic(topic, expected)
+        for attribute in [
+            "message_id",
+            "to",
+            "correlation_id",
+            "user_id",
+            "content_type",
+            "content_encoding",
+            "custom_properties",
+        ]:
+            assert getattr(message, attribute) == getattr(expected, attribute)
+        assert message.message_id == "id+1"
+        assert message.custom_properties == {"iothub-ack": "full", "my key": "my&value"}
+
+    @pytest.mark.it("Decodes C2D message topics with no properties")
+    @pytest.mark.parametrize(
+        "suffix", [pytest.param("", id="no trailing slash"), pytest.param("/", id="trailing slash")]
+    )
+    def test_c2d_no_properties(self, codec, suffix):
+        decoded = codec.decode("devices/{}/messages/devicebound{}".format(fake_device_id, suffix))
+        assert decoded.kind == mqtt_topic_iothub.C2D_TOPIC
+        assert decoded.properties is None
+
+    @pytest.mark.it(
+        "Does not decode the properties of a C2D message until the message is asked for one of them"
+    )
+    def test_c2d_lazy_properties(self, mocker, codec):
+        decode_spy = mocker.spy(mqtt_topic_iothub, "decode_message_properties")
+        topic = "devices/{}/messages/devicebound/%24.mid=id&key=value".format(fake_device_id)
+        message = Message("body")
+        codec.decode(topic).set_message_properties(message)
+        assert decode_spy.call_count == 0
+
+        assert message.custom_properties == {"key": "value"}
+        assert message.message_id == "id"
+        assert decode_spy.call_count == 1
+
+    @pytest.mark.it("Decodes input message topics, including the input name and properties")
+    def test_input(self):
+        codec = TopicCodec(fake_device_id, fake_module_id)
+        topic = "devices/{}/modules/{}/inputs/input1/%24.ct=text%2Fjson&key=value".format(
+            fake_device_id, fake_module_id
+        )
+        decoded = codec.decode(topic)
+        assert decoded.kind == mqtt_topic_iothub.INPUT_TOPIC
+        assert decoded.name == "input1"
+        assert mqtt_topic_iothub.decode_message_properties(decoded.properties) == (
+            {"content_type": "text/json"},
+            {"key": "value"},
+        )
+
+    @pytest.mark.it("Decodes input message topics with no properties")
+    def test_input_no_properties(self):
+        codec = TopicCodec(fake_device_id, fake_module_id)
+        decoded = codec.decode(
+            "devices/{}/modules/{}/inputs/input1".format(fake_device_id, fake_module_id)
+        )
+        assert decoded.kind == mqtt_topic_iothub.INPUT_TOPIC
+        assert decoded.name == "input1"
+        assert decoded.properties is None
+
+    @pytest.mark.it("Decodes method request topics, including the method name and request id")
+    def test_method(self, codec):
+        decoded = codec.decode("$iothub/methods/POST/reboot/?$rid=42")
+        assert decoded.kind == mqtt_topic_iothub.METHOD_TOPIC
+        assert decoded.name == "reboot"
+        assert decoded.request_id == "42"
+
+    @pytest.mark.it("Decodes twin response topics, including the status code and request id")
+    def test_twin_response(self, codec):
+        decoded = codec.decode("$iothub/twin/res/204/?$rid=7&$version=3")
+        assert decoded.kind == mqtt_topic_iothub.TWIN_RESPONSE_TOPIC
+        assert decoded.status_code == 204
+        assert decoded.request_id == "7"
+
+    @pytest.mark.it("Decodes twin desired property patch topics")
+    def test_twin_patch(self, codec):
+        decoded = codec.decode("$iothub/twin/PATCH/properties/desired/?$version=3")
+        assert decoded.kind == mqtt_topic_iothub.TWIN_PATCH_TOPIC
+
+    @pytest.mark.it("Returns None for topics that do not belong to the device or module")
+    @pytest.mark.parametrize(
+        "topic",
+        [
+            pytest.param("__unmatched_mqtt_topic__", id="unknown topic"),
+            pytest.param("devices/__other_device__/messages/devicebound/", id="other device"),
+            pytest.param(
+                "devices/{}/modules/__other_module__/inputs/input1/".format(fake_device_id),
+                id="other module",
+            ),
+        ],
+    )
+    def test_unmatched(self, codec, topic):
+        assert codec.decode(topic) is None
+
+    @pytest.mark.it("Does not decode input message topics for a device which is not a module")
+    def test_input_for_device(self):
+        codec = TopicCodec(fake_device_id, None)
+        assert codec.decode("devices/{}/modules/None/inputs/input1/".format(fake_device_id)) is None
+
+    @pytest.mark.it("Raises an error if a method or twin response topic has no request id")
+    @pytest.mark.parametrize(
+        "topic, error",
+        [
+            pytest.param("$iothub/methods/POST/reboot/", IndexError, id="method, no query"),
+            pytest.param("$iothub/methods/POST/reboot/?$x=1", KeyError, id="method, no rid"),
+            pytest.param("$iothub/twin/res/200", IndexError, id="twin response, no query"),
+        ],
+    )
+    def test_missing_request_id(self, codec, topic, error):
+        with pytest.raises(error):
+            codec.decode(topic)
+
+    @pytest.mark.it("Raises ValueError if a twin response topic has a missing or bad status code")
+    @pytest.mark.parametrize(
+        "topic",
+        [
+            pytest.param("$iothub/twin/res/?$rid=7", id="missing"),
+            pytest.param("$iothub/twin/res/abc/?$rid=7", id="not a number"),
+        ],
+    )
+    def test_bad_status_code(self, codec, topic):
+        with pytest.raises(ValueError):
+            codec.decode(topic)
@@ -207,6 +207,40 @@ pipeline_ops_test.add_operation_tests(
 )
 
 
+class SendD2CMessageBatchOperationTestConfig(object):
+    @pytest.fixture
+    def cls_type(self):
+        return pipeline_ops_iothub.SendD2CMessageBatchOperation
+
+    @pytest.fixture
+    def init_kwargs(self, mocker):
+        kwargs = {
+            "messages": [mocker.MagicMock(), mocker.MagicMock()],
+            "callback": mocker.MagicMock(),
+        }
+        return kwargs
+
+
+class SendD2CMessageBatchOperationInstantiationTests(SendD2CMessageBatchOperationTestConfig):
+    @pytest.mark.it("Initializes 'messages' attribute with the provided 'messages' parameter")
+    def test_messages(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.messages is init_kwargs["messages"]
+
+    @pytest.mark.it("Initializes 'results' attribute as None")
+    def test_results(self, cls_type, init_kwargs):
+        op = cls_type(**init_kwargs)
+        assert op.results is None
+
+
+pipeline_ops_test.add_operation_tests(
+    test_module=this_module,
+    op_class_under_test=pipeline_ops_iothub.SendD2CMessageBatchOperation,
+    op_test_config_class=SendD2CMessageBatchOperationTestConfig,
+    extended_op_instantiation_test_class=SendD2CMessageBatchOperationInstantiationTests,
+)
+
+
 class SendOutputEventOperationTestConfig(object):
     @pytest.fixture
     def cls_type(self):
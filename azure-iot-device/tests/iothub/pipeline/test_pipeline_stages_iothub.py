@@ -11,10 +11,11 @@ import sys
 import threading
 from concurrent.futures import Future
 from azure.iot.device.exceptions import ServiceError
-from azure.iot.device.common import handle_exceptions
-from azure.iot.device.common.pipeline import pipeline_ops_base
+from azure.iot.device.common import handle_exceptions, timer_wheel
+from azure.iot.device.common.pipeline import pipeline_ops_base, pipeline_stages_base
 from azure.iot.device.iothub.pipeline import pipeline_stages_iothub, pipeline_ops_iothub
 from azure.iot.device.iothub.pipeline.exceptions import PipelineError
+from azure.iot.device.iothub.pipeline.config import IoTHubPipelineConfig
 from azure.iot.device.iothub.auth.authentication_provider import AuthenticationProvider
 from tests.common.pipeline.helpers import StageRunOpTestBase, StageHandlePipelineEventTestBase
 from tests.common.pipeline import pipeline_stage_test
@@ -310,6 +311,108 @@ class TestUseAuthProviderStageRunOpWithAribitraryOperation(
         assert not op.completed
 
 
+@pytest.mark.describe(
+    "UseAuthProviderStage - .run_op() -- Called with RefreshConnectionArgsOperation"
+)
+class TestUseAuthProviderStageRunOpWithRefreshConnectionArgsOperation(
+    StageRunOpTestBase, UseAuthProviderStageTestConfig
+):
+    @pytest.fixture
+    def fake_auth_provider(self, mocker):
+        class FakeAuthProvider(AuthenticationProvider):
+            pass
+
+        fake_auth_provider = FakeAuthProvider(
+            hostname=fake_hostname, device_id=fake_device_id, module_id=fake_module_id
+        )
+        fake_auth_provider.gateway_hostname = fake_gateway_hostname
+        fake_auth_provider.server_verification_cert = fake_server_verification_cert
+        fake_auth_provider.get_current_sas_token = mocker.MagicMock()
+        fake_auth_provider.on_sas_token_updated_handler_list = []
+        fake_auth_provider.refresh_server_verification_cert = mocker.MagicMock(
+            return_value="__fake_refreshed_server_verification_cert__"
+        )
+        return fake_auth_provider
+
+    @pytest.fixture
+    def stage(self, mocker, cls_type, init_kwargs, fake_auth_provider):
+        stage = cls_type(**init_kwargs)
+        stage.send_op_down = mocker.MagicMock()
+        stage.send_event_up = mocker.MagicMock()
+        stage.auth_provider = fake_auth_provider
+        return stage
+
+    @pytest.fixture
+    def op(self, mocker):
+        return pipeline_ops_base.RefreshConnectionArgsOperation(callback=mocker.MagicMock())
+
+    @pytest.mark.it(
+        "Sends a SetIoTHubConnectionArgsOperation with the refreshed server verification certificate down the pipeline"
+    )
+    def test_sends_new_connection_args(self, stage, op):
+        stage.run_op(op)
+
+        assert stage.auth_provider.refresh_server_verification_cert.call_count == 1
+        assert stage.send_op_down.call_count == 1
+        new_op = stage.send_op_down.call_args[0][0]
+        assert isinstance(new_op, pipeline_ops_iothub.SetIoTHubConnectionArgsOperation)
+        assert new_op.device_id == fake_device_id
+        assert new_op.module_id == fake_module_id
+        assert new_op.hostname == fake_hostname
+        assert new_op.gateway_hostname == fake_gateway_hostname
+        assert new_op.server_verification_cert == "__fake_refreshed_server_verification_cert__"
+        assert new_op.sas_token is stage.auth_provider.get_current_sas_token.return_value
+        assert not op.completed
+
+    @pytest.mark.it(
+        "Marks the operation as refreshed and completes it upon completion of the SetIoTHubConnectionArgsOperation"
+    )
+    def test_complete_worker(self, stage, op, op_error):
+        stage.run_op(op)
+        new_op = stage.send_op_down.call_args[0][0]
+        new_op.complete(error=op_error)
+
+        assert op.refreshed
+        assert op.completed
+        assert op.error is op_error
+
+    @pytest.mark.it(
+        "Completes the operation without marking it as refreshed, if the server verification certificate is not refreshed"
+    )
+    def test_not_refreshed(self, stage, op):
+        stage.auth_provider.refresh_server_verification_cert.return_value = None
+        stage.run_op(op)
+
+        assert op.completed
+        assert op.error is None
+        assert not op.refreshed
+        assert stage.send_op_down.call_count == 0
+
+    @pytest.mark.it(
+        "Completes the operation without marking it as refreshed, if the authentication provider cannot refresh its server verification certificate"
+    )
+    def test_not_refreshable(self, stage, op):
+        del stage.auth_provider.refresh_server_verification_cert
+        stage.run_op(op)
+
+        assert op.completed
+        assert op.error is None
+        assert not op.refreshed
+        assert stage.send_op_down.call_count == 0
+
+    @pytest.mark.it(
+        "Completes the operation with the error, if refreshing the server verification certificate fails"
+    )
+    def test_refresh_fails(self, stage, op, arbitrary_exception):
+        stage.auth_provider.refresh_server_verification_cert.side_effect = arbitrary_exception
+        stage.run_op(op)
+
+        assert op.completed
+        assert op.error is arbitrary_exception
+        assert not op.refreshed
+        assert stage.send_op_down.call_count == 0
+
+
 @pytest.mark.describe(
     "UseAuthProviderStage - OCCURANCE: SAS Authentication Provider updates SAS token"
 )
@@ -378,6 +481,235 @@ class TestUseAuthProviderStageWhenAuthProviderGeneratesNewSasToken(UseAuthProvid
         assert mock_handle_background_exception.call_args == mocker.call(arbitrary_exception)
 
 
+######################################
+# COALESCE REPORTED PROPERTIES STAGE #
+######################################
+
+
+@pytest.fixture
+def mock_timer(mocker):
+    return mocker.patch.object(timer_wheel, "Timer")
+
+
+class CoalesceReportedPropertiesStageTestConfig(object):
+    @pytest.fixture
+    def cls_type(self):
+        return pipeline_stages_iothub.CoalesceReportedPropertiesStage
+
+    @pytest.fixture
+    def init_kwargs(self):
+        return {}
+
+    @pytest.fixture
+    def stage(self, mocker, cls_type, init_kwargs):
+        stage = cls_type(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(
+            IoTHubPipelineConfig(reported_properties_window=2)
+        )
+        stage.send_op_down = mocker.MagicMock()
+        stage.send_event_up = mocker.MagicMock()
+        return stage
+
+
+pipeline_stage_test.add_base_pipeline_stage_tests(
+    test_module=this_module,
+    stage_class_under_test=pipeline_stages_iothub.CoalesceReportedPropertiesStage,
+    stage_test_config_class=CoalesceReportedPropertiesStageTestConfig,
+)
+
+
+def make_patch_op(mocker, patch):
+    return pipeline_ops_iothub.PatchTwinReportedPropertiesOperation(
+        patch=patch, callback=mocker.MagicMock()
+    )
+
+
+@pytest.mark.describe(
+    "CoalesceReportedPropertiesStage - .run_op() -- Called with PatchTwinReportedPropertiesOperation"
+)
+class TestCoalesceReportedPropertiesStageRunOpWithPatchTwinReportedPropertiesOperation(
+    StageRunOpTestBase, CoalesceReportedPropertiesStageTestConfig
+):
+    @pytest.fixture
+    def op(self, mocker):
+        return make_patch_op(mocker, {"health": "ok"})
+
+    @pytest.mark.it(
+        "Sends the operation down as it is if the pipeline has no 'reported_properties_window'"
+    )
+    def test_no_window(self, mocker, stage, op, mock_timer):
+        stage.pipeline_root.pipeline_configuration.reported_properties_window = None
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+        assert mock_timer.call_count == 0
+
+    @pytest.mark.it(
+        "Holds the operation, and starts a timer for the 'reported_properties_window', if it is the first of a batch"
+    )
+    def test_starts_timer(self, stage, op, mock_timer):
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 0
+        assert mock_timer.call_count == 1
+        assert mock_timer.call_args[0][0] == 2
+        assert mock_timer.return_value.start.call_count == 1
+        assert not op.completed
+
+    @pytest.mark.it("Does not start another timer for later operations of the batch")
+    def test_one_timer_per_batch(self, mocker, stage, op, mock_timer):
+        stage.run_op(op)
+        stage.run_op(make_patch_op(mocker, {"firmware": "1.0"}))
+
+        assert mock_timer.call_count == 1
+        assert stage.send_op_down.call_count == 0
+
+    @pytest.mark.it(
+        "Sends the batch down as a single PatchTwinReportedPropertiesOperation once the timer expires"
+    )
+    def test_sends_batch_on_timer(self, mocker, stage, op, mock_timer):
+        stage.run_op(op)
+        stage.run_op(make_patch_op(mocker, {"firmware": "1.0"}))
+        mock_timer.call_args[0][1]()
+
+        assert stage.send_op_down.call_count == 1
+        new_op = stage.send_op_down.call_args[0][0]
+        assert isinstance(new_op, pipeline_ops_iothub.PatchTwinReportedPropertiesOperation)
+        assert new_op.patch == {"health": "ok", "firmware": "1.0"}
+
+    @pytest.mark.it(
+        "Deep merges the patches of the batch, with the last value of each property winning and None values kept"
+    )
+    def test_deep_merge(self, mocker, stage, mock_timer):
+        first = {"health": {"cpu": 10, "disk": 20}, "counters": {"sent": 1}, "old": 1}
+        second = {"health": {"cpu": 50}, "counters": None, "old": None}
+        third = {"counters": 3, "health": {"disk": None}}
+        for patch in (first, second, third):
+            stage.run_op(make_patch_op(mocker, patch))
+        mock_timer.call_args[0][1]()
+
+        new_op = stage.send_op_down.call_args[0][0]
+        assert new_op.patch == {
+            "health": {"cpu": 50, "disk": None},
+            "counters": 3,
+            "old": None,
+        }
+        # The patches of the operations are not changed
+        assert first == {"health": {"cpu": 10, "disk": 20}, "counters": {"sent": 1}, "old": 1}
+
+    @pytest.mark.it(
+        "Sends the batch down, and starts a new batch with the operation, if the operation's patch sets properties inside of a property that the batch removes"
+    )
+    @pytest.mark.parametrize(
+        "first,second",
+        [
+            pytest.param({"x": None}, {"x": {"a": 1}}, id="Top level"),
+            pytest.param({"y": {"x": None}}, {"y": {"x": {"a": 1}}}, id="Nested"),
+        ],
+    )
+    def test_removal_then_set(self, mocker, stage, mock_timer, first, second):
+        first_op = make_patch_op(mocker, first)
+        second_op = make_patch_op(mocker, second)
+        stage.run_op(first_op)
+        stage.run_op(second_op)
+
+        # The removal is sent on its own, without waiting for the timer
+        assert mock_timer.return_value.cancel.call_count == 1
+        assert stage.send_op_down.call_count == 1
+        first_batch_op = stage.send_op_down.call_args[0][0]
+        assert first_batch_op.patch == first
+
+        # The new batch has a timer of its own, and is sent once the first batch completes
+        assert mock_timer.call_count == 2
+        mock_timer.call_args[0][1]()
+        assert stage.send_op_down.call_count == 1
+        first_batch_op.complete()
+        assert first_op.completed
+        assert not second_op.completed
+        assert stage.send_op_down.call_count == 2
+        second_batch_op = stage.send_op_down.call_args[0][0]
+        assert second_batch_op.patch == second
+
+    @pytest.mark.it(
+        "Keeps merging patches which replace or set properties that the batch removes, as long as they do not set properties inside of them"
+    )
+    def test_removal_then_replace(self, mocker, stage, mock_timer):
+        for patch in ({"x": None, "y": None}, {"x": 5}, {"y": None}, {"z": {"a": 1}}):
+            stage.run_op(make_patch_op(mocker, patch))
+        mock_timer.call_args[0][1]()
+
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args[0][0].patch == {"x": 5, "y": None, "z": {"a": 1}}
+
+    @pytest.mark.it(
+        "Sends the batch down without waiting for the timer, and cancels the timer, once the batch reaches 'reported_properties_max_bytes'"
+    )
+    def test_size_limit(self, mocker, stage, op, mock_timer):
+        stage.pipeline_root.pipeline_configuration.reported_properties_max_bytes = 40
+        stage.run_op(op)
+        assert stage.send_op_down.call_count == 0
+
+        stage.run_op(make_patch_op(mocker, {"firmware": "1.0.0-a-long-version"}))
+        assert stage.send_op_down.call_count == 1
+        assert mock_timer.return_value.cancel.call_count == 1
+
+    @pytest.mark.it(
+        "Holds operations made while a batch is being sent until it completes, and then sends them as the next batch"
+    )
+    def test_one_batch_in_flight(self, mocker, stage, op, mock_timer):
+        stage.run_op(op)
+        mock_timer.call_args[0][1]()
+        first_batch_op = stage.send_op_down.call_args[0][0]
+
+        stage.run_op(make_patch_op(mocker, {"firmware": "1.0"}))
+        stage.run_op(make_patch_op(mocker, {"firmware": "2.0"}))
+        mock_timer.call_args[0][1]()
+        assert stage.send_op_down.call_count == 1
+
+        first_batch_op.complete()
+        assert stage.send_op_down.call_count == 2
+        second_batch_op = stage.send_op_down.call_args[0][0]
+        assert second_batch_op.patch == {"firmware": "2.0"}
+
+
+@pytest.mark.describe(
+    "CoalesceReportedPropertiesStage - .run_op() -- Called with other arbitrary operation"
+)
+class TestCoalesceReportedPropertiesStageRunOpWithArbitraryOperation(
+    StageRunOpTestBase, CoalesceReportedPropertiesStageTestConfig
+):
+    @pytest.fixture
+    def op(self, arbitrary_op):
+        return arbitrary_op
+
+    @pytest.mark.it("Sends the operation down the pipeline")
+    def test_sends_op_down(self, mocker, stage, op):
+        stage.run_op(op)
+
+        assert stage.send_op_down.call_count == 1
+        assert stage.send_op_down.call_args == mocker.call(op)
+
+
+@pytest.mark.describe(
+    "CoalesceReportedPropertiesStage - OCCURANCE: PatchTwinReportedPropertiesOperation sent for a batch is completed"
+)
+class TestCoalesceReportedPropertiesStageWhenBatchCompleted(
+    CoalesceReportedPropertiesStageTestConfig
+):
+    @pytest.mark.it("Completes every operation of the batch with the error of the batch, if any")
+    def test_completes_ops(self, mocker, stage, mock_timer, op_error):
+        ops = [make_patch_op(mocker, {"count": i}) for i in range(3)]
+        for op in ops:
+            stage.run_op(op)
+        mock_timer.call_args[0][1]()
+
+        stage.send_op_down.call_args[0][0].complete(error=op_error)
+        for op in ops:
+            assert op.completed
+            assert op.error is op_error
+
+
 ###############################
 # TWIN REQUEST RESPONSE STAGE #
 ###############################
@@ -395,6 +727,7 @@ class TwinRequestResponseStageTestConfig(object):
     @pytest.fixture
     def stage(self, mocker, cls_type, init_kwargs):
         stage = cls_type(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(IoTHubPipelineConfig())
         stage.send_op_down = mocker.MagicMock()
         stage.send_event_up = mocker.MagicMock()
         return stage
@@ -461,6 +794,17 @@ class TestTwinRequestResponseStageRunOpWithPatchTwinReportedPropertiesOperation(
         assert new_op.resource_location == "/properties/reported/"
         assert new_op.request_body == json.dumps(op.patch)
 
+    @pytest.mark.it("Serializes the patch with the JSON serializer the pipeline is configured with")
+    def test_uses_configured_serializer(self, mocker, stage, op):
+        serializer = mocker.MagicMock()
+        stage.pipeline_root.pipeline_configuration.json_serializer = serializer
+        stage.run_op(op)
+
+        assert serializer.dumps.call_count == 1
+        assert serializer.dumps.call_args == mocker.call(op.patch)
+        new_op = stage.send_op_down.call_args[0][0]
+        assert new_op.request_body is serializer.dumps.return_value
+
 
 @pytest.mark.describe(
     "TwinRequestResponseStage - .run_op() -- Called with other arbitrary operation"
@@ -494,6 +838,7 @@ class TestTwinRequestResponseStageWhenRequestAndResponseCreatedFromGetTwinOperat
     @pytest.fixture
     def stage(self, mocker, cls_type, init_kwargs, get_twin_op):
         stage = cls_type(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(IoTHubPipelineConfig())
         stage.send_op_down = mocker.MagicMock()
         stage.send_event_up = mocker.MagicMock()
 
@@ -622,6 +967,21 @@ class TestTwinRequestResponseStageWhenRequestAndResponseCreatedFromGetTwinOperat
         assert get_twin_op.error is None
         assert get_twin_op.twin == expected_twin
 
+    @pytest.mark.it(
+        "Deserializes the twin from the response body, without decoding it first, with the JSON serializer the pipeline is configured with"
+    )
+    def test_uses_configured_serializer(self, mocker, stage, get_twin_op, request_and_response_op):
+        serializer = mocker.MagicMock()
+        stage.pipeline_root.pipeline_configuration.json_serializer = serializer
+
+        request_and_response_op.status_code = 200
+        request_and_response_op.response_body = b'{"desired": {}}'
+        request_and_response_op.complete()
+
+        assert serializer.loads.call_count == 1
+        assert serializer.loads.call_args == mocker.call(b'{"desired": {}}')
+        assert get_twin_op.twin is serializer.loads.return_value
+
 
 @pytest.mark.describe(
     "TwinRequestResponseStage - OCCURANCE: RequestAndResponseOperation created from PatchTwinReportedPropertiesOperation is completed"
@@ -638,6 +998,7 @@ class TestTwinRequestResponseStageWhenRequestAndResponseCreatedFromPatchTwinRepo
     @pytest.fixture
     def stage(self, mocker, cls_type, init_kwargs, patch_twin_reported_properties_op):
         stage = cls_type(**init_kwargs)
+        stage.pipeline_root = pipeline_stages_base.PipelineRootStage(IoTHubPipelineConfig())
         stage.send_op_down = mocker.MagicMock()
         stage.send_event_up = mocker.MagicMock()
 
@@ -20,6 +20,7 @@ from azure.iot.device.iothub.pipeline import (
     pipeline_events_iothub,
     pipeline_ops_iothub,
     pipeline_stages_iothub_mqtt,
+    mqtt_topic_iothub,
     config,
 )
 from azure.iot.device.iothub.pipeline.exceptions import OperationError, PipelineError
@@ -115,6 +116,7 @@ fake_message_user_property_2_encoded = "sorted-house=hufflepuff"
 ops_handled_by_this_stage = [
     pipeline_ops_iothub.SetIoTHubConnectionArgsOperation,
     pipeline_ops_iothub.SendD2CMessageOperation,
+    pipeline_ops_iothub.SendD2CMessageBatchOperation,
     pipeline_ops_base.UpdateSasTokenOperation,
     pipeline_ops_iothub.SendOutputEventOperation,
     pipeline_ops_iothub.SendMethodResponseOperation,
@@ -941,6 +943,182 @@ class TestIoTHubMQTTConverterForPublishOps(IoTHubMQTTTranslationStageTestBase):
         assert new_op.payload == params["publish_payload"]
 
 
+@pytest.mark.describe(
+    "IoTHubMQTTTranslationStage - .run_op() -- called with SendD2CMessageBatchOperation"
+)
+class TestIoTHubMQTTConverterWithSendD2CMessageBatch(IoTHubMQTTTranslationStageTestBase):
+    @pytest.fixture
+    def messages(self):
+        return [
+            Message(fake_message_body),
+            Message(fake_message_body, message_id=fake_message_id),
+        ]
+
+    @pytest.fixture
+    def op(self, mocker, messages):
+        return pipeline_ops_iothub.SendD2CMessageBatchOperation(
+            messages=messages, callback=mocker.MagicMock()
+        )
+
+    @pytest.mark.it("Sends a single MQTTPublishBatchOperation down for the whole batch")
+    def test_sends_single_batch_op(self, stage, stages_configured_for_both, op):
+        stage.run_op(op)
+        assert stage.next._run_op.call_count == 1
+        new_op = stage.next._run_op.call_args[0][0]
+        assert isinstance(new_op, pipeline_ops_mqtt.MQTTPublishBatchOperation)
+
+    @pytest.mark.it(
+        "Uses the telemetry topic with encoded message properties and the message body for each publish in the batch"
+    )
+    def test_publishes(self, stage, stages_configured_for_both, op, messages):
+        stage.run_op(op)
+        new_op = stage.next._run_op.call_args[0][0]
+        assert new_op.publishes == [
+            (mqtt_topic_iothub.encode_properties(message, stage.telemetry_topic), message.data)
+            for message in messages
+        ]
+
+    @pytest.mark.it(
+        "Copies the per-message results onto the SendD2CMessageBatchOperation when the MQTTPublishBatchOperation completes"
+    )
+    def test_copies_results(self, stage, stages_configured_for_both, op, arbitrary_exception):
+        stage.run_op(op)
+        new_op = stage.next._run_op.call_args[0][0]
+        new_op.results = [None, arbitrary_exception]
+        new_op.complete()
+
+        assert op.completed
+        assert op.error is None
+        assert op.results == [None, arbitrary_exception]
+
+
+@pytest.mark.describe(
+    "IoTHubMQTTTranslationStage - .run_op() -- called with publish operations while a telemetry QoS is configured"
+)
+class TestIoTHubMQTTConverterTelemetryQos(IoTHubMQTTTranslationStageTestBase):
+    @pytest.mark.it("Publishes telemetry at the configured telemetry QoS level")
+    @pytest.mark.parametrize("qos", [0, 1])
+    @pytest.mark.parametrize(
+        "op_class, op_init_kwargs",
+        [
+            pytest.param(
+                pipeline_ops_iothub.SendD2CMessageOperation,
+                {"message": fake_message},
+                id="SendD2CMessageOperation",
+            ),
+            pytest.param(
+                pipeline_ops_iothub.SendOutputEventOperation,
+                {"message": fake_message},
+                id="SendOutputEventOperation",
+            ),
+            pytest.param(
+                pipeline_ops_iothub.SendD2CMessageBatchOperation,
+                {"messages": [fake_message]},
+                id="SendD2CMessageBatchOperation",
+            ),
+        ],
+    )
+    def test_telemetry_qos(
+        self, mocker, stage, stages_configured_for_both, qos, op_class, op_init_kwargs
+    ):
+        stage.pipeline_root.pipeline_configuration.telemetry_qos = qos
+        stage.run_op(op_class(callback=mocker.MagicMock(), **op_init_kwargs))
+        new_op = stage.next._run_op.call_args[0][0]
+        assert new_op.qos == qos
+
+    @pytest.mark.it("Publishes method responses at QoS 1, regardless of the telemetry QoS level")
+    def test_method_response_qos(self, mocker, stage, stages_configured_for_both):
+        stage.pipeline_root.pipeline_configuration.telemetry_qos = 0
+        stage.run_op(
+            pipeline_ops_iothub.SendMethodResponseOperation(
+                method_response=fake_method_response, callback=mocker.MagicMock()
+            )
+        )
+        new_op = stage.next._run_op.call_args[0][0]
+        assert new_op.qos == 1
+
+    @pytest.mark.it(
+        "Serializes method response payloads with the JSON serializer the pipeline is configured with"
+    )
+    def test_method_response_serializer(self, mocker, stage, stages_configured_for_both):
+        serializer = mocker.MagicMock()
+        stage.pipeline_root.pipeline_configuration.json_serializer = serializer
+        stage.run_op(
+            pipeline_ops_iothub.SendMethodResponseOperation(
+                method_response=fake_method_response, callback=mocker.MagicMock()
+            )
+        )
+        assert serializer.dumps.call_args == mocker.call(fake_method_response.payload)
+        new_op = stage.next._run_op.call_args[0][0]
+        assert new_op.payload is serializer.dumps.return_value
+
+
+@pytest.mark.describe(
+    "IoTHubMQTTTranslationStage - .run_op() -- called with operations which are sent as publishes"
+)
+class TestIoTHubMQTTConverterStorablePublishes(IoTHubMQTTTranslationStageTestBase):
+    @pytest.mark.it("Marks telemetry publishes as storable")
+    @pytest.mark.parametrize(
+        "op_class, op_init_kwargs",
+        [
+            pytest.param(
+                pipeline_ops_iothub.SendD2CMessageOperation,
+                {"message": fake_message},
+                id="SendD2CMessageOperation",
+            ),
+            pytest.param(
+                pipeline_ops_iothub.SendOutputEventOperation,
+                {"message": fake_message},
+                id="SendOutputEventOperation",
+            ),
+            pytest.param(
+                pipeline_ops_iothub.SendD2CMessageBatchOperation,
+                {"messages": [fake_message]},
+                id="SendD2CMessageBatchOperation",
+            ),
+        ],
+    )
+    def test_telemetry(self, mocker, stage, stages_configured_for_both, op_class, op_init_kwargs):
+        stage.run_op(op_class(callback=mocker.MagicMock(), **op_init_kwargs))
+        new_op = stage.next._run_op.call_args[0][0]
+        assert new_op.storable is True
+
+    @pytest.mark.it("Does not mark method response publishes as storable")
+    def test_method_response(self, mocker, stage, stages_configured_for_both):
+        stage.run_op(
+            pipeline_ops_iothub.SendMethodResponseOperation(
+                method_response=fake_method_response, callback=mocker.MagicMock()
+            )
+        )
+        new_op = stage.next._run_op.call_args[0][0]
+        assert new_op.storable is False
+
+    @pytest.mark.it("Does not mark twin request publishes as storable")
+    @pytest.mark.parametrize(
+        "method, resource_location",
+        [
+            pytest.param("GET", "/", id="Twin GET"),
+            pytest.param("PATCH", "/properties/reported/", id="Twin PATCH"),
+        ],
+    )
+    def test_twin_request(
+        self, mocker, stage, stages_configured_for_both, method, resource_location
+    ):
+        stage.run_op(
+            pipeline_ops_base.RequestOperation(
+                request_type="twin",
+                method=method,
+                resource_location=resource_location,
+                request_body=" ",
+                request_id=fake_request_id,
+                callback=mocker.MagicMock(),
+            )
+        )
+        new_op = stage.next._run_op.call_args[0][0]
+        assert isinstance(new_op, pipeline_ops_mqtt.MQTTPublishOperation)
+        assert new_op.storable is False
+
+
 feature_name_to_subscribe_topic = [
     {
         "stage_type": "device",
@@ -1022,7 +1200,7 @@ class TestIoTHubMQTTConverterWithEnableFeature(IoTHubMQTTTranslationStageTestBas
 
 @pytest.fixture
 def add_pipeline_root(stage, mocker):
-    root = pipeline_stages_base.PipelineRootStage(mocker.MagicMock())
+    root = pipeline_stages_base.PipelineRootStage(config.IoTHubPipelineConfig())
     mocker.spy(root, "handle_pipeline_event")
     stage.previous = root
     stage.pipeline_root = root
@@ -1302,6 +1480,20 @@ class TestIoTHubMQTTConverterHandlePipelineEventMethodRequets(IoTHubMQTTTranslat
             fake_method_request_payload.decode("utf-8")
         )
 
+    @pytest.mark.it(
+        "Deserializes the payload of the mqtt message, without decoding it first, with the JSON serializer the pipeline is configured with"
+    )
+    def test_uses_configured_serializer(
+        self, mocker, stage, stages_configured_for_both, add_pipeline_root, method_request_event
+    ):
+        serializer = mocker.MagicMock()
+        stage.pipeline_root.pipeline_configuration.json_serializer = serializer
+        stage.handle_pipeline_event(method_request_event)
+
+        assert serializer.loads.call_args == mocker.call(fake_method_request_payload)
+        new_event = stage.previous.handle_pipeline_event.call_args[0][0]
+        assert new_event.method_request.payload is serializer.loads.return_value
+
 
 @pytest.mark.describe(
     "IotHubMQTTConverter - .handle_pipeline_event() -- called with twin response topic"
@@ -1481,6 +1673,20 @@ class TestIotHubMQTTConverterHandlePipelineEventTwinPatch(IoTHubMQTTTranslationS
         assert isinstance(new_event, pipeline_events_iothub.TwinDesiredPropertiesPatchEvent)
         assert new_event.patch == fake_patch
 
+    @pytest.mark.it(
+        "Deserializes the payload, without decoding it first, with the JSON serializer the pipeline is configured with"
+    )
+    def test_uses_configured_serializer(
+        self, mocker, stage, fixup_stage_for_test, fake_event, fake_patch_as_bytes
+    ):
+        serializer = mocker.MagicMock()
+        stage.pipeline_root.pipeline_configuration.json_serializer = serializer
+        stage.handle_pipeline_event(fake_event)
+
+        assert serializer.loads.call_args == mocker.call(fake_patch_as_bytes)
+        new_event = stage.previous.handle_pipeline_event.call_args[0][0]
+        assert new_event.patch is serializer.loads.return_value
+
     @pytest.mark.it(
         "Calls the unhandled exception handler with a PipelineError if there is no previous stage"
     )
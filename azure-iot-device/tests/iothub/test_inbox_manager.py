@@ -10,6 +10,7 @@ import sys
 import six
 import abc
 from azure.iot.device.iothub.inbox_manager import InboxManager
+from azure.iot.device.iothub.sync_method_dispatcher import DispatcherClosed
 from azure.iot.device.iothub.models import Message, MethodRequest
 
 logging.basicConfig(level=logging.DEBUG)
@@ -313,3 +314,151 @@ class TestInboxManagerRouteMethodRequest(object):
         # Method Request 2 was delivered to its corresponding named inbox since the method name is known
         assert method_request2 in named_method_inbox
         assert method_request2 not in generic_method_inbox
+
+    @pytest.mark.it(
+        "Calls the handler corresponding to the method name instead of adding the MethodRequest to an inbox, if it exists"
+    )
+    def test_calls_named_handler(self, mocker, manager, method_request):
+        named_method_inbox = manager.get_method_request_inbox(method_request.name)
+        named_handler = mocker.MagicMock()
+        generic_handler = mocker.MagicMock()
+        manager.set_method_request_handler(method_request.name, named_handler)
+        manager.set_method_request_handler(None, generic_handler)
+
+        assert manager.route_method_request(method_request)
+        assert named_handler.call_args == mocker.call(method_request)
+        assert generic_handler.call_count == 0
+        assert named_method_inbox.empty()
+
+    @pytest.mark.it(
+        "Routes the MethodRequest again if the handler was closed after it was looked up, so that it reaches the handler or inbox which replaced it"
+    )
+    def test_handler_closed(self, mocker, manager, method_request):
+        named_method_inbox = manager.get_method_request_inbox(method_request.name)
+
+        def replace_and_close(request):
+            # What happens if the client replaces the handler while the request is being routed
+            manager.set_method_request_handler(method_request.name, None)
+            raise DispatcherClosed()
+
+        closed_handler = mocker.MagicMock(side_effect=replace_and_close)
+        manager.set_method_request_handler(method_request.name, closed_handler)
+
+        assert manager.route_method_request(method_request)
+        assert closed_handler.call_count == 1
+        assert method_request in named_method_inbox
+
+    @pytest.mark.it(
+        "Calls the generic handler, if there is neither a handler nor an inbox corresponding to the method name"
+    )
+    def test_calls_generic_handler(self, mocker, manager, method_request):
+        generic_handler = mocker.MagicMock()
+        manager.set_method_request_handler(None, generic_handler)
+
+        assert manager.route_method_request(method_request)
+        assert generic_handler.call_args == mocker.call(method_request)
+        assert manager.get_method_request_inbox().empty()
+
+    @pytest.mark.it(
+        "Adds MethodRequest to the inbox corresponding to the method name instead of calling the generic handler, if it exists"
+    )
+    def test_named_inbox_before_generic_handler(self, mocker, manager, method_request):
+        named_method_inbox = manager.get_method_request_inbox(method_request.name)
+        generic_handler = mocker.MagicMock()
+        manager.set_method_request_handler(None, generic_handler)
+
+        assert manager.route_method_request(method_request)
+        assert generic_handler.call_count == 0
+        assert method_request in named_method_inbox
+
+
+@pytest.mark.describe("InboxManager - .set_method_request_handler()")
+class TestInboxManagerSetMethodRequestHandler(object):
+    @pytest.mark.it("Returns the handler previously set for the method name, or None")
+    @pytest.mark.parametrize(
+        "method_name",
+        [pytest.param(None, id="Generic Method"), pytest.param("method_x", id="Named Method")],
+    )
+    def test_returns_previous_handler(self, mocker, manager, method_name):
+        handler1 = mocker.MagicMock()
+        handler2 = mocker.MagicMock()
+        assert manager.set_method_request_handler(method_name, handler1) is None
+        assert manager.set_method_request_handler(method_name, handler2) is handler1
+        assert manager.set_method_request_handler(method_name, None) is handler2
+
+    @pytest.mark.it("Routes MethodRequests to an inbox again when the handler is removed")
+    def test_remove_handler(self, mocker, manager, method_request):
+        handler = mocker.MagicMock()
+        manager.set_method_request_handler(method_request.name, handler)
+        manager.set_method_request_handler(method_request.name, None)
+
+        manager.route_method_request(method_request)
+        assert handler.call_count == 0
+        assert method_request in manager.get_method_request_inbox()
+
+
+@pytest.mark.describe("InboxManager - .set_capacity()")
+class TestInboxManagerSetCapacity(object):
+    @pytest.mark.it("Replaces every inbox with an empty inbox with the given capacity and policy")
+    def test_replaces_inboxes(self, manager, inbox_type, method_request):
+        manager.get_input_message_inbox("some_input")
+        manager.route_method_request(method_request)
+
+        manager.set_capacity(1, "drop_newest")
+        assert manager.input_message_inboxes == {}
+        assert manager.named_method_request_inboxes == {}
+        for inbox in (
+            manager.c2d_message_inbox,
+            manager.generic_method_request_inbox,
+            manager.twin_patch_inbox,
+            manager.get_input_message_inbox("some_input"),
+            manager.get_method_request_inbox("some_method"),
+        ):
+            assert isinstance(inbox, inbox_type)
+            assert inbox.empty()
+            inbox._put("item1")
+            inbox._put("item2")
+            assert inbox.depth == 1
+            assert inbox.dropped_count == 1
+
+    @pytest.mark.it("Raises TypeError if the capacity is neither an integer nor None")
+    @pytest.mark.parametrize("capacity", ["10", 1.5, True])
+    def test_invalid_capacity_type(self, manager, capacity):
+        with pytest.raises(TypeError):
+            manager.set_capacity(capacity)
+
+    @pytest.mark.it("Raises ValueError if the capacity is less than 1")
+    @pytest.mark.parametrize("capacity", [0, -1])
+    def test_invalid_capacity_value(self, manager, capacity):
+        with pytest.raises(ValueError):
+            manager.set_capacity(capacity)
+
+    @pytest.mark.it("Raises ValueError if the overflow policy is unknown")
+    def test_invalid_overflow_policy(self, manager):
+        with pytest.raises(ValueError):
+            manager.set_capacity(10, "reject")
+
+
+@pytest.mark.describe("InboxManager - .get_metrics()")
+class TestInboxManagerGetMetrics(object):
+    @pytest.mark.it("Returns the metrics of every inbox, by inbox name")
+    def test_returns_metrics(self, manager, method_request):
+        manager.get_input_message_inbox("some_input")
+        manager.get_method_request_inbox("some_method")
+        manager.route_c2d_message(Message("some data"))
+        manager.route_method_request(method_request)
+
+        metrics = manager.get_metrics()
+        assert sorted(metrics.keys()) == [
+            "c2d",
+            "input:some_input",
+            "method",
+            "method:some_method",
+            "twin_patch",
+        ]
+        assert metrics["c2d"].depth == 1
+        assert metrics["c2d"].oldest_item_age >= 0
+        assert metrics["c2d"].dropped_count == 0
+        assert metrics["method:some_method"].depth == 1
+        assert metrics["method"].depth == 0
+        assert metrics["method"].oldest_item_age is None
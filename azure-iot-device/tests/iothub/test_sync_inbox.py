@@ -8,7 +8,10 @@ import pytest
 import logging
 import threading
 import time
+from azure.iot.device.common.pipeline import pipeline_thread
+from azure.iot.device.iothub import sync_inbox
 from azure.iot.device.iothub.sync_inbox import SyncClientInbox, InboxEmpty
+from azure.iot.device.iothub.models import Message
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -117,6 +120,91 @@ class TestSyncClientInboxGet(object):
             inbox.get(block=False)
 
 
+@pytest.mark.describe("SyncClientInbox - .get_batch()")
+class TestSyncClientInboxGetBatch(object):
+    @pytest.mark.it("Returns and removes all items in the inbox, in FIFO order")
+    def test_returns_all_items(self):
+        inbox = SyncClientInbox()
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert inbox.get_batch() == ["item1", "item2", "item3"]
+        assert inbox.empty()
+
+    @pytest.mark.it("Returns and removes no more than max_items items")
+    def test_max_items(self):
+        inbox = SyncClientInbox()
+        for item in ("item1", "item2", "item3"):
+            inbox._put(item)
+        assert inbox.get_batch(max_items=2) == ["item1", "item2"]
+        assert inbox.get_batch(max_items=2) == ["item3"]
+        assert inbox.empty()
+
+    @pytest.mark.it("Raises ValueError if max_items is less than 1")
+    @pytest.mark.parametrize("max_items", [0, -1])
+    def test_invalid_max_items(self, max_items):
+        inbox = SyncClientInbox()
+        inbox._put("item1")
+        with pytest.raises(ValueError):
+            inbox.get_batch(max_items=max_items)
+
+    @pytest.mark.it(
+        "Blocks on an empty inbox until an item is available to remove and return, if using blocking mode"
+    )
+    def test_waits_for_item_in_blocking_mode(self):
+        inbox = SyncClientInbox()
+
+        def insert_item():
+            time.sleep(0.01)  # wait before inserting
+            inbox._put("item1")
+
+        insertion_thread = threading.Thread(target=insert_item)
+        insertion_thread.start()
+
+        assert inbox.get_batch(block=True) == ["item1"]
+        insertion_thread.join()
+
+    @pytest.mark.it(
+        "Raises InboxEmpty exception after a timeout while blocking on an empty inbox, if a timeout is specified"
+    )
+    def test_times_out_while_blocking_if_timeout_specified(self):
+        inbox = SyncClientInbox()
+        with pytest.raises(InboxEmpty):
+            inbox.get_batch(block=True, timeout=0.01)
+
+    @pytest.mark.it(
+        "Raises InboxEmpty exception if the inbox is empty, when using non-blocking mode"
+    )
+    def test_raises_empty_in_non_blocking_mode(self):
+        inbox = SyncClientInbox()
+        with pytest.raises(InboxEmpty):
+            inbox.get_batch(block=False)
+
+    @pytest.mark.it("Makes room for items blocked waiting for a free slot")
+    def test_unblocks_put(self):
+        inbox = SyncClientInbox(capacity=2, overflow_policy=sync_inbox.BLOCK)
+        inbox._put("item1")
+        inbox._put("item2")
+        insertion_thread = threading.Thread(target=inbox._put, args=("item3",))
+        insertion_thread.start()
+        insertion_thread.join(0.1)
+        assert insertion_thread.is_alive()
+        assert inbox.get_batch() == ["item1", "item2"]
+        insertion_thread.join(1)
+        assert not insertion_thread.is_alive()
+        assert inbox.get_batch() == ["item3"]
+
+    @pytest.mark.it("Updates the depth of the inbox and refills it from disk")
+    def test_spill(self):
+        inbox = SyncClientInbox(capacity=2, overflow_policy=sync_inbox.SPILL)
+        for item in ("item1", "item2", "item3", "item4"):
+            inbox._put(item)
+        assert inbox.get_batch() == ["item1", "item2"]
+        assert inbox.depth == 2
+        assert inbox.get_batch() == ["item3", "item4"]
+        assert inbox.depth == 0
+        assert inbox.oldest_item_age is None
+
+
 @pytest.mark.describe("SyncClientInbox - .clear()")
 class TestSyncClientInboxClear(object):
     @pytest.mark.it("Clears all items from the inbox")
@@ -132,3 +220,146 @@ class TestSyncClientInboxClear(object):
 
         inbox.clear()
         assert inbox.empty()
+
+    @pytest.mark.it("Clears items spilled to disk")
+    def test_clears_spilled_items(self):
+        inbox = SyncClientInbox(capacity=1, overflow_policy=sync_inbox.SPILL)
+        inbox._put("item1")
+        inbox._put("item2")
+        inbox.clear()
+        assert inbox.empty()
+        assert inbox.depth == 0
+        inbox._put("item3")
+        assert inbox.get(block=False) == "item3"
+
+
+@pytest.mark.describe("SyncClientInbox - Instantiation")
+class TestSyncClientInboxInstantiation(object):
+    @pytest.mark.it("Raises ValueError if the overflow policy is unknown")
+    def test_invalid_overflow_policy(self):
+        with pytest.raises(ValueError):
+            SyncClientInbox(capacity=1, overflow_policy="reject")
+
+    @pytest.mark.it(
+        "Raises ValueError if the overflow policy is BLOCK with a capacity while the pipeline runs on an event loop"
+    )
+    def test_block_on_event_loop(self, mocker):
+        mocker.patch.object(pipeline_thread, "get_event_loop", return_value=mocker.MagicMock())
+        with pytest.raises(ValueError):
+            SyncClientInbox(capacity=1, overflow_policy=sync_inbox.BLOCK)
+        # Without a capacity, the inbox never waits
+        SyncClientInbox(overflow_policy=sync_inbox.BLOCK)
+        SyncClientInbox(capacity=1, overflow_policy=sync_inbox.DROP_OLDEST)
+
+
+@pytest.mark.describe("SyncClientInbox - ._put() -- inbox is at capacity")
+class TestSyncClientInboxPutAtCapacity(object):
+    @pytest.mark.it("Blocks until an item is removed, if the overflow policy is BLOCK")
+    def test_block(self):
+        inbox = SyncClientInbox(capacity=2, overflow_policy=sync_inbox.BLOCK)
+        inbox._put("item1")
+        inbox._put("item2")
+
+        put_thread = threading.Thread(target=inbox._put, args=("item3",))
+        put_thread.start()
+        put_thread.join(0.05)
+        assert put_thread.is_alive()
+
+        assert inbox.get(block=False) == "item1"
+        put_thread.join(1)
+        assert not put_thread.is_alive()
+        assert inbox.get(block=False) == "item2"
+        assert inbox.get(block=False) == "item3"
+        assert inbox.dropped_count == 0
+
+    @pytest.mark.it(
+        "Drops the oldest item to make room for the new one, if the overflow policy is DROP_OLDEST"
+    )
+    def test_drop_oldest(self):
+        inbox = SyncClientInbox(capacity=2, overflow_policy=sync_inbox.DROP_OLDEST)
+        for item in ("item1", "item2", "item3", "item4"):
+            inbox._put(item)
+        assert inbox.dropped_count == 2
+        assert inbox.get(block=False) == "item3"
+        assert inbox.get(block=False) == "item4"
+        assert inbox.empty()
+
+    @pytest.mark.it("Drops the new item, if the overflow policy is DROP_NEWEST")
+    def test_drop_newest(self):
+        inbox = SyncClientInbox(capacity=2, overflow_policy=sync_inbox.DROP_NEWEST)
+        for item in ("item1", "item2", "item3", "item4"):
+            inbox._put(item)
+        assert inbox.dropped_count == 2
+        assert inbox.get(block=False) == "item1"
+        assert inbox.get(block=False) == "item2"
+        assert inbox.empty()
+
+    @pytest.mark.it(
+        "Spills the new item to disk, and returns it in order once there is room, if the overflow policy is SPILL"
+    )
+    def test_spill(self):
+        inbox = SyncClientInbox(capacity=2, overflow_policy=sync_inbox.SPILL)
+        messages = [Message("message {}".format(i), message_id=str(i)) for i in range(5)]
+        for message in messages:
+            inbox._put(message)
+        assert inbox.depth == 5
+        assert inbox.dropped_count == 0
+
+        # The first messages are held in memory, and the rest are read back from disk
+        assert inbox.get(block=False) is messages[0]
+        inbox._put(Message("message 5", message_id="5"))
+        received = [inbox.get(block=False) for _ in range(5)]
+        assert [message.message_id for message in received] == ["1", "2", "3", "4", "5"]
+        assert received[3].data == "message 4"
+        assert inbox.empty()
+
+    @pytest.mark.it("Spills items to the spill directory, if one is provided")
+    def test_spill_directory(self, tmpdir):
+        inbox = SyncClientInbox(
+            capacity=1, overflow_policy=sync_inbox.SPILL, spill_directory=str(tmpdir)
+        )
+        inbox._put("item1")
+        inbox._put("item2")
+        assert inbox._spill.directory == str(tmpdir)
+        assert inbox.get(block=False) == "item1"
+        assert inbox.get(block=False) == "item2"
+
+
+@pytest.mark.describe("SyncClientInbox - Metrics")
+class TestSyncClientInboxMetrics(object):
+    @pytest.mark.it("Reports the number of items in the inbox as its depth")
+    def test_depth(self):
+        inbox = SyncClientInbox()
+        assert inbox.depth == 0
+        inbox._put("item1")
+        inbox._put("item2")
+        assert inbox.depth == 2
+        inbox.get(block=False)
+        assert inbox.depth == 1
+
+    @pytest.mark.it(
+        "Reports the number of seconds since the oldest item in the inbox was put into it"
+    )
+    def test_oldest_item_age(self, mocker):
+        now = mocker.patch.object(sync_inbox, "_monotonic", return_value=100.0)
+        inbox = SyncClientInbox()
+        inbox._put("item1")
+        now.return_value = 105.0
+        inbox._put("item2")
+        now.return_value = 110.0
+        assert inbox.oldest_item_age == 10.0
+        inbox.get(block=False)
+        assert inbox.oldest_item_age == 5.0
+
+    @pytest.mark.it("Reports the oldest item age as None if the inbox is empty")
+    def test_oldest_item_age_empty(self):
+        inbox = SyncClientInbox()
+        assert inbox.oldest_item_age is None
+        inbox._put("item1")
+        inbox.get(block=False)
+        assert inbox.oldest_item_age is None
+
+    @pytest.mark.it("Reports a dropped count of 0 if no items have been dropped")
+    def test_dropped_count(self):
+        inbox = SyncClientInbox(capacity=1, overflow_policy=sync_inbox.DROP_NEWEST)
+        assert inbox.dropped_count == 0
@@ -0,0 +1,151 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+import threading
+import time
+from azure.iot.device.iothub.models import MethodRequest, MethodResponse
+from azure.iot.device.iothub.sync_method_dispatcher import SyncMethodDispatcher, DispatcherClosed
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+@pytest.fixture
+def method_request():
+    return MethodRequest(request_id="1", name="some_method", payload={"key": "value"})
+
+
+class ResponseList(list):
+    """The responses sent by a dispatcher, with an event set once a number of them are sent"""
+
+    def __init__(self, expected_count=1):
+        super(ResponseList, self).__init__()
+        self.expected_count = expected_count
+        self.event = threading.Event()
+
+    def send(self, method_response):
+        self.append(method_response)
+        if len(self) >= self.expected_count:
+            self.event.set()
+
+
+@pytest.fixture
+def sent_responses():
+    return ResponseList()
+
+
+@pytest.mark.describe("SyncMethodDispatcher - Instantiation")
+class TestSyncMethodDispatcherInstantiation(object):
+    @pytest.mark.it("Raises TypeError if max_concurrency is not an integer")
+    @pytest.mark.parametrize("max_concurrency", [1.5, "1", None, True])
+    def test_invalid_max_concurrency_type(self, mocker, max_concurrency):
+        with pytest.raises(TypeError):
+            SyncMethodDispatcher(mocker.MagicMock(), mocker.MagicMock(), max_concurrency)
+
+    @pytest.mark.it("Raises ValueError if max_concurrency is less than 1")
+    @pytest.mark.parametrize("max_concurrency", [0, -1])
+    def test_invalid_max_concurrency_value(self, mocker, max_concurrency):
+        with pytest.raises(ValueError):
+            SyncMethodDispatcher(mocker.MagicMock(), mocker.MagicMock(), max_concurrency)
+
+
+@pytest.mark.describe("SyncMethodDispatcher - .dispatch()")
+class TestSyncMethodDispatcherDispatch(object):
+    @pytest.mark.it("Calls the handler with the MethodRequest on a worker thread")
+    def test_calls_handler_on_worker_thread(self, method_request, sent_responses):
+        handler_threads = []
+
+        def handler(request):
+            handler_threads.append((request, threading.current_thread()))
+
+        dispatcher = SyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        assert sent_responses.event.wait(1)
+        assert handler_threads[0][0] is method_request
+        assert handler_threads[0][1] is not threading.current_thread()
+        dispatcher.close()
+
+    @pytest.mark.it(
+        "Sends a response with status 200 and the value returned by the handler as its payload"
+    )
+    def test_sends_payload_response(self, method_request, sent_responses):
+        dispatcher = SyncMethodDispatcher(lambda request: {"result": 1}, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        assert sent_responses.event.wait(1)
+        assert sent_responses[0].request_id == method_request.request_id
+        assert sent_responses[0].status == 200
+        assert sent_responses[0].payload == {"result": 1}
+        dispatcher.close()
+
+    @pytest.mark.it("Sends the MethodResponse returned by the handler as is")
+    def test_sends_method_response(self, method_request, sent_responses):
+        method_response = MethodResponse(method_request.request_id, 404, "not found")
+        dispatcher = SyncMethodDispatcher(lambda request: method_response, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        assert sent_responses.event.wait(1)
+        assert sent_responses[0] is method_response
+        dispatcher.close()
+
+    @pytest.mark.it(
+        "Sends a response with status 500 and a generic error message if the handler raises an exception"
+    )
+    def test_sends_error_response(self, method_request, sent_responses):
+        def handler(request):
+            raise ValueError("secret details")
+
+        dispatcher = SyncMethodDispatcher(handler, sent_responses.send)
+        dispatcher.dispatch(method_request)
+        assert sent_responses.event.wait(1)
+        assert sent_responses[0].request_id == method_request.request_id
+        assert sent_responses[0].status == 500
+        assert sent_responses[0].payload == {"error": "Method request handler failed"}
+        dispatcher.close()
+
+    @pytest.mark.it("Handles up to max_concurrency MethodRequests at a time")
+    @pytest.mark.parametrize("max_concurrency", [1, 3])
+    def test_max_concurrency(self, max_concurrency):
+        lock = threading.Lock()
+        release = threading.Event()
+        running = [0]
+        max_running = [0]
+        sent_responses = ResponseList(expected_count=5)
+
+        def handler(request):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            release.wait(1)
+            with lock:
+                running[0] -= 1
+
+        dispatcher = SyncMethodDispatcher(
+            handler, sent_responses.send, max_concurrency=max_concurrency
+        )
+        for i in range(5):
+            dispatcher.dispatch(MethodRequest(str(i), "some_method", None))
+        # Give the worker threads time to start as many handlers as they are allowed to
+        time.sleep(0.1)
+        assert running[0] == max_concurrency
+        release.set()
+        assert sent_responses.event.wait(1)
+        assert max_running[0] == max_concurrency
+        dispatcher.close()
+
+    @pytest.mark.it("Can be called as a handler")
+    def test_callable(self, mocker, method_request):
+        dispatcher = SyncMethodDispatcher(mocker.MagicMock(), mocker.MagicMock())
+        dispatch_mock = mocker.patch.object(dispatcher, "dispatch")
+        dispatcher(method_request)
+        assert dispatch_mock.call_args == mocker.call(method_request)
+        dispatcher.close()
+
+    @pytest.mark.it("Raises DispatcherClosed if the dispatcher has been closed")
+    def test_closed(self, mocker, method_request):
+        dispatcher = SyncMethodDispatcher(mocker.MagicMock(), mocker.MagicMock())
+        dispatcher.close()
+        with pytest.raises(DispatcherClosed):
+            dispatcher.dispatch(method_request)
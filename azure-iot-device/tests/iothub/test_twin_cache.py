@@ -0,0 +1,128 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import pytest
+import logging
+from azure.iot.device.iothub.twin_cache import TwinCache
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+def make_twin(version=1):
+    return {
+        "desired": {"interval": 30, "limits": {"low": 1, "high": 9}, "$version": version},
+        "reported": {"firmware": "1.0", "$version": 4},
+    }
+
+
+@pytest.fixture
+def cache():
+    cache = TwinCache()
+    cache.set(make_twin(), cache.generation)
+    return cache
+
+
+@pytest.mark.describe("TwinCache - .get()")
+class TestTwinCacheGet(object):
+    @pytest.mark.it("Returns None if no twin is cached")
+    def test_empty(self):
+        assert TwinCache().get() is None
+
+    @pytest.mark.it("Returns a copy of the cached twin")
+    def test_returns_copy(self, cache):
+        twin = cache.get()
+        assert twin == make_twin()
+        twin["desired"]["interval"] = 0
+        assert cache.get() == make_twin()
+
+
+@pytest.mark.describe("TwinCache - .set()")
+class TestTwinCacheSet(object):
+    @pytest.mark.it("Caches a copy of the twin")
+    def test_caches_copy(self):
+        cache = TwinCache()
+        twin = make_twin()
+        cache.set(twin, cache.generation)
+        twin["desired"]["interval"] = 0
+        assert cache.get() == make_twin()
+
+    @pytest.mark.it("Does not cache the twin if the cache was invalidated while it was fetched")
+    def test_invalidated_while_fetching(self):
+        cache = TwinCache()
+        generation = cache.generation
+        cache.invalidate()
+        cache.set(make_twin(), generation)
+        assert cache.get() is None
+
+    @pytest.mark.it("Applies the patches received while no twin was cached which are newer than it")
+    def test_applies_unapplied_patches(self):
+        cache = TwinCache()
+        cache.apply_desired_properties_patch({"interval": 5, "$version": 1})
+        cache.apply_desired_properties_patch({"interval": 15, "$version": 3})
+        cache.apply_desired_properties_patch({"interval": 10, "$version": 2})
+        cache.set(make_twin(version=1), cache.generation)
+        assert cache.get()["desired"]["interval"] == 15
+        assert cache.get()["desired"]["$version"] == 3
+
+
+@pytest.mark.describe("TwinCache - .apply_desired_properties_patch()")
+class TestTwinCacheApplyDesiredPropertiesPatch(object):
+    @pytest.mark.it("Merges the next version of the desired properties into the cached twin")
+    def test_merges_next_version(self, cache):
+        cache.apply_desired_properties_patch(
+            {"interval": 10, "limits": {"high": 20}, "mode": "eco", "$version": 2}
+        )
+        twin = cache.get()
+        assert twin["desired"] == {
+            "interval": 10,
+            "limits": {"low": 1, "high": 20},
+            "mode": "eco",
+            "$version": 2,
+        }
+        assert twin["reported"] == make_twin()["reported"]
+
+    @pytest.mark.it("Removes the desired properties which the patch sets to null")
+    def test_removes_null(self, cache):
+        cache.apply_desired_properties_patch(
+            {"limits": {"low": None}, "interval": None, "$version": 2}
+        )
+        assert cache.get()["desired"] == {"limits": {"high": 9}, "$version": 2}
+
+    @pytest.mark.it("Ignores a patch for a version the cached twin already has")
+    @pytest.mark.parametrize("version", [0, 1])
+    def test_ignores_old_version(self, cache, version):
+        cache.apply_desired_properties_patch({"interval": 10, "$version": version})
+        assert cache.get() == make_twin()
+
+    @pytest.mark.it("Invalidates the cached twin if a version of the desired properties was missed")
+    def test_invalidates_on_gap(self, cache):
+        generation = cache.generation
+        cache.apply_desired_properties_patch({"interval": 10, "$version": 3})
+        assert cache.get() is None
+        assert cache.generation == generation + 1
+
+    @pytest.mark.it("Invalidates the cached twin if the patch has no version")
+    def test_invalidates_without_version(self, cache):
+        cache.apply_desired_properties_patch({"interval": 10})
+        assert cache.get() is None
+
+
+@pytest.mark.describe("TwinCache - .invalidate()")
+class TestTwinCacheInvalidate(object):
+    @pytest.mark.it("Removes the cached twin, and increments the generation")
+    def test_invalidate(self, cache):
+        generation = cache.generation
+        cache.invalidate()
+        assert cache.get() is None
+        assert cache.generation == generation + 1
+
+    @pytest.mark.it("Discards the patches received while no twin was cached")
+    def test_discards_unapplied_patches(self):
+        cache = TwinCache()
+        cache.apply_desired_properties_patch({"interval": 10, "$version": 2})
+        cache.invalidate()
+        cache.set(make_twin(version=1), cache.generation)
+        assert cache.get() == make_twin(version=1)
@@ -110,7 +110,11 @@ def input_security_client(params_security_clients):
 
 @pytest.fixture
 def pipeline_configuration(mocker):
-    return mocker.MagicMock()
+    mock_config = mocker.MagicMock()
+    # Don't limit publishes
+    mock_config.max_in_flight_publishes = None
+    mock_config.max_queued_publish_bytes = None
+    return mock_config
 
 
 @pytest.fixture
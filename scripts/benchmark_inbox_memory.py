@@ -0,0 +1,76 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Measure the memory used by an azure-iot-device client inbox holding a large number of received messages.
+
+Each message is built from a C2D topic and payload the same way IoTHubMQTTTranslationStage builds
+received messages, and is put into a SyncClientInbox.  The memory allocated while filling the inbox
+is reported, then reported again after the properties of every queued message have been used.
+
+Usage:
+    python benchmark_inbox_memory.py --count 100000
+"""
+
+from __future__ import print_function
+import argparse
+import gc
+import tracemalloc
+from azure.iot.device.iothub.sync_inbox import SyncClientInbox
+from azure.iot.device.iothub.pipeline import mqtt_topic_iothub
+from azure.iot.device.iothub.models import Message
+
+DEVICE_ID = "gateway-device-0001"
+TOPIC = "devices/{}/messages/devicebound/%24.mid={{}}&%24.to=%2Fdevices%2F{}%2Fmessages%2FdeviceBound&%24.ct=application%2Fjson&%24.ce=utf-8&iothub-ack=full&building=4".format(
+    DEVICE_ID, DEVICE_ID
+)
+PAYLOAD = b'{"temperature": 21.5, "humidity": 40}'
+
+
+def report(name, size, count):
+    print(
+        "{:<28} {:>8.1f} MiB  ({:.0f} bytes per message)".format(
+            name, size / (1024.0 * 1024.0), float(size) / count
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--count", type=int, default=100000, help="number of messages to queue in the inbox"
+    )
+    args = parser.parse_args()
+
+    codec = mqtt_topic_iothub.TopicCodec(DEVICE_ID, None)
+    # Build the topics up front, since a real client does not keep them
+    topics = [TOPIC.format(i) for i in range(args.count)]
+    inbox = SyncClientInbox()
+
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+
+    for topic in topics:
+        message = Message(PAYLOAD)
+        codec.decode(topic).set_message_properties(message)
+        inbox._put(message)
+    del topic, message
+    gc.collect()
+    queued = tracemalloc.get_traced_memory()[0] - start
+    report("queued", queued, args.count)
+
+    for message in inbox._queue.queue:
+        message.custom_properties
+    del message
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    report("queued, properties used", used, args.count)
+
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
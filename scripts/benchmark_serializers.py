@@ -0,0 +1,85 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Compare the per-document cost of the azure-iot-device serializers on a twin document.
+
+The document is serialized with dumps() and deserialized with loads() from bytes, the way the
+pipeline handles twin patches and twin responses.  The standard library serializer is measured
+both with loads() and by decoding the bytes to str first, which is what the pipeline used to do.
+Serializers whose packages are not installed are skipped.
+
+Usage:
+    python benchmark_serializers.py --count 20000 --properties 200
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import time
+from azure.iot.device.common import serializers
+
+
+def make_twin(properties):
+    reported = {
+        "property{}".format(i): {"value": i * 1.5, "unit": "celsius", "ok": True}
+        for i in range(properties)
+    }
+    return {
+        "desired": {"telemetryInterval": 30, "$version": 12},
+        "reported": dict(reported, **{"$version": 40}),
+    }
+
+
+def measure(fn, count):
+    start = time.time()
+    for _ in range(count):
+        fn()
+    return (time.time() - start) * 1e6 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--count", type=int, default=20000, help="number of times to serialize each document"
+    )
+    parser.add_argument(
+        "--properties", type=int, default=200, help="number of reported properties in the twin"
+    )
+    args = parser.parse_args()
+
+    twin = make_twin(args.properties)
+    payload = json.dumps(twin).encode("utf-8")
+    print("Twin document of {} bytes".format(len(payload)))
+
+    decode_first = measure(lambda: json.loads(payload.decode("utf-8")), args.count)
+    print("{:<10} loads={:>8.2f}us  (decoding to str first)".format("json", decode_first))
+
+    for name in (
+        serializers.JSON,
+        serializers.ORJSON,
+        serializers.UJSON,
+        serializers.MSGPACK,
+        serializers.CBOR,
+    ):
+        try:
+            serializer = serializers.get_serializer(name)
+        except ValueError:
+            print("{:<10} not installed".format(name))
+            continue
+        data = serializer.dumps(twin)
+        if isinstance(data, str) and not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        dumps = measure(lambda: serializer.dumps(twin), args.count)
+        loads = measure(lambda: serializer.loads(data), args.count)
+        print(
+            "{:<10} loads={:>8.2f}us  dumps={:>8.2f}us  size={} bytes".format(
+                name, loads, dumps, len(data)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
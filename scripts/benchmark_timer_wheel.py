@@ -0,0 +1,80 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Compare threading.Timer with the shared timer wheel used by the azure-iot-device pipeline.
+
+For each implementation, this starts a number of timers (the way the pipeline starts one timer
+per in-flight operation), records how many threads are alive and how long scheduling took,
+then cancels them all (the way the pipeline does when the operations complete).
+
+Usage:
+    python benchmark_timer_wheel.py --timers 1000
+"""
+
+from __future__ import print_function
+import argparse
+import threading
+import time
+from azure.iot.device.common import timer_wheel
+
+
+def noop():
+    pass
+
+
+def run(name, timer_class, count, interval):
+    baseline_threads = threading.active_count()
+
+    start = time.time()
+    timers = [timer_class(interval, noop) for _ in range(count)]
+    for timer in timers:
+        timer.start()
+    schedule_time = time.time() - start
+    peak_threads = threading.active_count()
+
+    start = time.time()
+    for timer in timers:
+        timer.cancel()
+    cancel_time = time.time() - start
+
+    print(
+        "{:<16} timers={:<7} threads_added={:<7} schedule={:>9.1f}us/timer cancel={:>9.1f}us/timer".format(
+            name,
+            count,
+            peak_threads - baseline_threads,
+            schedule_time * 1e6 / count,
+            cancel_time * 1e6 / count,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--timers",
+        type=int,
+        nargs="+",
+        default=[100, 1000],
+        help="number of concurrent timers to start",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=30, help="timer interval in seconds (default: 30)"
+    )
+    args = parser.parse_args()
+
+    # Start the shared wheel's threads up front so they aren't counted against the first run
+    timer_wheel.Timer(0, noop).start()
+    time.sleep(0.1)
+
+    for count in args.timers:
+        run("threading.Timer", threading.Timer, count, args.interval)
+        # let the cancelled threads exit before the next measurement
+        time.sleep(0.5)
+        run("timer_wheel", timer_wheel.Timer, count, args.interval)
+
+
+if __name__ == "__main__":
+    main()
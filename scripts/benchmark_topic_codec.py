@@ -0,0 +1,128 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Compare the per-topic cost of the azure-iot-device IoT Hub MQTT topic functions with TopicCodec.
+
+Outgoing telemetry topics are encoded with encode_properties() and with
+TopicCodec.encode_telemetry_topic().  Incoming topics are classified and decoded the way
+IoTHubMQTTTranslationStage used to do it (an is_*_topic() check for each kind of topic, followed
+by the matching get_*_from_topic() and extract_properties_from_topic() calls), and with a single
+call to TopicCodec.decode().
+
+Usage:
+    python benchmark_topic_codec.py --count 100000
+"""
+
+from __future__ import print_function
+import argparse
+import time
+from azure.iot.device.iothub.pipeline import mqtt_topic_iothub
+from azure.iot.device.iothub.models import Message
+
+DEVICE_ID = "gateway-device-0001"
+MODULE_ID = "filter-module"
+
+
+def make_messages():
+    plain = Message("payload")
+
+    typical = Message("payload", message_id="3f0b6a51-54d4-4be6-8a3d-9f3b1b6f9e21")
+    typical.content_type = "application/json"
+    typical.content_encoding = "utf-8"
+
+    custom = Message("payload", message_id="3f0b6a51-54d4-4be6-8a3d-9f3b1b6f9e21")
+    custom.content_type = "application/json"
+    custom.content_encoding = "utf-8"
+    custom.custom_properties["temperatureAlert"] = "true"
+    custom.custom_properties["sensor"] = "building 4/floor 2"
+
+    return {"no properties": plain, "system properties": typical, "custom properties": custom}
+
+
+INCOMING_TOPICS = {
+    "c2d": "devices/{}/messages/devicebound/%24.mid=1a2b3c&%24.to=%2Fdevices%2F{}%2Fmessages%2FdeviceBound&%24.ct=application%2Fjson&%24.ce=utf-8&iothub-ack=full".format(
+        DEVICE_ID, DEVICE_ID
+    ),
+    "input": "devices/{}/modules/{}/inputs/input1/%24.mid=1a2b3c&%24.ct=application%2Fjson&sensor=building+4%2Ffloor+2".format(
+        DEVICE_ID, MODULE_ID
+    ),
+    "method": "$iothub/methods/POST/reboot/?$rid=17",
+    "twin response": "$iothub/twin/res/200/?$rid=8a9f1e9c-2c1d-4c6e-9f6e-6f7b1a3c2d4e",
+    "twin patch": "$iothub/twin/PATCH/properties/desired/?$version=12",
+}
+
+
+def decode_with_functions(topic):
+    # The classification chain IoTHubMQTTTranslationStage used before TopicCodec
+    if mqtt_topic_iothub.is_c2d_topic(topic, DEVICE_ID):
+        mqtt_topic_iothub.extract_properties_from_topic(topic, Message(None))
+    elif mqtt_topic_iothub.is_input_topic(topic, DEVICE_ID, MODULE_ID):
+        mqtt_topic_iothub.extract_properties_from_topic(topic, Message(None))
+        mqtt_topic_iothub.get_input_name_from_topic(topic)
+    elif mqtt_topic_iothub.is_method_topic(topic):
+        mqtt_topic_iothub.get_method_request_id_from_topic(topic)
+        mqtt_topic_iothub.get_method_name_from_topic(topic)
+    elif mqtt_topic_iothub.is_twin_response_topic(topic):
+        mqtt_topic_iothub.get_twin_request_id_from_topic(topic)
+        int(mqtt_topic_iothub.get_twin_status_code_from_topic(topic))
+    elif mqtt_topic_iothub.is_twin_desired_property_patch_topic(topic):
+        pass
+
+
+def decode_with_codec(codec, topic):
+    decoded = codec.decode(topic)
+    if decoded.properties is not None:
+        message = Message(None)
+        decoded.set_message_properties(message)
+        # Properties are decoded when they are first used
+        message.custom_properties
+
+
+def measure(fn, count):
+    start = time.time()
+    for _ in range(count):
+        fn()
+    return (time.time() - start) * 1e6 / count
+
+
+def report(name, before, after):
+    print(
+        "{:<26} functions={:>6.2f}us  codec={:>6.2f}us  ({:.0f}% less)".format(
+            name, before, after, (1 - after / before) * 100
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--count", type=int, default=100000, help="number of times to encode or decode each topic"
+    )
+    args = parser.parse_args()
+
+    codec = mqtt_topic_iothub.TopicCodec(DEVICE_ID, MODULE_ID)
+    telemetry_topic = mqtt_topic_iothub.get_telemetry_topic_for_publish(DEVICE_ID, MODULE_ID)
+
+    print("Encoding outgoing telemetry topics")
+    for name, message in make_messages().items():
+        assert codec.encode_telemetry_topic(message) == mqtt_topic_iothub.encode_properties(
+            message, telemetry_topic
+        )
+        before = measure(
+            lambda: mqtt_topic_iothub.encode_properties(message, telemetry_topic), args.count
+        )
+        after = measure(lambda: codec.encode_telemetry_topic(message), args.count)
+        report(name, before, after)
+
+    print("Decoding incoming topics")
+    for name, topic in INCOMING_TOPICS.items():
+        before = measure(lambda: decode_with_functions(topic), args.count)
+        after = measure(lambda: decode_with_codec(codec, topic), args.count)
+        report(name, before, after)
+
+
+if __name__ == "__main__":
+    main()